@@ -0,0 +1,478 @@
+# -*- coding: utf-8 -*-
+"""Recovery snapshots of networks with unsaved edits, taken periodically.
+
+A session holds edits its file does not have from the moment they are made
+until a commit writes them (or journals them, see ``network_journal``), and
+for longer when the write is refused or fails, or after a power flow. Until
+now nothing kept those edits if QGIS crashed: ``warn_about_unsaved_networks``
+only speaks up when the project is closed normally.
+
+The plugin calls :py:func:`autosave_all` on a timer. Every session whose
+latest edits are neither written nor journaled gets a recovery snapshot in a
+directory of the user's QGIS profile, never next to the network: the network
+file itself is not touched. A snapshot is a pickle, like the network cache's
+entries (see ``network_cache``), of the tables edited since the file was last
+written plus the network's small entries; a session whose edits were not
+described table by table is snapshotted whole. The tables are captured on the
+calling thread without being copied (``NetworkSession.capture``), which takes
+a few microseconds per table however large the network, and pickled on a
+background thread. An edit that arrives meanwhile copies the table it
+changes first, as it would for a table a scenario shares.
+
+A snapshot is deleted as soon as the session no longer needs it: when the
+file is written, or the journal catches up with the edits. A snapshot still
+there when the plugin starts is therefore left over from a session that
+ended without saving, and the plugin offers to restore it
+(:py:func:`list_recoveries`, :py:func:`restore`). Restoring opens the network
+from its file and puts the snapshot's tables back, leaving the session with
+unsaved edits to be committed as usual. A snapshot of a few tables only
+restores onto the file state it was taken against; a whole one restores
+regardless.
+
+Autosave is off until :py:func:`configure` is given a directory; the plugin
+does that from its settings.
+
+This module is Qt-free, like ``network_session``.
+"""
+
+import hashlib
+import os
+import pickle
+import threading
+import time
+import weakref
+
+from .network_change import ALL_ROWS, MODIFIED, NetworkChange
+
+# Bumped whenever the snapshot layout changes, so old snapshots are ignored.
+AUTOSAVE_FORMAT = 1
+
+# Snapshot file suffix, also used to recognise snapshots when listing.
+AUTOSAVE_SUFFIX = '.ppautosave'
+
+# Directory holding the snapshots, or None while autosave is disabled.
+_directory = None
+
+# Guards the bookkeeping below, which the writer threads update.
+_lock = threading.Lock()
+
+# Session -> generation of its latest snapshot on disk.
+_saved = weakref.WeakKeyDictionary()
+
+# Sessions whose snapshot is being written.
+_writing = weakref.WeakSet()
+
+# Session key -> number of times its snapshot was discarded, so a write that
+# finishes after a discard removes its snapshot again.
+_discards = {}
+
+
+def configure(directory):
+    """Enable autosave in a directory, or disable it.
+
+    Args:
+        directory: Directory for the snapshots, created if missing, or None
+            to disable autosave. Snapshots already there are kept.
+    """
+    global _directory
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    _directory = directory or None
+
+
+def enabled():
+    """Whether autosave is in use.
+
+    Returns:
+        bool: True if a snapshot directory is configured.
+    """
+    return _directory is not None
+
+
+def snapshot_path(key):
+    """Path of the recovery snapshot of a session.
+
+    Args:
+        key: The session's registry key, ``NetworkSession.key``.
+    Returns:
+        str: Snapshot path, or an empty string while autosave is disabled.
+    """
+    if _directory is None:
+        return ''
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+    return os.path.join(_directory, digest + AUTOSAVE_SUFFIX)
+
+
+def _file_state(path):
+    """The modification time and size of a file, as sessions record them.
+
+    Args:
+        path: File path.
+    Returns:
+        list: ``[mtime, size]``, or ``[None, None]`` if the file is missing.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return [None, None]
+    return [stat.st_mtime, stat.st_size]
+
+
+class Recovery:
+    """One recovery snapshot, as listed from its header."""
+
+    def __init__(self, snapshot, header):
+        """Initialise the recovery.
+
+        Args:
+            snapshot: Path of the snapshot file.
+            header: Its header, see :py:func:`_header`.
+        """
+        self.snapshot = snapshot
+        self.path = header['path']
+        self.scenario = header['scenario']
+        self.kind = header['kind']
+        self.epsg = header['epsg']
+        self.saved = header['saved']
+        # Table names, or None for a snapshot of the whole network.
+        self.tables = header['tables']
+        self.state_file = header['state_file']
+        self.state = header['state']
+
+    def complete(self):
+        """Whether the snapshot holds the whole network.
+
+        Returns:
+            bool: True if it does not depend on the file.
+        """
+        return self.tables is None
+
+    def restorable(self):
+        """Whether the snapshot can still be restored.
+
+        Returns:
+            bool: True if it holds the whole network, or the file it was
+                taken against is unchanged.
+        """
+        return self.complete() or _file_state(self.state_file) == self.state
+
+    def label(self):
+        """A short description for dialogs.
+
+        Returns:
+            str: e.g. 'grid.json (scenario feeder), 2025-01-01 12:00:00'.
+        """
+        name = os.path.basename(self.path)
+        if self.scenario is not None:
+            name += ' (scenario {})'.format(self.scenario)
+        return '{}, {}'.format(name, time.strftime(
+            '%Y-%m-%d %H:%M:%S', time.localtime(self.saved)))
+
+
+def _header(session, tables):
+    """Describe a session's snapshot.
+
+    Args:
+        session: The NetworkSession.
+        tables: Names of the tables in the snapshot, or None for all.
+    Returns:
+        dict: The header.
+    """
+    return {
+        'format': AUTOSAVE_FORMAT,
+        'path': session.path,
+        'scenario': session.scenario,
+        'kind': session.kind,
+        'epsg': session.epsg,
+        'saved': time.time(),
+        'tables': None if tables is None else sorted(tables),
+        # The edited tables are only valid on top of the file they were
+        # read from, in the state the session last saw it.
+        'state_file': session.state_file(),
+        'state': [session.file_mtime, session.file_size],
+    }
+
+
+def needs_autosave(session):
+    """Whether a session has edits no file, journal or snapshot holds.
+
+    Args:
+        session: The NetworkSession.
+    Returns:
+        bool: True if :py:func:`autosave` would write a snapshot.
+    """
+    if not enabled() or not session.edits_at_risk() \
+            or session.is_loading():
+        return False
+    with _lock:
+        return session not in _writing \
+            and _saved.get(session) != session.generation
+
+
+def _begin(session):
+    """Capture a session for a snapshot, on the calling thread.
+
+    Args:
+        session: The NetworkSession.
+    Returns:
+        tuple or None: ``(path, header, entries, generation, discards)`` for
+            :py:func:`_write`, or None if there is nothing to save.
+    """
+    from .network_session import ALL_TABLES
+
+    if not needs_autosave(session):
+        return None
+    tables = session.dirty_tables
+    entries = session.capture(tables)
+    if entries is None:
+        return None
+    with _lock:
+        _writing.add(session)
+        discards = _discards.get(session.key, 0)
+    header = _header(session, None if tables is ALL_TABLES else tables)
+    return (snapshot_path(session.key), header, entries, session.generation,
+            discards)
+
+
+def _write(session, path, header, entries, generation, discards):
+    """Write a captured snapshot and release the capture.
+
+    Args:
+        session: The NetworkSession captured.
+        path: Snapshot path.
+        header: Snapshot header.
+        entries: The captured entries.
+        generation: The session's generation when captured.
+        discards: Discard count of the session when captured.
+    Returns:
+        bool: True if the snapshot was written and is still wanted.
+    """
+    from .network_io import atomic_write
+
+    def write(handle):
+        # The header is a separate pickle, so listing reads just that.
+        pickle.dump(header, handle, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(entries, handle, protocol=pickle.HIGHEST_PROTOCOL)
+
+    try:
+        atomic_write(path, write, mode='wb')
+        written = True
+    except Exception as error:
+        print('Could not write recovery snapshot {}: {}'.format(path, error))
+        written = False
+    finally:
+        session.release_capture(entries)
+
+    with _lock:
+        _writing.discard(session)
+        stale = _discards.get(session.key, 0) != discards
+        if written and not stale:
+            _saved[session] = generation
+    if written and stale:
+        # Written or journaled meanwhile; the snapshot is not needed.
+        _remove(path)
+        return False
+    return written
+
+
+def autosave(session):
+    """Write a session's recovery snapshot on the calling thread.
+
+    Args:
+        session: The NetworkSession.
+    Returns:
+        bool: True if a snapshot was written.
+    """
+    job = _begin(session)
+    return job is not None and _write(session, *job)
+
+
+def autosave_in_background(session):
+    """Capture a session and write its recovery snapshot on a thread.
+
+    Only the capture runs on the calling thread; see the module docstring.
+
+    Args:
+        session: The NetworkSession.
+    Returns:
+        threading.Thread or None: The running thread, or None if the session
+            needs no snapshot.
+    """
+    job = _begin(session)
+    if job is None:
+        return None
+    thread = threading.Thread(
+        target=_write, args=(session,) + job,
+        name='pandapower-autosave', daemon=True)
+    thread.start()
+    return thread
+
+
+def autosave_all():
+    """Snapshot every open session that needs it, in the background.
+
+    Returns:
+        list: The threads started.
+    """
+    from .network_session import NetworkSession
+
+    threads = []
+    for session in NetworkSession.all_sessions():
+        thread = autosave_in_background(session)
+        if thread is not None:
+            threads.append(thread)
+    return threads
+
+
+def _remove(path):
+    """Delete a snapshot file, if present.
+
+    Args:
+        path: Snapshot path.
+    """
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def discard(key):
+    """Drop the recovery snapshot of a session, once nothing needs it.
+
+    Args:
+        key: The session's registry key.
+    """
+    if _directory is None:
+        return
+    with _lock:
+        _discards[key] = _discards.get(key, 0) + 1
+        for session in list(_saved.keys()):
+            if session.key == key:
+                del _saved[session]
+    _remove(snapshot_path(key))
+
+
+def _read_header(handle):
+    """Read a snapshot's header.
+
+    Args:
+        handle: The snapshot, open for binary reading.
+    Returns:
+        dict or None: The header, or None if it is of another format.
+    """
+    header = pickle.load(handle)
+    if not isinstance(header, dict) \
+            or header.get('format') != AUTOSAVE_FORMAT:
+        return None
+    return header
+
+
+def list_recoveries():
+    """List the recovery snapshots in the configured directory.
+
+    Snapshots of sessions that are open right now are not listed: they
+    belong to this QGIS session.
+
+    Returns:
+        list: Recovery objects, each file's network before its scenarios.
+    """
+    from .network_session import NetworkSession
+
+    if _directory is None:
+        return []
+    recoveries = []
+    for name in os.listdir(_directory):
+        if not name.endswith(AUTOSAVE_SUFFIX):
+            continue
+        snapshot = os.path.join(_directory, name)
+        try:
+            with open(snapshot, 'rb') as handle:
+                header = _read_header(handle)
+        except Exception as error:
+            print('Ignoring unreadable recovery snapshot {}: {}'.format(
+                snapshot, error))
+            continue
+        if header is None or NetworkSession.get(
+                header['path'], scenario=header['scenario']) is not None:
+            continue
+        recoveries.append(Recovery(snapshot, header))
+    recoveries.sort(key=lambda recovery: (
+        recovery.path, recovery.scenario is not None, recovery.scenario or ''))
+    return recoveries
+
+
+def read_entries(recovery):
+    """Read the network entries of a recovery snapshot.
+
+    Args:
+        recovery: A Recovery from :py:func:`list_recoveries`.
+    Returns:
+        dict: ``{name: entry}``.
+    Raises:
+        ValueError: If the snapshot is unreadable or of another format.
+    """
+    try:
+        with open(recovery.snapshot, 'rb') as handle:
+            if _read_header(handle) is None:
+                raise ValueError('unknown format')
+            return pickle.load(handle)
+    except Exception as error:
+        raise ValueError('Cannot read recovery snapshot {}: {}'.format(
+            recovery.snapshot, error))
+
+
+def restore(recovery, loader):
+    """Open a network and put the edits of a recovery snapshot back.
+
+    The session is left dirty, with the snapshot's tables as unsaved edits;
+    a commit writes them as usual. The snapshot is kept until then.
+
+    Args:
+        recovery: A restorable Recovery from :py:func:`list_recoveries`.
+        loader: Callable taking the path and kind of a network file and
+            returning its network, as ``network_preload.load_network`` does.
+    Returns:
+        NetworkSession: The acquired session; the caller releases it.
+    Raises:
+        ValueError: If the file changed since the snapshot of some tables
+            was taken, or the snapshot is unreadable.
+        Any exception raised by ``loader``.
+    """
+    from .network_session import NetworkSession
+
+    if not recovery.restorable():
+        raise ValueError(
+            '{} changed since the unsaved edits were recovered; they no '
+            'longer apply to it.'.format(recovery.state_file))
+    entries = read_entries(recovery)
+    session = NetworkSession.acquire(
+        recovery.path,
+        lambda: loader(recovery.path, recovery.kind),
+        epsg=recovery.epsg,
+        kind=recovery.kind,
+        scenario=recovery.scenario)
+    try:
+        net = session.net
+        # Whole tables replace the loaded ones; nothing changes in place.
+        net.update(entries)
+        if recovery.complete():
+            change = NetworkChange.all()
+        else:
+            change = NetworkChange()
+            for table in recovery.tables:
+                change.add_rows(MODIFIED, table, ALL_ROWS)
+        session.mark_dirty(change)
+        session.notify_changed(change=change)
+    except BaseException:
+        session.release()
+        raise
+    return session
+
+
+def discard_recovery(recovery):
+    """Delete a recovery snapshot the user does not want back.
+
+    Args:
+        recovery: A Recovery from :py:func:`list_recoveries`.
+    """
+    _remove(recovery.snapshot)
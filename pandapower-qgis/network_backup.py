@@ -0,0 +1,552 @@
+# -*- coding: utf-8 -*-
+"""Deduplicating backups of network files.
+
+Every commit used to copy the whole network to a timestamped ``.bak`` file
+next to it. A day of editing a 1 GB network filled the disk, and the copy
+doubled the time of each save. Backups now go to a store next to the network,
+named after it:
+
+    grid.json.backups/
+    ├── snapshots/
+    │   ├── 20250101_120000_000000.json     one manifest per backup
+    │   └── ...
+    └── objects/
+        └── 3f/3fa1...                      compressed pieces, by content hash
+
+A snapshot is a list of the pieces that make up the file, in order. A JSON
+network is cut at the boundaries of its entries (see ``network_lazy``), so
+each table is one piece, named by the hash of its bytes and stored compressed
+once. The next snapshot after editing one table adds that table only; every
+other piece is already in the store. The short text between the entries is
+kept inline in the manifest. Other files - ``.ppnet`` zip stores, files that
+do not scan - are cut into fixed blocks instead, and a directory store is
+backed up file by file.
+
+A restore joins the pieces back into the exact bytes that were backed up, and
+compresses them again if the network file was compressed.
+
+After each backup the snapshots are thinned out: the newest ``keep_last`` are
+kept, plus the newest of each of the last ``keep_hourly`` hours and
+``keep_daily`` days that have a snapshot. Pieces no kept snapshot refers to
+are deleted. The plugin sets the policy through :py:func:`configure`.
+
+This module is Qt-free, like ``network_session``.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from .network_compression import GZIP, ZSTD, detect_compression, \
+    open_binary, plain_copy, write_binary
+from .network_store import store_root, state_path
+
+# Suffix of the backup directory, appended to the network's file name.
+BACKUP_SUFFIX = '.backups'
+
+SNAPSHOTS_DIR = 'snapshots'
+OBJECTS_DIR = 'objects'
+
+# Bumped whenever the manifest layout changes.
+BACKUP_FORMAT = 1
+
+# Pieces smaller than this are kept in the manifest rather than as objects.
+INLINE_BYTES = 4096
+
+# Size of the blocks files without entries are cut into, and of the reads
+# used to hash and compress a piece.
+BLOCK_BYTES = 4 * 1024 * 1024
+
+# Default retention, see configure().
+DEFAULT_KEEP_LAST = 10
+DEFAULT_KEEP_HOURLY = 24
+DEFAULT_KEEP_DAILY = 14
+
+_retention = (DEFAULT_KEEP_LAST, DEFAULT_KEEP_HOURLY, DEFAULT_KEEP_DAILY)
+
+# Serialises work on the stores: a save's backup runs on a task thread while
+# the user may restore from the Browser.
+_lock = threading.RLock()
+
+
+def configure(keep_last=DEFAULT_KEEP_LAST, keep_hourly=DEFAULT_KEEP_HOURLY,
+              keep_daily=DEFAULT_KEEP_DAILY):
+    """Set which snapshots are kept when a store is thinned out.
+
+    Args:
+        keep_last: Number of newest snapshots always kept (at least 1).
+        keep_hourly: Number of recent hours whose newest snapshot is kept.
+        keep_daily: Number of recent days whose newest snapshot is kept.
+    """
+    global _retention
+    _retention = (max(1, int(keep_last)), max(0, int(keep_hourly)),
+                  max(0, int(keep_daily)))
+
+
+def retention():
+    """The current retention policy.
+
+    Returns:
+        tuple: ``(keep_last, keep_hourly, keep_daily)``.
+    """
+    return _retention
+
+
+def backup_directory(path):
+    """The directory holding a network's backups.
+
+    Args:
+        path: Path of the network file or store.
+    Returns:
+        str: e.g. '/data/grid.json.backups' for '/data/grid.json'.
+    """
+    return store_root(path) + BACKUP_SUFFIX
+
+
+class Snapshot:
+    """One backup of a network file, as listed from its manifest."""
+
+    def __init__(self, path, snapshot_id, created, size):
+        """Initialise the snapshot.
+
+        Args:
+            path: Path of the manifest.
+            snapshot_id: Name of the snapshot, unique within its store.
+            created: Time of the backup, in seconds since the epoch.
+            size: Size of the backed up network in bytes, uncompressed.
+        """
+        self.path = path
+        self.id = snapshot_id
+        self.created = created
+        self.size = size
+
+    def label(self):
+        """A short description for menus.
+
+        Returns:
+            str: e.g. '2025-01-01 12:00:00 (12.3 MB)'.
+        """
+        return '{} ({:.1f} MB)'.format(
+            time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.created)),
+            self.size / (1024 * 1024))
+
+
+# -- objects -------------------------------------------------------------
+
+
+def _object_compression():
+    """The compression new objects are stored with.
+
+    Returns:
+        str: ZSTD if the zstandard package is available, else GZIP.
+    """
+    try:
+        import zstandard  # noqa: F401
+    except ImportError:
+        return GZIP
+    return ZSTD
+
+
+def _object_path(directory, digest):
+    return os.path.join(directory, OBJECTS_DIR, digest[:2], digest)
+
+
+def _blocks(buffer, start, end):
+    """Yield a byte range of a buffer in blocks, without copying it whole."""
+    view = memoryview(buffer)
+    try:
+        for offset in range(start, end, BLOCK_BYTES):
+            yield view[offset:min(offset + BLOCK_BYTES, end)]
+    finally:
+        view.release()
+
+
+def _store_piece(directory, buffer, start, end):
+    """Describe one piece of a file, storing it as an object if it is new.
+
+    Args:
+        directory: The backup directory.
+        buffer: The file's bytes (an mmap).
+        start: Offset of the piece.
+        end: Offset after the piece.
+    Returns:
+        dict: ``{'inline': text}`` for a small piece, else
+            ``{'object': digest, 'size': bytes}``.
+    """
+    if end - start < INLINE_BYTES:
+        # latin-1 maps every byte to one character, so any bytes survive.
+        return {'inline': bytes(buffer[start:end]).decode('latin-1')}
+
+    hasher = hashlib.blake2b(digest_size=32)
+    for block in _blocks(buffer, start, end):
+        hasher.update(block)
+    digest = hasher.hexdigest()
+
+    target = _object_path(directory, digest)
+    if not os.path.exists(target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(target),
+                                             suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as stream:
+                def write(out):
+                    for block in _blocks(buffer, start, end):
+                        out.write(block)
+
+                write_binary(stream, _object_compression(), write)
+            os.replace(temp_path, target)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+    return {'object': digest, 'size': end - start}
+
+
+def _boundaries(path, size):
+    """Offsets at which to cut a file into pieces.
+
+    Args:
+        path: Path of an uncompressed file.
+        size: Its size in bytes.
+    Returns:
+        list: Increasing offsets from 0 to ``size``.
+    """
+    from .network_lazy import scan_entries
+
+    cuts = set(range(0, size, BLOCK_BYTES))
+    try:
+        spans = scan_entries(path)
+    except (ValueError, OSError):
+        pass  # Not a JSON network; fixed blocks only
+    else:
+        # Whole entries: an unchanged table then hashes to the same piece
+        # wherever it sits in the file.
+        cuts = {0}
+        for start, end in spans.values():
+            cuts.update((start, end))
+    cuts.add(size)
+    return sorted(cuts)
+
+
+def _file_pieces(directory, path):
+    """Store a file's pieces and describe the file.
+
+    Args:
+        directory: The backup directory.
+        path: Path of the file.
+    Returns:
+        dict: ``{'compression': ..., 'size': bytes, 'pieces': [...]}``.
+    """
+    compression = detect_compression(path)
+    with plain_copy(path) as plain:
+        size = os.path.getsize(plain)
+        pieces = []
+        if size:
+            with open(plain, 'rb') as handle, \
+                    mmap.mmap(handle.fileno(), 0,
+                              access=mmap.ACCESS_READ) as buffer:
+                cuts = _boundaries(plain, size)
+                for start, end in zip(cuts, cuts[1:]):
+                    pieces.append(_store_piece(directory, buffer, start, end))
+    return {'compression': compression, 'size': size, 'pieces': pieces}
+
+
+def _write_pieces(directory, pieces, out):
+    """Write a file's pieces back out, in order.
+
+    Args:
+        directory: The backup directory.
+        pieces: Piece descriptions from :py:func:`_store_piece`.
+        out: Binary file object.
+    Raises:
+        ValueError: If an object is missing from the store.
+    """
+    for piece in pieces:
+        if 'inline' in piece:
+            out.write(piece['inline'].encode('latin-1'))
+            continue
+        object_path = _object_path(directory, piece['object'])
+        if not os.path.exists(object_path):
+            raise ValueError('The backup is incomplete: a piece is missing '
+                             'from {}.'.format(directory))
+        with open_binary(object_path) as source:
+            shutil.copyfileobj(source, out, BLOCK_BYTES)
+
+
+# -- snapshots -----------------------------------------------------------
+
+
+def _read_manifest(manifest_path):
+    with open(manifest_path, encoding='utf-8') as handle:
+        manifest = json.load(handle)
+    if manifest.get('format') != BACKUP_FORMAT:
+        raise ValueError('Unknown backup format in {}.'.format(manifest_path))
+    return manifest
+
+
+def list_snapshots(path):
+    """List the backups of a network, newest first.
+
+    Args:
+        path: Path of the network file or store.
+    Returns:
+        list: Snapshot objects; manifests that cannot be read are skipped.
+    """
+    snapshots_dir = os.path.join(backup_directory(path), SNAPSHOTS_DIR)
+    try:
+        names = os.listdir(snapshots_dir)
+    except OSError:
+        return []
+
+    snapshots = []
+    for name in names:
+        if not name.endswith('.json'):
+            continue
+        manifest_path = os.path.join(snapshots_dir, name)
+        try:
+            manifest = _read_manifest(manifest_path)
+        except (OSError, ValueError):
+            continue
+        size = sum(entry['size'] for entry in manifest['files'].values())
+        snapshots.append(Snapshot(manifest_path, name[:-len('.json')],
+                                  manifest['created'], size))
+    snapshots.sort(key=lambda snapshot: (snapshot.created, snapshot.id),
+                   reverse=True)
+    return snapshots
+
+
+def _source_state(root):
+    """The file state a snapshot of an unchanged network would record."""
+    stat = os.stat(state_path(root))
+    return [stat.st_mtime, stat.st_size]
+
+
+def create_snapshot(path):
+    """Back up a network file or store.
+
+    Nothing is stored if the network has not changed since its newest
+    snapshot; that snapshot is returned instead. The store is thinned out
+    afterwards.
+
+    Args:
+        path: Path of the network file or store.
+    Returns:
+        Snapshot or None: The snapshot, or None if the network does not exist.
+    Raises:
+        OSError: If the backup cannot be written.
+    """
+    with _lock:
+        snapshot = _take_snapshot(store_root(path))
+        if snapshot is not None:
+            prune(path)
+        return snapshot
+
+
+def _take_snapshot(root):
+    """Back up a network without thinning out its store.
+
+    Args:
+        root: Path of the network file or store directory.
+    Returns:
+        Snapshot or None: As for :py:func:`create_snapshot`.
+    """
+    if not os.path.exists(root):
+        return None
+
+    with _lock:
+        directory = backup_directory(root)
+        state = _source_state(root)
+        snapshots = list_snapshots(root)
+        if snapshots:
+            with open(snapshots[0].path, encoding='utf-8') as handle:
+                if json.load(handle).get('state') == state:
+                    return snapshots[0]
+
+        if os.path.isdir(root):
+            files = {}
+            for parent, _dirs, names in os.walk(root):
+                for name in names:
+                    member = os.path.join(parent, name)
+                    relative = os.path.relpath(member, root).replace(
+                        os.sep, '/')
+                    files[relative] = _file_pieces(directory, member)
+        else:
+            files = {'': _file_pieces(directory, root)}
+
+        created = time.time()
+        snapshot_id = '{}_{:06d}'.format(
+            time.strftime('%Y%m%d_%H%M%S', time.localtime(created)),
+            int(created % 1 * 1e6))
+        manifest = {
+            'format': BACKUP_FORMAT,
+            'created': created,
+            'source': os.path.basename(root),
+            'layout': 'directory' if os.path.isdir(root) else 'file',
+            'state': state,
+            'files': files,
+        }
+
+        from .network_io import atomic_write
+
+        snapshots_dir = os.path.join(directory, SNAPSHOTS_DIR)
+        os.makedirs(snapshots_dir, exist_ok=True)
+        manifest_path = os.path.join(snapshots_dir, snapshot_id + '.json')
+        # The manifest is written last: a snapshot exists once it does.
+        atomic_write(manifest_path, lambda stream: json.dump(manifest, stream))
+
+        size = sum(entry['size'] for entry in files.values())
+        return Snapshot(manifest_path, snapshot_id, created, size)
+
+
+def restore_snapshot(path, snapshot_id, target=None):
+    """Write a network back as it was when a snapshot was taken.
+
+    Restoring over the network backs the current file up first, so a restore
+    can itself be undone.
+
+    Args:
+        path: Path of the network file or store the snapshot belongs to.
+        snapshot_id: Snapshot.id of the snapshot.
+        target: Where to write the network; the network's own path if None.
+    Returns:
+        str: The path written.
+    Raises:
+        ValueError: If the snapshot does not exist or is incomplete.
+        OSError: If the network cannot be written.
+    """
+    from .network_io import atomic_write, replace_directory
+
+    root = store_root(path)
+    directory = backup_directory(root)
+    manifest_path = os.path.join(directory, SNAPSHOTS_DIR,
+                                 snapshot_id + '.json')
+    if target is None:
+        target = root
+
+    with _lock:
+        try:
+            manifest = _read_manifest(manifest_path)
+        except OSError:
+            raise ValueError('There is no backup {} of {}.'.format(
+                snapshot_id, root))
+        restoring_in_place = target == root
+        if restoring_in_place:
+            # Not thinned out yet: that could drop the snapshot being restored.
+            _take_snapshot(root)
+
+        if manifest['layout'] == 'file':
+            entry = manifest['files']['']
+            atomic_write(target, lambda handle: _restore_file(
+                directory, entry, handle), mode='wb')
+        else:
+            staging = tempfile.mkdtemp(
+                dir=os.path.dirname(os.path.abspath(target)),
+                prefix='.{}.'.format(os.path.basename(target)), suffix='.tmp')
+            try:
+                for relative, entry in manifest['files'].items():
+                    member = os.path.join(staging, *relative.split('/'))
+                    os.makedirs(os.path.dirname(member), exist_ok=True)
+                    with open(member, 'wb') as handle:
+                        _restore_file(directory, entry, handle)
+                replace_directory(staging, target)
+            except BaseException:
+                shutil.rmtree(staging, ignore_errors=True)
+                raise
+
+        if restoring_in_place:
+            prune(root)
+        return target
+
+
+def _restore_file(directory, entry, handle):
+    """Write one backed up file, compressed as the original was.
+
+    Args:
+        directory: The backup directory.
+        entry: The file's description from the manifest.
+        handle: Binary file object to write to.
+    """
+    write_binary(handle, entry['compression'],
+                 lambda out: _write_pieces(directory, entry['pieces'], out))
+
+
+# -- retention -----------------------------------------------------------
+
+
+def select_kept(snapshots, keep_last, keep_hourly, keep_daily):
+    """Pick the snapshots a retention policy keeps.
+
+    Args:
+        snapshots: Snapshot objects.
+        keep_last: Number of newest snapshots kept.
+        keep_hourly: Number of recent hours whose newest snapshot is kept.
+        keep_daily: Number of recent days whose newest snapshot is kept.
+    Returns:
+        set: The ids of the kept snapshots.
+    """
+    newest_first = sorted(snapshots, key=lambda snapshot: snapshot.created,
+                          reverse=True)
+    kept = {snapshot.id for snapshot in newest_first[:keep_last]}
+
+    for period_format, count in (('%Y%m%d%H', keep_hourly),
+                                 ('%Y%m%d', keep_daily)):
+        periods = set()
+        for snapshot in newest_first:
+            period = time.strftime(period_format,
+                                   time.localtime(snapshot.created))
+            if period in periods:
+                continue
+            if len(periods) >= count:
+                break
+            periods.add(period)
+            kept.add(snapshot.id)
+    return kept
+
+
+def prune(path, policy=None):
+    """Thin out a network's snapshots and delete pieces no longer used.
+
+    Args:
+        path: Path of the network file or store.
+        policy: ``(keep_last, keep_hourly, keep_daily)``; the configured
+            policy if None.
+    Returns:
+        int: Number of snapshots deleted.
+    """
+    directory = backup_directory(path)
+    with _lock:
+        snapshots = list_snapshots(path)
+        kept = select_kept(snapshots, *(policy or _retention))
+
+        removed = 0
+        referenced = set()
+        for snapshot in snapshots:
+            if snapshot.id not in kept:
+                try:
+                    os.remove(snapshot.path)
+                    removed += 1
+                except OSError:
+                    pass
+                continue
+            manifest = _read_manifest(snapshot.path)
+            for entry in manifest['files'].values():
+                referenced.update(piece['object'] for piece in entry['pieces']
+                                  if 'object' in piece)
+
+        # Sweep objects, and temporary files a crash may have left behind.
+        objects_dir = os.path.join(directory, OBJECTS_DIR)
+        for parent, _dirs, names in os.walk(objects_dir):
+            for name in names:
+                if name not in referenced:
+                    try:
+                        os.remove(os.path.join(parent, name))
+                    except OSError:
+                        pass
+        return removed
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""Binary cache of parsed networks, so a cold open skips the JSON parse.
+
+Opening a network runs ``pandapower.from_json`` and the provider's
+post-processing on every cold open, which takes over a minute for a 500 MB
+file. With the cache enabled, the parsed network is also stored as a pickle:
+pandas pickles a DataFrame as its column blocks, so loading it is close to
+copying arrays back into memory.
+
+An entry is only used when it still describes the file exactly. Its header
+records the JSON's path, modification time and size, the pandapower version
+that parsed it and whether the network was compacted (``network_compaction``);
+a mismatch in any of them, including a compaction setting changed since,
+makes the entry stale. A stale or
+missing entry costs nothing extra on open: the JSON is parsed as before, and
+the entry is rebuilt on a background thread afterwards. Commits refresh the
+entry right after writing the file (see ``network_tasks``), so a network that
+is worked on daily stays warm.
+
+Files in an older pandapower format (the ``bus_geodata``/``line_geodata``
+layout of pandapower 2, say) also go through ``convert_format`` on every open,
+and cannot be opened lazily. Their entries hold the converted network, so
+they are worth keeping even when the user has not enabled the cache: with
+``converted_only`` (see :py:func:`configure`) only such files are cached. Once
+a file has been saved in the current format its entry is dropped again.
+
+Entries live in a directory owned by the user's QGIS profile rather than next
+to the network, since unpickling a file runs code and a network folder may be
+shared. The cache is off until :py:func:`configure` is given a directory; the
+plugin does that from its settings.
+
+This module is Qt-free, like ``network_session``.
+"""
+
+import hashlib
+import os
+import pickle
+import threading
+
+# Bumped whenever the entry layout changes, so old entries are ignored.
+CACHE_FORMAT = 2
+
+# Entry file suffix, also used to recognise entries when clearing.
+CACHE_SUFFIX = '.ppcache'
+
+# Directory holding the entries, or None while the cache is disabled.
+_directory = None
+
+# Whether only networks that need format conversion get entries.
+_converted_only = False
+
+
+def configure(directory, converted_only=False):
+    """Enable the cache in a directory, or disable it.
+
+    Args:
+        directory: Directory for the entries, created if missing, or None to
+            disable the cache.
+        converted_only: Only store networks whose files are in an older
+            pandapower format. Existing entries are still used.
+    """
+    global _directory, _converted_only
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    _directory = directory or None
+    _converted_only = bool(converted_only)
+
+
+def enabled():
+    """Whether the cache is in use.
+
+    Returns:
+        bool: True if a cache directory is configured.
+    """
+    return _directory is not None
+
+
+def entry_path(path):
+    """Path of the cache entry for a network file.
+
+    Args:
+        path: Normalised path of the network file.
+    Returns:
+        str: Entry path, or an empty string while the cache is disabled.
+    """
+    if _directory is None:
+        return ''
+    digest = hashlib.sha1(path.encode('utf-8')).hexdigest()
+    return os.path.join(_directory, digest + CACHE_SUFFIX)
+
+
+def _library_version(kind):
+    """Version of the library that parses networks of a kind.
+
+    Args:
+        kind: KIND_POWER or KIND_PIPES.
+    Returns:
+        str: The version string.
+    """
+    from .network_session import KIND_PIPES
+
+    if kind == KIND_PIPES:
+        import pandapipes as library
+    else:
+        import pandapower as library
+    return getattr(library, '__version__', '')
+
+
+def _header(path, kind, compacted):
+    """Describe a network file as the cache sees it.
+
+    Args:
+        path: Normalised path of the network file.
+        kind: KIND_POWER or KIND_PIPES.
+        compacted: Whether the network is compacted.
+    Returns:
+        dict or None: The header, or None if the file cannot be read.
+    """
+    from .network_store import state_path
+
+    try:
+        stat = os.stat(state_path(path))
+    except OSError:
+        return None
+    return {
+        'format': CACHE_FORMAT,
+        'path': path,
+        'mtime_ns': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'kind': kind,
+        'version': _library_version(kind),
+        'compacted': bool(compacted),
+    }
+
+
+def _worth_storing(path, kind):
+    """Whether a network file should have a cache entry.
+
+    Args:
+        path: Normalised path of the network file.
+        kind: KIND_POWER or KIND_PIPES.
+    Returns:
+        bool: True unless only converted networks are cached and this file is
+            in the current format (or cannot be indexed).
+    """
+    if not _converted_only:
+        return True
+    from .network_index import read_index
+
+    try:
+        # Usually remembered already: the Browser indexes every file it lists.
+        return read_index(path, kind).legacy
+    except (OSError, ValueError):
+        return False
+
+
+def load(path, kind):
+    """Load a network from the cache if its entry is still valid.
+
+    Args:
+        path: Normalised path of the network file.
+        kind: KIND_POWER or KIND_PIPES.
+    Returns:
+        The cached network, or None if the cache is disabled, has no entry,
+        or the entry is stale or unreadable.
+    """
+    entry = entry_path(path)
+    if not entry or not os.path.exists(entry):
+        return None
+
+    from . import network_compaction
+    from .network_session import KIND_POWER
+
+    # Opening compacts only pandapower networks, see compact_loaded().
+    expected = _header(path, kind, kind == KIND_POWER
+                       and network_compaction.enabled())
+    if expected is None:
+        return None
+
+    try:
+        with open(entry, 'rb') as handle:
+            # The header is a separate pickle, so a stale entry is rejected
+            # without reading the network behind it.
+            if pickle.load(handle) != expected:
+                return None
+            return pickle.load(handle)
+    except Exception as error:
+        # A truncated or foreign entry is just a cache miss.
+        print('Ignoring unreadable network cache {}: {}'.format(entry, error))
+        return None
+
+
+def store(path, net, kind):
+    """Write the cache entry for a network file.
+
+    ``net`` must match the file as it is on disk now: the entry is stamped
+    with the file's current modification time and size.
+
+    Args:
+        path: Normalised path of the network file.
+        net: The parsed network. Must not be modified while this runs.
+        kind: KIND_POWER or KIND_PIPES.
+    Returns:
+        bool: True if an entry was written.
+    """
+    from .network_compaction import COMPACTION_KEY
+    from .network_io import atomic_write
+
+    entry = entry_path(path)
+    if entry and not _worth_storing(path, kind):
+        # E.g. the file was just saved in the current format.
+        invalidate(path)
+        return False
+    header = _header(path, kind, COMPACTION_KEY in net) if entry else None
+    if header is None:
+        return False
+
+    def write(handle):
+        pickle.dump(header, handle, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(net, handle, protocol=pickle.HIGHEST_PROTOCOL)
+
+    try:
+        atomic_write(entry, write, mode='wb')
+    except Exception as error:
+        print('Could not write network cache {}: {}'.format(entry, error))
+        return False
+    return True
+
+
+def store_in_background(path, net, kind):
+    """Rebuild a cache entry on a background thread.
+
+    The tables are copied first, on the calling thread, so edits made while
+    the entry is written cannot tear it.
+
+    Args:
+        path: Normalised path of the network file.
+        net: The freshly parsed network.
+        kind: KIND_POWER or KIND_PIPES.
+    Returns:
+        threading.Thread or None: The running thread, or None when the cache
+            is disabled or would not keep this network.
+    """
+    if not enabled() or not _worth_storing(path, kind):
+        return None
+
+    from .network_io import snapshot_network
+
+    snapshot = snapshot_network(net)
+    thread = threading.Thread(
+        target=store, args=(path, snapshot, kind),
+        name='pandapower-cache', daemon=True)
+    thread.start()
+    return thread
+
+
+def invalidate(path):
+    """Drop the cache entry of one network file.
+
+    Args:
+        path: Normalised path of the network file.
+    """
+    entry = entry_path(path)
+    if entry:
+        try:
+            os.remove(entry)
+        except OSError:
+            pass
+
+
+def clear():
+    """Delete every cache entry in the configured directory.
+
+    Returns:
+        int: Number of entries removed.
+    """
+    if _directory is None:
+        return 0
+    removed = 0
+    for name in os.listdir(_directory):
+        if name.endswith(CACHE_SUFFIX):
+            try:
+                os.remove(os.path.join(_directory, name))
+                removed += 1
+            except OSError:
+                pass
+    return removed
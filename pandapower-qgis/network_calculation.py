@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+"""Power flows on a snapshot of a session's network, off the GUI thread.
+
+A power flow used to run on the session's network itself, on the GUI thread:
+pandapower writes its results into the network it calculates, so nothing else
+could touch that network meanwhile, and QGIS froze for the whole call - over
+30 s on a transmission model. A :py:class:`Calculation` instead gives the
+power flow a network of its own to run on a worker thread, and moves the
+results into the session's network afterwards, on the main thread, in one
+step (``ppqgis_runpp.NetworkCalculationTask`` drives it).
+
+Rules a calculation follows:
+
+* Its network shares the session's tables without copying them
+  (``NetworkSession.capture``): each is a new table object over the same
+  data, so taking the snapshot costs microseconds per table. An edit made
+  while the power flow runs copies the table it changes first, so the power
+  flow sees the network as it was when it started. Only the result tables,
+  which pandapower writes into, are copied up front.
+* The results are the result tables and whatever else pandapower replaced or
+  added, such as ``converged`` and its internal ``_ppc``. The network's own
+  tables are never taken back from the snapshot.
+* An edit made during the run is detected by the session's generation. The
+  results are still applied, but :py:meth:`Calculation.edited` flags that
+  they describe the network before the edit.
+* Cancelling raises ``InterruptedError`` in the calculating thread
+  (:py:meth:`Calculation.cancel`), which stops pandapower as soon as it runs
+  Python code again, and leaves the session's network as it was. Nothing
+  watches the calculation itself, which runs as fast as it would on the
+  GUI thread; a separate thread checks for cancellation and reports progress
+  every :py:data:`CHECK_INTERVAL_S` seconds.
+
+This module is Qt-free, like ``network_session``.
+"""
+
+import copy
+import ctypes
+import threading
+import time
+
+from .network_change import NetworkChange
+
+# How often a running calculation checks for cancellation and reports
+# progress, in seconds.
+CHECK_INTERVAL_S = 0.1
+
+# Session key -> seconds its last calculation took, to estimate progress:
+# pandapower reports none itself.
+_durations = {}
+
+# Serialises cancelling a calculation with its end, so that no cancellation
+# reaches its thread once the calculation is over.
+_cancel_lock = threading.Lock()
+
+
+def _raise_in_thread(thread_id, exception):
+    """Raise an exception in another thread at its next Python bytecode.
+
+    Args:
+        thread_id: ``threading.get_ident()`` of the thread.
+        exception: Exception class to raise, or None to withdraw one that
+            was not raised yet.
+    """
+    ctypes.pythonapi.PyThreadState_SetAsyncExc(
+        ctypes.c_ulong(thread_id),
+        ctypes.py_object(exception) if exception is not None else None)
+
+
+def _is_table(value):
+    """Whether a network entry is a table.
+
+    Args:
+        value: The entry.
+    Returns:
+        bool: True for a DataFrame.
+    """
+    return hasattr(value, 'columns')
+
+
+class Calculation:
+    """A power flow's own network, taken from a session, and its results."""
+
+    # Identity of the thread running the calculation, while it runs, and
+    # whether it was cancelled.
+    _thread = None
+    _cancelled = False
+
+    def __init__(self, session):
+        """Take the snapshot the power flow runs on.
+
+        Args:
+            session: The NetworkSession to calculate. A lazily opened network
+                is decoded in full first.
+        Raises:
+            ValueError: If the session has no network yet.
+        """
+        source = session.net
+        entries = session.capture()
+        if source is None or entries is None:
+            raise ValueError('The network of {} is not loaded yet.'.format(
+                session.path))
+        self.session = session
+        self.generation = session.generation
+        self._source = source
+        self._entries = entries
+        # Whether edits preceded the results, once applied.
+        self._edited = None
+
+        net = copy.copy(source)
+        net.update(entries)
+        for name, value in list(net.items()):
+            if _is_table(value):
+                # pandapower fills result tables cell by cell; every other
+                # table is only read, or reshaped into a new object.
+                net[name] = value.copy(deep=name.startswith('res_'))
+        self.net = net
+        # What the power flow was given, to tell what it replaced.
+        self._given = dict(net)
+
+    def run(self, function, is_canceled=None, progress=None):
+        """Run a calculation on the snapshot. May run on any thread.
+
+        Args:
+            function: Callable taking the network, e.g. ``pandapower.runpp``.
+            is_canceled: Callable returning True once the calculation should
+                stop, checked every :py:data:`CHECK_INTERVAL_S` seconds on
+                another thread. :py:meth:`cancel` stops it at once.
+            progress: Callable receiving an estimated percentage done, based
+                on how long the previous calculation of the network took.
+                Called from another thread.
+        Returns:
+            Whatever ``function`` returns.
+        Raises:
+            InterruptedError: If the calculation was cancelled.
+            Any exception raised by ``function``.
+        """
+        expected = self.expected_duration()
+        started = time.monotonic()
+        done = threading.Event()
+
+        def watch():
+            while not done.wait(CHECK_INTERVAL_S):
+                if is_canceled is not None and is_canceled():
+                    self.cancel()
+                    return
+                if progress is not None and expected:
+                    progress(min(95.0, 100.0 * (time.monotonic() - started)
+                                 / expected))
+
+        thread_id = threading.get_ident()
+        with _cancel_lock:
+            self._thread = thread_id
+        if is_canceled is not None or progress is not None:
+            threading.Thread(target=watch, name='calculation watch',
+                             daemon=True).start()
+        try:
+            try:
+                result = function(self.net)
+            finally:
+                self._stop_cancelling(thread_id)
+        finally:
+            done.set()
+        # pandapower may have caught the interruption and carried on.
+        if self._cancelled or (is_canceled is not None and is_canceled()):
+            raise InterruptedError('Calculation cancelled.')
+        self.record_duration(time.monotonic() - started)
+        return result
+
+    def _stop_cancelling(self, thread_id):
+        """Make sure no cancellation reaches the thread once the run ends.
+
+        A cancellation raised while this runs is caught and this tried
+        again; :py:meth:`run` still raises ``InterruptedError`` for it.
+
+        Args:
+            thread_id: The thread that ran the calculation.
+        """
+        while True:
+            try:
+                with _cancel_lock:
+                    self._thread = None
+                    # Cancelled just as the calculation ended.
+                    _raise_in_thread(thread_id, None)
+                return
+            except InterruptedError:
+                continue
+
+    def cancel(self):
+        """Stop the calculation. May be called from any thread.
+
+        The running calculation raises ``InterruptedError`` as soon as it
+        runs Python code; :py:meth:`run` raises it in any case.
+        """
+        with _cancel_lock:
+            self._cancelled = True
+            if self._thread is not None:
+                _raise_in_thread(self._thread, InterruptedError)
+
+    def expected_duration(self):
+        """How long the calculation should take, going by the previous one.
+
+        Returns:
+            float or None: Seconds, or None if the network was not calculated
+                before.
+        """
+        return _durations.get(self.session.key)
+
+    def record_duration(self, seconds):
+        """Remember how long the calculation took, for the next estimate.
+
+        Args:
+            seconds: The duration.
+        """
+        _durations[self.session.key] = seconds
+
+    def edited(self):
+        """Whether the session changed since the snapshot was taken.
+
+        Returns:
+            bool: True if the results describe an older state of the network.
+                After :py:meth:`apply`, whether they did when applied.
+        """
+        if self._edited is not None:
+            return self._edited
+        return self.session.generation != self.generation \
+            or self.session.net is not self._source
+
+    def results(self):
+        """The entries the calculation produced.
+
+        Returns:
+            dict: ``{name: entry}`` to put into the session's network.
+        """
+        produced = {}
+        for name, value in self.net.items():
+            if _is_table(value) and not name.startswith(('res_', '_')):
+                continue  # The network's own tables
+            if name.startswith('res_') or self._given.get(name) is not value:
+                produced[name] = value
+        return produced
+
+    def apply(self, net=None):
+        """Put the results into the session's network, on the main thread.
+
+        The result tables are replaced rather than changed in place, so
+        scenarios sharing the old ones keep them.
+
+        Args:
+            net: The network the calculation returned, if it is not the
+                snapshot itself.
+        Returns:
+            NetworkChange: The change, already marked on the session.
+        """
+        if net is not None:
+            self.net = net
+        self.release()
+        self._edited = self.edited()
+        session = self.session
+        session.net.update(self.results())
+        change = NetworkChange.results_changed(session.net)
+        session.mark_dirty(change)
+        session.record_change(change)
+        return change
+
+    def release(self):
+        """Let edits change the session's tables in place again.
+
+        Called by :py:meth:`apply`; call it directly for a calculation that
+        failed or was cancelled.
+        """
+        if self._entries is not None:
+            self.session.release_capture(self._entries)
+            self._entries = None
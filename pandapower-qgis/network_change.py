@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+"""What changed in a shared network, carried by session change events.
+
+``NetworkSession.notify_changed()`` used to carry no payload, so every provider
+of a file had to assume that everything had changed: a single line edit rebuilt
+and repainted every bus layer. A :py:class:`NetworkChange` names the tables that
+were touched and, per table, the row ids that were added, removed or modified,
+plus whether results or geometry changed. A provider can then ignore an event
+for a table it does not show, patch only the affected rows, and keep its cached
+extent when nothing moved.
+
+Row id sets may be :py:data:`ALL_ROWS` when the producer cannot tell which rows
+changed (a power flow rewrites whole result tables), and a change built with
+:py:meth:`NetworkChange.all` (its ``everything`` flag set) stands for "assume
+anything changed", which is what a reload from disk amounts to.
+"""
+
+# Marker for "every row of this table", used instead of an id set when the
+# producer of a change cannot or need not enumerate the rows.
+ALL_ROWS = None
+
+# Kinds of row change, in the order they are reported.
+ADDED = 'added'
+REMOVED = 'removed'
+MODIFIED = 'modified'
+
+
+def _union(first, second):
+    """Union two id sets, where ALL_ROWS absorbs everything.
+
+    Args:
+        first: A set of ids, or ALL_ROWS.
+        second: A set of ids, or ALL_ROWS.
+    Returns:
+        set or None: The union, or ALL_ROWS if either side is ALL_ROWS.
+    """
+    if first is ALL_ROWS or second is ALL_ROWS:
+        return ALL_ROWS
+    return first | second
+
+
+class NetworkChange:
+    """The tables and rows affected by one or more edits of a network."""
+
+    def __init__(self, everything=False):
+        """Initialise an empty change. Prefer the constructors below.
+
+        Args:
+            everything: True for a change that invalidates the whole network.
+        """
+        self.everything = everything
+        # Per kind: {table: set of ids, or ALL_ROWS}.
+        self._rows = {ADDED: {}, REMOVED: {}, MODIFIED: {}}
+        # {table: set of column names, or None when unknown}. Only modified
+        # rows carry columns; added and removed rows affect every column.
+        self._columns = {}
+        self.results = False
+        self.geometry = False
+
+    # -- construction -----------------------------------------------------
+
+    @classmethod
+    def all(cls):
+        """A change that invalidates everything, e.g. a reload from disk.
+
+        Returns:
+            NetworkChange: The change.
+        """
+        return cls(everything=True)
+
+    @classmethod
+    def rows_added(cls, table, ids):
+        """Rows added to one table.
+
+        Args:
+            table: pandapower table name.
+            ids: Iterable of new row ids.
+        Returns:
+            NetworkChange: The change.
+        """
+        change = cls()
+        change.add_rows(ADDED, table, ids)
+        return change
+
+    @classmethod
+    def rows_removed(cls, table, ids):
+        """Rows removed from one table.
+
+        Args:
+            table: pandapower table name.
+            ids: Iterable of removed row ids.
+        Returns:
+            NetworkChange: The change.
+        """
+        change = cls()
+        change.add_rows(REMOVED, table, ids)
+        return change
+
+    @classmethod
+    def rows_modified(cls, table, ids, columns=None, geometry=False):
+        """Existing rows of one table whose values changed.
+
+        Args:
+            table: pandapower table name.
+            ids: Iterable of modified row ids, or ALL_ROWS.
+            columns: Names of the columns that changed, or None when unknown.
+            geometry: True when the change moved the rows' geometry.
+        Returns:
+            NetworkChange: The change.
+        """
+        change = cls()
+        change.add_rows(MODIFIED, table, ids, columns=columns)
+        change.geometry = geometry
+        return change
+
+    @classmethod
+    def results_changed(cls, net):
+        """Every result table rewritten, as after a power flow.
+
+        Args:
+            net: The network the calculation ran on.
+        Returns:
+            NetworkChange: The change.
+        """
+        change = cls()
+        change.results = True
+        for table in result_tables(net):
+            change.add_rows(MODIFIED, table, ALL_ROWS)
+        return change
+
+    @classmethod
+    def from_index_diff(cls, before, net):
+        """Describe the rows that appeared or vanished since a snapshot.
+
+        pandapower functions such as ``drop_buses`` cascade into other tables,
+        so the only reliable way to know what they removed is to compare the
+        table indices before and after.
+
+        Args:
+            before: Result of :py:func:`snapshot_indices` taken beforehand.
+            net: The network after the operation.
+        Returns:
+            NetworkChange: Rows added and removed, per table.
+        """
+        change = cls()
+        after = snapshot_indices(net)
+        for table in set(before) | set(after):
+            old = before.get(table)
+            new = after.get(table)
+            if old is None or new is None:
+                # A table that appeared or disappeared wholesale.
+                change.add_rows(MODIFIED, table, ALL_ROWS)
+                continue
+            removed = old.difference(new)
+            added = new.difference(old)
+            if len(removed):
+                change.add_rows(REMOVED, table, removed)
+            if len(added):
+                change.add_rows(ADDED, table, added)
+        return change
+
+    def add_rows(self, kind, table, ids, columns=None):
+        """Record rows of one table as added, removed or modified.
+
+        Args:
+            kind: ADDED, REMOVED or MODIFIED.
+            table: pandapower table name.
+            ids: Iterable of row ids, or ALL_ROWS.
+            columns: For MODIFIED, the names of the columns that changed, or
+                None when unknown.
+        """
+        ids = ALL_ROWS if ids is ALL_ROWS else {_plain_id(i) for i in ids}
+        rows = self._rows[kind]
+        rows[table] = _union(rows.get(table, set()), ids)
+
+        if kind == MODIFIED:
+            known = self._columns.get(table, set())
+            if columns is None or known is None:
+                self._columns[table] = None
+            else:
+                self._columns[table] = known | set(columns)
+
+        if table.startswith('res_'):
+            self.results = True
+
+    def merge(self, other):
+        """Fold another change into this one.
+
+        Args:
+            other: NetworkChange to merge, or None.
+        Returns:
+            NetworkChange: This change, for chaining.
+        """
+        if other is None:
+            return self
+        self.everything = self.everything or other.everything
+        self.results = self.results or other.results
+        self.geometry = self.geometry or other.geometry
+        for kind, tables in other._rows.items():
+            for table, ids in tables.items():
+                mine = self._rows[kind]
+                mine[table] = _union(mine.get(table, set()), ids)
+        for table, columns in other._columns.items():
+            known = self._columns.get(table, set())
+            if columns is None or known is None:
+                self._columns[table] = None
+            else:
+                self._columns[table] = known | columns
+        return self
+
+    # -- queries ----------------------------------------------------------
+
+    @property
+    def tables(self):
+        """Names of every table this change touches.
+
+        Returns:
+            set: Table names. Empty for a change built with :py:meth:`all`,
+                which touches everything; check :py:attr:`everything` first.
+        """
+        names = set()
+        for tables in self._rows.values():
+            names.update(tables)
+        return names
+
+    def is_empty(self):
+        """Whether the change affects nothing at all.
+
+        Returns:
+            bool: True when no table is touched.
+        """
+        return not self.everything and not self.tables
+
+    def touches(self, table):
+        """Whether a table is affected.
+
+        Args:
+            table: pandapower table name.
+        Returns:
+            bool: True if any row of the table changed.
+        """
+        return self.everything or table in self.tables
+
+    def touches_column(self, table, column):
+        """Whether a column of a table may have changed.
+
+        Added and removed rows count as a change to every column.
+
+        Args:
+            table: pandapower table name.
+            column: Column name.
+        Returns:
+            bool: True if the column may hold new values.
+        """
+        if self.everything:
+            return True
+        if table in self._rows[ADDED] or table in self._rows[REMOVED]:
+            return True
+        if table not in self._rows[MODIFIED]:
+            return False
+        columns = self._columns.get(table)
+        return columns is None or column in columns
+
+    def rows(self, kind, table):
+        """Row ids of one kind of change to one table.
+
+        Args:
+            kind: ADDED, REMOVED or MODIFIED.
+            table: pandapower table name.
+        Returns:
+            set or None: The ids, an empty set if none, or ALL_ROWS.
+        """
+        if self.everything:
+            return ALL_ROWS
+        return self._rows[kind].get(table, set())
+
+    def modified_columns(self, table):
+        """Columns of a table whose values were modified.
+
+        Args:
+            table: pandapower table name.
+        Returns:
+            set or None: The column names, an empty set if no row of the
+                table was modified, or None when unknown.
+        """
+        if self.everything:
+            return None
+        if table not in self._rows[MODIFIED]:
+            return set()
+        return self._columns.get(table)
+
+    def affected_rows(self, table):
+        """Every row id of a table touched in any way.
+
+        Args:
+            table: pandapower table name.
+        Returns:
+            set or None: The ids, or ALL_ROWS.
+        """
+        ids = set()
+        for kind in (ADDED, REMOVED, MODIFIED):
+            ids = _union(ids, self.rows(kind, table))
+        return ids
+
+    def __repr__(self):
+        if self.everything:
+            return '<NetworkChange everything>'
+
+        def describe(ids):
+            return 'all' if ids is ALL_ROWS else len(ids)
+
+        parts = []
+        for kind, tables in self._rows.items():
+            for table, ids in sorted(tables.items()):
+                parts.append('{} {}={}'.format(kind, table, describe(ids)))
+        if self.geometry:
+            parts.append('geometry')
+        return '<NetworkChange {}>'.format(', '.join(parts) or 'empty')
+
+
+def _plain_id(value):
+    """Turn a numpy integer id into a plain int so ids compare and hash alike.
+
+    Args:
+        value: A row id.
+    Returns:
+        The id, as an int where possible.
+    """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def result_tables(net):
+    """List the ``res_*`` tables of a network.
+
+    Args:
+        net: A pandapower network.
+    Returns:
+        list: Names of the result tables present on the network.
+    """
+    return [name for name in net.keys()
+            if name.startswith('res_') and hasattr(net[name], 'index')]
+
+
+def snapshot_indices(net):
+    """Record the row ids of every table, for :py:meth:`from_index_diff`.
+
+    Only the index objects are kept, which pandas never mutates in place, so
+    the snapshot costs references rather than copies.
+
+    Args:
+        net: A pandapower network.
+    Returns:
+        dict: ``{table: pandas.Index}``.
+    """
+    return {name: value.index for name, value in net.items()
+            if not name.startswith('_') and hasattr(value, 'index')
+            and hasattr(value, 'columns')}
@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+"""Holding a loaded network in less memory.
+
+``pandapower.from_json`` builds every table the way pandas reads JSON: each
+string cell is an object of its own, even where a column holds the same three
+standard type names a million times, and every index and bus reference is a
+64-bit integer. A large model needs several times its file size in memory.
+
+Compaction, switched on by the user (:py:func:`configure`), shrinks a network
+right after it was loaded, without changing a single value:
+
+* In a string column with few distinct values (``std_type``, ``type``,
+  ``zone``), equal strings become one shared object. The column stays an
+  object column. Categoricals would save a little more, but pandapower's
+  ``create_*`` functions cannot add a value a categorical does not know yet,
+  so adding a feature would fail.
+* Integer columns and indices - the bus references (``bus``, ``from_bus``,
+  ``hv_bus``, ...), ``element`` and the row ids - become 32-bit where every
+  value fits.
+
+Writes must still produce the file the network came from, so the original
+dtypes are kept in the network itself, under :py:data:`COMPACTION_KEY`.
+pandapower does not write entries starting with ``_``, and the writers in
+``network_io`` and ``network_store`` use the record to restore each table as
+they encode it. The record also holds the memory the network took before and
+after compaction, for the memory report.
+
+The GeoJSON ``geo`` column is left alone: every value differs, and the
+geometry readers expect GeoJSON strings there.
+
+This module is Qt-free, like ``network_session``.
+"""
+
+import sys
+
+import numpy as np
+import pandas as pd
+
+# Network entry holding the original dtypes and the memory report.
+COMPACTION_KEY = '_compaction'
+
+# Key of the index in a table's record; no column can be named None.
+INDEX = None
+
+# Columns with at most this share of distinct values get shared strings.
+SHARE_MAX_DISTINCT = 0.5
+
+_INT32 = np.iinfo(np.int32)
+
+# Whether networks are compacted after loading; off unless the user enables it.
+_enabled = False
+
+
+def configure(enabled):
+    """Switch compaction of newly loaded networks on or off.
+
+    Networks already open stay as they are.
+
+    Args:
+        enabled: True to compact networks after loading.
+    """
+    global _enabled
+    _enabled = bool(enabled)
+
+
+def enabled():
+    """Whether networks are compacted after loading.
+
+    Returns:
+        bool: The setting.
+    """
+    return _enabled
+
+
+def measure(entries):
+    """Measure the memory held by the tables of a network.
+
+    Unlike ``DataFrame.memory_usage(deep=True)``, an object shared by several
+    cells is counted once, so the saving of shared strings shows.
+
+    Args:
+        entries: Iterable of network entries, e.g. ``net.values()``.
+    Returns:
+        int: Size in bytes.
+    """
+    total = 0
+    for value in entries:
+        if not isinstance(value, pd.DataFrame):
+            continue
+        total += int(value.memory_usage(index=True, deep=False).sum())
+        for column in value.columns[value.dtypes == object]:
+            seen = {}
+            for cell in value[column].to_numpy():
+                seen[id(cell)] = cell
+            total += sum(sys.getsizeof(cell) for cell in seen.values())
+    return total
+
+
+def _share_strings(frame, column):
+    """Make equal strings of a column one shared object, in place.
+
+    Args:
+        frame: The table.
+        column: Name of an object column.
+    """
+    series = frame[column]
+    if not len(series) or pd.api.types.infer_dtype(
+            series, skipna=True) != 'string':
+        return
+    codes, uniques = pd.factorize(series.to_numpy(), use_na_sentinel=True)
+    if len(uniques) > SHARE_MAX_DISTINCT * len(series):
+        return
+    values = series.to_numpy()
+    # Missing cells keep what they held (None or NaN).
+    shared = np.where(codes >= 0, uniques.take(np.maximum(codes, 0)), values)
+    frame[column] = pd.Series(shared, index=frame.index, dtype=object)
+
+
+def _fits_int32(values):
+    """Whether integer values survive a conversion to 32 bits.
+
+    Args:
+        values: Integer Series or Index.
+    Returns:
+        bool: True if every value lies in the 32-bit range.
+    """
+    return not len(values) or (values.min() >= _INT32.min
+                               and values.max() <= _INT32.max)
+
+
+def compact_table(frame, record):
+    """Compact one table in place.
+
+    Args:
+        frame: The DataFrame.
+        record: ``{column: original dtype}`` of the table, updated here. A
+            column recorded already keeps its original dtype.
+    """
+    for column in frame.columns:
+        dtype = frame[column].dtype
+        if dtype == object:
+            _share_strings(frame, column)
+        elif dtype in (np.int64, np.uint64) and _fits_int32(frame[column]):
+            record.setdefault(column, str(dtype))
+            frame[column] = frame[column].astype(np.int32)
+    if frame.index.dtype in (np.int64, np.uint64) \
+            and _fits_int32(frame.index):
+        record.setdefault(INDEX, str(frame.index.dtype))
+        frame.index = frame.index.astype(np.int32)
+
+
+def compact_network(net):
+    """Compact every table of a network in place, and record how.
+
+    Running it again on a compacted network compacts only what changed since.
+
+    Args:
+        net: The pandapower network.
+    Returns:
+        dict: The record stored under :py:data:`COMPACTION_KEY`.
+    """
+    tables = [(name, value) for name, value in net.items()
+              if not name.startswith('_') and isinstance(value, pd.DataFrame)]
+    record = net.get(COMPACTION_KEY)
+    if record is None:
+        record = {'dtypes': {}, 'before': measure(
+            value for _, value in tables)}
+    for name, value in tables:
+        compact_table(value, record['dtypes'].setdefault(name, {}))
+    record['after'] = measure(value for _, value in tables)
+    net[COMPACTION_KEY] = record
+    return record
+
+
+def original_dtypes(frame, dtypes):
+    """The column dtypes a table had before it was compacted.
+
+    Args:
+        frame: The table.
+        dtypes: Its record, ``{column: original dtype}``, or None.
+    Returns:
+        pandas.Series: dtype per column, like ``DataFrame.dtypes``.
+    """
+    current = frame.dtypes
+    if not dtypes:
+        return current
+    return pd.Series({column: pd.api.types.pandas_dtype(dtypes[column])
+                      if column in dtypes else current[column]
+                      for column in frame.columns}, dtype=object)
+
+
+def expand_table(frame, dtypes):
+    """Restore the original dtypes of a compacted table.
+
+    Args:
+        frame: The compacted table, left unchanged.
+        dtypes: Its record, ``{column: original dtype}``, or None.
+    Returns:
+        pandas.DataFrame: ``frame`` itself when nothing is compacted, else a
+            copy with the original dtypes.
+    """
+    if not dtypes:
+        return frame
+    columns = {column: dtype for column, dtype in dtypes.items()
+               if column is not INDEX and column in frame.columns
+               and str(frame[column].dtype) != dtype}
+    index = dtypes.get(INDEX)
+    if not columns and (index is None or str(frame.index.dtype) == index):
+        return frame
+    expanded = frame.astype(columns) if columns else frame.copy()
+    if index is not None and str(frame.index.dtype) != index:
+        expanded.index = expanded.index.astype(index)
+    return expanded
+
+
+def expander(net):
+    """Make a function that restores any compacted table of a network.
+
+    The writers call it on each table just before encoding it, so only one
+    expanded table exists at a time.
+
+    Args:
+        net: The network about to be written.
+    Returns:
+        callable: Takes a network entry and returns it with its original
+            dtypes; other entries are returned unchanged.
+    """
+    record = net.get(COMPACTION_KEY)
+    if not record:
+        return lambda value: value
+    by_id = {id(net[name]): dtypes for name, dtypes in record['dtypes'].items()
+             if name in net and dtypes}
+
+    def expand(value):
+        dtypes = by_id.get(id(value))
+        return value if dtypes is None else expand_table(value, dtypes)
+    return expand
+
+
+def table_dtypes(net, name):
+    """The original dtypes recorded for one table of a network.
+
+    Args:
+        net: The network.
+        name: Table name.
+    Returns:
+        dict or None: ``{column: original dtype}``, or None if the table was
+            not compacted.
+    """
+    record = net.get(COMPACTION_KEY) if net is not None else None
+    return record['dtypes'].get(name) if record else None
+
+
+class MemoryReport:
+    """Memory a network took before and after compaction."""
+
+    def __init__(self, before, after):
+        """Initialise the report.
+
+        Args:
+            before: Bytes before compaction.
+            after: Bytes after compaction.
+        """
+        self.before = before
+        self.after = after
+
+    @classmethod
+    def of(cls, net):
+        """The report of a compacted network.
+
+        Args:
+            net: The network.
+        Returns:
+            MemoryReport or None: None if the network was not compacted.
+        """
+        record = net.get(COMPACTION_KEY) if net is not None else None
+        if not record:
+            return None
+        return cls(record['before'], record['after'])
+
+    def saved(self):
+        """Bytes compaction saved.
+
+        Returns:
+            int: The difference, never negative.
+        """
+        return max(0, self.before - self.after)
+
+    def describe(self):
+        """Summarise the report for a message box.
+
+        Returns:
+            str: e.g. '1.2 GB before compaction, 700.0 MB after (42% less).'
+        """
+        share = 100.0 * self.saved() / self.before if self.before else 0.0
+        return '{} before compaction, {} after ({:.0f}% less).'.format(
+            format_bytes(self.before), format_bytes(self.after), share)
+
+
+def format_bytes(size):
+    """Format a byte count for people.
+
+    Args:
+        size: Bytes.
+    Returns:
+        str: e.g. '512.0 MB'.
+    """
+    for unit in ('bytes', 'KB', 'MB', 'GB'):
+        if abs(size) < 1024 or unit == 'GB':
+            return ('{:.0f} {}' if unit == 'bytes' else '{:.1f} {}').format(
+                size, unit)
+        size /= 1024.0
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""Compressed network files: ``.json.gz`` and ``.json.zst``.
+
+A pandapower JSON file is mostly repetitive text (column names, ``null``, the
+escaped JSON of every table) and shrinks ten to twenty times when compressed.
+On a network share, reading the compressed file and decompressing it is
+several times faster than reading the plain one.
+
+Compressed files are recognised by their magic bytes, not their name, so a
+renamed file still opens.
+A new file is compressed according to its suffix; an existing file keeps the
+compression it already has when it is saved.
+
+Everything here streams: files are decompressed and compressed in blocks, and
+:py:func:`write_text` hands the compressor one table at a time from
+``network_io.stream_json``. gzip needs only the standard library; zstd needs
+the optional ``zstandard`` package.
+
+This module is Qt-free, like ``network_session``.
+"""
+
+import contextlib
+import gzip
+import io
+import os
+import shutil
+import tempfile
+
+GZIP = 'gzip'
+ZSTD = 'zstd'
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+# Suffixes of the network files the Browser and the file dialogs offer.
+COMPRESSED_SUFFIXES = {'.json.gz': GZIP, '.json.zst': ZSTD}
+JSON_SUFFIXES = ('.json',) + tuple(COMPRESSED_SUFFIXES)
+
+# gzip level 6 is gzip's own default; zstd level 3 is zstd's. Both favour
+# speed, since a save should not take noticeably longer than before.
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+# Block size used when copying decompressed data.
+COPY_BLOCK_BYTES = 1 << 20
+
+
+def _zstandard():
+    """Import the optional zstandard package.
+
+    Returns:
+        module: ``zstandard``.
+    Raises:
+        ImportError: With an explanation, if it is not installed.
+    """
+    try:
+        import zstandard
+    except ImportError as error:
+        raise ImportError(
+            'Reading and writing .json.zst networks needs the "zstandard" '
+            'package. Install it into the Python environment of QGIS.'
+        ) from error
+    return zstandard
+
+
+def detect_compression(path):
+    """Tell from a file's first bytes whether and how it is compressed.
+
+    Args:
+        path: Path of the file.
+    Returns:
+        str or None: GZIP, ZSTD, or None for an uncompressed (or unreadable)
+            file.
+    """
+    try:
+        with open(path, 'rb') as handle:
+            head = handle.read(len(ZSTD_MAGIC))
+    except OSError:
+        return None
+    if head.startswith(GZIP_MAGIC):
+        return GZIP
+    if head.startswith(ZSTD_MAGIC):
+        return ZSTD
+    return None
+
+
+def compression_for_suffix(path):
+    """The compression a new file gets from its name.
+
+    Args:
+        path: Path of the file to write.
+    Returns:
+        str or None: GZIP, ZSTD, or None for plain JSON.
+    """
+    lower = path.lower()
+    for suffix, compression in COMPRESSED_SUFFIXES.items():
+        if lower.endswith(suffix):
+            return compression
+    return None
+
+
+def compression_for_write(path):
+    """The compression to save a network file with.
+
+    An existing file keeps its compression whatever its name; a new file
+    follows its suffix.
+
+    Args:
+        path: Path of the file to write.
+    Returns:
+        str or None: GZIP, ZSTD, or None for plain JSON.
+    """
+    if os.path.isfile(path):
+        return detect_compression(path)
+    return compression_for_suffix(path)
+
+
+def is_network_file_name(path):
+    """Whether a file name looks like a JSON network, compressed or not.
+
+    Args:
+        path: File path or name.
+    Returns:
+        bool: True for ``.json``, ``.json.gz`` and ``.json.zst``.
+    """
+    return bool(path) and path.lower().endswith(JSON_SUFFIXES)
+
+
+def network_stem(path):
+    """A network file's name without its extensions.
+
+    Args:
+        path: File path.
+    Returns:
+        str: e.g. 'grid' for '/data/grid.json.gz'.
+    """
+    name = os.path.basename(path)
+    lower = name.lower()
+    for suffix in sorted(JSON_SUFFIXES, key=len, reverse=True):
+        if lower.endswith(suffix):
+            return name[:-len(suffix)]
+    return os.path.splitext(name)[0]
+
+
+def open_binary(path):
+    """Open a network file for reading, decompressing it on the fly.
+
+    Args:
+        path: Path of the file.
+    Returns:
+        A binary file object yielding the uncompressed bytes.
+    Raises:
+        OSError: If the file cannot be opened.
+        ImportError: For a zstd file without the zstandard package.
+    """
+    compression = detect_compression(path)
+    if compression == GZIP:
+        return gzip.open(path, 'rb')
+    if compression == ZSTD:
+        zstandard = _zstandard()
+        handle = open(path, 'rb')
+        return zstandard.ZstdDecompressor().stream_reader(
+            handle, closefd=True)
+    return open(path, 'rb')
+
+
+def open_text(path, errors='strict'):
+    """Open a network file as text, decompressing it on the fly.
+
+    Args:
+        path: Path of the file.
+        errors: Decoding error handling, as for ``open``.
+    Returns:
+        A text file object.
+    """
+    return io.TextIOWrapper(open_binary(path), encoding='utf-8',
+                            errors=errors)
+
+
+def write_binary(handle, compression, write):
+    """Write bytes through a compressor into an open binary file.
+
+    The binary file stays open, so the caller can still sync it to disk.
+
+    Args:
+        handle: Binary file object opened for writing.
+        compression: GZIP, ZSTD, or None to write the bytes uncompressed.
+        write: Callable taking a binary file object and writing to it.
+    """
+    if compression == GZIP:
+        # GzipFile never closes a file object it was given.
+        compressor = gzip.GzipFile(fileobj=handle, mode='wb',
+                                   compresslevel=GZIP_LEVEL)
+    elif compression == ZSTD:
+        compressor = _zstandard().ZstdCompressor(
+            level=ZSTD_LEVEL).stream_writer(handle, closefd=False)
+    else:
+        compressor = handle
+
+    write(compressor)
+    # Closing the compressor writes its final block.
+    if compressor is not handle:
+        compressor.close()
+
+
+def write_text(handle, compression, write):
+    """Write text through a compressor into an open binary file.
+
+    Args:
+        handle: Binary file object opened for writing.
+        compression: GZIP, ZSTD, or None to write the text uncompressed.
+        write: Callable taking a text file object and writing to it.
+    """
+    def write_encoded(binary):
+        text = io.TextIOWrapper(binary, encoding='utf-8')
+        write(text)
+        text.flush()
+        # Detach so that the text layer does not close the binary one.
+        text.detach()
+
+    write_binary(handle, compression, write_encoded)
+
+
+@contextlib.contextmanager
+def plain_copy(path):
+    """Give a path to the uncompressed content of a network file.
+
+    Scanners that map a file into memory (``network_lazy``, ``network_index``)
+    need the plain bytes on disk. A compressed file is decompressed block by
+    block into a temporary file, removed again on exit.
+
+    Args:
+        path: Path of the network file.
+    Yields:
+        str: ``path`` itself for an uncompressed file, else the temporary file.
+    """
+    if detect_compression(path) is None:
+        yield path
+        return
+
+    handle, temp_path = tempfile.mkstemp(suffix='.json')
+    try:
+        with os.fdopen(handle, 'wb') as target, open_binary(path) as source:
+            shutil.copyfileobj(source, target, COPY_BLOCK_BYTES)
+        yield temp_path
+    finally:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
@@ -0,0 +1,840 @@
+# -*- coding: utf-8 -*-
+"""Networks kept in a GeoPackage or SQLite database, saved row by row.
+
+JSON files and ``.ppnet`` stores are rewritten per save - whole, or table by
+table. A network in a database is saved in proportion to the edit: a commit
+deletes, updates and inserts exactly the rows it touched, in one transaction.
+The same path and URI scheme as for files applies:
+
+    grid.gpkg       (or grid.sqlite)
+    ├── pandapower_network          format, kind, table manifest, and the
+    │                               rest of the network as pandapower JSON
+    ├── bus, line, load, ...        one table per pandapower table
+    ├── rtree_bus_geom, ...         spatial indexes
+    └── gpkg_contents, ...          GeoPackage metadata
+
+Each pandapower table becomes a database table whose ``fid`` integer primary
+key is the pandapower index, with one typed column per pandapower column.
+``bus`` and ``line`` (``junction`` and ``pipe`` for pipe networks) also get a
+native ``geom`` column, derived from ``geo``, with an R*Tree spatial index, so
+the tables can be rendered straight from the file by QGIS or any other
+GeoPackage reader. ``geo`` itself is kept next to it, which lets the network
+round-trip exactly. A table that cannot be stored that way - a column of
+controller objects, say - stays in full in the network's JSON, like in a
+``.ppnet`` store.
+
+Loading reads only the tables asked for: the manifest lists every table with
+its row count and dtypes, and a lazy network (see ``network_lazy``) selects a
+table when a layer first asks for it.
+
+The spatial indexes are kept current by the triggers the GeoPackage standard
+defines. They call ``ST_MinX`` and friends, which QGIS and GDAL provide and
+:py:func:`connect` registers; other SQLite clients cannot edit those tables.
+
+This module is Qt-free, like ``network_session``.
+"""
+
+import contextlib
+import copy
+import json
+import os
+import sqlite3
+import struct
+import tempfile
+
+from .network_change import ADDED, ALL_ROWS, MODIFIED, REMOVED
+
+# File name suffixes of a network database.
+DATABASE_SUFFIXES = ('.gpkg', '.sqlite')
+
+# Key/value table holding everything that is not a table of its own.
+META_TABLE = 'pandapower_network'
+
+# Identifies a database written by this module; bumped on layout changes.
+DATABASE_FORMAT = 'pandapower-sqlite'
+DATABASE_FORMAT_VERSION = 1
+
+# Primary key column, holding the pandapower index.
+FID_COLUMN = 'fid'
+GEOMETRY_COLUMN = 'geom'
+
+# Tables that get a native geometry column, and its type. Lines are always
+# stored as multi-lines, so a table never mixes the two.
+GEOMETRY_TABLES = {'bus': 'POINT', 'junction': 'POINT',
+                   'line': 'MULTILINESTRING', 'pipe': 'MULTILINESTRING'}
+
+# 'GPKG' and GeoPackage 1.2, written to the file header of a .gpkg.
+GPKG_APPLICATION_ID = 0x47504B47
+GPKG_USER_VERSION = 10200
+
+# Ids per statement when selecting rows by id, below SQLite's variable limit.
+_CHUNK = 500
+
+_WGS84 = ('GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,'
+          '298.257223563,AUTHORITY["EPSG","7030"]],AUTHORITY["EPSG","6326"]],'
+          'PRIMEM["Greenwich",0,AUTHORITY["EPSG","8901"]],UNIT["degree",'
+          '0.0174532925199433,AUTHORITY["EPSG","9122"]],'
+          'AUTHORITY["EPSG","4326"]]')
+
+_GEOPACKAGE_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS gpkg_spatial_ref_sys ('
+    'srs_name TEXT NOT NULL, srs_id INTEGER PRIMARY KEY, '
+    'organization TEXT NOT NULL, organization_coordsys_id INTEGER NOT NULL, '
+    'definition TEXT NOT NULL, description TEXT)',
+    'CREATE TABLE IF NOT EXISTS gpkg_contents ('
+    'table_name TEXT NOT NULL PRIMARY KEY, data_type TEXT NOT NULL, '
+    'identifier TEXT UNIQUE, description TEXT DEFAULT \'\', '
+    'last_change DATETIME NOT NULL DEFAULT '
+    '(strftime(\'%Y-%m-%dT%H:%M:%fZ\', \'now\')), '
+    'min_x DOUBLE, min_y DOUBLE, max_x DOUBLE, max_y DOUBLE, srs_id INTEGER, '
+    'CONSTRAINT fk_gc_r_srs_id FOREIGN KEY (srs_id) '
+    'REFERENCES gpkg_spatial_ref_sys(srs_id))',
+    'CREATE TABLE IF NOT EXISTS gpkg_geometry_columns ('
+    'table_name TEXT NOT NULL, column_name TEXT NOT NULL, '
+    'geometry_type_name TEXT NOT NULL, srs_id INTEGER NOT NULL, '
+    'z TINYINT NOT NULL, m TINYINT NOT NULL, '
+    'CONSTRAINT pk_geom_cols PRIMARY KEY (table_name, column_name), '
+    'CONSTRAINT uk_gc_table_name UNIQUE (table_name), '
+    'CONSTRAINT fk_gc_tn FOREIGN KEY (table_name) '
+    'REFERENCES gpkg_contents(table_name), '
+    'CONSTRAINT fk_gc_srs FOREIGN KEY (srs_id) '
+    'REFERENCES gpkg_spatial_ref_sys (srs_id))',
+    'CREATE TABLE IF NOT EXISTS gpkg_extensions ('
+    'table_name TEXT, column_name TEXT, extension_name TEXT NOT NULL, '
+    'definition TEXT NOT NULL, scope TEXT NOT NULL, '
+    'CONSTRAINT ge_tce UNIQUE (table_name, column_name, extension_name))',
+    'CREATE TABLE IF NOT EXISTS {} ('
+    'name TEXT NOT NULL PRIMARY KEY, value TEXT)'.format(META_TABLE),
+)
+
+# The R*Tree triggers of the GeoPackage standard, filled in per table with
+# t (table), c (geometry column), i (primary key) and r (R*Tree table).
+_RTREE_TRIGGERS = (
+    'CREATE TRIGGER "{r}_insert" AFTER INSERT ON "{t}" '
+    'WHEN (NEW."{c}" NOT NULL AND NOT ST_IsEmpty(NEW."{c}")) BEGIN '
+    'INSERT OR REPLACE INTO "{r}" VALUES (NEW."{i}", ST_MinX(NEW."{c}"), '
+    'ST_MaxX(NEW."{c}"), ST_MinY(NEW."{c}"), ST_MaxY(NEW."{c}")); END',
+    'CREATE TRIGGER "{r}_update1" AFTER UPDATE OF "{c}" ON "{t}" '
+    'WHEN OLD."{i}" = NEW."{i}" AND '
+    '(NEW."{c}" NOTNULL AND NOT ST_IsEmpty(NEW."{c}")) BEGIN '
+    'INSERT OR REPLACE INTO "{r}" VALUES (NEW."{i}", ST_MinX(NEW."{c}"), '
+    'ST_MaxX(NEW."{c}"), ST_MinY(NEW."{c}"), ST_MaxY(NEW."{c}")); END',
+    'CREATE TRIGGER "{r}_update2" AFTER UPDATE OF "{c}" ON "{t}" '
+    'WHEN OLD."{i}" = NEW."{i}" AND '
+    '(NEW."{c}" ISNULL OR ST_IsEmpty(NEW."{c}")) BEGIN '
+    'DELETE FROM "{r}" WHERE id = OLD."{i}"; END',
+    'CREATE TRIGGER "{r}_update3" AFTER UPDATE ON "{t}" '
+    'WHEN OLD."{i}" != NEW."{i}" AND '
+    '(NEW."{c}" NOTNULL AND NOT ST_IsEmpty(NEW."{c}")) BEGIN '
+    'DELETE FROM "{r}" WHERE id = OLD."{i}"; '
+    'INSERT OR REPLACE INTO "{r}" VALUES (NEW."{i}", ST_MinX(NEW."{c}"), '
+    'ST_MaxX(NEW."{c}"), ST_MinY(NEW."{c}"), ST_MaxY(NEW."{c}")); END',
+    'CREATE TRIGGER "{r}_update4" AFTER UPDATE ON "{t}" '
+    'WHEN OLD."{i}" != NEW."{i}" AND '
+    '(NEW."{c}" ISNULL OR ST_IsEmpty(NEW."{c}")) BEGIN '
+    'DELETE FROM "{r}" WHERE id IN (OLD."{i}", NEW."{i}"); END',
+    'CREATE TRIGGER "{r}_delete" AFTER DELETE ON "{t}" '
+    'WHEN OLD."{c}" NOT NULL BEGIN '
+    'DELETE FROM "{r}" WHERE id = OLD."{i}"; END',
+)
+
+
+class DatabaseError(ValueError):
+    """A database is not a pandapower network this version can read."""
+
+
+def is_database_path(path):
+    """Whether a path names a network database, judged by its suffix.
+
+    Args:
+        path: File system path.
+    Returns:
+        bool: True for a ``.gpkg`` or ``.sqlite`` path.
+    """
+    return bool(path) and path.lower().endswith(DATABASE_SUFFIXES)
+
+
+def _quote(name):
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+def _rtree_name(table):
+    return 'rtree_{}_{}'.format(table, GEOMETRY_COLUMN)
+
+
+# -- geometry --------------------------------------------------------------
+
+def _envelope(blob):
+    """Read the bounding box of a GeoPackage geometry blob.
+
+    Args:
+        blob: The blob, or None.
+    Returns:
+        tuple or None: ``(min_x, max_x, min_y, max_y)``, or None for a
+            missing or empty geometry, or one this module cannot read.
+    """
+    if not isinstance(blob, bytes) or len(blob) < 8 or blob[:2] != b'GP':
+        return None
+    flags = blob[3]
+    if flags & 0x10:
+        return None
+    order = '<' if flags & 0x01 else '>'
+    if (flags >> 1) & 0x07:
+        return struct.unpack_from(order + '4d', blob, 8)
+    # Without an envelope (optional for points), a point is its own.
+    wkb = blob[8:]
+    if len(wkb) < 21:
+        return None
+    order = '<' if wkb[0] == 1 else '>'
+    if struct.unpack_from(order + 'I', wkb, 1)[0] % 1000 != 1:
+        return None
+    x, y = struct.unpack_from(order + '2d', wkb, 5)
+    return x, x, y, y
+
+
+def _envelope_function(position):
+    def function(blob):
+        envelope = _envelope(blob)
+        return None if envelope is None else envelope[position]
+    return function
+
+
+def _is_empty(blob):
+    if not isinstance(blob, bytes) or len(blob) < 4:
+        return None
+    return int(bool(blob[3] & 0x10))
+
+
+def _register_functions(connection):
+    """Provide the spatial functions the R*Tree triggers call."""
+    connection.create_function('ST_IsEmpty', 1, _is_empty,
+                               deterministic=True)
+    for position, name in enumerate(('ST_MinX', 'ST_MaxX',
+                                     'ST_MinY', 'ST_MaxY')):
+        connection.create_function(name, 1, _envelope_function(position),
+                                   deterministic=True)
+
+
+def geometry_blob(geo, srs_id):
+    """Encode a pandapower ``geo`` cell as a GeoPackage geometry blob.
+
+    Args:
+        geo: GeoJSON text of a Point, LineString or MultiLineString, or a
+            missing value.
+        srs_id: Spatial reference system id of the coordinates.
+    Returns:
+        bytes or None: The blob, with its envelope, or None if the cell
+            holds no geometry this module can encode.
+    """
+    if not isinstance(geo, str):
+        return None
+    try:
+        geometry = json.loads(geo)
+        kind = geometry['type']
+        coordinates = geometry['coordinates']
+        if kind == 'Point':
+            points = [coordinates[:2]]
+            wkb = struct.pack('<BI2d', 1, 1, *points[0])
+        else:
+            if kind == 'LineString':
+                coordinates = [coordinates]
+            elif kind != 'MultiLineString':
+                return None
+            points = [point[:2] for part in coordinates for point in part]
+            wkb = struct.pack('<BII', 1, 5, len(coordinates)) + b''.join(
+                struct.pack('<BII', 1, 2, len(part))
+                + b''.join(struct.pack('<2d', *point[:2]) for point in part)
+                for part in coordinates)
+    except (KeyError, TypeError, ValueError, struct.error):
+        return None
+    if not points:
+        return None
+    xs = [point[0] for point in points]
+    ys = [point[1] for point in points]
+    header = b'GP' + bytes((0, 0x03)) + struct.pack(
+        '<i4d', srs_id, min(xs), max(xs), min(ys), max(ys))
+    return header + wkb
+
+
+# -- reading ---------------------------------------------------------------
+
+@contextlib.contextmanager
+def connect(path, writable=False):
+    """Open a database, with the spatial functions registered.
+
+    Args:
+        path: Database path.
+        writable: False opens it read-only, which never creates a file.
+    Yields:
+        sqlite3.Connection: In autocommit mode; writers open transactions
+            themselves.
+    Raises:
+        DatabaseError: If the file cannot be opened.
+    """
+    try:
+        if writable:
+            connection = sqlite3.connect(path, isolation_level=None)
+        else:
+            from urllib.request import pathname2url
+
+            connection = sqlite3.connect(
+                'file:{}?mode=ro'.format(pathname2url(os.path.abspath(path))),
+                uri=True, isolation_level=None)
+    except sqlite3.Error as error:
+        raise DatabaseError('Cannot open {}: {}'.format(path, error)) \
+            from error
+    try:
+        _register_functions(connection)
+        yield connection
+    finally:
+        connection.close()
+
+
+def _read_meta(connection, path):
+    """Read the key/value table of a network database.
+
+    Args:
+        connection: Open connection.
+        path: Database path, for error messages.
+    Returns:
+        dict: ``{name: value}``.
+    Raises:
+        DatabaseError: If the database is not a network written by this
+            module, or by a newer version of it.
+    """
+    try:
+        meta = dict(connection.execute(
+            'SELECT name, value FROM {}'.format(META_TABLE)))
+    except sqlite3.Error as error:
+        raise DatabaseError('Not a pandapower network database: {} ({})'
+                            .format(path, error)) from error
+    if meta.get('format') != DATABASE_FORMAT:
+        raise DatabaseError('Not a pandapower network database: {}'
+                            .format(path))
+    if int(meta.get('format_version') or 0) > DATABASE_FORMAT_VERSION:
+        raise DatabaseError('{} was written by a newer version of the plugin.'
+                            .format(path))
+    return meta
+
+
+def read_manifest(path):
+    """Read what a network database holds, without reading any table.
+
+    Args:
+        path: Database path.
+    Returns:
+        dict: ``{'kind', 'pandapower_version', 'tables'}``, where ``tables``
+            maps each table name to its row count, storage (``'table'`` or
+            ``'json'``), columns and dtypes.
+    Raises:
+        DatabaseError: If the path is not a readable network database.
+    """
+    with connect(path) as connection:
+        meta = _read_meta(connection, path)
+    return {'kind': meta.get('kind'),
+            'pandapower_version': meta.get('pandapower_version', ''),
+            'tables': json.loads(meta.get('tables') or '{}')}
+
+
+def read_skeleton_text(path):
+    """Read the pandapower JSON of the entries that are not tables.
+
+    Args:
+        path: Database path.
+    Returns:
+        str: ``std_types``, scalar settings, and the tables kept as JSON.
+    """
+    with connect(path) as connection:
+        return _read_meta(connection, path)['network']
+
+
+def read_table(path, table, manifest=None):
+    """Read one table of a network database, without touching the others.
+
+    Rows come in index order.
+
+    Args:
+        path: Database path.
+        table: Table name.
+        manifest: The database's manifest, if already read.
+    Returns:
+        pandas.DataFrame or None: The table, or None if the database keeps it
+            in the network's JSON instead.
+    """
+    import pandas as pd
+
+    manifest = manifest or read_manifest(path)
+    entry = manifest['tables'].get(table)
+    if entry is None or entry.get('storage') != 'table':
+        return None
+
+    columns = entry['columns']
+    selected = ', '.join(_quote(name) for name in [FID_COLUMN] + columns)
+    with connect(path) as connection:
+        records = connection.execute('SELECT {} FROM {} ORDER BY {}'.format(
+            selected, _quote(table), _quote(FID_COLUMN))).fetchall()
+
+    frame = pd.DataFrame.from_records(records, columns=[FID_COLUMN] + columns)
+    index = pd.Index(frame.pop(FID_COLUMN).to_numpy(), dtype=entry['index'])
+    frame.index = index
+    # SQLite keeps no dtypes: integers come back for booleans, and an empty
+    # or all-missing column as objects.
+    for column, dtype in entry['dtype'].items():
+        if str(frame[column].dtype) != dtype:
+            try:
+                frame[column] = frame[column].astype(dtype)
+            except (TypeError, ValueError):
+                pass
+    return frame
+
+
+def load_database(path):
+    """Load a complete network from a database.
+
+    Args:
+        path: Database path.
+    Returns:
+        The network, converted to the running pandapower version.
+    Raises:
+        DatabaseError: If the database is not a network.
+    """
+    from .network_session import KIND_PIPES
+
+    manifest = read_manifest(path)
+    if manifest.get('kind') == KIND_PIPES:
+        from pandapipes.io.convert_format import convert_format
+        from pandapipes.io.file_io import from_json_string
+    else:
+        from pandapower.convert_format import convert_format
+        from pandapower.file_io import from_json_string
+
+    net = from_json_string(read_skeleton_text(path), convert=False)
+    for table, entry in manifest['tables'].items():
+        if entry.get('storage') == 'table':
+            net[table] = read_table(path, table, manifest)
+
+    convert_format(net)
+    return net
+
+
+def describe_database(path):
+    """List the tables of a database and their row counts, from the manifest.
+
+    Args:
+        path: Database path.
+    Returns:
+        dict: ``{table: rows}``.
+    """
+    return {table: entry.get('rows', 0)
+            for table, entry in read_manifest(path)['tables'].items()}
+
+
+def sniff_database_kind(path):
+    """Decide whether a database holds a network, from its manifest alone.
+
+    A GeoPackage that does not hold a pandapower network - most of them -
+    is not one.
+
+    Args:
+        path: Candidate path.
+    Returns:
+        str or None: The network kind, or None if not a network database.
+    """
+    if not is_database_path(path) or not os.path.isfile(path):
+        return None
+    try:
+        return read_manifest(path).get('kind')
+    except DatabaseError:
+        return None
+
+
+# -- writing ---------------------------------------------------------------
+
+def _is_table(value):
+    return hasattr(value, 'columns') and hasattr(value, 'index')
+
+
+def _column_types(frame):
+    """Choose the SQLite column type of every column of a table.
+
+    Args:
+        frame: The table.
+    Returns:
+        list: One declared type per column.
+    Raises:
+        TypeError: If a column cannot be stored as one SQLite column that
+            reads back exactly, such as a column of objects.
+    """
+    types = []
+    for name in frame.columns:
+        if not isinstance(name, str) or name in (FID_COLUMN, GEOMETRY_COLUMN):
+            raise TypeError('column {!r}'.format(name))
+        series = frame[name]
+        kind = series.dtype.kind
+        if kind == 'b':
+            types.append('BOOLEAN')
+        elif kind in 'iu':
+            # SQLite integers are signed 64-bit.
+            if kind == 'u' and series.dtype.itemsize == 8 and len(series) \
+                    and series.max() >= 1 << 63:
+                raise TypeError('column {!r} exceeds int64'.format(name))
+            types.append('INTEGER')
+        elif kind == 'f':
+            types.append('REAL')
+        elif kind == 'O' and all(isinstance(value, str)
+                                 for value in series.dropna()):
+            types.append('TEXT')
+        else:
+            raise TypeError('column {!r} of {}'.format(name, series.dtype))
+    return types
+
+
+def _records(frame, columns, geometry_srs=None):
+    """Turn rows into SQLite parameters: the id, the cells, the geometry.
+
+    Args:
+        frame: The rows.
+        columns: Columns to include, in order.
+        geometry_srs: SRS id to encode ``geo`` as a geometry with, or None
+            for no geometry.
+    Returns:
+        list: One tuple per row.
+    """
+    cells = frame[columns].astype(object)
+    cells = cells.where(frame[columns].notna(), None)
+    ids = [int(row) for row in frame.index]
+    rows = cells.itertuples(index=False, name=None)
+    if geometry_srs is None:
+        return [(row_id,) + row for row_id, row in zip(ids, rows)]
+    geo = frame['geo'] if 'geo' in frame.columns \
+        else [None] * len(frame)
+    return [(row_id,) + row + (geometry_blob(cell, geometry_srs),)
+            for row_id, row, cell in zip(ids, rows, geo)]
+
+
+def _ensure_srs(connection, srs_id):
+    """Register a spatial reference system the geometries refer to."""
+    if srs_id == 4326:
+        row = ('WGS 84 geodetic', 4326, 'EPSG', 4326, _WGS84)
+    else:
+        row = ('EPSG:{}'.format(srs_id), srs_id, 'EPSG', srs_id, 'undefined')
+    connection.execute('INSERT OR IGNORE INTO gpkg_spatial_ref_sys '
+                       '(srs_name, srs_id, organization, '
+                       'organization_coordsys_id, definition) '
+                       'VALUES (?, ?, ?, ?, ?)', row)
+
+
+def _create_geopackage(connection, path):
+    """Create the GeoPackage metadata tables of a new database."""
+    if path.lower().endswith('.gpkg'):
+        connection.execute('PRAGMA application_id = {}'.format(
+            GPKG_APPLICATION_ID))
+        connection.execute('PRAGMA user_version = {}'.format(
+            GPKG_USER_VERSION))
+    for statement in _GEOPACKAGE_SCHEMA:
+        connection.execute(statement)
+    connection.executemany(
+        'INSERT OR IGNORE INTO gpkg_spatial_ref_sys '
+        '(srs_name, srs_id, organization, organization_coordsys_id, '
+        'definition) VALUES (?, ?, ?, ?, ?)',
+        [('Undefined cartesian SRS', -1, 'NONE', -1, 'undefined'),
+         ('Undefined geographic SRS', 0, 'NONE', 0, 'undefined')])
+    _ensure_srs(connection, 4326)
+
+
+def _drop_table(connection, table):
+    """Remove a table, its spatial index and its metadata, if present."""
+    connection.execute('DROP TABLE IF EXISTS {}'.format(_quote(table)))
+    connection.execute('DROP TABLE IF EXISTS {}'.format(
+        _quote(_rtree_name(table))))
+    for metadata in ('gpkg_extensions', 'gpkg_geometry_columns',
+                     'gpkg_contents'):
+        connection.execute('DELETE FROM {} WHERE table_name = ?'
+                           .format(metadata), (table,))
+
+
+def _write_table(connection, table, frame, srs_id):
+    """Store a whole table, replacing what the database held for it.
+
+    Args:
+        connection: Connection inside a transaction.
+        table: Table name.
+        frame: The table, with its original dtypes.
+        srs_id: SRS id of the network's coordinates.
+    Returns:
+        dict or None: The table's manifest entry, or None if the table cannot
+            be stored as a database table and has to stay in the JSON.
+    """
+    try:
+        if frame.index.dtype.kind not in 'iu' or not frame.index.is_unique:
+            raise TypeError('index of {}'.format(frame.index.dtype))
+        types = _column_types(frame)
+        geometry = GEOMETRY_TABLES.get(table)
+        records = _records(frame, list(frame.columns),
+                           srs_id if geometry else None)
+    except TypeError:
+        _drop_table(connection, table)
+        return None
+
+    _drop_table(connection, table)
+    definitions = ['{} INTEGER PRIMARY KEY NOT NULL'.format(
+        _quote(FID_COLUMN))]
+    definitions += ['{} {}'.format(_quote(name), declared)
+                    for name, declared in zip(frame.columns, types)]
+    if geometry:
+        definitions.append('{} {}'.format(_quote(GEOMETRY_COLUMN), geometry))
+    connection.execute('CREATE TABLE {} ({})'.format(
+        _quote(table), ', '.join(definitions)))
+
+    connection.execute(
+        'INSERT INTO gpkg_contents (table_name, data_type, identifier, '
+        'srs_id) VALUES (?, ?, ?, ?)',
+        (table, 'features' if geometry else 'attributes', table,
+         srs_id if geometry else None))
+    if geometry:
+        _ensure_srs(connection, srs_id)
+        connection.execute(
+            'INSERT INTO gpkg_geometry_columns VALUES (?, ?, ?, ?, 0, 0)',
+            (table, GEOMETRY_COLUMN, geometry, srs_id))
+        rtree = _rtree_name(table)
+        connection.execute(
+            'CREATE VIRTUAL TABLE {} USING rtree(id, minx, maxx, miny, maxy)'
+            .format(_quote(rtree)))
+        for trigger in _RTREE_TRIGGERS:
+            connection.execute(trigger.format(
+                t=table, c=GEOMETRY_COLUMN, i=FID_COLUMN, r=rtree))
+        connection.execute(
+            'INSERT INTO gpkg_extensions VALUES (?, ?, ?, ?, ?)',
+            (table, GEOMETRY_COLUMN, 'gpkg_rtree_index',
+             'http://www.geopackage.org/spec120/#extension_rtree',
+             'write-only'))
+
+    width = len(definitions)
+    connection.executemany('INSERT INTO {} VALUES ({})'.format(
+        _quote(table), ', '.join('?' * width)), records)
+
+    entry = {'rows': len(frame), 'storage': 'table',
+             'columns': list(frame.columns),
+             'dtype': frame.dtypes.astype(str).to_dict(),
+             'index': str(frame.index.dtype)}
+    if geometry:
+        entry['srs_id'] = srs_id
+    return entry
+
+
+def _write_rows(connection, net, table, entry, change):
+    """Store only the rows of a table that a change touched.
+
+    Args:
+        connection: Connection inside a transaction.
+        net: The network.
+        table: Table name.
+        entry: The table's manifest entry in the database.
+        change: NetworkChange of the edits since the database was written.
+    Returns:
+        dict or None: The table's new manifest entry, or None if the table has
+            to be stored whole instead: the change does not name the rows,
+            or the table's columns or dtypes are no longer those stored.
+            Nothing was written then.
+    """
+    from .network_compaction import expand_table, table_dtypes
+
+    removed = change.rows(REMOVED, table)
+    added = change.rows(ADDED, table)
+    modified = change.rows(MODIFIED, table)
+    if ALL_ROWS in (removed, added, modified):
+        return None
+    frame = net[table]
+    if list(frame.columns) != entry['columns']:
+        return None
+
+    present = frame.index.intersection(list(added | modified))
+    # Rows added and removed again before the commit are simply gone.
+    gone = (removed | added | modified).difference(present)
+    rows = expand_table(frame.loc[present], table_dtypes(net, table))
+    if rows.dtypes.astype(str).to_dict() != entry['dtype'] \
+            or str(rows.index.dtype) != entry['index']:
+        return None
+    columns = change.modified_columns(table)
+    if added or columns is None:
+        columns = list(frame.columns)
+    else:
+        columns = [column for column in frame.columns if column in columns]
+    srs_id = entry.get('srs_id') if table in GEOMETRY_TABLES else None
+    try:
+        _column_types(rows)
+    except TypeError:
+        return None
+
+    quoted = _quote(table)
+    key = _quote(FID_COLUMN)
+    ids = [int(row) for row in rows.index]
+    stored = set()
+    for start in range(0, len(ids), _CHUNK):
+        chunk = ids[start:start + _CHUNK]
+        stored.update(row_id for row_id, in connection.execute(
+            'SELECT {} FROM {} WHERE {} IN ({})'.format(
+                key, quoted, key, ', '.join('?' * len(chunk))), chunk))
+    known = rows.index.isin(list(stored))
+
+    connection.executemany('DELETE FROM {} WHERE {} = ?'.format(quoted, key),
+                           [(int(row),) for row in gone])
+    geometry = srs_id if 'geo' in columns else None
+    names = columns + ([GEOMETRY_COLUMN] if geometry is not None else [])
+    if columns and known.any():
+        connection.executemany('UPDATE {} SET {} WHERE {} = ?'.format(
+            quoted, ', '.join('{} = ?'.format(_quote(name)) for name in names),
+            key), [row[1:] + row[:1]
+                   for row in _records(rows[known], columns, geometry)])
+    if not known.all():
+        # A row the database lacks is inserted whole, whatever was modified.
+        columns = list(frame.columns)
+        geometry = srs_id if 'geo' in columns else None
+        names = columns + ([GEOMETRY_COLUMN] if geometry is not None else [])
+        connection.executemany('INSERT INTO {} ({}) VALUES ({})'.format(
+            quoted, ', '.join(_quote(name) for name in [FID_COLUMN] + names),
+            ', '.join('?' * (len(names) + 1))),
+            _records(rows[~known], columns, geometry))
+    connection.execute(
+        'UPDATE gpkg_contents SET last_change = '
+        'strftime(\'%Y-%m-%dT%H:%M:%fZ\', \'now\') WHERE table_name = ?',
+        (table,))
+    return dict(entry, rows=len(frame))
+
+
+def _write_network(connection, net, kind, srs_id, progress=None,
+                   tables=None, changed=None, change=None):
+    """Write a network into an open database, inside one transaction.
+
+    Args:
+        connection: Connection in autocommit mode.
+        net: The network.
+        kind: KIND_POWER or KIND_PIPES.
+        srs_id: SRS id of the network's coordinates.
+        progress: Optional callable receiving the fraction of tables written.
+        tables: The database's current manifest entries, or None for a new
+            database.
+        changed: Names of the tables changed since the database was written;
+            the others are left as they are. None writes every table.
+        change: NetworkChange naming the changed rows, so that those tables
+            are written row by row.
+    """
+    import pandapower
+
+    from .network_compaction import expander
+    from .network_session import KIND_PIPES
+
+    if kind == KIND_PIPES:
+        from pandapipes.io.file_io import to_json
+    else:
+        from pandapower.file_io import to_json
+
+    tables = tables or {}
+    expand = expander(net)
+    skeleton = copy.copy(net)
+    manifest = {}
+    names = [name for name, value in net.items()
+             if not name.startswith('_') and _is_table(value)]
+
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        for done, name in enumerate(names):
+            if progress is not None:
+                progress(done / max(1, len(names)))
+            entry = tables.get(name)
+            if entry is not None and changed is not None \
+                    and name not in changed:
+                pass  # Unchanged, so the database has it already
+            elif entry is not None and entry.get('storage') == 'table' \
+                    and change is not None and not change.everything:
+                entry = _write_rows(connection, net, name, entry, change) \
+                    or _write_table(connection, name, expand(net[name]),
+                                    srs_id)
+            else:
+                entry = _write_table(connection, name, expand(net[name]),
+                                     srs_id)
+            if entry is None:
+                # Not storable as a table; the JSON keeps the whole table.
+                entry = {'rows': len(net[name]), 'storage': 'json'}
+            elif entry.get('storage') == 'table':
+                del skeleton[name]
+            manifest[name] = entry
+        for name in tables:
+            if name not in manifest:
+                _drop_table(connection, name)
+
+        meta = {
+            'format': DATABASE_FORMAT,
+            'format_version': str(DATABASE_FORMAT_VERSION),
+            'kind': kind,
+            'pandapower_version': getattr(pandapower, '__version__', ''),
+            'tables': json.dumps(manifest),
+            'network': to_json(skeleton),
+        }
+        connection.executemany('INSERT OR REPLACE INTO {} VALUES (?, ?)'
+                               .format(META_TABLE), meta.items())
+        connection.execute('COMMIT')
+    except BaseException:
+        connection.execute('ROLLBACK')
+        raise
+    if progress is not None:
+        progress(1.0)
+
+
+def write_database(net, path, kind=None, progress=None, changed=None,
+                   change=None, epsg=None):
+    """Write a network to a database.
+
+    An existing network database is updated in place, in one transaction:
+    tables outside ``changed`` are left alone, and tables ``change`` names
+    rows of are written row by row. Anything else - a new file, a file that
+    is not a network database, or ``changed`` None - is written as a new
+    database that replaces the old file atomically.
+
+    Args:
+        net: The network.
+        path: Database path.
+        kind: KIND_POWER or KIND_PIPES.
+        progress: Optional callable receiving the fraction written.
+        changed: Names of the tables changed since the database was last read
+            or written. None, the default, writes every table.
+        change: Optional NetworkChange of the edits since then.
+        epsg: EPSG code of the network's coordinates, 4326 if not given.
+    Raises:
+        DatabaseError: If the database cannot be opened.
+        sqlite3.Error: If writing fails; the database is left as it was.
+    """
+    from .network_io import replace_file
+    from .network_session import DEFAULT_EPSG, KIND_POWER
+
+    kind = kind or KIND_POWER
+    srs_id = int(epsg or DEFAULT_EPSG)
+
+    tables = None
+    if changed is not None and os.path.isfile(path):
+        try:
+            manifest = read_manifest(path)
+        except DatabaseError:
+            manifest = None
+        if manifest is not None and manifest.get('kind') == kind:
+            tables = manifest['tables']
+    if tables is not None:
+        with connect(path, writable=True) as connection:
+            _write_network(connection, net, kind, srs_id, progress, tables,
+                           changed, change)
+        return
+
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, staging = tempfile.mkstemp(
+        dir=directory, prefix='.{}.'.format(os.path.basename(path)),
+        suffix='.tmp')
+    os.close(handle)
+    try:
+        with connect(staging, writable=True) as connection:
+            _create_geopackage(connection, path)
+            _write_network(connection, net, kind, srs_id, progress)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(staging)
+        raise
+    replace_file(staging, path)
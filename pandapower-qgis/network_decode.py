@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""Decoding a pandapower JSON network with its tables side by side.
+
+A pandapower JSON file is an outer object whose tables are JSON documents of
+their own, embedded as strings::
+
+    {"_module": ..., "_class": "pandapowerNet", "_object": {
+        "bus": {"_module": "pandas.core.frame", "_class": "DataFrame",
+                "_object": "{\\"columns\\": [...], \\"data\\": [...]}", ...},
+        ...}}
+
+``pandapower.from_json`` decodes the outer object with the standard library
+parser and every table, one after another, as the parser meets it. The outer
+object is cheap; nearly all of the time goes into the tables.
+
+:py:func:`decode_network` takes the file apart instead. The outer object is
+parsed with ``orjson`` when it is installed (the standard library otherwise),
+which yields every table as a plain dict still holding its JSON string. The
+tables are then decoded by pandapower's own object hook, exactly as
+``from_json`` would decode them, but large ones in the worker processes of
+``network_preload`` while this thread decodes the small ones and builds the
+empty network they go into. Threads would not help: pandas' JSON reader holds
+the interpreter lock.
+
+The result is the network ``from_json`` returns. Anything this module does not
+know how to reproduce exactly - a file in an older format, an object other
+than tables and plain values (controllers, characteristics, graphs) - makes
+:py:func:`decode_network` return None, and the caller uses ``from_json``.
+
+Empty tables, most of a typical file, cost pandas as much to build as small
+ones. They look the same in every file written by one pandapower version, so
+they are decoded once and copied afterwards (:py:data:`EMPTY_TABLE_CACHE`).
+
+This module is Qt-free, like ``network_session``.
+"""
+
+import json
+import threading
+from collections import OrderedDict
+
+from .network_compression import open_binary
+
+# Outer objects that decode into tables; anything else with a class of its
+# own is left to pandapower.from_json.
+TABLE_CLASSES = {
+    ('pandas.core.frame', 'DataFrame'),
+    ('pandas', 'DataFrame'),
+    ('pandas.core.series', 'Series'),
+    ('pandas', 'Series'),
+}
+NETWORK_CLASS = ('pandapower.auxiliary', 'pandapowerNet')
+
+# Tables whose JSON is at least this long are decoded in a worker process;
+# shorter ones are decoded here faster than they could be sent there.
+TABLE_PROCESS_MIN_CHARS = 1 << 18
+
+# Decoded empty tables kept for reuse, keyed by their JSON, at most this many.
+EMPTY_TABLE_CACHE = 512
+
+_empty_tables = OrderedDict()
+_empty_lock = threading.Lock()
+
+
+def json_backend():
+    """Name of the parser used for the outer object.
+
+    Returns:
+        str: 'orjson' if it is installed, else 'json'.
+    """
+    try:
+        import orjson  # noqa: F401
+    except ImportError:
+        return 'json'
+    return 'orjson'
+
+
+def parse_document(data):
+    """Parse a network document into plain Python values.
+
+    Args:
+        data: The file's bytes.
+    Returns:
+        The parsed document; tables are dicts holding their JSON strings.
+    """
+    try:
+        import orjson
+    except ImportError:
+        return json.loads(data)
+    try:
+        return orjson.loads(data)
+    except orjson.JSONDecodeError:
+        # orjson rejects NaN and Infinity, which pandapower writes for missing
+        # scalars; the standard library accepts them.
+        return json.loads(data)
+
+
+def _is_known(value):
+    """Whether a parsed value decodes to what from_json would make of it.
+
+    Args:
+        value: A parsed network entry.
+    Returns:
+        bool: True for tables and for plain values holding no objects.
+    """
+    if isinstance(value, dict):
+        if '_module' in value and '_class' in value:
+            return (value['_module'], value['_class']) in TABLE_CLASSES
+        return all(_is_known(item) for item in value.values())
+    if isinstance(value, list):
+        return all(_is_known(item) for item in value)
+    return True
+
+
+def hook(value):
+    """Decode a parsed value the way ``json.loads(..., cls=PPJSONDecoder)`` does.
+
+    The standard library calls the decoder's object hook on every dict once
+    its members are decoded, innermost first; this does the same on values
+    that were parsed without it.
+
+    Args:
+        value: A parsed value.
+    Returns:
+        The decoded value, e.g. a DataFrame for a table.
+    """
+    from pandapower.io_utils import pp_hook
+
+    if isinstance(value, dict):
+        return pp_hook({key: hook(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return [hook(item) for item in value]
+    return value
+
+
+def decode_table(entry):
+    """Decode one table. Runs in a worker process for large tables.
+
+    Args:
+        entry: The table's parsed dict.
+    Returns:
+        The decoded DataFrame or Series.
+    """
+    return hook(entry)
+
+
+def _empty_key(entry):
+    """Cache key of a table without rows, or None for a table with rows.
+
+    Args:
+        entry: The table's parsed dict.
+    Returns:
+        str or None: The entry's JSON, if the table is empty.
+    """
+    text = entry.get('_object')
+    if not isinstance(text, str) or len(text) > 4096 \
+            or '"data":[]' not in text.replace(' ', ''):
+        return None
+    return json.dumps(entry, sort_keys=True)
+
+
+def _decode_small(entry):
+    """Decode a table here, reusing an earlier decode of an empty table.
+
+    Args:
+        entry: The table's parsed dict.
+    Returns:
+        The decoded table.
+    """
+    key = _empty_key(entry)
+    if key is None:
+        return decode_table(entry)
+    with _empty_lock:
+        table = _empty_tables.get(key)
+        if table is not None:
+            _empty_tables.move_to_end(key)
+    if table is None:
+        table = decode_table(entry)
+        with _empty_lock:
+            _empty_tables[key] = table
+            while len(_empty_tables) > EMPTY_TABLE_CACHE:
+                _empty_tables.popitem(last=False)
+    return table.copy()
+
+
+def decode_network(path, pool=None):
+    """Decode a pandapower JSON network, its large tables in parallel.
+
+    Args:
+        path: Path of the JSON file, compressed or not.
+        pool: Optional ``concurrent.futures`` executor of worker processes
+            for the large tables, e.g. ``network_preload.worker_pool()``.
+            Without one, every table is decoded on this thread.
+    Returns:
+        pandapowerNet or None: The network ``pandapower.from_json`` returns for
+            the file, or None if only ``from_json`` can decode it.
+    """
+    from pandapower.io_utils import pp_hook
+
+    from .network_lazy import _is_current_format
+
+    with open_binary(path) as handle:
+        document = parse_document(handle.read())
+    if not isinstance(document, dict) \
+            or (document.get('_module'), document.get('_class')) \
+            != NETWORK_CLASS or not isinstance(document.get('_object'), dict):
+        return None
+    entries = document['_object']
+    if not _is_current_format(entries) \
+            or not all(_is_known(value) for value in entries.values()):
+        return None
+
+    futures = {}
+    if pool is not None:
+        try:
+            for name, value in entries.items():
+                if isinstance(value, dict) and '_class' in value \
+                        and len(value.get('_object') or '') \
+                        >= TABLE_PROCESS_MIN_CHARS:
+                    futures[name] = pool.submit(decode_table, value)
+        except Exception as error:
+            # A pool that broke stays broken; the rest is decoded here.
+            print('Decoding {} in this process: {}'.format(path, error))
+
+    decoded = {}
+    for name, value in entries.items():
+        if name in futures:
+            decoded[name] = None  # Keeps the file order
+        elif isinstance(value, dict) and '_class' in value:
+            decoded[name] = _decode_small(value)
+        else:
+            decoded[name] = hook(value)
+    for name, future in futures.items():
+        try:
+            decoded[name] = future.result()
+        except Exception as error:
+            # A worker that failed is no reason to fail the load; a table
+            # that cannot be decoded fails again here, properly.
+            print('Decoding {} of {} here: {}'.format(name, path, error))
+            decoded[name] = decode_table(entries[name])
+
+    net = pp_hook({'_module': document['_module'],
+                   '_class': document['_class'], '_object': decoded})
+    from pandapower.convert_format import convert_format
+
+    # from_json runs it on every network; on a current one it only checks.
+    convert_format(net, elements_to_deserialize=None,
+                   drop_invalid_geodata=False, donot_open_newer=True)
+    return net
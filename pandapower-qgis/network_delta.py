@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""The difference between an open network and its file on disk.
+
+When a network file is rewritten outside QGIS - typically by a script that
+runs a calculation every few minutes - the open network has to catch up.
+Replacing it wholesale (``NetworkSession.seed``) rebuilds every layer and
+throws away unsaved edits. A :py:class:`NetworkDelta` instead compares the
+open network with the new file table by table, and records only the rows that
+were added or removed and, for rows present in both, the columns whose values
+changed. Applying it patches those cells in place, and its
+:py:attr:`NetworkDelta.change` tells each layer exactly which rows to redraw.
+
+Unsaved edits are respected. The session's pending change says which rows the
+user edited, and in which columns. Where the file differs from the open
+network only in cells the user edited, the difference is the user's own edit
+and is kept. Where the file also differs elsewhere in an edited row, or
+removes it, or the edit's extent is unknown, the two disagree: that is a
+conflict, which the caller resolves by asking the user.
+
+This module is Qt-free, like ``network_session``.
+"""
+
+import numpy as np
+import pandas as pd
+
+from .network_change import ADDED, ALL_ROWS, MODIFIED, REMOVED, NetworkChange
+from .network_compaction import INDEX, original_dtypes
+
+# Geometry columns; a change to them moves features on the map.
+GEOMETRY_COLUMNS = ('geo', 'coords')
+
+
+def _changed_mask(old, new):
+    """Which positions of two aligned columns hold different values.
+
+    Args:
+        old: Values of the open network.
+        new: Values of the file, in the same row order.
+    Returns:
+        numpy.ndarray: Boolean mask, True where the values differ. Two missing
+            values count as equal.
+    """
+    old_values = old.to_numpy()
+    new_values = new.to_numpy()
+    try:
+        different = np.asarray(old_values != new_values, dtype=bool)
+    except (TypeError, ValueError):
+        # Cells holding containers compare element by element in numpy.
+        different = np.array([not _equal(a, b)
+                              for a, b in zip(old_values, new_values)],
+                             dtype=bool)
+    if different.shape != (len(old_values),):
+        return np.ones(len(old_values), dtype=bool)
+    return different & ~(pd.isna(old).to_numpy() & pd.isna(new).to_numpy())
+
+
+def _equal(first, second):
+    """Compare two values that may be containers or missing.
+
+    Args:
+        first: A value.
+        second: Another value.
+    Returns:
+        bool: True if they are equal.
+    """
+    try:
+        if isinstance(first, pd.DataFrame) or isinstance(second, pd.DataFrame):
+            return (isinstance(first, pd.DataFrame)
+                    and isinstance(second, pd.DataFrame)
+                    and first.equals(second))
+        return bool(first == second)
+    except (TypeError, ValueError):
+        return False
+
+
+def _any(ids):
+    """Whether an id set from a NetworkChange names any row.
+
+    Args:
+        ids: A set of ids, or ALL_ROWS.
+    Returns:
+        bool: True for ALL_ROWS or a non-empty set.
+    """
+    return ids is ALL_ROWS or bool(ids)
+
+
+def _same_layout(old, new, dtypes=None):
+    """Whether two versions of a table can be patched into one another.
+
+    Args:
+        old: Table of the open network.
+        new: Table of the file.
+        dtypes: The open table's original dtypes if it was compacted, see
+            ``network_compaction``.
+    Returns:
+        bool: True if the columns and their types are the same.
+    """
+    index = (dtypes or {}).get(INDEX, old.index.dtype)
+    return list(old.columns) == list(new.columns) \
+        and original_dtypes(old, dtypes).equals(new.dtypes) \
+        and new.index.dtype == index
+
+
+class NetworkDelta:
+    """What to change in an open network to match its file.
+
+    Build one with :py:func:`diff_network`.
+    """
+
+    def __init__(self):
+        """Initialise an empty delta."""
+        # What applying the delta changes, for the layers.
+        self.change = NetworkChange()
+        # Tables or entries in conflict with unsaved edits.
+        self.conflicts = []
+        # {name: value} replaced whole: new or reshaped tables, scalars.
+        self._replace = {}
+        # {table: (removed ids, added rows, {column: new values})}.
+        self._patches = {}
+        # {table: original dtypes} of a compacted open network.
+        self._compaction = {}
+
+    def is_empty(self):
+        """Whether the open network already matches the file.
+
+        Returns:
+            bool: True if there is nothing to apply and nothing in conflict.
+        """
+        return not self._replace and not self._patches and not self.conflicts
+
+    def apply(self, net):
+        """Patch a network so that it matches the file, edits aside.
+
+        Conflicting tables are left alone.
+
+        Args:
+            net: The open network, changed in place.
+        """
+        for name, value in self._replace.items():
+            if value is None:
+                net.pop(name, None)  # Gone from the file
+            else:
+                net[name] = value
+
+        for name, (removed, added, columns) in self._patches.items():
+            table = net[name]
+            for column, values in columns.items():
+                table.loc[values.index, column] = values
+            if len(removed):
+                table = table.drop(index=removed)
+            if len(added):
+                table = pd.concat([table, added])
+            net[name] = table
+
+    # -- building ---------------------------------------------------------
+
+    def _diff_table(self, name, old, new, edits):
+        """Record the differences of one table.
+
+        Args:
+            name: Table name.
+            old: Table of the open network.
+            new: Table of the file.
+            edits: The session's pending NetworkChange.
+        """
+        edited = edits.affected_rows(name)
+        if not _same_layout(old, new, self._compaction.get(name)):
+            if _any(edited):
+                self.conflicts.append(name)
+                return
+            self._replace[name] = new
+            self.change.add_rows(MODIFIED, name, ALL_ROWS)
+            return
+
+        removed = old.index.difference(new.index)
+        added = new.index.difference(old.index)
+        if edited is not ALL_ROWS:
+            # Rows the user added are missing from the file, and rows the user
+            # removed are still in it; neither is the file's doing.
+            removed = removed.difference(list(edits.rows(ADDED, name)))
+            added = added.difference(list(edits.rows(REMOVED, name)))
+
+        common = old.index.intersection(new.index)
+        if old.index.equals(new.index):
+            old_rows, new_rows = old, new
+        else:
+            old_rows, new_rows = old.loc[common], new.loc[common]
+
+        changed = {}  # column -> ids whose value differs
+        for column in old.columns:
+            mask = _changed_mask(old_rows[column], new_rows[column])
+            if mask.any():
+                changed[column] = common[mask]
+
+        if edited is ALL_ROWS:
+            if changed or len(removed) or len(added):
+                self.conflicts.append(name)
+            return
+
+        edited_columns = edits.modified_columns(name)
+        conflict = any(row in edited for row in removed)
+        columns = {}
+        for column, ids in changed.items():
+            mine = ids.isin(list(edited))
+            if mine.any() and (edited_columns is None
+                               or column not in edited_columns):
+                conflict = True
+                break
+            theirs = ids[~mine]
+            if len(theirs):
+                columns[column] = new.loc[theirs, column]
+        if conflict:
+            self.conflicts.append(name)
+            return
+
+        if not columns and not len(removed) and not len(added):
+            return
+        self._patches[name] = (removed, new.loc[added], columns)
+
+        if len(removed):
+            self.change.add_rows(REMOVED, name, removed)
+        if len(added):
+            self.change.add_rows(ADDED, name, added)
+        ids = set()
+        for values in columns.values():
+            ids.update(values.index)
+        if ids:
+            self.change.add_rows(MODIFIED, name, ids, columns=list(columns))
+            if any(column in GEOMETRY_COLUMNS for column in columns):
+                self.change.geometry = True
+
+    def _diff_entry(self, name, old, new, edits):
+        """Record the difference of one entry that is not a table.
+
+        Args:
+            name: Entry name.
+            old: Value in the open network, or None if it is absent.
+            new: Value in the file, or None if it is absent.
+            edits: The session's pending NetworkChange.
+        """
+        if isinstance(old, pd.DataFrame) and isinstance(new, pd.DataFrame):
+            self._diff_table(name, old, new, edits)
+            return
+        if _equal(old, new):
+            return
+        if _any(edits.affected_rows(name)):
+            self.conflicts.append(name)
+            return
+        self._replace[name] = new
+        if isinstance(old, pd.DataFrame) or isinstance(new, pd.DataFrame):
+            self.change.add_rows(MODIFIED, name, ALL_ROWS)
+
+
+def diff_network(names, old_entry, new_entry, edits=None, compaction=None):
+    """Compare an open network with the new content of its file.
+
+    Args:
+        names: Names of the entries to compare. For a lazily opened network,
+            only the decoded ones, since only those can be on screen.
+        old_entry: Callable returning an entry of the open network by name,
+            or None if it has no such entry.
+        new_entry: Callable returning an entry of the file in the same way.
+        edits: NetworkChange of the unsaved edits, or None if there are none.
+        compaction: The open network's compaction record, if it was
+            compacted; its tables are compared by their original dtypes.
+    Returns:
+        NetworkDelta: The differences.
+    """
+    if edits is None:
+        edits = NetworkChange()
+    delta = NetworkDelta()
+    if compaction:
+        delta._compaction = compaction['dtypes']
+    for name in names:
+        if name.startswith('_'):
+            continue  # pandapower's internal state, e.g. _ppc
+        delta._diff_entry(name, old_entry(name), new_entry(name), edits)
+    return delta
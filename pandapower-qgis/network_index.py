@@ -0,0 +1,532 @@
+# -*- coding: utf-8 -*-
+"""What a network file holds, without loading it.
+
+The Browser and the Data Source Manager list a network's tables, their row
+counts and the voltage levels of ``bus`` and ``line``. Both used to get these
+by opening a :py:class:`NetworkSession`, i.e. a full ``pandapower.from_json``,
+only to release it again; expanding a folder of large networks loaded every one
+of them.
+
+A :py:class:`NetworkIndex` holds just that listing, plus the bounding box of
+the buses and whether the file is in an older pandapower format. It is built from the file without building a network:
+
+* Row counts are read off each table's ``"index"`` array in the raw bytes,
+  using the entry spans of ``network_lazy.scan_entries``.
+* Only ``bus`` (levels, bounding box) and ``line`` (the buses it starts at) are
+  decoded, as plain JSON rather than DataFrames.
+* A ``.ppnet`` store takes its row counts from the manifest, and reads just the
+  needed columns of those two tables. A database does the same.
+
+Indexes are remembered in memory and, once :py:func:`configure` has been given
+a directory, on disk as small JSON files, keyed by the file's path,
+modification time and size. An unchanged file is therefore never read again.
+
+This module is Qt-free, like ``network_session``.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+
+from . import network_database
+from .network_compression import plain_copy
+from .network_lazy import _is_current_format, needs_conversion, \
+    read_scalars, scan_entries
+from .network_session import KIND_PIPES
+from .network_store import is_store_path, read_manifest, read_table, state_path
+
+# Bumped whenever the stored layout changes, so old entries are rebuilt.
+INDEX_FORMAT = 2
+
+INDEX_SUFFIX = '.ppindex'
+
+# Columns the levels of a table are read from, and for a table without such a
+# column, the node table and foreign key its level derives from.
+LEVEL_COLUMNS = {'bus': 'vn_kv', 'line': 'vn_kv',
+                 'junction': 'pn_bar', 'pipe': 'pn_bar'}
+LEVEL_SOURCES = {'line': ('bus', 'from_bus'), 'pipe': ('junction', 'from_junction')}
+
+# Directory holding the stored indexes, or None to keep them in memory only.
+_directory = None
+
+# Normalised path -> (file state, NetworkIndex).
+_memo = {}
+
+
+class NetworkIndex:
+    """Tables, row counts, levels and extent of one network."""
+
+    def __init__(self, kind, rows, level_rows=None, bbox=None, legacy=False):
+        """Initialise the index.
+
+        Args:
+            kind: KIND_POWER or KIND_PIPES.
+            rows: ``{table: row count}`` for every public DataFrame of the
+                network.
+            level_rows: ``{table: {level: row count}}`` for the tables that
+                can be split by voltage or pressure level.
+            bbox: ``(xmin, ymin, xmax, ymax)`` of the node geodata, or None.
+            legacy: True if loading the file runs pandapower's format
+                conversion (see ``network_lazy.needs_conversion``).
+        """
+        self.kind = kind
+        self.rows = dict(rows)
+        self.level_rows = {table: dict(counts)
+                           for table, counts in (level_rows or {}).items()}
+        self.bbox = tuple(bbox) if bbox else None
+        self.legacy = bool(legacy)
+
+    @classmethod
+    def from_net(cls, net, kind):
+        """Index a loaded network, e.g. one that is open and edited.
+
+        Args:
+            net: The network.
+            kind: KIND_POWER or KIND_PIPES.
+        Returns:
+            NetworkIndex: The index.
+        """
+        import pandas as pd
+
+        rows = {}
+        for name in dir(net):
+            if name.startswith('_'):
+                continue  # pandapower's private bookkeeping tables
+            try:
+                value = getattr(net, name)
+            except Exception:
+                continue
+            if isinstance(value, pd.DataFrame):
+                rows[name] = len(value)
+
+        level_rows = {}
+        for table, column in LEVEL_COLUMNS.items():
+            frame = getattr(net, table, None)
+            if not isinstance(frame, pd.DataFrame):
+                continue
+            if column in frame.columns:
+                level_rows[table] = _level_rows(frame[column].dropna())
+            elif table in LEVEL_SOURCES:
+                source, key = LEVEL_SOURCES[table]
+                nodes = getattr(net, source, None)
+                if isinstance(nodes, pd.DataFrame) \
+                        and column in nodes.columns and key in frame.columns:
+                    levels = nodes[column].reindex(frame[key].values)
+                    level_rows[table] = _level_rows(levels.dropna())
+
+        node_table = 'junction' if kind == KIND_PIPES else 'bus'
+        nodes = getattr(net, node_table, None)
+        bbox = None
+        if isinstance(nodes, pd.DataFrame) and 'geo' in nodes.columns:
+            bbox = _bbox(nodes['geo'])
+        return cls(kind, rows, level_rows, bbox)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild an index stored with :py:meth:`to_dict`.
+
+        Args:
+            data: The stored dict.
+        Returns:
+            NetworkIndex: The index.
+        """
+        level_rows = {table: {float(level): count for level, count in pairs}
+                      for table, pairs in data.get('level_rows', {}).items()}
+        return cls(data['kind'], data['rows'], level_rows, data.get('bbox'),
+                   data.get('legacy', False))
+
+    def to_dict(self):
+        """Describe the index as JSON-compatible data.
+
+        Returns:
+            dict: The index.
+        """
+        return {
+            'kind': self.kind,
+            'rows': self.rows,
+            # Levels are floats, which JSON object keys cannot be.
+            'level_rows': {table: sorted(counts.items())
+                           for table, counts in self.level_rows.items()},
+            'bbox': list(self.bbox) if self.bbox else None,
+            'legacy': self.legacy,
+        }
+
+    def tables(self, hidden=()):
+        """List the tables worth showing.
+
+        Only populated input tables are listed. Result tables are listed
+        whether populated or not, as long as their input table is populated.
+
+        Args:
+            hidden: Names never to list.
+        Returns:
+            tuple: ``(input_tables, result_tables)``, each a list of names in
+                table order.
+        """
+        inputs = [name for name, count in self.rows.items()
+                  if count and not name.startswith('res_')
+                  and name not in hidden]
+        populated = set(inputs)
+        results = [name for name in self.rows
+                   if name.startswith('res_') and name[4:] in populated
+                   and name not in hidden]
+        return inputs, results
+
+    def levels(self, table):
+        """List the levels a table can be split by.
+
+        Args:
+            table: Table name.
+        Returns:
+            list: Sorted level values, empty when the table has none.
+        """
+        return sorted(self.level_rows.get(table, {}))
+
+    def row_count(self, table, level=None):
+        """Count the rows of a table, optionally at one level only.
+
+        Args:
+            table: Table name.
+            level: A level from :py:meth:`levels`, or None for all rows.
+        Returns:
+            int: The row count, 0 for an unknown table or level.
+        """
+        if level is None:
+            return self.rows.get(table, 0)
+        return self.level_rows.get(table, {}).get(float(level), 0)
+
+
+def _bbox(geo_values):
+    """Bounding box of GeoJSON point strings.
+
+    Args:
+        geo_values: Iterable of GeoJSON strings (or None).
+    Returns:
+        tuple or None: ``(xmin, ymin, xmax, ymax)``, or None without points.
+    """
+    xs, ys = [], []
+    for value in geo_values:
+        if not isinstance(value, str) or not value:
+            continue
+        try:
+            coordinates = json.loads(value).get('coordinates')
+            x, y = float(coordinates[0]), float(coordinates[1])
+        except (ValueError, TypeError, AttributeError, IndexError):
+            continue
+        xs.append(x)
+        ys.append(y)
+    if not xs:
+        return None
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+# -- building from files ---------------------------------------------------
+
+def _split_frame(buffer, start, end):
+    """Decode a table entry of a JSON network to its raw split-orient parts.
+
+    pandapower stores each DataFrame as a JSON string in "split" orientation.
+    Decoding that with the json module is much cheaper than building the
+    DataFrame.
+
+    Args:
+        buffer: The document bytes.
+        start: Offset of the entry.
+        end: Offset just past the entry.
+    Returns:
+        dict: ``{'columns': [...], 'index': [...], 'data': [[...], ...]}``.
+    """
+    entry = json.loads(buffer[start:end])
+    return json.loads(entry['_object'])
+
+
+def _column(frame, name):
+    """Values of one column of a split-orient frame, keyed by index.
+
+    Args:
+        frame: Result of :py:func:`_split_frame`.
+        name: Column name.
+    Returns:
+        dict or None: ``{index: value}``, or None if there is no such column.
+    """
+    try:
+        position = frame['columns'].index(name)
+    except ValueError:
+        return None
+    return {index: row[position]
+            for index, row in zip(frame['index'], frame['data'])}
+
+
+def _count_rows(buffer, start, end):
+    """Count the rows of a table entry from its index array alone.
+
+    Args:
+        buffer: The document bytes.
+        start: Offset of the entry.
+        end: Offset just past the entry.
+    Returns:
+        int: The row count.
+    """
+    # The frame is an escaped JSON string inside the entry, hence \".
+    marker = buffer.find(b'\\"index\\":[', start, end)
+    if marker >= 0:
+        first = marker + len(b'\\"index\\":[')
+        last = buffer.find(b']', first, end)
+        numbers = buffer[first:last]
+        if b'"' not in numbers:  # Plain integer ids: count the separators
+            return numbers.count(b',') + 1 if numbers.strip() else 0
+    return len(_split_frame(buffer, start, end)['index'])
+
+
+def _level_rows(values):
+    counts = {}
+    for value in values:
+        if value is None:
+            continue
+        level = float(value)
+        counts[level] = counts.get(level, 0) + 1
+    return counts
+
+
+def _index_json(path, kind):
+    """Build the index of a JSON network from a scan of its bytes.
+
+    Args:
+        path: Path of the JSON file.
+        kind: KIND_POWER or KIND_PIPES.
+    Returns:
+        NetworkIndex: The index.
+    """
+    spans = scan_entries(path)
+    node_table = 'junction' if kind == KIND_PIPES else 'bus'
+    rows = {}
+    level_rows = {}
+    bbox = None
+    with open(path, 'rb') as handle, \
+            mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        frames = {}
+        for name, (start, end) in spans.items():
+            if name.startswith('_') \
+                    or b'"DataFrame"' not in buffer[start:min(end, start + 512)]:
+                continue
+            rows[name] = _count_rows(buffer, start, end)
+
+        def frame(name):
+            if name not in frames:
+                frames[name] = (_split_frame(buffer, *spans[name])
+                                if rows.get(name) else None)
+            return frames[name]
+
+        for table, column in LEVEL_COLUMNS.items():
+            if not rows.get(table):
+                continue
+            values = _column(frame(table), column)
+            if values is None and table in LEVEL_SOURCES:
+                # The level comes from the node the element starts at.
+                source, key = LEVEL_SOURCES[table]
+                node_levels = (_column(frame(source), column)
+                               if rows.get(source) else None)
+                keys = _column(frame(table), key)
+                if node_levels is None or keys is None:
+                    continue
+                values = {index: node_levels.get(node)
+                          for index, node in keys.items()}
+            if values is not None:
+                level_rows[table] = _level_rows(values.values())
+
+        if rows.get(node_table):
+            geo = _column(frame(node_table), 'geo')
+            if geo:
+                bbox = _bbox(geo.values())
+    legacy = kind != KIND_PIPES \
+        and not _is_current_format(read_scalars(path, spans))
+    return NetworkIndex(kind, rows, level_rows, bbox, legacy)
+
+
+def _index_store(path, kind):
+    """Build the index of a ``.ppnet`` store from its manifest.
+
+    Args:
+        path: Store path.
+        kind: KIND_POWER or KIND_PIPES.
+    Returns:
+        NetworkIndex: The index.
+    """
+    manifest = read_manifest(path)
+    return _index_tables(path, kind, manifest, read_table)
+
+
+def _index_database(path, kind):
+    """Build the index of a network database from its manifest.
+
+    Args:
+        path: Database path.
+        kind: KIND_POWER or KIND_PIPES.
+    Returns:
+        NetworkIndex: The index.
+    """
+    manifest = network_database.read_manifest(path)
+    return _index_tables(path, kind, manifest, network_database.read_table)
+
+
+def _index_tables(path, kind, manifest, read):
+    """Build an index from a manifest and the tables it needs.
+
+    Args:
+        path: Path of the store or database.
+        kind: KIND_POWER or KIND_PIPES.
+        manifest: Its manifest, listing the tables and their row counts.
+        read: ``read(path, table, manifest)`` returning one table, or None.
+    Returns:
+        NetworkIndex: The index.
+    """
+    rows = {table: entry.get('rows', 0)
+            for table, entry in manifest['tables'].items()}
+
+    frames = {}
+
+    def frame(table):
+        if table not in frames:
+            frames[table] = (read(path, table, manifest)
+                             if rows.get(table) else None)
+        return frames[table]
+
+    level_rows = {}
+    for table, column in LEVEL_COLUMNS.items():
+        data = frame(table)
+        if data is None:
+            continue
+        if column in data.columns:
+            level_rows[table] = _level_rows(data[column].dropna())
+        elif table in LEVEL_SOURCES:
+            source, key = LEVEL_SOURCES[table]
+            nodes = frame(source)
+            if nodes is not None and column in nodes.columns \
+                    and key in data.columns:
+                levels = nodes[column].reindex(data[key].values)
+                level_rows[table] = _level_rows(levels.dropna())
+
+    node_table = 'junction' if kind == KIND_PIPES else 'bus'
+    nodes = frame(node_table)
+    bbox = None
+    if nodes is not None and 'geo' in nodes.columns:
+        bbox = _bbox(nodes['geo'])
+    legacy = kind != KIND_PIPES and needs_conversion(path)
+    return NetworkIndex(kind, rows, level_rows, bbox, legacy)
+
+
+def build_index(path, kind):
+    """Index a network file without loading it.
+
+    Args:
+        path: Path of the network file or store.
+        kind: KIND_POWER or KIND_PIPES.
+    Returns:
+        NetworkIndex: The index.
+    Raises:
+        ValueError: If the file is not a network this module can read.
+    """
+    if is_store_path(path):
+        return _index_store(path, kind)
+    if network_database.is_database_path(path):
+        return _index_database(path, kind)
+    # A compressed file is scanned from a decompressed temporary copy.
+    with plain_copy(path) as plain:
+        return _index_json(plain, kind)
+
+
+# -- caching ---------------------------------------------------------------
+
+def configure(directory):
+    """Store indexes in a directory, or keep them in memory only.
+
+    Args:
+        directory: Directory for the stored indexes, created if missing, or
+            None.
+    """
+    global _directory
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    _directory = directory or None
+
+
+def _file_state(path):
+    try:
+        stat = os.stat(state_path(path))
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _entry_path(path):
+    digest = hashlib.sha1(path.encode('utf-8')).hexdigest()
+    return os.path.join(_directory, digest + INDEX_SUFFIX)
+
+
+def _load_entry(path, state):
+    if _directory is None:
+        return None
+    try:
+        with open(_entry_path(path), encoding='utf-8') as handle:
+            entry = json.load(handle)
+        if entry.get('format') != INDEX_FORMAT or entry.get('path') != path \
+                or entry.get('state') != state:
+            return None
+        return NetworkIndex.from_dict(entry['index'])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _store_entry(path, state, index):
+    from .network_io import atomic_write
+
+    if _directory is None:
+        return
+    entry = {'format': INDEX_FORMAT, 'path': path, 'state': state,
+             'index': index.to_dict()}
+    try:
+        atomic_write(_entry_path(path),
+                     lambda handle: json.dump(entry, handle))
+    except OSError as error:
+        print('Could not store network index {}: {}'.format(path, error))
+
+
+def read_index(path, kind):
+    """Return the index of a network file, building it only if it changed.
+
+    Args:
+        path: Normalised path of the network file or store.
+        kind: KIND_POWER or KIND_PIPES.
+    Returns:
+        NetworkIndex: The index.
+    Raises:
+        ValueError: If the file cannot be indexed.
+        OSError: If the file cannot be read.
+    """
+    state = _file_state(path)
+    if state is None:
+        raise OSError('File not found: {}'.format(path))
+
+    remembered = _memo.get(path)
+    if remembered is not None and remembered[0] == state:
+        return remembered[1]
+
+    index = _load_entry(path, state)
+    if index is None:
+        index = build_index(path, kind)
+        _store_entry(path, state, index)
+    _memo[path] = (state, index)
+    return index
+
+
+def forget(path=None):
+    """Drop remembered indexes from memory, e.g. after a file was written.
+
+    Args:
+        path: Normalised path to forget, or None for all.
+    """
+    if path is None:
+        _memo.clear()
+    else:
+        _memo.pop(path, None)
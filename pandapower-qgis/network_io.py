@@ -0,0 +1,422 @@
+# -*- coding: utf-8 -*-
+"""Crash-safe, streamed writing of network files.
+
+``NetworkSession.write`` used to call ``pandapower.to_json(net, path)`` on the
+target file. That builds the complete JSON document as one string before a
+single byte reaches disk, which on a 2 GB network roughly doubles peak memory
+during a save, and it truncates the target before writing, so a crash half way
+leaves a broken file and no network.
+
+This module writes the same bytes differently:
+
+* The document is streamed. pandapower's encoder serialises one table at a
+  time while the output is consumed, so only one table's JSON is alive at once.
+* The output goes to a temporary file in the target's directory, is flushed and
+  fsynced, and only then renamed over the original. A reader, or a crash, sees
+  either the old file or the new one, never a mixture.
+
+The output is byte-identical to ``pandapower.to_json``; the file format does
+not change. A compressed network (see ``network_compression``) is streamed
+through the compressor into the temporary file, and stays compressed.
+
+A save also encodes only what was edited. The session tracks which tables
+changed since the file was last written (``NetworkSession.dirty_tables``);
+every other table already sits in the file, encoded exactly as it would be
+again. :py:func:`write_network` locates those tables with the scan lazy
+loading uses (``network_lazy.scan_entries``) and copies their bytes into the
+new file, so editing one bus of a large network no longer encodes every
+``res_*`` table and ``std_types`` as well. A columnar store keeps the Parquet
+files of unchanged tables in the same way (``network_store.write_store``),
+and a database goes further still and writes only the edited rows
+(``network_database.write_database``).
+"""
+
+import codecs
+import copy
+import os
+import tempfile
+
+from .network_compaction import expander
+from .network_compression import compression_for_write, plain_copy, \
+    write_text
+from .network_database import is_database_path, write_database
+from .network_lazy import _is_current_format, needs_conversion, \
+    read_scalars, scan_entries
+from .network_session import KIND_PIPES
+from .network_store import is_store_path, write_store
+
+# Encoder chunks are tiny (often a single bracket); collect them into blocks of
+# roughly this many characters before handing them to the file object.
+WRITE_BLOCK_CHARS = 1 << 20
+
+# Indentation used by pandapower.to_json. Changing it would change the file.
+JSON_INDENT = 2
+
+
+class _Reused:
+    """Stands in for a network entry copied from the existing file."""
+
+    __slots__ = ('marker',)
+
+    def __init__(self, marker):
+        self.marker = marker
+
+
+def stream_json(net, handle, progress=None, source=None, reuse=None):
+    """Write a pandapower network as JSON to an open text file, table by table.
+
+    Produces exactly what ``pandapower.to_json(net)`` would, without building
+    the whole document in memory. Tables compacted by ``network_compaction``
+    are written with their original dtypes, as they were read.
+
+    Args:
+        net: The pandapower network.
+        handle: Text file object opened for writing.
+        progress: Optional callable receiving the fraction of tables written,
+            from 0.0 to 1.0. It may raise to abort the write.
+        source: Binary file object of a previous version of the document,
+            which ``reuse`` points into.
+        reuse: Optional ``{name: (start, end)}`` byte spans in ``source`` of
+            entries that did not change. They are copied, not encoded again.
+    """
+    from pandapower.io_utils import PPJSONEncoder
+
+    encoder = PPJSONEncoder(indent=JSON_INDENT)
+    encode_object = encoder.default
+    # Compacted tables are written with their original dtypes.
+    expand = expander(net)
+
+    # Unchanged entries are swapped for placeholders, which the encoder turns
+    # into one unique string chunk each; the chunk is replaced by the old
+    # bytes as the document is written.
+    spans = {}
+    if reuse:
+        outline = copy.copy(net)
+        for name, span in reuse.items():
+            if name in outline:
+                # NUL cannot occur in a table name, so the marker is unique.
+                marker = '\x00reuse\x00' + name
+                outline[name] = _Reused(marker)
+                spans[encoder.encode(marker)] = span
+        net = outline
+
+    def default(value):
+        if isinstance(value, _Reused):
+            return value.marker
+        return encode_object(expand(value))
+
+    encoder.default = default
+
+    if progress is not None:
+        # The encoder calls default() once per table as it reaches it, which
+        # is the natural progress tick.
+        total = max(1, sum(1 for value in net.values()
+                           if _is_table(value) or isinstance(value, _Reused)))
+        done = [0]
+
+        def counting_default(value):
+            if _is_table(value) or isinstance(value, _Reused):
+                progress(done[0] / total)
+                done[0] += 1
+            return default(value)
+
+        encoder.default = counting_default
+
+    block, size = [], 0
+    for chunk in encoder.iterencode(net):
+        span = spans.get(chunk) if spans else None
+        if span is not None:
+            handle.write(''.join(block))
+            block, size = [], 0
+            _copy_span(source, span, handle)
+            continue
+        block.append(chunk)
+        size += len(chunk)
+        if size >= WRITE_BLOCK_CHARS:
+            handle.write(''.join(block))
+            block, size = [], 0
+    if block:
+        handle.write(''.join(block))
+
+    if progress is not None:
+        progress(1.0)
+
+
+def _copy_span(source, span, handle):
+    """Copy a byte span of the old document into the new one.
+
+    Args:
+        source: Binary file object of the old document.
+        span: ``(start, end)`` byte offsets.
+        handle: Text file object of the new document.
+    """
+    start, end = span
+    source.seek(start)
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    remaining = end - start
+    while remaining > 0:
+        data = source.read(min(WRITE_BLOCK_CHARS, remaining))
+        if not data:
+            raise ValueError('The network file ended unexpectedly.')
+        remaining -= len(data)
+        # The text layer translates newlines on the way out again. JSON keeps
+        # line breaks in strings escaped, so a raw CR is always whitespace.
+        handle.write(decoder.decode(data, final=remaining <= 0)
+                     .replace('\r', ''))
+
+
+def reusable_entries(net, path, changed):
+    """Find the entries of a network that can be copied from its file.
+
+    Args:
+        net: The network about to be written.
+        path: Plain (uncompressed) JSON file the network was read from or
+            last written to.
+        changed: Names of the entries changed since, or None if unknown.
+    Returns:
+        dict: ``{name: (start, end)}`` byte spans in ``path``. Empty if
+            nothing can be reused.
+    """
+    if changed is None:
+        return {}
+    try:
+        spans = scan_entries(path)
+    except (OSError, ValueError):
+        return {}  # Not a document we can splice into; encode it all
+    if not _is_current_format(read_scalars(path, spans)):
+        # Its tables are in the layout of an older pandapower; copied into
+        # a file stamped with the current format version, they would never
+        # be converted again.
+        return {}
+    # Scalar entries are never recorded as changed, and cost nothing to
+    # encode; only tables and std_types are worth copying.
+    return {name: span for name, span in spans.items()
+            if name not in changed and not name.startswith('_')
+            and (_is_table(net.get(name)) or isinstance(net.get(name), dict))}
+
+
+def _is_table(value):
+    """Whether a network entry is a table (a DataFrame).
+
+    Args:
+        value: A value of the network dict.
+    Returns:
+        bool: True for DataFrames.
+    """
+    return hasattr(value, 'columns') and hasattr(value, 'index')
+
+
+def snapshot_network(net):
+    """Copy a network cheaply enough to write it while editing continues.
+
+    Every table is copied, since edits change cells in place; the remaining
+    entries (std_types, settings) are shared, since edits never touch them.
+    Object columns copy references to their immutable strings, not the
+    strings themselves.
+
+    Args:
+        net: The network to copy.
+    Returns:
+        The copy, of the same type as ``net``.
+    """
+    snapshot = copy.copy(net)
+    for key, value in net.items():
+        if _is_table(value):
+            snapshot[key] = value.copy()
+    return snapshot
+
+
+def atomic_write(path, write, mode='w'):
+    """Write a file through a temporary sibling and rename it into place.
+
+    The temporary file sits in the same directory as ``path`` so the final
+    rename stays on one file system and is atomic. It is fsynced before the
+    rename, and the original file's permission bits are carried over.
+
+    Args:
+        path: Target file path.
+        write: Callable taking an open file object and writing the content
+            to it.
+        mode: ``'w'`` for a text file, ``'wb'`` for a binary one.
+    Raises:
+        Any exception raised by ``write`` or by the file system. The target
+        file is left untouched and the temporary file is removed.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, temp_path = tempfile.mkstemp(
+        dir=directory, prefix='.{}.'.format(os.path.basename(path)),
+        suffix='.tmp')
+    try:
+        # Default newline handling and encoding, as pandapower.to_json uses,
+        # so the bytes on disk do not depend on which writer produced them.
+        with os.fdopen(handle, mode) as stream:
+            write(stream)
+            stream.flush()
+            os.fsync(stream.fileno())
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+    replace_file(temp_path, path)
+
+
+def replace_file(staging, path):
+    """Move a complete, synced file into place with an atomic rename.
+
+    The original file's permission bits are carried over. For writers that
+    cannot hand their output to :py:func:`atomic_write` as a stream, such as
+    SQLite, which opens its database by path.
+
+    Args:
+        staging: The new file, in the same directory as ``path``.
+        path: Target file path.
+    Raises:
+        OSError: If the rename fails. ``staging`` is removed and the target
+            file is left untouched.
+    """
+    try:
+        os.chmod(staging, os.stat(path).st_mode & 0o7777)
+    except OSError:
+        pass  # New file, or a file system without permission bits
+
+    try:
+        os.replace(staging, path)
+    except BaseException:
+        try:
+            os.remove(staging)
+        except OSError:
+            pass
+        raise
+
+    _fsync_directory(os.path.dirname(os.path.abspath(path)))
+
+
+def replace_directory(staging, path):
+    """Swap a fully written directory into place of another.
+
+    Directories cannot be replaced in one rename, so the old directory is
+    moved aside first; it is only deleted once the new one is in place.
+
+    Args:
+        staging: The new directory, a sibling of ``path``.
+        path: The directory to replace. It need not exist.
+    """
+    import shutil
+
+    if not os.path.exists(path):
+        os.replace(staging, path)
+        return
+
+    retired = staging + '.old'
+    os.replace(path, retired)
+    try:
+        os.replace(staging, path)
+    except OSError:
+        os.replace(retired, path)
+        raise
+    shutil.rmtree(retired, ignore_errors=True)
+
+
+def _fsync_directory(directory):
+    """Persist a rename by syncing its directory, where the platform allows.
+
+    Args:
+        directory: Directory that holds the renamed file.
+    """
+    if not hasattr(os, 'O_DIRECTORY'):
+        return  # Windows: directories cannot be opened, and need not be
+    try:
+        descriptor = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    except OSError:
+        return
+    try:
+        os.fsync(descriptor)
+    except OSError:
+        pass
+    finally:
+        os.close(descriptor)
+
+
+def write_network(net, path, kind=None, progress=None, changed=None,
+                  change=None, epsg=None):
+    """Write a network to its JSON file, columnar store or database.
+
+    A ``.ppnet`` path is written as a columnar store (see ``network_store``),
+    a ``.gpkg`` or ``.sqlite`` path as a database, row by row where
+    ``change`` allows (see ``network_database``).
+    Other pandapower networks are streamed to JSON table by table. pandapipes networks go
+    through ``pandapipes.to_json`` into the temporary file, which keeps the
+    crash safety though not the lower peak memory or progress reporting.
+    JSON is compressed as the existing file is, or else as the path's suffix
+    asks (``.json.gz``, ``.json.zst``).
+
+    Args:
+        net: The network to write.
+        path: Target file path.
+        kind: KIND_POWER or KIND_PIPES.
+        progress: Optional callable receiving the fraction written.
+        changed: Names of the tables changed since ``path`` was last read or
+            written. The others are copied from the existing file instead of
+            being encoded again. None, the default, encodes everything.
+        change: Optional NetworkChange of the edits since then, naming the
+            rows a database write touches.
+        epsg: EPSG code of the network's coordinates, for a database.
+    """
+    if is_database_path(path):
+        write_database(net, path, kind, progress=progress, changed=changed,
+                       change=change, epsg=epsg)
+        return
+
+    if is_store_path(path):
+        try:
+            if changed is not None and needs_conversion(path):
+                changed = None  # Same reason as in reusable_entries
+        except (OSError, ValueError):
+            pass  # No store yet, or none write_store could reuse anyway
+        write_store(net, path, kind, progress=progress, changed=changed)
+        return
+
+    if kind == KIND_PIPES or changed is None or not os.path.isfile(path):
+        _write_json(net, path, kind, progress)
+        return
+
+    # A compressed file is read back from a decompressed copy, since the
+    # entries are located by their offsets in the plain document.
+    with plain_copy(path) as plain:
+        reuse = reusable_entries(net, plain, changed)
+        if not reuse:
+            _write_json(net, path, kind, progress)
+            return
+        with open(plain, 'rb') as source:
+            _write_json(net, path, kind, progress, source, reuse)
+
+
+def _write_json(net, path, kind, progress, source=None, reuse=None):
+    """Write a network to a JSON file atomically, see :py:func:`write_network`.
+
+    Args:
+        net: The network to write.
+        path: Target file path.
+        kind: KIND_POWER or KIND_PIPES.
+        progress: Optional callable receiving the fraction written.
+        source: Passed to :py:func:`stream_json`.
+        reuse: Passed to :py:func:`stream_json`.
+    """
+    if kind == KIND_PIPES:
+        import pandapipes
+
+        def write(stream):
+            pandapipes.to_json(net, stream)
+    else:
+        def write(stream):
+            stream_json(net, stream, progress, source=source, reuse=reuse)
+
+    compression = compression_for_write(path)
+    if compression is None:
+        atomic_write(path, write)
+    else:
+        atomic_write(path, lambda handle: write_text(handle, compression, write),
+                     mode='wb')
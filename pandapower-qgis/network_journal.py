@@ -0,0 +1,425 @@
+# -*- coding: utf-8 -*-
+"""A write-ahead journal of committed edits, kept next to the network.
+
+A commit writes the whole network, which takes long enough on a large file
+that users batch their edits for hours - and lose them all when QGIS crashes
+before the save. With journaling enabled (:py:func:`configure`), a commit
+instead appends the rows it touched to a small sidecar file,
+
+    grid.json.journal
+
+so it costs what was edited, not what is open. The network file itself is
+only rewritten when the journal has grown past :py:data:`FLUSH_BYTES`, when the
+user saves the network from the Browser, or when an edit cannot be journaled
+(a power flow rewrites whole result tables). A successful write
+deletes the journal, since the file now holds everything in it.
+
+The journal is JSON Lines. The first line records the state (modification time
+and size) of the network file the journal applies to; every further line is
+one commit: per table, the ids of the rows removed and the current values of
+the rows added or modified. Lines are flushed and synced as they are written,
+so a crash loses at most the commit being written, and a torn last line is
+ignored when reading. Values are plain JSON, never pickles, since the journal
+sits in a folder that may be shared.
+
+Opening a network with a journal replays it (:py:func:`replay`): the edits are
+applied to the freshly loaded network, which then counts as edited but not yet
+saved. A journal whose recorded state no longer matches the file was written
+against another version of it - the file was saved or replaced since - and is
+set aside as ``grid.json.journal.stale`` rather than applied.
+
+This module is Qt-free, like ``network_session``.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from .network_change import ADDED, ALL_ROWS, MODIFIED, REMOVED, NetworkChange
+from .network_store import state_path, store_root
+
+# Bumped whenever the line layout changes; other journals are set aside.
+JOURNAL_FORMAT = 1
+
+JOURNAL_SUFFIX = '.journal'
+
+# Suffix added to a journal that does not apply to its file any more.
+STALE_SUFFIX = '.stale'
+
+# Once the journal is this large, the next commit rewrites the network file.
+FLUSH_BYTES = 8 << 20
+
+# Whether commits are journaled; off unless the user enables it.
+_enabled = False
+_flush_bytes = FLUSH_BYTES
+
+
+class JournalError(ValueError):
+    """A journal cannot be applied to the network it was found next to."""
+
+
+def configure(enabled, flush_bytes=FLUSH_BYTES):
+    """Switch journaling of commits on or off.
+
+    Journals already written are still replayed when journaling is off; the
+    next commit then rewrites the file and deletes them.
+
+    Args:
+        enabled: True to journal commits instead of rewriting the file.
+        flush_bytes: Journal size from which a commit rewrites the file.
+    """
+    global _enabled, _flush_bytes
+    _enabled = bool(enabled)
+    _flush_bytes = int(flush_bytes)
+
+
+def enabled():
+    """Whether commits are journaled.
+
+    Returns:
+        bool: The setting.
+    """
+    return _enabled
+
+
+def journal_path(path):
+    """The journal of a network file.
+
+    Args:
+        path: Path of the network file or store.
+    Returns:
+        str: e.g. '/data/grid.json.journal' for '/data/grid.json'.
+    """
+    return store_root(path) + JOURNAL_SUFFIX
+
+
+def has_journal(path):
+    """Whether a network has a journal waiting to be replayed.
+
+    Args:
+        path: Path of the network file or store.
+    Returns:
+        bool: True if the journal file exists.
+    """
+    return os.path.isfile(journal_path(path))
+
+
+def journal_size(path):
+    """Size of a network's journal.
+
+    Args:
+        path: Path of the network file or store.
+    Returns:
+        int: Size in bytes, 0 if there is no journal.
+    """
+    try:
+        return os.path.getsize(journal_path(path))
+    except OSError:
+        return 0
+
+
+def needs_flush(path):
+    """Whether a network's journal has grown large enough to write the file.
+
+    Args:
+        path: Path of the network file or store.
+    Returns:
+        bool: True once the journal reaches the configured size.
+    """
+    return journal_size(path) >= _flush_bytes
+
+
+def _file_state(path):
+    """The state of the network file a journal is tied to.
+
+    Args:
+        path: Path of the network file or store.
+    Returns:
+        list or None: ``[mtime_ns, size]``, or None if the file is missing.
+    """
+    try:
+        stat = os.stat(state_path(path))
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _plain(value):
+    """Turn a table cell into a JSON value.
+
+    Args:
+        value: The cell.
+    Returns:
+        A str, int, float, bool or None.
+    Raises:
+        TypeError: For cells JSON cannot hold, such as controller objects.
+    """
+    if isinstance(value, np.generic):
+        value = value.item()
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    if value is pd.NA or value is pd.NaT:
+        return None
+    raise TypeError('cannot journal a {}'.format(type(value).__name__))
+
+
+def journal_entry(net, change):
+    """Describe committed edits as one journal line.
+
+    Args:
+        net: The edited network.
+        change: NetworkChange of the edits.
+    Returns:
+        dict or None: The entry, or None if the edits cannot be journaled:
+            the change covers everything or whole tables, or touches entries
+            that are not tables or cells that are not plain values.
+    """
+    if change.everything:
+        return None
+    tables = {}
+    for name in sorted(change.tables):
+        frame = net.get(name)
+        if not isinstance(frame, pd.DataFrame):
+            return None
+        removed = change.rows(REMOVED, name)
+        added = change.rows(ADDED, name)
+        modified = change.rows(MODIFIED, name)
+        if ALL_ROWS in (removed, added, modified):
+            return None
+
+        present = frame.index.intersection(list(added | modified))
+        # Rows added and removed again before the commit are simply gone.
+        gone = (removed | added | modified).difference(present)
+        columns = change.modified_columns(name)
+        if added or columns is None:
+            columns = list(frame.columns)
+        else:
+            columns = [column for column in frame.columns if column in columns]
+        try:
+            data = [[_plain(value) for value in row]
+                    for row in frame.loc[present, columns].itertuples(
+                        index=False, name=None)]
+            tables[name] = {
+                'removed': sorted(_plain(row) for row in gone),
+                'index': [_plain(row) for row in present],
+                'columns': columns,
+                'data': data,
+            }
+        except TypeError:
+            return None
+    return {'tables': tables}
+
+
+def append(path, net, change):
+    """Append committed edits to a network's journal.
+
+    Starts a journal if there is none. Refuses to add to a journal written
+    against another state of the file, since it would then be set aside with
+    the new edits in it.
+
+    Args:
+        path: Path of the network file or store.
+        net: The edited network.
+        change: NetworkChange of the edits since the last commit.
+    Returns:
+        bool: True if the edits are now in the journal; False if they must be
+            written to the file instead.
+    """
+    entry = journal_entry(net, change)
+    state = _file_state(path)
+    if entry is None or state is None:
+        return False
+
+    journal = journal_path(path)
+    lines = []
+    if os.path.isfile(journal):
+        header = _read_header(journal)
+        if header is None or header.get('state') != state:
+            return False
+    else:
+        lines.append({'journal': JOURNAL_FORMAT,
+                      'network': os.path.basename(store_root(path)),
+                      'state': state})
+    lines.append(entry)
+
+    try:
+        with open(journal, 'a', encoding='utf-8') as handle:
+            for line in lines:
+                handle.write(json.dumps(line, separators=(',', ':')) + '\n')
+            handle.flush()
+            os.fsync(handle.fileno())
+    except OSError as error:
+        print('Could not write journal {}: {}'.format(journal, error))
+        return False
+    return True
+
+
+def _read_header(journal):
+    """Read the first line of a journal.
+
+    Args:
+        journal: Path of the journal.
+    Returns:
+        dict or None: The header, or None if it is unreadable or of another
+            format.
+    """
+    try:
+        with open(journal, encoding='utf-8') as handle:
+            header = json.loads(handle.readline())
+    except (OSError, ValueError):
+        return None
+    if not isinstance(header, dict) or header.get('journal') != JOURNAL_FORMAT:
+        return None
+    return header
+
+
+def read_entries(path):
+    """Read the entries of a network's journal.
+
+    Args:
+        path: Path of the network file or store.
+    Returns:
+        list: The entries, oldest first. Empty without a journal.
+    Raises:
+        JournalError: If the journal does not apply to the file as it is now.
+    """
+    journal = journal_path(path)
+    if not os.path.isfile(journal):
+        return []
+    header = _read_header(journal)
+    if header is None:
+        raise JournalError('{} is not a journal this version can read.'
+                           .format(journal))
+    if header.get('state') != _file_state(path):
+        raise JournalError('{} was written for another version of {}.'
+                           .format(journal, os.path.basename(path)))
+
+    entries = []
+    with open(journal, encoding='utf-8') as handle:
+        handle.readline()
+        for line in handle:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                # Only the last line can be torn, by a crash while writing it.
+                break
+    return entries
+
+
+def _apply_table(frame, entry):
+    """Apply one table's part of a journal entry.
+
+    Args:
+        frame: The table; left unchanged.
+        entry: The table's part of the entry.
+    Returns:
+        DataFrame: The table with the edits applied.
+    """
+    removed = frame.index.intersection(entry['removed'])
+    if len(removed):
+        frame = frame.drop(index=removed)
+
+    columns = entry['columns']
+    rows = pd.DataFrame(entry['data'], columns=columns,
+                        index=pd.Index(entry['index'], dtype=object))
+    existing = rows.index.isin(frame.index)
+    if existing.any():
+        for column in columns:
+            frame.loc[list(rows.index[existing]), column] = \
+                rows.loc[existing, column].to_numpy()
+    if not existing.all():
+        new = rows.loc[~existing].copy()
+        new.index = pd.Index(list(new.index), dtype=frame.index.dtype)
+        for column in columns:
+            if column in frame.columns:
+                try:
+                    new[column] = new[column].astype(frame[column].dtype)
+                except (TypeError, ValueError):
+                    pass  # e.g. a missing value in an integer column
+        frame = pd.concat([frame, new])
+    return frame
+
+
+def apply_entries(net, entries):
+    """Apply journal entries to a network.
+
+    Each table an entry touches is replaced by an edited copy, all at once at
+    the end, so a failure leaves the network whole.
+
+    Args:
+        net: The network, changed in place.
+        entries: Entries as :py:func:`journal_entry` describes them.
+    Returns:
+        NetworkChange: What the entries changed.
+    Raises:
+        KeyError, TypeError, ValueError: If an entry does not apply to the
+            network.
+    """
+    change = NetworkChange()
+    tables = {}
+    for entry in entries:
+        for name, part in entry['tables'].items():
+            frame = tables.get(name)
+            if frame is None:
+                frame = net[name].copy()
+            tables[name] = _apply_table(frame, part)
+            change.add_rows(REMOVED, name, part['removed'])
+            change.add_rows(MODIFIED, name, part['index'],
+                            columns=part['columns'])
+    net.update(tables)
+    return change
+
+
+def replay(path, net):
+    """Apply a network's journal to the network just loaded from its file.
+
+    Args:
+        path: Path of the network file or store.
+        net: The loaded network, changed in place.
+    Returns:
+        NetworkChange or None: What the journal changed, or None if there was
+            no journal to apply. A journal that does not apply to the file is
+            set aside (see the module docstring) and None returned.
+    """
+    try:
+        entries = read_entries(path)
+    except JournalError as error:
+        set_aside(path, error)
+        return None
+    if not entries:
+        return None
+
+    try:
+        return apply_entries(net, entries)
+    except (KeyError, TypeError, ValueError) as error:
+        set_aside(path, error)
+        return None
+
+
+def set_aside(path, reason=''):
+    """Move a journal out of the way without deleting it.
+
+    Args:
+        path: Path of the network file or store.
+        reason: Why, for the log.
+    """
+    journal = journal_path(path)
+    try:
+        os.replace(journal, journal + STALE_SUFFIX)
+    except OSError:
+        return
+    print('Not replaying {}: {}'.format(journal, reason))
+
+
+def discard(path):
+    """Delete a network's journal, e.g. after the file was written.
+
+    Args:
+        path: Path of the network file or store.
+    """
+    try:
+        os.remove(journal_path(path))
+    except OSError:
+        pass
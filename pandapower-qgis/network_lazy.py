@@ -0,0 +1,489 @@
+# -*- coding: utf-8 -*-
+"""Lazy networks: tables are decoded when a layer first asks for them.
+
+Opening one ``bus@20.0`` layer used to decode every table of the file,
+including dozens of empty DC and asymmetric tables, ``std_types`` and every
+``res_*`` frame. A :py:class:`LazyNetwork` decodes only the cheap scalar entries
+(``name``, ``f_hz``, ``format_version``, ...) up front and every table on first
+access, so opening a layer costs roughly what the layer shows.
+
+For a JSON file, the tables are located by a single scan over the raw bytes.
+pandapower writes a network as
+
+    {"_module": ..., "_class": "pandapowerNet", "_object": {"bus": {...}, ...}}
+
+and the scan records the byte span of every entry of ``_object`` without
+decoding anything: strings are skipped by a regular expression and only
+brackets are counted, more than ten times faster than decoding. Decoding an entry later reads
+just its span and hands it to pandapower's own decoder. A ``.ppnet`` store
+needs no scan; its tables are read from their Parquet files. A database
+(``.gpkg``, ``.sqlite``) reads each table with one query.
+
+A lazy network is never handed to pandapower. Anything that works on the whole
+network - a power flow, a save, an export, an edit that may cascade - goes
+through ``NetworkSession.net``, which first decodes the remaining tables into a
+complete network, exactly as ``pandapower.from_json`` would have built it.
+
+Only files in the current pandapower format are opened lazily, since an older
+file needs ``convert_format``, which works on the whole network. Small files
+are not worth it either, and compressed files cannot be read at an offset.
+All of these fall back to a full load.
+
+This module is Qt-free, like ``network_session``.
+"""
+
+import json
+import mmap
+import os
+import re
+
+from . import network_database
+from .network_compression import detect_compression, plain_copy
+from .network_store import is_store_path, read_manifest, read_table, \
+    state_path, NETWORK_NAME
+
+# Files smaller than this are decoded in full; a lazy open would not be
+# noticeably faster and adds a second code path for nothing.
+LAZY_MIN_BYTES = 1 << 20
+
+_WHITESPACE = re.compile(rb'[ \t\n\r]*')
+# A JSON string, written so that the engine loops over runs of plain
+# characters instead of single characters: tables are stored as long strings.
+_STRING = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+_STRUCTURE = re.compile(rb'["{}\[\]]')
+_SCALAR = re.compile(rb'[^,}\]\s]+')
+
+
+class StaleNetworkError(ValueError):
+    """The file behind a lazy network changed before all tables were read."""
+
+
+def _skip_whitespace(buffer, position):
+    return _WHITESPACE.match(buffer, position).end()
+
+
+def _string_end(buffer, position):
+    match = _STRING.match(buffer, position)
+    if match is None:
+        raise ValueError('Unterminated string at byte {}'.format(position))
+    return match.end()
+
+
+def _value_end(buffer, position):
+    """Find the end of the JSON value starting at a position.
+
+    Args:
+        buffer: The document bytes (or a memory map of them).
+        position: Offset of the value's first byte.
+    Returns:
+        int: Offset just past the value.
+    """
+    first = buffer[position:position + 1]
+    if first == b'"':
+        return _string_end(buffer, position)
+    if first not in (b'{', b'['):
+        match = _SCALAR.match(buffer, position)
+        if match is None:
+            raise ValueError('Unexpected byte at {}'.format(position))
+        return match.end()
+
+    depth = 0
+    while True:
+        match = _STRUCTURE.search(buffer, position)
+        if match is None:
+            raise ValueError('Unterminated value')
+        position = match.start()
+        char = buffer[position:position + 1]
+        if char == b'"':
+            position = _string_end(buffer, position)
+            continue
+        depth += 1 if char in (b'{', b'[') else -1
+        position += 1
+        if depth == 0:
+            return position
+
+
+def _object_members(buffer, position, stop_at=None):
+    """Yield ``(key, start, end)`` for each member of a JSON object.
+
+    Args:
+        buffer: The document bytes.
+        position: Offset of the object's opening brace.
+        stop_at: Key at which to stop. Its member is yielded last, with an
+            end of None, so its value is not scanned twice.
+    """
+    if buffer[position:position + 1] != b'{':
+        raise ValueError('Expected an object at byte {}'.format(position))
+    position = _skip_whitespace(buffer, position + 1)
+    if buffer[position:position + 1] == b'}':
+        return
+    while True:
+        key_end = _string_end(buffer, position)
+        key = json.loads(buffer[position:key_end])
+        position = _skip_whitespace(buffer, key_end)
+        if buffer[position:position + 1] != b':':
+            raise ValueError('Expected ":" at byte {}'.format(position))
+        start = _skip_whitespace(buffer, position + 1)
+        if key == stop_at:
+            yield key, start, None
+            return
+        end = _value_end(buffer, start)
+        yield key, start, end
+        position = _skip_whitespace(buffer, end)
+        separator = buffer[position:position + 1]
+        if separator == b'}':
+            return
+        if separator != b',':
+            raise ValueError('Expected "," at byte {}'.format(position))
+        position = _skip_whitespace(buffer, position + 1)
+
+
+def scan_entries(path):
+    """Locate every entry of a pandapower JSON network without decoding it.
+
+    Args:
+        path: Path of the JSON file.
+    Returns:
+        dict: ``{name: (start, end)}`` byte spans of the entries of the
+            network's ``_object``, in file order.
+    Raises:
+        ValueError: If the file is not a pandapower network document.
+    """
+    with open(path, 'rb') as handle, \
+            mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        position = _skip_whitespace(buffer, 0)
+        for key, start, _ in _object_members(buffer, position, '_object'):
+            if key == '_object':
+                return {name: (entry_start, entry_end)
+                        for name, entry_start, entry_end
+                        in _object_members(buffer, start)}
+    raise ValueError('{} is not a pandapower network document.'.format(path))
+
+
+def _decode(text):
+    """Decode one entry with pandapower's own JSON decoder.
+
+    Args:
+        text: JSON text of the entry.
+    Returns:
+        The decoded value (a DataFrame for a table).
+    """
+    from pandapower.io_utils import PPJSONDecoder
+
+    return json.loads(text, cls=PPJSONDecoder)
+
+
+def _is_current_format(values):
+    """Whether a network's scalar entries say it needs no format conversion.
+
+    Args:
+        values: Mapping holding the network's ``version`` and
+            ``format_version`` entries.
+    Returns:
+        bool: True if ``convert_format`` would leave the network unchanged.
+    """
+    from packaging.version import InvalidVersion, Version
+    from pandapower import __format_version__
+
+    format_version = values.get('format_version')
+    if not isinstance(values.get('version'), str) \
+            or not isinstance(format_version, str):
+        return False
+    try:
+        return Version(format_version) == Version(__format_version__)
+    except InvalidVersion:
+        return False
+
+
+def read_scalars(path, spans):
+    """Decode the scalar entries of a network: versions, name, frequency.
+
+    Args:
+        path: Path of the plain JSON file.
+        spans: Its entry spans, from :py:func:`scan_entries`.
+    Returns:
+        dict: ``{name: value}`` for every entry that is not an object or an
+            array. These are a few bytes each.
+    """
+    values = {}
+    with open(path, 'rb') as handle:
+        for name, (start, end) in spans.items():
+            handle.seek(start)
+            if handle.read(1) not in (b'{', b'['):
+                handle.seek(start)
+                values[name] = _decode(handle.read(end - start))
+    return values
+
+
+def needs_conversion(path):
+    """Whether loading a network runs pandapower's format conversion.
+
+    True for files written by an older pandapower, such as the
+    ``bus_geodata`` and ``line_geodata`` layout of pandapower 2, which
+    ``convert_format`` rewrites on every load. Only the scalar entries are
+    decoded.
+
+    Args:
+        path: Path of the network file or store.
+    Returns:
+        bool: True if the file is not in the current format.
+    Raises:
+        ValueError: If the file is not a pandapower network document.
+        OSError: If it cannot be read.
+    """
+    if is_store_path(path):
+        return not _is_current_format(_store_skeleton(path))
+    if network_database.is_database_path(path):
+        return not _is_current_format(_database_skeleton(path))
+    # A compressed file is scanned from a decompressed temporary copy.
+    with plain_copy(path) as plain:
+        return not _is_current_format(read_scalars(plain,
+                                                   scan_entries(plain)))
+
+
+class LazyNetwork:
+    """A network whose tables are decoded on first access.
+
+    Build one with :py:func:`open_lazy`. The session owning it turns it into a
+    complete network with :py:meth:`materialize` once anything needs the
+    whole network.
+    """
+
+    def __init__(self, path, values, readers, prepare=None):
+        """Initialise the lazy network. Use :py:func:`open_lazy` instead.
+
+        Args:
+            path: Path of the network file or store.
+            values: Entries decoded up front, ``{name: value}``.
+            readers: ``{name: callable}`` returning each deferred entry.
+            prepare: Optional callable ``prepare(name, value, table)`` run on
+                every entry once decoded; ``table(name)`` gives another entry.
+        """
+        self.path = path
+        self._values = values
+        self._readers = readers
+        self._prepare = prepare
+        self._prepared = set()
+        self._state = self._file_state()
+
+    def _file_state(self):
+        try:
+            stat = os.stat(state_path(self.path))
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def __contains__(self, name):
+        return name in self._values or name in self._readers
+
+    def names(self):
+        """Names of every entry, decoded or not.
+
+        Returns:
+            list: Entry names.
+        """
+        return list(self._values) + [name for name in self._readers
+                                     if name not in self._values]
+
+    def decoded(self):
+        """Names of the entries decoded so far.
+
+        Returns:
+            list: Entry names.
+        """
+        return list(self._values)
+
+    def table(self, name, default=None):
+        """Return one entry, decoding it on first access.
+
+        Args:
+            name: Entry name, e.g. 'bus' or 'res_line'.
+            default: Returned when the network has no such entry.
+        Returns:
+            The entry's value, or ``default``.
+        Raises:
+            StaleNetworkError: If the file changed since it was opened.
+        """
+        reader = self._readers.pop(name, None)
+        if reader is not None:
+            if self._file_state() != self._state:
+                self._readers[name] = reader
+                raise StaleNetworkError(
+                    '{} changed on disk while it was open. Remove its layers '
+                    'and add them again.'.format(self.path))
+            self._values[name] = reader()
+        if name not in self._values:
+            return default
+        value = self._values[name]
+        if name not in self._prepared:
+            self._prepared.add(name)
+            if self._prepare is not None:
+                self._prepare(name, value, self.table)
+        return value
+
+    def materialize(self):
+        """Decode every remaining entry and build the complete network.
+
+        The result is what ``pandapower.from_json`` returns for the file (plus
+        what ``prepare`` adds): tables the file lacks come from an empty
+        network. Entries already handed out are reused, not decoded again.
+
+        Returns:
+            pandapowerNet: The complete network.
+        Raises:
+            StaleNetworkError: If the file changed since it was opened.
+        """
+        from pandapower import create_empty_network
+
+        for name in self.names():
+            self.table(name)
+        net = create_empty_network()
+        net.update(self._values)
+        return net
+
+
+def _open_json(path, prepare):
+    """Open a pandapower JSON network lazily.
+
+    Args:
+        path: Path of the JSON file.
+        prepare: Passed to :py:class:`LazyNetwork`.
+    Returns:
+        LazyNetwork or None: None if a full load is preferable.
+    """
+    if os.path.getsize(path) < LAZY_MIN_BYTES or detect_compression(path):
+        return None
+
+    spans = scan_entries(path)
+    values = read_scalars(path, spans)
+    if not _is_current_format(values):
+        return None
+    readers = {name: _span_reader(path, start, end)
+               for name, (start, end) in spans.items() if name not in values}
+    return LazyNetwork(path, values, readers, prepare)
+
+
+def _span_reader(path, start, end):
+    def read():
+        with open(path, 'rb') as handle:
+            handle.seek(start)
+            return _decode(handle.read(end - start))
+    return read
+
+
+def _open_store(path, prepare):
+    """Open a ``.ppnet`` store lazily.
+
+    Args:
+        path: Store path.
+        prepare: Passed to :py:class:`LazyNetwork`.
+    Returns:
+        LazyNetwork or None: None if a full load is preferable.
+    """
+    manifest = read_manifest(path)
+    skeleton = _store_skeleton(path)
+    if not _is_current_format(skeleton):
+        return None
+
+    readers = {
+        table: _table_reader(path, table, manifest)
+        for table, entry in manifest['tables'].items() if entry.get('file')
+    }
+    values = {name: value for name, value in skeleton.items()
+              if name not in readers}
+    return LazyNetwork(path, values, readers, prepare)
+
+
+def _store_skeleton(path):
+    """Read the entries of a ``.ppnet`` store that are not tables.
+
+    Args:
+        path: Store path.
+    Returns:
+        pandapowerNet: The scalars and ``std_types``, without conversion.
+    """
+    from pandapower.auxiliary import pandapowerNet
+    from pandapower.file_io import from_json_string
+
+    from .network_store import _StoreReader
+
+    with _StoreReader(path) as reader:
+        # A bare pandapowerNet instead of create_empty_network(), so only the
+        # entries the store actually holds end up in the skeleton.
+        return from_json_string(reader.read_text(NETWORK_NAME),
+                                empty_dict_like_object=pandapowerNet({}))
+
+
+def _table_reader(path, table, manifest):
+    return lambda: read_table(path, table, manifest)
+
+
+def _open_database(path, prepare):
+    """Open a network database lazily.
+
+    Args:
+        path: Database path.
+        prepare: Passed to :py:class:`LazyNetwork`.
+    Returns:
+        LazyNetwork or None: None if a full load is preferable.
+    """
+    manifest = network_database.read_manifest(path)
+    skeleton = _database_skeleton(path)
+    if not _is_current_format(skeleton):
+        return None
+
+    readers = {
+        table: _database_reader(path, table, manifest)
+        for table, entry in manifest['tables'].items()
+        if entry.get('storage') == 'table'
+    }
+    values = {name: value for name, value in skeleton.items()
+              if name not in readers}
+    return LazyNetwork(path, values, readers, prepare)
+
+
+def _database_skeleton(path):
+    """Read the entries of a network database that are not tables.
+
+    Args:
+        path: Database path.
+    Returns:
+        pandapowerNet: The scalars, ``std_types`` and the tables kept as
+            JSON, without conversion.
+    """
+    from pandapower.auxiliary import pandapowerNet
+    from pandapower.file_io import from_json_string
+
+    return from_json_string(network_database.read_skeleton_text(path),
+                            empty_dict_like_object=pandapowerNet({}))
+
+
+def _database_reader(path, table, manifest):
+    return lambda: network_database.read_table(path, table, manifest)
+
+
+def open_lazy(path, kind, prepare=None):
+    """Open a network file lazily, if that is possible and worthwhile.
+
+    Args:
+        path: Path of the network file or store.
+        kind: KIND_POWER or KIND_PIPES. Pipe networks are always loaded fully.
+        prepare: Optional per-entry hook, see :py:class:`LazyNetwork`.
+    Returns:
+        LazyNetwork or None: None when the caller should load the file fully.
+    """
+    from .network_session import KIND_POWER
+
+    if kind != KIND_POWER:
+        return None
+    try:
+        if is_store_path(path):
+            return _open_store(path, prepare)
+        if network_database.is_database_path(path):
+            return _open_database(path, prepare)
+        return _open_json(path, prepare)
+    except Exception as error:
+        # Anything unexpected is left to the full loader, which reports
+        # errors properly.
+        print('Loading {} in full: {}'.format(path, error))
+        return None
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""Loading networks in the background.
+
+Constructing a provider used to load its network on the GUI thread, inside
+``NetworkSession.acquire``. A project with several large networks froze QGIS
+for minutes at start. A provider for a large file that is not open yet now
+registers a *loading* session instead and hands the load to a
+:py:class:`NetworkLoadTask` in the QGIS task manager.
+
+Rules the load follows:
+
+* One load per file. Every provider acquiring the file while it loads joins the
+  same session, and is told once the network arrives.
+* Meanwhile the providers are valid but empty: no fields, no features, an empty
+  extent. ``PandapowerProvider.on_network_loaded`` then fills the layer in.
+* A failed load drops the session, so the next attempt starts afresh.
+
+Small files are still loaded on the spot; a task would only add a flicker.
+
+When a project is opened, :py:func:`preload_networks` starts a load for every
+network of the project before its first layer is built, small files included,
+so the files load side by side rather than one layer at a time (see
+``network_preload``).
+"""
+
+import os
+
+from qgis.core import QgsApplication, QgsTask
+
+from .network_lazy import LAZY_MIN_BYTES
+from .network_store import state_path
+
+# Files smaller than this are loaded directly by the provider.
+BACKGROUND_MIN_BYTES = LAZY_MIN_BYTES
+
+
+def should_load_in_background(path):
+    """Whether a network file is large enough to be loaded in a task.
+
+    Args:
+        path: Path of the network file or store.
+    Returns:
+        bool: True for a large file, False for a small or missing one.
+    """
+    try:
+        return os.path.getsize(state_path(path)) >= BACKGROUND_MIN_BYTES
+    except OSError:
+        return False  # Let the direct load report the missing file
+
+
+class NetworkLoadTask(QgsTask):
+    """Loads one session's network on a worker thread."""
+
+    def __init__(self, session, load):
+        """Initialise the task. Use :py:func:`load_in_background` instead.
+
+        Args:
+            session: The loading NetworkSession.
+            load: Zero-argument callable returning ``(net, lazy)``, see
+                ``network_session.open_network``.
+        """
+        super().__init__('Loading {}'.format(os.path.basename(session.path)),
+                         QgsTask.CanCancel)
+        self.session = session
+        self.load = load
+        self.loaded = None
+        self.error = None
+
+    def run(self):
+        """Load the network. Runs on a worker thread.
+
+        pandapower's parser reports no progress, so the bar moves when the
+        load starts and when it is done.
+
+        Returns:
+            bool: True if the network was loaded.
+        """
+        self.setProgress(5)
+        try:
+            self.loaded = self.load()
+        except Exception as error:
+            self.error = error
+            return False
+        self.setProgress(100)
+        return not self.isCanceled()
+
+    def finished(self, result):
+        """Install the network and tell the providers, on the main thread.
+
+        Args:
+            result: Return value of :py:meth:`run`.
+        """
+        session = self.session
+        session.load_task = None
+        # The layers of the network's scenarios waited for it as well.
+        providers = session.providers()
+        for fork in session.forks():
+            providers.extend(fork.providers())
+
+        if result:
+            net, lazy = self.loaded
+            session.install(net=net, lazy=lazy)
+            for provider in providers:
+                try:
+                    provider.on_network_loaded()
+                except Exception as error:  # pragma: no cover - defensive
+                    print('Failed to show loaded network: {}'.format(error))
+            return
+
+        # Nothing to keep; the next acquisition loads the file again.
+        for fork in session.forks():
+            fork.drop()
+        session.drop()
+        if self.error is not None:
+            message = str(self.error)
+        else:
+            message = 'Loading {} was cancelled.'.format(session.path)
+        for provider in providers:
+            provider.on_network_failed(message)
+
+
+def load_in_background(session, load):
+    """Start loading a session's network in the task manager.
+
+    Passed as ``background`` to ``NetworkSession.acquire``.
+
+    Args:
+        session: The NetworkSession, registered without a network.
+        load: Zero-argument callable returning ``(net, lazy)``.
+    Returns:
+        NetworkLoadTask: The started task.
+    """
+    task = NetworkLoadTask(session, load)
+    # The session keeps the Python wrapper alive until finished() has run.
+    session.load_task = task
+    QgsApplication.taskManager().addTask(task)
+    return task
+
+
+def wait_for_load(session, timeout=None):
+    """Block until a session's background load has finished.
+
+    Processes events meanwhile, so the task's finished() runs. Used by tests.
+
+    Args:
+        session: The NetworkSession.
+        timeout: Seconds to wait at most, or None for no limit.
+    Returns:
+        bool: True if no load is in flight any more.
+    """
+    import time
+
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while session.load_task is not None:
+        if deadline is not None and time.monotonic() > deadline:
+            return False
+        QgsApplication.processEvents()
+        time.sleep(0.01)
+    return True
+
+
+def preload_networks(networks):
+    """Start loading networks in the background before their layers exist.
+
+    Each network gets a loading session, which its layers join when QGIS
+    builds them. The sessions are acquired here and must be released with
+    :py:func:`release_preloaded` once the layers have been built; a network no
+    layer joined then moves to the warm pool.
+
+    Args:
+        networks: ``(path, kind, epsg)`` per network, see
+            ``network_preload.project_networks``.
+    Returns:
+        list: The acquired NetworkSessions.
+    """
+    from .network_lazy import open_lazy
+    from .network_preload import load_network
+    from .network_session import NetworkSession, prepare_table
+
+    sessions = []
+    for path, kind, epsg in networks:
+        if NetworkSession.get(path) is not None \
+                or not os.path.exists(state_path(path)):
+            continue  # Open already, or left to the layer to report
+        try:
+            sessions.append(NetworkSession.acquire(
+                path,
+                lambda path=path, kind=kind: load_network(path, kind),
+                epsg=epsg,
+                kind=kind,
+                lazy_loader=lambda path=path, kind=kind: open_lazy(
+                    path, kind, prepare_table),
+                background=load_in_background))
+        except Exception as error:
+            print('Could not preload {}: {}'.format(path, error))
+    return sessions
+
+
+def release_preloaded(sessions):
+    """Release the sessions :py:func:`preload_networks` acquired.
+
+    Args:
+        sessions: The list it returned; emptied here.
+    """
+    while sessions:
+        sessions.pop().release()
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""Loading the networks of a project before its layers ask for them.
+
+When a project is read, QGIS constructs its layers one after the other, and
+each provider acquires its network in its constructor. A project with layers
+from eight network files therefore loaded eight files in a row, and opening it
+took as long as all of them together.
+
+Before the first layer is built, the plugin now reads the project file itself
+(:py:func:`project_layer_sources`), collects the distinct networks its
+pandapower layers use (:py:func:`project_networks`) and starts loading all of
+them at once (``network_loading.preload_networks``). The providers then join
+sessions that are already loading or loaded, and the project opens in about
+the time of its largest file.
+
+Loading in parallel needs more than threads: pandapower's JSON parser holds the
+interpreter lock, so two files parsed on two threads take as long as one after
+the other. A large file that has to be decoded in full therefore has its large
+tables decoded in worker processes (:py:func:`load_network`, see
+``network_decode``), which hand them back pickled. Starting a worker costs
+about as much as parsing a small file, so only files of
+:py:data:`PROCESS_MIN_BYTES` or more use the workers. Small files, files
+opened lazily and files found in the network cache are handled as before. If
+no worker can be started, for instance because no Python interpreter is found
+next to QGIS, the tables are decoded in this process.
+
+This module is Qt-free, like ``network_session``, so a worker process can
+import it.
+"""
+
+import io
+import multiprocessing
+import os
+import sys
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from xml.etree import ElementTree
+
+from .network_compression import detect_compression, open_text
+from .network_database import is_database_path, load_database
+from .network_decode import decode_network
+from .network_session import KIND_PIPES, KIND_POWER, DEFAULT_EPSG, \
+    add_vn_kv_to_lines, normalise_path
+from .network_store import is_store_path, load_store, state_path
+
+# Provider key the plugin registers; layers of other providers are ignored.
+PROVIDER_KEY = 'PandapowerProvider'
+
+# Tables that only exist in pandapipes networks, as in the provider.
+PIPE_TABLES = ('junction', 'pipe')
+
+# Files smaller than this are decoded in this process; a worker would take
+# longer to start than the decode.
+PROCESS_MIN_BYTES = 8 << 20
+
+# Worker processes decoding at the same time. Each holds the table it decodes
+# twice while it pickles it, so more would trade memory for little.
+PROCESS_WORKERS = max(1, min(4, (os.cpu_count() or 1) - 1))
+
+# The worker pool, started on first use and shut down with the plugin.
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def read_network(path, kind, pool=None):
+    """Load a network file or store in full.
+
+    What a provider's loader does, without Qt.
+
+    Args:
+        path: Path of the network file or store.
+        kind: KIND_POWER or KIND_PIPES.
+        pool: Optional executor of worker processes to decode large tables
+            in, see ``network_decode.decode_network``.
+    Returns:
+        The loaded network, with the ``vn_kv`` column on its lines.
+    Raises:
+        ValueError: If the path is empty or missing, or the kind unsupported.
+    """
+    import pandapower as pp
+
+    if not path:
+        raise ValueError('File path is empty')
+    if not os.path.exists(path):
+        raise ValueError('File not found: {}'.format(path))
+    if kind == KIND_PIPES:
+        # pandapipes support is planned but not integrated yet (plan section 5.4).
+        raise ValueError('Pipe networks not yet implemented')
+
+    if is_store_path(path):
+        # Columnar .ppnet store: one Parquet file per table
+        net = load_store(path)
+    elif is_database_path(path):
+        # GeoPackage / SQLite database: one database table per table
+        net = load_database(path)
+    else:
+        # Tables side by side; None for what only from_json can decode
+        net = decode_network(path, pool)
+    if net is None and detect_compression(path):
+        # .json.gz / .json.zst, decompressed while it is read
+        with open_text(path) as handle:
+            net = pp.from_json(handle)
+    elif net is None:
+        net = pp.from_json(path)
+    # Line layers are filtered by the voltage level of their from_bus.
+    add_vn_kv_to_lines(net)
+    return net
+
+
+def python_executable():
+    """Find a Python interpreter to start worker processes with.
+
+    Inside QGIS ``sys.executable`` is usually QGIS itself, which must not be
+    started once per worker; the interpreter QGIS embeds lives under
+    ``sys.exec_prefix``.
+
+    Returns:
+        str or None: Path of the interpreter, or None if none was found.
+    """
+    if os.path.basename(sys.executable or '').lower().startswith('python'):
+        return sys.executable
+    names = ('python.exe', 'pythonw.exe') if os.name == 'nt' else (
+        'python{}.{}'.format(*sys.version_info[:2]), 'python3', 'python')
+    for directory in (sys.exec_prefix, os.path.join(sys.exec_prefix, 'bin')):
+        for name in names:
+            candidate = os.path.join(directory, name)
+            if os.path.isfile(candidate):
+                return candidate
+    return None
+
+
+def worker_pool():
+    """The pool of worker processes, started on first use.
+
+    Workers are spawned rather than forked: a forked copy of QGIS would
+    inherit its threads and Qt state.
+
+    Returns:
+        concurrent.futures.ProcessPoolExecutor or None: None if no Python
+            interpreter was found to run the workers.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            executable = python_executable()
+            if executable is None:
+                return None
+            context = multiprocessing.get_context('spawn')
+            context.set_executable(executable)
+            _pool = ProcessPoolExecutor(max_workers=PROCESS_WORKERS,
+                                        mp_context=context)
+        return _pool
+
+
+def shutdown_pool():
+    """Stop the worker processes, if any were started."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def load_network(path, kind):
+    """Load a network in full, its large tables in worker processes.
+
+    Blocks the calling thread, but not the interpreter, while the workers
+    decode, so several loads on several threads run side by side.
+
+    Args:
+        path: Path of the network file or store.
+        kind: KIND_POWER or KIND_PIPES.
+    Returns:
+        The loaded network, as :py:func:`read_network` returns it.
+    Raises:
+        Any exception raised by :py:func:`read_network`.
+    """
+    try:
+        large = os.path.getsize(state_path(path)) >= PROCESS_MIN_BYTES
+    except OSError:
+        large = False  # Let read_network report the missing file
+    pool = worker_pool() if large and kind == KIND_POWER else None
+    return read_network(path, kind, pool)
+
+
+def _project_document(project_path):
+    """Open the XML document of a project file.
+
+    Args:
+        project_path: Path of a ``.qgs`` or ``.qgz`` project.
+    Returns:
+        A binary file object with the ``.qgs`` XML.
+    Raises:
+        OSError: If the project cannot be read.
+    """
+    if zipfile.is_zipfile(project_path):
+        with zipfile.ZipFile(project_path) as archive:
+            for name in archive.namelist():
+                if name.lower().endswith('.qgs'):
+                    return io.BytesIO(archive.read(name))
+        raise OSError('{} holds no .qgs document'.format(project_path))
+    return open(project_path, 'rb')
+
+
+def project_layer_sources(project_path, provider=PROVIDER_KEY):
+    """Read the data sources of a project's layers from the project file.
+
+    Args:
+        project_path: Path of a ``.qgs`` or ``.qgz`` project.
+        provider: Only layers of this data provider are returned.
+    Returns:
+        list: The layers' data source URIs, in project order.
+    Raises:
+        OSError: If the project cannot be read.
+        xml.etree.ElementTree.ParseError: If it is not a project.
+    """
+    sources = []
+    with _project_document(project_path) as document:
+        for _, element in ElementTree.iterparse(document):
+            if element.tag != 'maplayer':
+                continue
+            if (element.findtext('provider') or '').strip() == provider:
+                source = element.findtext('datasource')
+                if source:
+                    sources.append(source)
+            element.clear()  # Layer styles can be large
+    return sources
+
+
+def project_networks(sources, decode, project_path=None):
+    """Collect the distinct networks a project's layers use.
+
+    Args:
+        sources: Data source URIs, see :py:func:`project_layer_sources`.
+        decode: Callable turning a URI into a dict in the current scheme,
+            e.g. ``pandapower_uri.decode_uri`` applied to
+            ``QgsProviderMetadata.decodeUri``.
+        project_path: Path of the project file. QGIS saves data sources
+            relative to it by default; they are resolved against its
+            directory, as QGIS does when it reads the project.
+    Returns:
+        list: ``(path, kind, epsg)`` per network file, in the order the first
+            layer of each appears. Layers of one file are one entry.
+    """
+    directory = os.path.dirname(os.path.abspath(project_path)) \
+        if project_path else None
+    networks = {}
+    for source in sources:
+        parts = decode(source)
+        path = parts.get('path')
+        if path and directory and not os.path.isabs(path):
+            path = os.path.normpath(os.path.join(directory, path))
+        key = normalise_path(path)
+        if not key:
+            continue
+        kind = KIND_PIPES if parts.get('table') in PIPE_TABLES else KIND_POWER
+        if key not in networks:
+            networks[key] = (path, kind,
+                             int(parts.get('epsg') or DEFAULT_EPSG))
+        elif kind == KIND_PIPES:
+            path, _, epsg = networks[key]
+            networks[key] = (path, kind, epsg)
+    return list(networks.values())
@@ -0,0 +1,446 @@
+# -*- coding: utf-8 -*-
+"""What-if scenarios of a network, sharing unchanged tables copy-on-write.
+
+Comparing variants of a network - a new line here, a closed switch there -
+used to mean copying the file and opening every copy, so ten variants of a
+2 GB network held 20 GB. A scenario instead starts as a shallow copy of the
+network it is forked from (``NetworkSession.fork``): the network dict is new,
+every table in it is the very same DataFrame object the base network holds.
+Only the tables a scenario edits get copied, just before the edit
+(``NetworkSession.own``); deleting features copies only the tables rows were
+dropped from (``NetworkSession.detached``). The base network copies a table
+it shares the same way before changing it, so a scenario keeps the state it
+was forked with.
+
+Each scenario has a session of its own (:py:class:`ScenarioSession`), keyed by
+the file and the scenario name, so layers, power flows and commits work on it
+exactly as on the file's session. A layer chooses its scenario with the
+``scenario`` key of its URI::
+
+    path="C:/net/grid.json";table="bus";scenario="new_feeder"
+
+Committing a scenario does not touch the network file. It saves only the
+tables the scenario owns, as a small network document next to the file::
+
+    C:/net/grid.json.scenarios/new_feeder.json
+
+Opening the scenario again reads those tables on top of the file's network,
+which provides every table the scenario did not change.
+
+This module is Qt-free, like ``network_session``.
+"""
+
+import copy
+import os
+import re
+
+from .network_compaction import COMPACTION_KEY
+from .network_session import DEFAULT_EPSG, KIND_POWER, NetworkSession, \
+    estimate_memory, normalise_path
+from .network_store import store_root
+
+# Directory next to the network file that holds its saved scenarios.
+SCENARIO_DIR_SUFFIX = '.scenarios'
+
+SCENARIO_SUFFIX = '.json'
+
+# Separates the file from the scenario name in a session key. '?' is not
+# allowed in Windows paths and unusual elsewhere.
+KEY_SEPARATOR = '?scenario='
+
+# Scenario names double as file names, so they are kept to safe characters.
+_NAME = re.compile(r'[\w][\w .-]{0,63}')
+
+
+def check_name(name):
+    """Validate a scenario name.
+
+    Args:
+        name: The name, e.g. 'new_feeder'.
+    Returns:
+        str: The name without surrounding whitespace.
+    Raises:
+        ValueError: If the name is empty, too long, or has characters other
+            than letters, digits, spaces, '.', '-' and '_'.
+    """
+    name = (name or '').strip()
+    if not _NAME.fullmatch(name):
+        raise ValueError('{!r} is not a valid scenario name. Use letters, '
+                         'digits, spaces, ".", "-" and "_".'.format(name))
+    return name
+
+
+def scenario_key(path, name):
+    """The registry key of a scenario's session.
+
+    Args:
+        path: Path of the network file.
+        name: Scenario name.
+    Returns:
+        str: The file's session key, extended by the scenario name.
+    """
+    return normalise_path(path) + KEY_SEPARATOR + check_name(name)
+
+
+def scenario_dir(path):
+    """The directory holding a network's saved scenarios.
+
+    Args:
+        path: Path of the network file or store.
+    Returns:
+        str: e.g. '/data/grid.json.scenarios' for '/data/grid.json'.
+    """
+    return store_root(path) + SCENARIO_DIR_SUFFIX
+
+
+def scenario_path(path, name):
+    """The file a scenario is saved to.
+
+    Args:
+        path: Path of the network file or store.
+        name: Scenario name.
+    Returns:
+        str: e.g. '/data/grid.json.scenarios/new_feeder.json'.
+    """
+    return os.path.join(scenario_dir(path), check_name(name) + SCENARIO_SUFFIX)
+
+
+def scenario_exists(path, name):
+    """Whether a scenario of a network has been saved.
+
+    Args:
+        path: Path of the network file or store.
+        name: Scenario name.
+    Returns:
+        bool: True if its file exists.
+    """
+    return os.path.isfile(scenario_path(path, name))
+
+
+def list_scenarios(path):
+    """List a network's scenarios, saved or open.
+
+    Args:
+        path: Path of the network file or store.
+    Returns:
+        list: Scenario names, sorted.
+    """
+    names = set()
+    try:
+        for entry in os.listdir(scenario_dir(path)):
+            if entry.endswith(SCENARIO_SUFFIX):
+                names.add(entry[:-len(SCENARIO_SUFFIX)])
+    except OSError:
+        pass  # No scenario saved yet
+    prefix = normalise_path(path) + KEY_SEPARATOR
+    for session in NetworkSession.all_sessions():
+        if session.key.startswith(prefix):
+            names.add(session.scenario)
+    return sorted(names)
+
+
+def read_scenario(path):
+    """Read the entries a saved scenario holds.
+
+    Args:
+        path: Path of the scenario file.
+    Returns:
+        dict: Entry name to decoded value; empty if the file does not exist.
+    Raises:
+        ValueError: If the file is not a scenario this version can read.
+    """
+    from .network_decode import hook, parse_document
+
+    try:
+        with open(path, 'rb') as handle:
+            data = handle.read()
+    except FileNotFoundError:
+        return {}
+    document = parse_document(data)
+    entries = document.get('_object') if isinstance(document, dict) else None
+    if not isinstance(entries, dict):
+        raise ValueError('{} is not a saved scenario.'.format(path))
+    return {name: hook(value) for name, value in entries.items()}
+
+
+class ScenarioSession(NetworkSession):
+    """The session of one scenario, forked from the session of its file.
+
+    Create one with ``NetworkSession.fork``, or open a saved one with
+    ``NetworkSession.acquire(..., scenario=name)``. The scenario holds a
+    reference to the file's session until it leaves the registry.
+    """
+
+    def __init__(self, parent, name, net=None):
+        """Initialise a scenario. Use ``NetworkSession.fork`` instead.
+
+        Args:
+            parent: Session of the network file. The caller has taken the
+                reference the scenario holds.
+            name: Scenario name.
+            net: The network to start from, a shallow copy of the one forked.
+                None opens the saved scenario on top of the parent's network,
+                once the parent has one.
+        Raises:
+            ValueError: If the name is invalid or the saved scenario
+                unreadable.
+        """
+        self.parent = parent
+        self.scenario = check_name(name)
+        self.file_path = scenario_path(parent.path, self.scenario)
+        # Entries of the saved scenario, until the parent's network arrives.
+        self._overlay = {} if net is not None \
+            else read_scenario(self.file_path)
+        self._forgotten = False
+        super().__init__(parent.path, net, epsg=parent.epsg, kind=parent.kind)
+        self.key = scenario_key(parent.path, self.scenario)
+        parent._forks.add(self)
+
+    # -- network access ---------------------------------------------------
+
+    @property
+    def net(self):
+        """The scenario's network, taken from the parent's on first access."""
+        with self._network_lock:
+            if self._net is None:
+                self.attach()
+            return self._net
+
+    @net.setter
+    def net(self, net):
+        self._overlay = {}
+        self._net = net
+
+    def attach(self):
+        """Build the network from the parent's, if not done yet.
+
+        The parent's network is copied shallowly, so every table is shared,
+        and the saved scenario's entries replace the parent's.
+        """
+        with self._network_lock:
+            if self._net is not None:
+                return
+            base = self.parent.net
+            if base is None:
+                return  # Still loading
+            net = copy.copy(base)
+            net.update(self._overlay)
+            self._overlay = {}
+            self._net = net
+
+    def table(self, name, default=None):
+        """Return one table, without building the network.
+
+        Args:
+            name: Entry name, e.g. 'bus'.
+            default: Returned when the network has no such entry.
+        Returns:
+            The scenario's entry, or else the parent's.
+        """
+        with self._network_lock:
+            if self._net is not None:
+                return getattr(self._net, name, default)
+            if name in self._overlay:
+                return self._overlay[name]
+        return self.parent.table(name, default)
+
+    def has_network(self):
+        """Whether the scenario or its parent holds a network.
+
+        Returns:
+            bool: True once the parent's network has arrived.
+        """
+        return self._net is not None or self.parent.has_network()
+
+    def is_loading(self):
+        """Whether the parent's network is still being loaded.
+
+        Returns:
+            bool: True while a background load is in flight.
+        """
+        return self._net is None and self.parent.is_loading()
+
+    def owned(self):
+        """Names of the entries the scenario does not share with its parent.
+
+        Returns:
+            list: The tables and values the scenario changed, or that the
+                parent changed after the fork; private entries excluded.
+        """
+        with self._network_lock:
+            net = self._net
+            if net is None:
+                return [name for name in self._overlay
+                        if not name.startswith('_')]
+            base = self.parent._net
+            return [name for name, value in net.items()
+                    if not name.startswith('_')
+                    and (base is None or base.get(name) is not value)]
+
+    def memory_usage(self):
+        """Estimate the memory the scenario holds beyond its parent's.
+
+        Returns:
+            int: Estimated size in bytes of the tables it owns.
+        """
+        with self._network_lock:
+            if self._net is None:
+                entries = list(self._overlay.values())
+            else:
+                entries = [self._net[name] for name in self.owned()]
+        return estimate_memory(entries)
+
+    # -- writing ----------------------------------------------------------
+
+    def _owned_network(self):
+        """The network reduced to the entries the scenario owns.
+
+        Returns:
+            The reduced network, of the same type as ``net``, or None.
+        """
+        net = self.net
+        if net is None:
+            return None
+        with self._network_lock:
+            names = self.owned()
+            reduced = copy.copy(net)
+            reduced.clear()
+            reduced.update({name: net[name] for name in names})
+            # Lets the writer restore compacted dtypes; not written itself.
+            if COMPACTION_KEY in net:
+                reduced[COMPACTION_KEY] = net[COMPACTION_KEY]
+        return reduced
+
+    def state_file(self):
+        """The scenario's own file, which commits write.
+
+        Returns:
+            str: Path of the saved scenario.
+        """
+        return self.file_path
+
+    def snapshot(self):
+        """Copy the tables the scenario owns, for a background write.
+
+        Returns:
+            tuple: ``(net, generation)``, see ``NetworkSession.snapshot``.
+        """
+        from .network_io import snapshot_network
+
+        return snapshot_network(self._owned_network()), self.generation
+
+    def write(self, backup=True, net=None, progress=None):
+        """Save the tables the scenario owns to its file.
+
+        The network file is never written; see the module docstring. A
+        scenario is small and rewritten whole, so it keeps no backups.
+
+        Args:
+            backup: Ignored.
+            net: A snapshot from :py:meth:`snapshot` to write instead.
+            progress: Optional callable receiving the fraction written.
+        Returns:
+            tuple: ``(success, message, backup_path)``; no backup is made.
+        """
+        from .network_io import write_network
+
+        snapshot = net is not None
+        if not snapshot:
+            net = self._owned_network()
+        if net is None:
+            return False, 'No network loaded.', ''
+
+        try:
+            os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+            write_network(net, self.file_path, self.kind, progress=progress)
+        except PermissionError:
+            return (False,
+                    'Cannot write {}. You may not have permission.'.format(
+                        self.file_path), '')
+        except Exception as error:
+            return False, 'Could not save scenario: {}'.format(error), ''
+
+        if not snapshot:
+            self.mark_clean()
+        return (True, 'Scenario {} saved to {}'.format(
+            self.scenario, self.file_path), '')
+
+    def create_backup(self):
+        """Scenarios keep no backups, see :py:meth:`write`.
+
+        Returns:
+            str: Always an empty string.
+        """
+        return ''
+
+    def append_journal(self):
+        """Scenarios are not journaled; their file is small.
+
+        Returns:
+            bool: Always False, so commits write the scenario file.
+        """
+        return False
+
+    def discard_journal(self):
+        """Leave the network file's journal alone; it is not the scenario's."""
+
+    def _replay_journal(self):
+        """A scenario has no journal to replay."""
+
+    def _forget(self):
+        """Release the parent, once, after leaving the registry."""
+        if self._forgotten:
+            return
+        self._forgotten = True
+        self.parent.release()
+
+    def __repr__(self):
+        return ('<ScenarioSession {} of {} refs={} dirty={} owned={}>'.format(
+            self.scenario, self.path, self._refcount, self.dirty,
+            len(self.owned())))
+
+
+def acquire_scenario(path, name, loader, epsg=DEFAULT_EPSG, kind=KIND_POWER,
+                     lazy_loader=None, background=None):
+    """Get the session of a scenario, opening it if it is not open yet.
+
+    Called by ``NetworkSession.acquire`` for a ``scenario``; the other
+    arguments are those of the file's session, which is acquired as well and
+    held by the scenario. A scenario that was never saved opens as an
+    unchanged copy of the network.
+
+    Args:
+        path: Path of the network file.
+        name: Scenario name.
+        loader: See ``NetworkSession.acquire``.
+        epsg: See ``NetworkSession.acquire``.
+        kind: See ``NetworkSession.acquire``.
+        lazy_loader: See ``NetworkSession.acquire``.
+        background: See ``NetworkSession.acquire``.
+    Returns:
+        ScenarioSession: The shared session of the scenario.
+    Raises:
+        ValueError: If the name is invalid or the saved scenario unreadable.
+        Any exception raised by ``loader``.
+    """
+    key = scenario_key(path, name)
+    with NetworkSession._lock:
+        session = NetworkSession._take(key)
+        if session is not None:
+            session._refcount += 1
+            return session
+
+    parent = NetworkSession.acquire(path, loader, epsg=epsg, kind=kind,
+                                    lazy_loader=lazy_loader,
+                                    background=background)
+    try:
+        opened = ScenarioSession(parent, name)
+    except BaseException:
+        parent.release()
+        raise
+    with NetworkSession._lock:
+        session = NetworkSession._sessions.setdefault(key, opened)
+        session._refcount += 1
+    if session is not opened:
+        opened._forget()  # Another thread opened it meanwhile
+    return session
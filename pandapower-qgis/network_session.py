@@ -13,20 +13,88 @@ edit made through one layer is immediately visible to all others. That is what
 makes the plugin operate on the pandapower network itself rather than on
 per-layer copies.
 
+A session whose last layer is closed is not dropped at once but kept in a warm
+pool, so closing and reopening a layer, or opening a layer right after the
+Browser listed the file, does not parse the file again. The pool is bounded by
+a memory budget (see :py:func:`configure_pool`) and evicts the least recently
+released sessions first. A session with unsaved edits is never evicted: its
+edits exist nowhere else.
+
+A session can fork what-if scenarios (:py:meth:`NetworkSession.fork`), each a
+session of its own that shares every table it has not changed with the
+network it was forked from; see ``network_scenario``.
+
+The registry may be used from several threads: QGIS can build Browser items
+and run tasks off the main thread. One lock guards the registry, the pool and
+every reference count, and is never held while a network loads. A file is
+loaded once however many threads acquire it at the same time: the first
+acquirer loads it, the others wait for that load (see :py:class:`_PendingLoad`).
+
 See docs/dataprovider_v2_plan.md section 3.3.
 """
 
+import copy
 import os
+import threading
 import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from .network_change import NetworkChange
+from .network_store import state_path, store_root
 
 # Network kinds. Only KIND_POWER is exercised today; KIND_PIPES exists so the
 # pandapipes integration (plan section 5.4) can slot in without restructuring.
 KIND_POWER = 'power'
 KIND_PIPES = 'pipes'
 
+# Marker for "every table", used for the dirty tables of a session whose edits
+# were not described precisely. Mirrors network_change.ALL_ROWS.
+ALL_TABLES = None
+
 # Default CRS assumed when a network carries no explicit EPSG code.
 DEFAULT_EPSG = 4326
 
+# Memory released sessions may keep in the warm pool, in bytes, unless the
+# user configured otherwise.
+DEFAULT_POOL_BUDGET = 512 * 1024 * 1024
+
+# Current budget of the warm pool; 0 drops clean sessions on release.
+_pool_budget = DEFAULT_POOL_BUDGET
+
+
+def configure_pool(budget):
+    """Set how much memory released sessions may keep, and apply it now.
+
+    Args:
+        budget: Budget in bytes. 0 (or None) drops a clean session as soon as
+            its last user releases it.
+    """
+    global _pool_budget
+    _pool_budget = max(0, int(budget or 0))
+    NetworkSession.trim_pool()
+
+
+def estimate_memory(entries):
+    """Estimate the memory held by the tables of a network.
+
+    Only DataFrames are counted; the scalar entries and ``std_types`` are
+    negligible next to them. String columns are measured deeply, since the
+    GeoJSON column is usually the largest column of a table.
+
+    Args:
+        entries: Iterable of network entries, e.g. ``net.values()``.
+    Returns:
+        int: Estimated size in bytes.
+    """
+    import pandas as pd
+
+    total = 0
+    for value in entries:
+        if isinstance(value, pd.DataFrame):
+            total += int(value.memory_usage(index=True, deep=True).sum())
+    return total
+
 
 def add_vn_kv_to_lines(net):
     """Copy the bus voltage level onto the line table as a ``vn_kv`` column.
@@ -51,12 +119,86 @@ def add_vn_kv_to_lines(net):
     add_column_from_node_to_elements(net, 'vn_kv', True, ['line'])
 
 
+def prepare_table(name, value, table):
+    """Per-table counterpart of :py:func:`add_vn_kv_to_lines`.
+
+    Passed to ``network_lazy.open_lazy``, so a line table decoded on its own
+    gets the same ``vn_kv`` column as one from a fully loaded network.
+
+    Args:
+        name: Name of the decoded entry.
+        value: The decoded entry.
+        table: Callable returning another entry of the network by name.
+    """
+    if name == 'line':
+        from pandapower.auxiliary import ADict
+
+        add_vn_kv_to_lines(ADict(bus=table('bus'), line=value))
+
+
+def compact_loaded(net, kind):
+    """Compact a freshly loaded network, if the user enabled compaction.
+
+    Only pandapower networks are compacted: the pandapipes writer cannot
+    restore the original dtypes (see ``network_compaction``).
+
+    Args:
+        net: The loaded network, changed in place.
+        kind: KIND_POWER or KIND_PIPES.
+    Returns:
+        The network.
+    """
+    from . import network_compaction
+
+    if net is not None and kind == KIND_POWER and network_compaction.enabled():
+        network_compaction.compact_network(net)
+    return net
+
+
+def open_network(key, loader, kind=KIND_POWER, lazy_loader=None):
+    """Load a network that is not open yet, the cheapest way available.
+
+    Tries the network cache, then ``lazy_loader``, then ``loader``. After a
+    full parse the cache entry is rebuilt in the background. A fully loaded
+    network is compacted if enabled (:py:func:`compact_loaded`). A file with
+    a journal is never opened lazily, since the session replays the journal
+    onto the whole network. Does not touch the registry, so it may run on a
+    worker thread.
+
+    Args:
+        key: Normalised path of the network file.
+        loader: Zero-argument callable returning a loaded network object.
+        kind: KIND_POWER or KIND_PIPES.
+        lazy_loader: Optional zero-argument callable returning a
+            ``network_lazy.LazyNetwork``, or None to fall back to ``loader``.
+    Returns:
+        tuple: ``(net, lazy)``, exactly one of which is not None.
+    Raises:
+        Any exception raised by ``loader``.
+    """
+    from . import network_cache, network_journal
+
+    net = network_cache.load(key, kind)
+    lazy = None
+    if network_journal.has_journal(key):
+        lazy_loader = None
+    if net is None and lazy_loader is not None:
+        lazy = lazy_loader()
+    if net is None and lazy is None:
+        net = compact_loaded(loader(), kind)
+        network_cache.store_in_background(key, net, kind)
+    elif net is not None:
+        compact_loaded(net, kind)
+    return net, lazy
+
+
 def normalise_path(path):
     """Normalise a file path for use as a session key.
 
     Two URIs pointing at the same file must map to the same session, so the
     path is made absolute and case-normalised (the latter matters on Windows,
-    where ``C:/net.json`` and ``c:\\NET.json`` are the same file).
+    where ``C:/net.json`` and ``c:\\NET.json`` are the same file). A path to
+    the manifest of a directory store maps to the store itself.
 
     Args:
         path: File system path to normalise.
@@ -65,39 +207,118 @@ def normalise_path(path):
     """
     if not path:
         return ''
-    return os.path.normcase(os.path.abspath(path))
+    return os.path.normcase(os.path.abspath(store_root(path)))
+
+
+class _PendingLoad:
+    """A load in progress that other acquirers of the same file wait for."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        # The loader's exception, re-raised in every waiting acquirer.
+        self.error = None
 
 
 class NetworkSession:
     """A single loaded pandapower network, shared by all layers of one file.
 
     Sessions are obtained through :py:meth:`acquire` and released through
-    :py:meth:`release`. They are reference counted: the session is dropped from
-    the registry when the last provider using it goes away.
+    :py:meth:`release`. They are reference counted: when the last provider
+    using a session goes away, the session moves to the warm pool, from which
+    it is either acquired again or evicted.
     """
 
-    # Registry of live sessions, keyed by normalised absolute file path.
+    # Registry of open sessions, keyed by normalised absolute file path. This
+    # includes the sessions in the warm pool.
     _sessions = {}
 
-    def __init__(self, path, net, epsg=DEFAULT_EPSG, kind=KIND_POWER):
+    # Released sessions, least recently released first. Same keys as above.
+    _warm = OrderedDict()
+
+    # Files being loaded by acquire(), normalised path -> _PendingLoad.
+    _pending = {}
+
+    # Guards the three mappings above and every session's reference count.
+    # Reentrant, because release() trims the pool while holding it.
+    _lock = threading.RLock()
+
+    # The session a scenario was forked from, and the scenario's name. Both
+    # stay None for the session of a file (see ``network_scenario``).
+    parent = None
+    scenario = None
+
+    def __init__(self, path, net, epsg=DEFAULT_EPSG, kind=KIND_POWER,
+                 lazy=None):
         """Initialise a session. Use :py:meth:`acquire` instead of calling this.
 
         Args:
             path: Normalised absolute path of the network file.
-            net: The loaded pandapower network object.
+            net: The loaded pandapower network object, or None if ``lazy``
+                is given.
             epsg: EPSG code of the network geodata.
             kind: KIND_POWER or KIND_PIPES.
+            lazy: A ``network_lazy.LazyNetwork`` to decode tables from on
+                demand until the whole network is needed.
         """
         self.path = path
-        self.net = net
+        # Key of the session in the registry: the normalised path, extended
+        # by the scenario name for a scenario.
+        self.key = path
+        self._net = net
+        # While set, tables are decoded on first access through table();
+        # reading ``net`` decodes the rest and clears it.
+        self.lazy = lazy
         self.epsg = int(epsg) if epsg else DEFAULT_EPSG
         self.kind = kind
 
-        # Set when the in-memory net diverges from the file on disk. Phase 6
-        # turns this into commit-based writing; until then the provider still
-        # saves eagerly and simply keeps this flag up to date.
+        # Set when the in-memory net diverges from the file on disk, and
+        # cleared once a commit has written it.
         self.dirty = False
 
+        # Tables edited since the file was last written, or ALL_TABLES when an
+        # edit did not say. A save encodes only these again and copies the
+        # rest from the file (see network_io.write_network). Replaced rather
+        # than updated in place, since a background write reads it.
+        self.dirty_tables = frozenset()
+
+        # The edits since the file was last written, row by row, so that a
+        # database writes just those rows (see network_database). Replaced
+        # rather than merged in place, like dirty_tables.
+        self.write_change = NetworkChange()
+
+        # Bumped by every edit. A background write remembers the generation it
+        # snapshotted, and may only mark the session clean if no edit arrived
+        # while it was writing.
+        self.generation = 0
+
+        # Edits the file's journal does not hold yet, and the generation the
+        # journal is complete up to (see network_journal).
+        self.journal_change = NetworkChange()
+        self.journal_generation = 0
+
+        # The background write in flight, and whether another commit arrived
+        # meanwhile and must write again once it finishes. Managed by
+        # network_tasks, which keeps this module Qt-free.
+        self.write_task = None
+        self.write_queued = False
+
+        # The background load in flight while the session has no network yet.
+        # Managed by network_loading, like write_task.
+        self.load_task = None
+
+        # The power flow running on a snapshot of the network. Managed by
+        # ppqgis_runpp, like write_task.
+        self.calculation_task = None
+
+        # Edits the worker process's mirror of the network lacks, or None if
+        # it has no mirror. Managed by network_worker.
+        self.mirror_change = None
+
+        # Edits made since the last commit, folded into one NetworkChange. The
+        # commit hands it to the sibling layers so they refresh only what the
+        # edits touched.
+        self.pending_change = NetworkChange()
+
         # Guards the once-per-session warning emitted when a feature moves
         # between voltage-level layers (plan section 5.1).
         self.voltage_move_warned = False
@@ -108,39 +329,170 @@ class NetworkSession:
         self.file_size = None
         self.remember_file_state()
 
+        # Serialises decoding, so two threads reading a lazy network do not
+        # decode the same tables twice.
+        self._network_lock = threading.RLock()
+
         self._refcount = 0
+        # Estimated size of the network, measured when the session enters the
+        # warm pool.
+        self.pool_memory = 0
         # Weak references, so a provider that QGIS destroys without calling
         # release() cannot keep the session alive.
         self._providers = weakref.WeakSet()
+        # Provider -> id of the QGIS layer it backs, so the layers of a file
+        # are found without scanning the project.
+        self._layer_ids = weakref.WeakKeyDictionary()
+
+        # Debounces sibling refreshes; created on first use by
+        # refresh_scheduler.scheduler_for(), which keeps this module Qt-free.
+        self.refresh_scheduler = None
+
+        # Follows external changes to the file; created by
+        # network_watcher.watch_session(), for the same reason.
+        self.file_watcher = None
+
+        # Scenarios forked from this session; they hold it, not the reverse.
+        self._forks = weakref.WeakSet()
+
+        # Entries background readers hold without a copy (see capture()), one
+        # dict per reader; own() copies such a table before it changes.
+        self._captures = []
+
+        if self.has_network():
+            self._replay_journal()
 
     # -- acquisition ------------------------------------------------------
 
     @classmethod
-    def acquire(cls, path, loader, epsg=DEFAULT_EPSG, kind=KIND_POWER):
+    def acquire(cls, path, loader, epsg=DEFAULT_EPSG, kind=KIND_POWER,
+                lazy_loader=None, background=None, scenario=None):
         """Get the session for a file, loading it if it is not open yet.
 
+        A file that is not open is taken from the network cache when that is
+        enabled and holds a valid entry (see ``network_cache``). Otherwise it
+        is opened lazily if ``lazy_loader`` allows, or the loader parses it and
+        the cache entry is rebuilt in the background.
+
+        A released session still in the warm pool is reused as it is, unless
+        it has no unsaved edits and the file changed on disk since; then it is
+        loaded again.
+
+        With ``background``, a file that is not open is not loaded here: the
+        session is registered without a network and ``background`` is asked to
+        load it, see :py:meth:`is_loading`. Anyone acquiring the file meanwhile
+        gets the same loading session, so a file is never loaded twice.
+
+        Safe to call from any thread. Without ``background``, threads that
+        acquire a file while another thread loads it wait for that load
+        rather than starting their own.
+
+        With ``scenario``, the session of that scenario of the file is
+        returned instead, opened from its saved tables on top of the file's
+        network if it is not open yet (see ``network_scenario``).
+
         Args:
             path: Path of the network file.
             loader: Zero-argument callable returning a loaded network object.
-                Only called when the file is not already open.
+                Only called when the file is neither open nor cached.
             epsg: EPSG code to record if the session is created now.
             kind: KIND_POWER or KIND_PIPES, recorded if created now.
+            lazy_loader: Optional zero-argument callable returning a
+                ``network_lazy.LazyNetwork``, or None to fall back to
+                ``loader``. Callers that only show some tables pass it.
+            background: Optional callable ``background(session, load)`` that
+                runs the zero-argument ``load`` elsewhere and hands its
+                ``(net, lazy)`` result to :py:meth:`install`.
+            scenario: Optional name of a scenario of the file.
         Returns:
             NetworkSession: The shared session for this file.
         Raises:
-            ValueError: If the path is empty.
+            ValueError: If the path is empty, or the scenario name invalid.
             Any exception raised by ``loader``.
         """
+        if scenario:
+            from .network_scenario import acquire_scenario
+
+            return acquire_scenario(path, scenario, loader, epsg=epsg,
+                                    kind=kind, lazy_loader=lazy_loader,
+                                    background=background)
+
         key = normalise_path(path)
         if not key:
             raise ValueError('Cannot open a network session without a path.')
 
-        session = cls._sessions.get(key)
-        if session is None:
-            session = cls(key, loader(), epsg=epsg, kind=kind)
-            cls._sessions[key] = session
+        while True:
+            with cls._lock:
+                session = cls._take(key)
+                if session is not None:
+                    session._refcount += 1
+                    return session
+
+                pending = cls._pending.get(key)
+                if pending is None and background is not None:
+                    # Registered at once; later acquirers join it.
+                    session = cls(key, None, epsg=epsg, kind=kind)
+                    session._refcount += 1
+                    cls._sessions[key] = session
+                    break
+                if pending is None:
+                    pending = cls._pending[key] = _PendingLoad()
+                    break
+
+            # Another thread is loading this file; wait, then take its session.
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+
+        if background is not None:
+            background(session, lambda: open_network(
+                key, loader, kind=kind, lazy_loader=lazy_loader))
+            return session
+
+        try:
+            net, lazy = open_network(key, loader, kind=kind,
+                                     lazy_loader=lazy_loader)
+        except BaseException as error:
+            pending.error = error
+            raise
+        else:
+            with cls._lock:
+                # A network seeded while this one loaded wins, as in install();
+                # the session is only built, and its journal replayed, if not.
+                session = cls._sessions.get(key)
+                if session is None:
+                    session = cls(key, net, epsg=epsg, kind=kind, lazy=lazy)
+                    # After a clear() the caller still gets its network, but
+                    # the registry does not.
+                    if cls._pending.get(key) is pending:
+                        cls._sessions[key] = session
+                session._refcount += 1
+            return session
+        finally:
+            with cls._lock:
+                if cls._pending.get(key) is pending:
+                    del cls._pending[key]
+            pending.done.set()
 
-        session._refcount += 1
+    @classmethod
+    def _take(cls, key):
+        """Look up an open session for reuse. Call with the lock held.
+
+        A session is taken out of the warm pool. A clean warm session whose
+        file changed on disk is stale and dropped instead.
+
+        Args:
+            key: Normalised path.
+        Returns:
+            NetworkSession or None: The session, or None if it must be loaded.
+        """
+        session = cls._sessions.get(key)
+        if key in cls._warm:
+            del cls._warm[key]
+            if not session.dirty and session.file_changed_externally():
+                del cls._sessions[key]
+                session._forget()
+                return None
         return session
 
     @classmethod
@@ -167,28 +519,41 @@ class NetworkSession:
         if not key:
             raise ValueError('Cannot open a network session without a path.')
 
-        session = cls._sessions.get(key)
-        if session is None:
-            session = cls(key, net, epsg=epsg, kind=kind)
-            cls._sessions[key] = session
-        else:
-            session.net = net
+        with cls._lock:
+            session = cls._sessions.get(key)
+            if session is None:
+                session = cls(key, compact_loaded(net, kind), epsg=epsg,
+                              kind=kind)
+                cls._sessions[key] = session
+                return session
+            with session._network_lock:
+                session.net = compact_loaded(net, kind)
             session.epsg = int(epsg) if epsg else DEFAULT_EPSG
             session.kind = kind
             session.mark_clean()
-            session.notify_changed()
+            session.pending_change = NetworkChange()
+        # Outside the lock: the providers may acquire or release sessions.
+        session.notify_changed(change=NetworkChange.all())
         return session
 
     @classmethod
-    def get(cls, path):
+    def get(cls, path, scenario=None):
         """Return the open session for a file, without loading it.
 
         Args:
             path: Path of the network file.
+            scenario: Optional name of a scenario of the file.
         Returns:
             NetworkSession or None: The session, or None if not open.
         """
-        return cls._sessions.get(normalise_path(path))
+        if scenario:
+            from .network_scenario import scenario_key
+
+            key = scenario_key(path, scenario)
+        else:
+            key = normalise_path(path)
+        with cls._lock:
+            return cls._sessions.get(key)
 
     @classmethod
     def all_sessions(cls):
@@ -197,24 +562,413 @@ class NetworkSession:
         Returns:
             list: The live NetworkSession instances.
         """
-        return list(cls._sessions.values())
+        with cls._lock:
+            return list(cls._sessions.values())
 
     @classmethod
     def clear(cls):
-        """Drop all sessions. Intended for tests and plugin unload."""
-        cls._sessions.clear()
+        """Drop all sessions. Intended for tests and plugin unload.
+
+        Loads in flight are forgotten too: their sessions are not registered,
+        and the next acquire of their files loads them again.
+        """
+        with cls._lock:
+            cls._sessions.clear()
+            cls._warm.clear()
+            cls._pending.clear()
+
+    @classmethod
+    def trim_pool(cls):
+        """Evict released sessions, oldest first, until the pool fits its budget.
+
+        Sessions with unsaved edits, or with a write still running, are never
+        evicted. They do count against the budget, so clean sessions make way
+        for them.
+
+        Returns:
+            list: Paths of the evicted sessions.
+        """
+        with cls._lock:
+            total = sum(session.pool_memory for session in cls._warm.values())
+            evicted = []
+            for key, session in list(cls._warm.items()):
+                if total <= _pool_budget:
+                    break
+                if session.edits_at_risk() or session.write_task is not None:
+                    continue
+                del cls._warm[key]
+                cls._sessions.pop(key, None)
+                session._forget()
+                total -= session.pool_memory
+                evicted.append(key)
+            return evicted
 
     def release(self):
-        """Drop one reference; forget the session when the last one goes.
+        """Drop one reference; move the session to the warm pool when the last
+        one goes.
 
         Returns:
-            bool: True if the session was dropped from the registry.
+            bool: True if the session was dropped from the registry rather
+                than kept warm.
         """
-        self._refcount -= 1
-        if self._refcount <= 0:
-            self._sessions.pop(self.path, None)
-            return True
-        return False
+        with self._lock:
+            self._refcount -= 1
+            if self._refcount > 0:
+                return False
+            self._refcount = 0
+            if self._sessions.get(self.key) is not self:
+                return True  # Already dropped, e.g. by clear()
+
+            if _pool_budget <= 0 and not self.edits_at_risk():
+                del self._sessions[self.key]
+                self._forget()
+                return True
+
+            self.pool_memory = self.memory_usage()
+            self._warm[self.key] = self
+            self._warm.move_to_end(self.key)
+            self.trim_pool()
+            return self.key not in self._sessions
+
+    def in_use(self):
+        """Whether any provider still holds this session.
+
+        Returns:
+            bool: False for a session in the warm pool.
+        """
+        return self._refcount > 0
+
+    def drop(self):
+        """Forget a released session now, unsaved edits included.
+
+        For callers that have told the user about the edits, such as the
+        prompt shown when a project is closed.
+        """
+        with self._lock:
+            if self._sessions.get(self.key) is self:
+                del self._sessions[self.key]
+            if self._warm.get(self.key) is self:
+                del self._warm[self.key]
+            self._forget()
+
+    def _forget(self):
+        """Let go of what the session holds once it left the registry.
+
+        A scenario releases the session it was forked from here.
+        """
+
+    def memory_report(self):
+        """How much memory compaction saved on this network.
+
+        Returns:
+            network_compaction.MemoryReport or None: None unless the network
+                is loaded and was compacted.
+        """
+        from .network_compaction import MemoryReport
+
+        with self._network_lock:
+            return MemoryReport.of(self._net)
+
+    def memory_usage(self):
+        """Estimate the memory held by the network, without decoding it.
+
+        Returns:
+            int: Estimated size in bytes, counting only decoded tables of a
+                lazily opened network.
+        """
+        with self._network_lock:
+            if self.lazy is not None:
+                entries = [self.lazy.table(name)
+                           for name in self.lazy.decoded()]
+            elif self._net is not None and hasattr(self._net, 'values'):
+                entries = list(self._net.values())
+            else:
+                entries = []
+        return estimate_memory(entries)
+
+    # -- network access ---------------------------------------------------
+
+    @property
+    def net(self):
+        """The complete network, decoding any tables not read yet.
+
+        Everything that works on the network as a whole (power flow, save,
+        export, edits) reads this. Code that shows a single table should use
+        :py:meth:`table`, which leaves a lazily opened network lazy.
+        """
+        with self._network_lock:
+            if self.lazy is not None:
+                from . import network_cache
+
+                # Cleared only once decoding succeeded, so a failure can be
+                # retried rather than leaving the session without a network.
+                self._net = compact_loaded(self.lazy.materialize(),
+                                           self.kind)
+                self.lazy = None
+                network_cache.store_in_background(
+                    self.path, self._net, self.kind)
+            return self._net
+
+    @net.setter
+    def net(self, net):
+        self.lazy = None
+        self._net = net
+
+    def table(self, name, default=None):
+        """Return one table (or other entry) of the network.
+
+        Args:
+            name: Entry name, e.g. 'bus' or 'res_line'.
+            default: Returned when the network has no such entry.
+        Returns:
+            The entry, decoded now if the session is lazy and had not read it.
+        """
+        with self._network_lock:
+            if self.lazy is not None:
+                return self.lazy.table(name, default)
+            return getattr(self._net, name, default)
+
+    def has_network(self):
+        """Whether a network is loaded, fully or lazily, without loading it.
+
+        Returns:
+            bool: True if the session holds a network.
+        """
+        return self.lazy is not None or self._net is not None
+
+    def is_loading(self):
+        """Whether the network is still being loaded in the background.
+
+        Until it arrives, :py:attr:`net` is None and :py:meth:`table` returns
+        its default.
+
+        Returns:
+            bool: True while a background load is in flight.
+        """
+        return self.load_task is not None
+
+    def install(self, net=None, lazy=None):
+        """Hand a session the network its background load produced.
+
+        A network seeded meanwhile wins; the loaded one is then discarded.
+
+        Args:
+            net: The loaded network, or None if ``lazy`` is given.
+            lazy: A ``network_lazy.LazyNetwork``.
+        Returns:
+            bool: True if the network was installed.
+        """
+        with self._network_lock:
+            if self.has_network():
+                return False
+            self._net = net
+            self.lazy = lazy
+        self.remember_file_state()
+        self._replay_journal()
+        with self._lock:
+            if self._warm.get(self.key) is self:
+                # Released while loading; it entered the pool empty.
+                self.pool_memory = self.memory_usage()
+                self.trim_pool()
+        return True
+
+    # -- scenarios --------------------------------------------------------
+
+    def fork(self, name):
+        """Fork a what-if scenario off the network, copy-on-write.
+
+        The scenario starts out as a shallow copy of this network: every
+        table is shared, so a fork costs next to no memory however large the
+        network is. A table is copied only when one of the sessions sharing
+        it is about to change it (see :py:meth:`own`), so ten scenarios that
+        each edit a few tables cost ten copies of those tables, not of the
+        network. Forking a scenario forks its network off the same file.
+
+        The scenario is registered like a released session, so layers join it
+        through :py:meth:`acquire` with ``scenario=name``.
+
+        Args:
+            name: Name of the scenario, see ``network_scenario.check_name``.
+        Returns:
+            network_scenario.ScenarioSession: The new scenario.
+        Raises:
+            ValueError: If the name is invalid or taken, or the network has
+                not finished loading.
+        """
+        from .network_scenario import ScenarioSession, scenario_exists, \
+            scenario_key
+
+        root = self.parent or self
+        key = scenario_key(root.path, name)
+        if self.is_loading() or not self.has_network():
+            raise ValueError('{} has not finished loading.'.format(
+                os.path.basename(root.path)))
+        net = self.net
+        with self._lock:
+            if key in self._sessions or scenario_exists(root.path, name):
+                raise ValueError('There is a scenario named {!r} '
+                                 'already.'.format(name))
+            fork = ScenarioSession(root, name, net=copy.copy(net))
+            # The scenario holds the file's session until it is forgotten.
+            root._refcount += 1
+            if self._warm.get(root.key) is root:
+                del self._warm[root.key]
+            self._sessions[key] = fork
+            self._warm[key] = fork
+        return fork
+
+    def forks(self):
+        """Return the open scenarios forked from this session.
+
+        Returns:
+            list: Their ScenarioSessions.
+        """
+        return list(self._forks)
+
+    def _relatives(self):
+        """The other sessions that may share tables with this one.
+
+        Returns:
+            list: The file's session and its scenarios, this one excluded.
+        """
+        root = self.parent or self
+        return [session for session in [root] + root.forks()
+                if session is not self]
+
+    def _shared(self, relatives, name, value):
+        """Whether another session holds the very same table object.
+
+        Args:
+            relatives: Result of :py:meth:`_relatives`.
+            name: Entry name.
+            value: This session's entry.
+        Returns:
+            bool: True if changing ``value`` in place would change theirs.
+        """
+        for relative in relatives:
+            net = relative._net
+            if net is not None and net.get(name) is value:
+                return True
+        # A table captured for a background reader, here or by a relative.
+        return any(captured.get(name) is value
+                   for session in [self] + relatives
+                   for captured in session._captures)
+
+    def own(self, names=None):
+        """Copy the tables this session shares with scenarios, before editing.
+
+        Anything that changes cells in place (``DataFrame.at``, ``.loc``)
+        must call this first, or the edit would show in every scenario
+        sharing the table. Tables nobody else holds are left alone, so
+        without scenarios this costs nothing.
+
+        Args:
+            names: Names of the tables about to change, or None for all.
+        Returns:
+            list: Names of the tables copied.
+        """
+        relatives = self._relatives()
+        if not relatives and not self._captures:
+            return []
+        # A scenario still waiting for this network takes its tables now,
+        # before they change.
+        for relative in relatives:
+            relative.attach()
+        with self._network_lock:
+            net = self.net
+            if net is None:
+                return []
+            if names is None:
+                names = list(net.keys())
+            copied = []
+            for name in names:
+                value = net.get(name)
+                if hasattr(value, 'columns') and \
+                        self._shared(relatives, name, value):
+                    net[name] = value.copy()
+                    copied.append(name)
+            return copied
+
+    @contextmanager
+    def detached(self):
+        """Let pandapower drop rows in place without touching scenarios.
+
+        Functions like ``pandapower.drop_buses`` drop rows with
+        ``inplace=True``, which changes the table object itself. Inside this
+        block every shared table is replaced by a shallow copy - a new table
+        object over the same data - and afterwards each one left as it was is
+        swapped back for the shared table, so deleting a bus copies the
+        tables it touched and nothing else. A shallow copy shares its cells,
+        so edits that change cells still need :py:meth:`own`.
+        """
+        relatives = self._relatives()
+        if not relatives and not self._captures:
+            yield
+            return
+        for relative in relatives:
+            relative.attach()
+        borrowed = {}
+        with self._network_lock:
+            net = self.net
+            for name, value in list(net.items()):
+                if hasattr(value, 'columns') and \
+                        self._shared(relatives, name, value):
+                    net[name] = value.copy(deep=False)
+                    borrowed[name] = (value, net[name])
+        try:
+            yield
+        finally:
+            with self._network_lock:
+                for name, (shared, shallow) in borrowed.items():
+                    if net.get(name) is shallow \
+                            and shallow.index.equals(shared.index) \
+                            and shallow.columns.equals(shared.columns):
+                        net[name] = shared
+
+    def attach(self):
+        """Take the tables of a scenario's network. Only scenarios do this."""
+
+    def capture(self, tables=ALL_TABLES):
+        """Hand the network's entries to a background reader, without copying.
+
+        The tables are the network's own objects, so capturing a network of
+        any size takes a few microseconds per table. Until
+        :py:meth:`release_capture`, :py:meth:`own` and :py:meth:`detached`
+        treat a captured table as shared and copy it before it changes, so
+        the reader keeps seeing the network as it was captured. Entries that
+        are not tables are small and copied right away. Private entries such
+        as pandapower's internal power flow data are left out.
+
+        Args:
+            tables: Names of the tables wanted, or ALL_TABLES.
+        Returns:
+            dict or None: ``{name: entry}``, or None while the network is not
+                loaded in full.
+        """
+        with self._network_lock:
+            net = self._net if self.lazy is None else None
+            if net is None:
+                return None
+            entries = {}
+            for name, value in net.items():
+                if name.startswith('_'):
+                    continue
+                if not hasattr(value, 'columns'):
+                    entries[name] = copy.deepcopy(value)
+                elif tables is ALL_TABLES or name in tables:
+                    entries[name] = value
+            self._captures = self._captures + [entries]
+            return entries
+
+    def release_capture(self, entries):
+        """Let edits change captured tables in place again.
+
+        Args:
+            entries: The result of :py:meth:`capture` that is done with.
+        """
+        with self._network_lock:
+            self._captures = [captured for captured in self._captures
+                              if captured is not entries]
 
     # -- provider registration --------------------------------------------
 
@@ -233,6 +987,36 @@ class NetworkSession:
             provider: The PandapowerProvider instance.
         """
         self._providers.discard(provider)
+        self._layer_ids.pop(provider, None)
+
+    def register_layer(self, provider, layer_id):
+        """Remember which layer a provider backs.
+
+        Args:
+            provider: A provider registered with :py:meth:`add_provider`.
+            layer_id: The QGIS layer id.
+        """
+        if layer_id:
+            self._layer_ids[provider] = layer_id
+
+    def layer_id(self, provider):
+        """Return the id of the layer a provider backs.
+
+        Args:
+            provider: A provider of this session.
+        Returns:
+            str or None: The layer id, or None if never registered.
+        """
+        return self._layer_ids.get(provider)
+
+    def layer_ids(self):
+        """Return the ids of every registered layer of this session.
+
+        Returns:
+            list: Layer ids of the live providers.
+        """
+        return [layer_id for provider, layer_id in list(self._layer_ids.items())
+                if provider in self._providers]
 
     def providers(self):
         """Return the providers currently using this session.
@@ -242,31 +1026,143 @@ class NetworkSession:
         """
         return list(self._providers)
 
-    def notify_changed(self, source=None):
+    def notify_changed(self, source=None, change=None):
         """Tell every other provider of this file that the network changed.
 
         Because all providers share one ``net``, they need only invalidate
         their cached dataframe and repaint; no data is copied between them.
+        The change says which tables and rows were affected, so a provider
+        whose table was not touched can ignore the event.
 
         Args:
             source: Provider that caused the change, skipped during
                 notification. Pass None to notify all providers.
+            change: NetworkChange describing what changed. None means
+                anything may have changed.
         """
+        if change is None:
+            change = NetworkChange.all()
+        elif change.is_empty():
+            return
+
         for provider in self.providers():
             if provider is source:
                 continue
             try:
-                provider.on_session_changed()
+                provider.on_session_changed(change)
             except Exception as error:  # pragma: no cover - defensive
                 print('Failed to notify provider of network change: '
                       '{}'.format(error))
 
+    def record_change(self, change):
+        """Remember an edit until the next commit.
+
+        Args:
+            change: NetworkChange made to the in-memory network.
+        """
+        self.pending_change.merge(change)
+
+    def take_pending_change(self):
+        """Return the edits recorded since the last commit, and forget them.
+
+        Returns:
+            NetworkChange: Everything recorded through :py:meth:`record_change`.
+        """
+        change, self.pending_change = self.pending_change, NetworkChange()
+        return change
+
+    def unsaved_edits(self):
+        """The edits the file on disk does not have yet.
+
+        Returns:
+            NetworkChange or None: The pending change, None for a clean
+                session, or a change covering everything when the session is
+                dirty but recorded nothing more precise.
+        """
+        if not self.dirty:
+            return None
+        if self.pending_change.is_empty():
+            return NetworkChange.all()
+        return self.pending_change
+
+    def diff_file(self, new_entry, new_names):
+        """Compare the open network with the new content of its file.
+
+        Reads the open tables, so call it where they are edited, i.e. on the
+        main thread.
+
+        Args:
+            new_entry: Callable returning an entry of the file by name, or
+                None if it has no such entry.
+            new_names: Names of the file's entries.
+        Returns:
+            NetworkDelta: The differences, see ``network_delta``.
+        """
+        from .network_compaction import COMPACTION_KEY
+        from .network_delta import diff_network
+
+        with self._network_lock:
+            lazy, net = self.lazy, self._net
+        if lazy is not None:
+            # Only decoded tables can be on screen; the rest is read from the
+            # new file when needed.
+            return diff_network(lazy.decoded(), lazy.table, new_entry,
+                                self.unsaved_edits())
+        names = list(net.keys()) + [name for name in new_names
+                                    if name not in net]
+        return diff_network(names, net.get, new_entry, self.unsaved_edits(),
+                            compaction=net.get(COMPACTION_KEY))
+
+    def apply_delta(self, delta, net=None, lazy=None):
+        """Bring the open network up to date with its changed file.
+
+        Cells the delta does not cover, unsaved edits among them, are kept.
+        The file's new state is remembered, so a later save does not report
+        it as an external change.
+
+        A lazily opened session has no edits and cannot decode its remaining
+        tables from the changed file, so it takes over the new file's network
+        instead; the delta then only tells the layers what changed.
+
+        Args:
+            delta: NetworkDelta from :py:meth:`diff_file`.
+            net: The new file's network, if it was loaded in full.
+            lazy: The new file's ``LazyNetwork``, if it was opened lazily.
+        Returns:
+            bool: False if a lazy session was given no network to take over;
+                nothing was changed.
+        """
+        # Scenarios keep the tables they were forked with.
+        self.own(None if delta.change.everything else delta.change.tables)
+        with self._network_lock:
+            if self.lazy is not None:
+                if lazy is not None:
+                    self.lazy = lazy
+                elif net is not None:
+                    self.net = compact_loaded(net, self.kind)
+                else:
+                    return False
+            else:
+                delta.apply(self._net)
+                if self.mirror_change is not None:
+                    self.mirror_change.merge(delta.change)
+        self.remember_file_state()
+        return True
+
     # -- file state -------------------------------------------------------
 
+    def state_file(self):
+        """The file whose mtime and size tell whether the network changed.
+
+        Returns:
+            str: The network file, or a store's manifest.
+        """
+        return state_path(self.path)
+
     def remember_file_state(self):
         """Record the file's current mtime and size as the known-good state."""
         try:
-            stat = os.stat(self.path)
+            stat = os.stat(self.state_file())
             self.file_mtime = stat.st_mtime
             self.file_size = stat.st_size
         except OSError:
@@ -285,7 +1181,7 @@ class NetworkSession:
         if self.file_mtime is None:
             return False
         try:
-            stat = os.stat(self.path)
+            stat = os.stat(self.state_file())
         except OSError:
             # The file disappeared; treat that as an external change.
             return True
@@ -293,53 +1189,82 @@ class NetworkSession:
                 or stat.st_size != self.file_size)
 
     def create_backup(self):
-        """Copy the current file aside before it is overwritten.
+        """Back the current file up before it is overwritten.
+
+        The backup goes to the network's deduplicating backup store (see
+        ``network_backup``), which only stores the tables that changed since
+        the previous backup.
 
         Returns:
-            str: Path of the backup, or an empty string if none was made.
+            str: Path of the snapshot's manifest, or an empty string if none
+                was made.
         """
-        import shutil
-        from datetime import datetime
-
-        if not os.path.exists(self.path):
-            return ''
+        from .network_backup import create_snapshot
 
-        backup_path = '{}.{}.bak'.format(
-            self.path, datetime.now().strftime('%Y%m%d_%H%M%S'))
         try:
-            shutil.copy2(self.path, backup_path)
-            return backup_path
-        except OSError:
+            snapshot = create_snapshot(self.path)
+        except (OSError, ValueError):
             # A failed backup must not block the save; the user asked to write.
             return ''
+        return snapshot.path if snapshot is not None else ''
+
+    def snapshot(self):
+        """Copy the network for a write that runs while editing continues.
+
+        Returns:
+            tuple: ``(net, generation)`` - the copied network, and the edit
+                generation it reflects, for :py:meth:`finish_write`.
+        """
+        from .network_io import snapshot_network
+
+        return snapshot_network(self.net), self.generation
 
-    def write(self, backup=True):
+    def write(self, backup=True, net=None, progress=None):
         """Write the in-memory network to its file.
 
         This is the single place the network reaches disk. Because every layer
         of a file shares one ``net``, the whole network is written once, rather
         than each layer merging its own slice into a re-read copy of the file.
 
+        The network is streamed into a temporary file that replaces the
+        original only once it is complete (see ``network_io``), so a crash
+        during the save leaves the previous file intact. Only the tables in
+        :py:attr:`dirty_tables` are encoded again; the others are copied from
+        the existing file, so a save costs what was edited, not what is open.
+        A database is updated in place, row by row (:py:attr:`write_change`).
+
         The caller is responsible for checking :py:meth:`file_changed_externally`
         first and asking the user what to do; this method does not prompt.
 
         Args:
-            backup: Copy the existing file aside first.
+            backup: Back the existing file up first.
+            net: A snapshot from :py:meth:`snapshot` to write instead of the
+                live network. The session is then not marked clean; the caller
+                does that with :py:meth:`finish_write` on the main thread.
+            progress: Optional callable receiving the fraction written.
         Returns:
             tuple: ``(success, message, backup_path)``.
         """
-        if self.net is None:
+        from .network_io import write_network
+
+        snapshot = net is not None
+        if not snapshot:
+            net = self.net
+        if net is None:
             return False, 'No network loaded.', ''
 
         backup_path = self.create_backup() if backup else ''
 
-        try:
-            if self.kind == KIND_PIPES:
-                import pandapipes as writer
-            else:
-                import pandapower as writer
+        # Unchanged tables are copied from the file, unless it is no longer
+        # the file they were read from. A snapshot write may see tables
+        # dirtied after the snapshot too, which only costs their encoding.
+        changed = ALL_TABLES if self.file_changed_externally() \
+            else self.dirty_tables
 
-            writer.to_json(self.net, self.path)
+        try:
+            write_network(net, self.path, self.kind, progress=progress,
+                          changed=changed, change=self.write_change,
+                          epsg=self.epsg)
         except PermissionError:
             return (False,
                     'Cannot write {}. The file may be open in another '
@@ -348,12 +1273,54 @@ class NetworkSession:
         except Exception as error:
             return False, 'Could not save network: {}'.format(error), backup_path
 
-        self.mark_clean()
+        # The file now holds everything the journal did.
+        self.discard_journal()
+        if not snapshot:
+            self.mark_clean()
         return True, 'Network saved to {}'.format(self.path), backup_path
 
-    def mark_dirty(self):
-        """Flag the in-memory network as diverged from the file on disk."""
+    def finish_write(self, generation):
+        """Record a successful snapshot write.
+
+        The file now matches the snapshot, so its state is remembered. The
+        session only becomes clean if nothing was edited since the snapshot;
+        otherwise the newer edits still have to reach disk.
+
+        Args:
+            generation: Generation returned by :py:meth:`snapshot`.
+        Returns:
+            bool: True if the session is now clean.
+        """
+        self.remember_file_state()
+        if generation == self.generation:
+            self.dirty = False
+            self.dirty_tables = frozenset()
+            self.write_change = NetworkChange()
+            self.journal_change = NetworkChange()
+            self.discard_autosave()
+        return not self.dirty
+
+    def mark_dirty(self, change=None):
+        """Flag the in-memory network as diverged from the file on disk.
+
+        Args:
+            change: NetworkChange describing the edit, so that the next save
+                encodes only the tables it touched. None means any table may
+                have changed.
+        """
         self.dirty = True
+        self.generation += 1
+        if change is None:
+            change = NetworkChange.all()
+        self.journal_change.merge(change)
+        self.write_change = NetworkChange().merge(self.write_change) \
+            .merge(change)
+        if self.mirror_change is not None:
+            self.mirror_change.merge(change)
+        if change.everything or self.dirty_tables is ALL_TABLES:
+            self.dirty_tables = ALL_TABLES
+        else:
+            self.dirty_tables = self.dirty_tables | change.tables
 
     def mark_clean(self):
         """Flag the network as matching the file, and refresh the file state.
@@ -361,8 +1328,83 @@ class NetworkSession:
         Call this after a successful write.
         """
         self.dirty = False
+        self.dirty_tables = frozenset()
+        self.write_change = NetworkChange()
+        self.journal_change = NetworkChange()
+        self.journal_generation = self.generation
         self.remember_file_state()
+        # Its edits are either in the file now or were discarded.
+        self.discard_journal()
+        self.discard_autosave()
+
+    def edits_at_risk(self):
+        """Whether the session holds edits that neither its file nor its
+        journal has, and that would be lost with it.
+
+        Returns:
+            bool: True if the latest edits were not written or journaled.
+        """
+        return self.dirty and self.journal_generation != self.generation
+
+    def append_journal(self):
+        """Record the edits since the last commit in the file's journal.
+
+        Returns:
+            bool: True if the edits are in the journal now. False if the file
+                has to be written instead: journaling is off, the journal is
+                full or belongs to another state of the file, or the edits
+                cannot be journaled. A database is never journaled, since
+                writing its edited rows costs no more.
+        """
+        from . import network_journal
+        from .network_database import is_database_path
+
+        if not network_journal.enabled() or is_database_path(self.path) \
+                or network_journal.needs_flush(self.path) \
+                or self.file_changed_externally():
+            return False
+        with self._network_lock:
+            net = self._net if self.lazy is None else None
+            if net is None or not network_journal.append(
+                    self.path, net, self.journal_change):
+                return False
+        self.journal_change = NetworkChange()
+        self.journal_generation = self.generation
+        # The journal is newer than any autosave now.
+        self.discard_autosave()
+        return True
+
+    def discard_journal(self):
+        """Delete the file's journal, once the file holds its edits."""
+        from . import network_journal
+
+        network_journal.discard(self.path)
+
+    def discard_autosave(self):
+        """Delete the session's recovery snapshot, once nothing needs it."""
+        from . import network_autosave
+
+        network_autosave.discard(self.key)
+
+    def _replay_journal(self):
+        """Apply the journal an earlier QGIS session left next to the file.
+
+        The network then holds those edits and the file does not, so the
+        session is dirty, with the edits already safe in the journal.
+        """
+        from . import network_journal
+
+        if not network_journal.has_journal(self.path):
+            return
+        change = network_journal.replay(self.path, self.net)
+        if change is None:
+            return
+        self.mark_dirty(change)
+        self.journal_change = NetworkChange()
+        self.journal_generation = self.generation
 
     def __repr__(self):
-        return ('<NetworkSession {} kind={} refs={} dirty={}>'
-                .format(self.path, self.kind, self._refcount, self.dirty))
+        return ('<NetworkSession {} kind={} refs={} dirty={} lazy={} '
+                'loading={}>'.format(self.path, self.kind, self._refcount,
+                                     self.dirty, self.lazy is not None,
+                                     self.is_loading()))
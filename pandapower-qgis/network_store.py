@@ -0,0 +1,493 @@
+# -*- coding: utf-8 -*-
+"""Columnar network store: one Parquet file per table plus a manifest.
+
+JSON is slow to parse and is always rewritten whole. This module adds a second
+on-disk format for large models, read and written through the same session and
+URI scheme as JSON files:
+
+    grid.ppnet/                     a directory ...
+    ├── manifest.json
+    ├── network.json
+    └── tables/
+        ├── bus.parquet
+        ├── line.parquet
+        └── ...
+
+or the same members in a zip archive named ``grid.ppnet`` (members stored
+uncompressed, since Parquet is compressed already).
+
+``manifest.json`` identifies the store and lists every table with its row count
+and file, so the Browser and the Data Source Manager can describe a network
+without reading any table. Parquet keeps each table's index and pandas dtypes.
+``network.json`` holds everything else - ``std_types`` and scalar settings -
+written by pandapower's own JSON encoder. A table that Arrow cannot represent
+(a column mixing types, say) stays in full in ``network.json``.
+
+Reading one table from a store is cheap: a directory store memory-maps the
+Parquet file, and a zip store memory-maps the stored member in place. Writing
+is cheap in the same way: a save encodes only the tables that changed, and
+keeps the Parquet files of the others - hard-linked into the new directory, or
+copied verbatim into the new archive.
+
+Parquet support needs ``pyarrow``. Without it a store is still recognised, but
+opening or writing one raises a clear error.
+"""
+
+import contextlib
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+
+# File name suffix of a store, for both the directory and the zip form.
+STORE_SUFFIX = '.ppnet'
+
+MANIFEST_NAME = 'manifest.json'
+NETWORK_NAME = 'network.json'
+TABLES_DIR = 'tables'
+
+# Identifies a manifest written by this module; bumped on layout changes.
+STORE_FORMAT = 'pandapower-parquet'
+STORE_FORMAT_VERSION = 1
+
+
+class StoreError(ValueError):
+    """A store is malformed, or cannot be used in this environment."""
+
+
+def is_store_path(path):
+    """Whether a path names a columnar store (directory or zip).
+
+    A path to the ``manifest.json`` inside a directory store also counts, so
+    a store can be picked in an ordinary file dialog.
+
+    Args:
+        path: File system path.
+    Returns:
+        bool: True for a store path.
+    """
+    return bool(path) and store_root(path).lower().endswith(STORE_SUFFIX)
+
+
+def store_root(path):
+    """Map a path inside a directory store to the store itself.
+
+    Args:
+        path: File system path.
+    Returns:
+        str: The store path for ``<store>/manifest.json``, else ``path``.
+    """
+    if os.path.basename(path) == MANIFEST_NAME:
+        return os.path.dirname(path)
+    return path
+
+
+def state_path(path):
+    """The file whose mtime and size track changes to a store.
+
+    A directory's own mtime does not change when a file inside it is
+    rewritten, so a directory store is tracked through its manifest, which
+    every write replaces.
+
+    Args:
+        path: Store path.
+    Returns:
+        str: Path to stat.
+    """
+    if os.path.isdir(path):
+        return os.path.join(path, MANIFEST_NAME)
+    return path
+
+
+def _require_pyarrow():
+    """Import pyarrow's Parquet support or explain what is missing.
+
+    Returns:
+        tuple: ``(pyarrow, pyarrow.parquet)``.
+    Raises:
+        StoreError: If pyarrow is not installed.
+    """
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as error:
+        raise StoreError(
+            'Opening .ppnet networks needs the pyarrow package: {}'
+            .format(error)) from error
+    return pyarrow, pyarrow.parquet
+
+
+# -- reading ---------------------------------------------------------------
+
+class _StoreReader:
+    """Reads members of a directory or zip store."""
+
+    def __init__(self, path):
+        self.path = store_root(path)
+        self.is_dir = os.path.isdir(self.path)
+        self._zip = None if self.is_dir else zipfile.ZipFile(self.path)
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def read_text(self, name):
+        """Read a member as text."""
+        if self.is_dir:
+            with open(os.path.join(self.path, name), encoding='utf-8') as handle:
+                return handle.read()
+        return self._zip.read(name).decode('utf-8')
+
+    def arrow_source(self, name):
+        """Return a pyarrow-readable, memory-mapped view of a member."""
+        pyarrow, _ = _require_pyarrow()
+        if self.is_dir:
+            return pyarrow.memory_map(os.path.join(self.path, name))
+
+        info = self._zip.getinfo(name)
+        if info.compress_type != zipfile.ZIP_STORED:
+            return pyarrow.BufferReader(self._zip.read(name))
+        # A stored member is the file's bytes verbatim, right after its local
+        # header, so it can be mapped in place instead of extracted.
+        mapped = pyarrow.memory_map(self.path)
+        mapped.seek(info.header_offset)
+        header = mapped.read(30)
+        name_length = int.from_bytes(header[26:28], 'little')
+        extra_length = int.from_bytes(header[28:30], 'little')
+        start = info.header_offset + 30 + name_length + extra_length
+        return pyarrow.BufferReader(mapped.read_at(info.file_size, start))
+
+
+def read_manifest(path):
+    """Read and check the manifest of a store.
+
+    Args:
+        path: Store path.
+    Returns:
+        dict: The manifest.
+    Raises:
+        StoreError: If the path is not a readable store.
+    """
+    try:
+        with _StoreReader(path) as reader:
+            manifest = json.loads(reader.read_text(MANIFEST_NAME))
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile) as error:
+        raise StoreError('Not a pandapower network store: {} ({})'
+                         .format(path, error)) from error
+    if manifest.get('format') != STORE_FORMAT:
+        raise StoreError('Not a pandapower network store: {}'.format(path))
+    if manifest.get('format_version', 0) > STORE_FORMAT_VERSION:
+        raise StoreError('{} was written by a newer version of the plugin.'
+                         .format(path))
+    return manifest
+
+
+def read_table(path, table, manifest=None):
+    """Read one Parquet table of a store, without touching the others.
+
+    Args:
+        path: Store path.
+        table: Table name.
+        manifest: The store's manifest, if already read.
+    Returns:
+        pandas.DataFrame or None: The table, or None if the store keeps it in
+            ``network.json`` instead.
+    """
+    manifest = manifest or read_manifest(path)
+    entry = manifest['tables'].get(table)
+    if entry is None or not entry.get('file'):
+        return None
+
+    _, parquet = _require_pyarrow()
+    with _StoreReader(path) as reader:
+        arrow_table = parquet.read_table(reader.arrow_source(entry['file']))
+    frame = arrow_table.to_pandas()
+
+    # Arrow types an object column by its contents, so an object column that
+    # happens to hold only numbers comes back numeric. Put the recorded
+    # pandas dtype back where it differs.
+    for column, dtype in entry.get('dtype', {}).items():
+        if column in frame.columns and str(frame[column].dtype) != dtype:
+            try:
+                frame[column] = frame[column].astype(dtype)
+            except (TypeError, ValueError):
+                pass
+    return frame
+
+
+def load_store(path):
+    """Load a complete network from a store.
+
+    Args:
+        path: Store path.
+    Returns:
+        The network, converted to the running pandapower version.
+    Raises:
+        StoreError: If the store is malformed or pyarrow is missing.
+    """
+    from .network_session import KIND_PIPES
+
+    manifest = read_manifest(path)
+    if manifest.get('kind') == KIND_PIPES:
+        from pandapipes.io.convert_format import convert_format
+        from pandapipes.io.file_io import from_json_string
+    else:
+        from pandapower.convert_format import convert_format
+        from pandapower.file_io import from_json_string
+
+    with _StoreReader(path) as reader:
+        net = from_json_string(reader.read_text(NETWORK_NAME), convert=False)
+
+    for table, entry in manifest['tables'].items():
+        if entry.get('file'):
+            net[table] = read_table(path, table, manifest)
+
+    convert_format(net)
+    return net
+
+
+def describe_store(path):
+    """List the tables of a store and their row counts, from the manifest.
+
+    Args:
+        path: Store path.
+    Returns:
+        dict: ``{table: rows}``.
+    """
+    manifest = read_manifest(path)
+    return {table: entry.get('rows', 0)
+            for table, entry in manifest['tables'].items()}
+
+
+def sniff_store_kind(path):
+    """Decide whether a path is a store, from its manifest alone.
+
+    Args:
+        path: Candidate path.
+    Returns:
+        str or None: The store's network kind, or None if not a store.
+    """
+    if not is_store_path(path):
+        return None
+    try:
+        return read_manifest(path).get('kind')
+    except StoreError:
+        return None
+
+
+# -- writing ---------------------------------------------------------------
+
+def _is_table(value):
+    return hasattr(value, 'columns') and hasattr(value, 'index')
+
+
+def _table_to_parquet(frame):
+    """Encode one table as Parquet bytes.
+
+    Args:
+        frame: The DataFrame.
+    Returns:
+        bytes or None: The Parquet file, or None if Arrow cannot represent
+            the table.
+    """
+    pyarrow, parquet = _require_pyarrow()
+    try:
+        arrow_table = pyarrow.Table.from_pandas(frame, preserve_index=True)
+    except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError,
+            pyarrow.ArrowNotImplementedError, TypeError, ValueError):
+        return None
+    sink = pyarrow.BufferOutputStream()
+    parquet.write_table(arrow_table, sink)
+    return sink.getvalue().to_pybytes()
+
+
+def _reusable_tables(net, path, changed):
+    """Find the tables whose Parquet files a write can keep.
+
+    Args:
+        net: The network about to be written.
+        path: Store path.
+        changed: Names of the tables changed since the store was last read or
+            written, or None if unknown.
+    Returns:
+        dict: ``{table: manifest entry}`` of the existing store.
+    """
+    if changed is None or not os.path.exists(path):
+        return {}
+    try:
+        tables = read_manifest(path)['tables']
+    except StoreError:
+        return {}
+    return {name: entry for name, entry in tables.items()
+            if entry.get('file') and name not in changed
+            and _is_table(net.get(name))}
+
+
+def _store_members(net, kind, progress=None, reuse=None):
+    """Yield ``(name, bytes)`` for every member of a store, manifest last.
+
+    Args:
+        net: The network.
+        kind: KIND_POWER or KIND_PIPES.
+        progress: Optional callable receiving the fraction of tables encoded.
+        reuse: Optional ``{table: manifest entry}`` of tables to keep from the
+            existing store. Their members are yielded with None for bytes.
+    """
+    import copy
+
+    import pandapower
+
+    from .network_compaction import expander
+    from .network_session import KIND_PIPES
+
+    if kind == KIND_PIPES:
+        from pandapipes.io.file_io import to_json
+    else:
+        from pandapower.file_io import to_json
+
+    # Compacted tables are stored with their original dtypes.
+    expand = expander(net)
+    skeleton = copy.copy(net)
+    tables = {}
+    names = [name for name, value in net.items()
+             if not name.startswith('_') and _is_table(value)]
+    for done, name in enumerate(names):
+        if progress is not None:
+            progress(done / max(1, len(names)))
+        value = net[name]
+        if reuse and name in reuse:
+            entry = reuse[name]
+            yield entry['file'], None
+            tables[name] = entry
+            del skeleton[name]
+            continue
+        value = expand(value)
+        data = _table_to_parquet(value)
+        if data is None:
+            # Arrow cannot hold it; network.json keeps the whole table.
+            tables[name] = {'rows': len(value), 'file': ''}
+            skeleton[name] = value
+            continue
+        member = '{}/{}.parquet'.format(TABLES_DIR, name)
+        yield member, data
+        tables[name] = {'rows': len(value), 'file': member,
+                        'dtype': value.dtypes.astype(str).to_dict()}
+        # Parquet keeps the rows and the pandas dtypes; decoding the table a
+        # second time from network.json would only cost load time.
+        del skeleton[name]
+
+    yield NETWORK_NAME, to_json(skeleton).encode('utf-8')
+
+    manifest = {
+        'format': STORE_FORMAT,
+        'format_version': STORE_FORMAT_VERSION,
+        'kind': kind,
+        'pandapower_version': getattr(pandapower, '__version__', ''),
+        'tables': tables,
+    }
+    yield MANIFEST_NAME, json.dumps(manifest, indent=2).encode('utf-8')
+    if progress is not None:
+        progress(1.0)
+
+
+def write_store(net, path, kind=None, progress=None, changed=None):
+    """Write a network as a store, replacing any previous one atomically.
+
+    The form follows what is on disk: an existing directory store is
+    rewritten as a directory, anything else becomes a zip archive.
+
+    Args:
+        net: The network.
+        path: Store path.
+        kind: KIND_POWER or KIND_PIPES.
+        progress: Optional callable receiving the fraction written.
+        changed: Names of the tables changed since the store was last read or
+            written. The Parquet files of the others are kept. None, the
+            default, encodes every table.
+    Raises:
+        StoreError: If pyarrow is missing.
+    """
+    from .network_io import atomic_write
+    from .network_session import KIND_POWER
+
+    _require_pyarrow()
+    path = store_root(path)
+    kind = kind or KIND_POWER
+    reuse = _reusable_tables(net, path, changed)
+
+    if os.path.isdir(path):
+        _write_directory(net, path, kind, progress, reuse)
+        return
+
+    def write(stream):
+        with contextlib.ExitStack() as stack:
+            old = stack.enter_context(zipfile.ZipFile(path)) if reuse else None
+            archive = stack.enter_context(
+                zipfile.ZipFile(stream, 'w', zipfile.ZIP_STORED))
+            for name, data in _store_members(net, kind, progress, reuse):
+                if data is None:
+                    # Stored uncompressed, so this is a plain copy.
+                    data = old.read(name)
+                # Parquet pages are compressed already; only the small JSON
+                # members are worth deflating.
+                compression = zipfile.ZIP_STORED if name.endswith('.parquet') \
+                    else zipfile.ZIP_DEFLATED
+                archive.writestr(name, data, compress_type=compression)
+
+    atomic_write(path, write, mode='wb')
+
+
+def _write_directory(net, path, kind, progress=None, reuse=None):
+    """Write a directory store next to the old one, then swap them.
+
+    Kept tables are hard-linked from the old directory, which costs nothing
+    and leaves the old store intact until the swap.
+
+    Args:
+        net: The network.
+        path: Store directory.
+        kind: KIND_POWER or KIND_PIPES.
+        progress: Optional callable receiving the fraction written.
+        reuse: Optional ``{table: manifest entry}`` of tables to keep.
+    """
+    from .network_io import replace_directory
+
+    parent = os.path.dirname(os.path.abspath(path))
+    staging = tempfile.mkdtemp(dir=parent, prefix='.{}.'.format(
+        os.path.basename(path)), suffix='.tmp')
+    try:
+        os.makedirs(os.path.join(staging, TABLES_DIR))
+        for name, data in _store_members(net, kind, progress, reuse):
+            target = os.path.join(staging, name)
+            if data is None:
+                _link_or_copy(os.path.join(path, name), target)
+                continue
+            with open(target, 'wb') as handle:
+                handle.write(data)
+                handle.flush()
+                os.fsync(handle.fileno())
+
+        replace_directory(staging, path)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+
+def _link_or_copy(source, target):
+    """Hard-link a file, or copy it where the file system cannot link.
+
+    Args:
+        source: Existing file.
+        target: New path.
+    """
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""Writing committed networks in the background.
+
+Committing layer edits used to serialise and write the whole network on the
+GUI thread, freezing QGIS for tens of seconds on large files. A commit now
+takes a cheap snapshot of the session (a copy of each table) and hands the
+serialisation and file I/O to a :py:class:`NetworkWriteTask` in the QGIS task
+manager, which shows its progress.
+
+Rules the write follows:
+
+* The session is marked clean only when the write succeeds **and** nothing was
+  edited since the snapshot (``NetworkSession.generation``).
+* A commit arriving while a write is in flight is queued, not lost: when the
+  running write finishes, the session is written again if still dirty.
+* The external-change prompt stays on the main thread, before the task starts.
+* With journaling enabled, a commit appends its edits to the file's journal
+  instead (see ``network_journal``), which takes no task at all. The file is
+  only written once the journal is full or the edits cannot be journaled.
+"""
+
+import os
+
+from qgis.core import QgsApplication, QgsTask
+
+from . import network_cache
+from .provider_utils import MessageManager
+
+
+class NetworkWriteTask(QgsTask):
+    """Writes a snapshot of one session's network to its file."""
+
+    def __init__(self, session, net, generation, confirm_overwrite=None,
+                 backup=True):
+        """Initialise the task. Use :py:func:`commit_session` instead.
+
+        Args:
+            session: The NetworkSession being written.
+            net: Snapshot of the network from ``session.snapshot()``.
+            generation: Edit generation the snapshot reflects.
+            confirm_overwrite: Callable asking whether to overwrite an
+                externally changed file, kept for a queued follow-up write.
+            backup: Back the existing file up first.
+        """
+        super().__init__('Saving {}'.format(os.path.basename(session.path)),
+                         QgsTask.CanCancel)
+        self.session = session
+        self.net = net
+        self.generation = generation
+        self.confirm_overwrite = confirm_overwrite
+        self.backup = backup
+        self.outcome = (False, 'The save was cancelled.', '')
+
+    def run(self):
+        """Serialise and write the snapshot. Runs on a worker thread.
+
+        Returns:
+            bool: True if the file was written.
+        """
+        def progress(fraction):
+            if self.isCanceled():
+                # Raising aborts the stream; the temporary file is discarded
+                # and the original stays in place.
+                raise InterruptedError('Save cancelled.')
+            self.setProgress(100.0 * fraction)
+
+        try:
+            self.outcome = self.session.write(
+                backup=self.backup, net=self.net, progress=progress)
+            if self.outcome[0] and self.session.scenario is None:
+                # The snapshot is exactly what is now on disk, so the cache
+                # entry can be refreshed without parsing the file again. A
+                # scenario's snapshot holds only its own tables.
+                network_cache.store(self.session.path, self.net,
+                                    self.session.kind)
+        except InterruptedError:
+            return False
+        finally:
+            # The snapshot is only needed while writing.
+            self.net = None
+        return self.outcome[0]
+
+    def finished(self, result):
+        """Apply the outcome on the main thread.
+
+        Args:
+            result: Return value of :py:meth:`run`.
+        """
+        session = self.session
+        session.write_task = None
+        success, message, backup_path = self.outcome
+
+        if success:
+            session.finish_write(self.generation)
+            MessageManager.show_success("Network Saved", message)
+            if backup_path:
+                MessageManager.show_info(
+                    "Backup Created",
+                    "The previous version can be restored from the "
+                    "network's Browser menu (Restore backup).")
+        elif not self.isCanceled():
+            MessageManager.show_error(
+                "Save Failed",
+                f"{message}\n\nThe changes are still in memory. "
+                f"Fix the problem and save the layer again."
+            )
+
+        queued, session.write_queued = session.write_queued, False
+        if queued and success:
+            commit_session(session, self.confirm_overwrite)
+
+
+def commit_session(session, confirm_overwrite=None, backup=True):
+    """Write a session's network in the background, or queue the write.
+
+    Args:
+        session: The NetworkSession to write.
+        confirm_overwrite: Callable returning True if a file that changed on
+            disk may be overwritten. Without it, such a file is never
+            overwritten.
+        backup: Back the existing file up first.
+    Returns:
+        NetworkWriteTask or None: The started task, or None if nothing was
+            started (clean session, edits journaled, queued behind a running
+            write, or the overwrite was refused).
+    """
+    if session is None:
+        return None
+
+    if session.write_task is not None:
+        # The running write reflects an older state; write again afterwards.
+        session.write_queued = True
+        return None
+
+    if not session.edits_at_risk():
+        return None  # Nothing to write, or already written or journaled
+
+    if session.append_journal():
+        MessageManager.show_success(
+            "Edits Saved",
+            f"Recorded in the journal of {os.path.basename(session.path)}; "
+            f"the file itself is rewritten later.")
+        return None
+
+    # Never silently overwrite a file that changed underneath us (plan 5.3).
+    if session.file_changed_externally():
+        if confirm_overwrite is None or not confirm_overwrite():
+            return None
+
+    net, generation = session.snapshot()
+    task = NetworkWriteTask(session, net, generation,
+                            confirm_overwrite=confirm_overwrite, backup=backup)
+    # The session keeps the Python wrapper alive until finished() has run.
+    session.write_task = task
+    QgsApplication.taskManager().addTask(task)
+    return task
+
+
+def wait_for_write(session, timeout=None):
+    """Block until a session's background write has finished.
+
+    Processes events meanwhile, so the task's finished() runs. Used before
+    QGIS quits and by tests.
+
+    Args:
+        session: The NetworkSession.
+        timeout: Seconds to wait at most, or None for no limit.
+    Returns:
+        bool: True if no write is in flight any more.
+    """
+    import time
+
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while session.write_task is not None or session.write_queued:
+        if deadline is not None and time.monotonic() > deadline:
+            return False
+        QgsApplication.processEvents()
+        time.sleep(0.01)
+    return True
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""Following network files that change outside QGIS.
+
+A network used to be checked against its file only when a commit was about to
+overwrite it, and the Browser's *Reload from disk* replaced the whole network,
+rebuilding every layer. Scripts that rewrite the file every few minutes, for
+instance after a calculation, left the layers stale in between.
+
+Each open session now has a :py:class:`NetworkWatcher`. It watches the file
+with a ``QFileSystemWatcher`` and waits until the file has been quiet for
+:py:data:`WATCH_DEBOUNCE_MS`, since a writer may touch it several times. A
+:py:class:`FileReloadTask` then loads the new file in the task manager. Back
+on the main thread, where nothing edits the open network meanwhile, the file
+is compared with it (``network_delta``), only the changed rows and result
+columns are patched into the network, and each layer redraws only the rows
+that changed. A reload that fails is tried again after the next quiet period.
+
+Unsaved edits survive an external change that does not touch them. Only when
+the file changed the same rows as the user is the user asked which to keep.
+
+The watcher ignores the plugin's own saves: a save records the file's new
+state, so the file no longer counts as changed externally.
+"""
+
+import os
+import weakref
+
+from qgis.core import QgsApplication, QgsTask
+from qgis.PyQt.QtCore import QFileSystemWatcher, QObject, QTimer
+
+from .network_store import state_path
+from .provider_utils import MessageManager
+
+# How long the file must be quiet before it is reloaded.
+WATCH_DEBOUNCE_MS = 2000
+
+
+class FileReloadTask(QgsTask):
+    """Loads a changed network file, for the watcher to diff and merge."""
+
+    def __init__(self, watcher, session, loader, lazy_loader=None):
+        """Initialise the task.
+
+        Args:
+            watcher: The NetworkWatcher to report back to.
+            session: The NetworkSession whose file changed.
+            loader: Zero-argument callable returning the file's network.
+            lazy_loader: Optional zero-argument callable returning a
+                ``network_lazy.LazyNetwork``, used for a lazy session.
+        """
+        super().__init__('Reloading {}'.format(os.path.basename(session.path)),
+                         QgsTask.CanCancel)
+        self.watcher = watcher
+        self.session = session
+        self.loader = loader
+        self.lazy_loader = lazy_loader
+        self.net = None
+        self.lazy = None
+        self.error = None
+
+    def run(self):
+        """Load the file. Runs on a worker thread.
+
+        The open network is not read here, since the main thread may be
+        editing it; the watcher compares the two once the task has finished.
+
+        Returns:
+            bool: True if the file was loaded.
+        """
+        try:
+            lazy = self.session.lazy
+            if lazy is not None and self.lazy_loader is not None:
+                self.lazy = self.lazy_loader()
+                self.setProgress(50)
+                # The tables the comparison reads, decoded here rather than
+                # on the main thread.
+                for name in list(lazy.decoded()):
+                    self.lazy.table(name)
+            else:
+                self.net = self.loader()
+        except Exception as error:
+            self.error = error
+            return False
+        self.setProgress(100)
+        return not self.isCanceled()
+
+    def finished(self, result):
+        """Hand the outcome to the watcher, on the main thread.
+
+        Args:
+            result: Return value of :py:meth:`run`.
+        """
+        self.watcher.reload_finished(self, result)
+
+
+class NetworkWatcher(QObject):
+    """Watches one session's file and merges external changes into it."""
+
+    def __init__(self, session, loader, lazy_loader=None, debounce_ms=None):
+        """Initialise the watcher. Use :py:func:`watch_session` instead.
+
+        Args:
+            session: The NetworkSession to keep up to date.
+            loader: Zero-argument callable returning the file's network.
+            lazy_loader: Optional zero-argument callable returning a
+                ``network_lazy.LazyNetwork``.
+            debounce_ms: Milliseconds the file must be quiet before a reload;
+                :py:data:`WATCH_DEBOUNCE_MS` if None.
+        """
+        super().__init__()
+        # Weak, so the watcher cannot keep a dropped session alive.
+        self._session = weakref.ref(session)
+        self.loader = loader
+        self.lazy_loader = lazy_loader
+        self.task = None
+
+        self._path = state_path(session.path)
+        self._watcher = QFileSystemWatcher(self)
+        # The directory too: a file replaced by a rename (as every atomic
+        # save does) drops out of the file watch.
+        self._watcher.addPath(os.path.dirname(self._path))
+        self._watch_file()
+        self._watcher.fileChanged.connect(self._on_changed)
+        self._watcher.directoryChanged.connect(self._on_changed)
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(WATCH_DEBOUNCE_MS if debounce_ms is None
+                                else debounce_ms)
+        self._timer.timeout.connect(self.check)
+
+    def _watch_file(self):
+        if os.path.exists(self._path) \
+                and self._path not in self._watcher.files():
+            self._watcher.addPath(self._path)
+
+    def _on_changed(self, _path=None):
+        """Restart the quiet period after any change to the file."""
+        self._watch_file()
+        self._timer.start()
+
+    def stop(self):
+        """Stop watching."""
+        self._timer.stop()
+        paths = self._watcher.files() + self._watcher.directories()
+        if paths:
+            self._watcher.removePaths(paths)
+
+    def check(self):
+        """Reload the file if it changed and nothing else is using it."""
+        session = self._session()
+        if session is None:
+            self.stop()
+            return
+        if session.write_task is not None or session.is_loading() \
+                or self.task is not None:
+            self._timer.start()  # Look again once that has finished
+            return
+        if not session.in_use() or not session.has_network():
+            return  # Checked again when it is acquired (NetworkSession._take)
+        if not session.file_changed_externally():
+            return  # Our own save, or a touch that changed nothing
+
+        self.task = FileReloadTask(self, session, self.loader,
+                                   self.lazy_loader)
+        QgsApplication.taskManager().addTask(self.task)
+
+    def reload_finished(self, task, result):
+        """Merge a reloaded file into the session, on the main thread.
+
+        Args:
+            task: The finished FileReloadTask.
+            result: Whether it loaded and diffed the file.
+        """
+        self.task = None
+        session = self._session()
+        if session is None:
+            return
+        if not result:
+            if task.error is not None:
+                MessageManager.show_warning(
+                    'Network changed on disk',
+                    'Could not reload {}: {}. Trying again shortly.'.format(
+                        os.path.basename(self._path), task.error))
+                self._timer.start()
+            return
+
+        if task.lazy is not None:
+            delta = session.diff_file(task.lazy.table, task.lazy.names())
+        else:
+            delta = session.diff_file(task.net.get, list(task.net.keys()))
+        if not merge_file_changes(session, delta, net=task.net,
+                                  lazy=task.lazy):
+            self._timer.start()
+
+
+def merge_file_changes(session, delta, net=None, lazy=None):
+    """Apply a reloaded file to a session, asking about conflicts.
+
+    Args:
+        session: The NetworkSession.
+        delta: NetworkDelta between the session and the file.
+        net: The file's network, when it was loaded in full.
+        lazy: The file's LazyNetwork, when the session is lazy.
+    Returns:
+        bool: False if nothing could be applied and the file must be
+            reloaded again, see ``NetworkSession.apply_delta``.
+    """
+    from .network_session import NetworkSession
+    from .refresh_scheduler import schedule_refresh
+
+    if delta.conflicts and ask_about_conflict(session, delta):
+        NetworkSession.seed(session.path,
+                            net if net is not None else lazy.materialize(),
+                            epsg=session.epsg, kind=session.kind)
+        return True
+
+    # Without conflicts, or keeping the edits: merge what does not clash.
+    if not session.apply_delta(delta, net=net, lazy=lazy):
+        return False
+    schedule_refresh(session, delta.change)
+    return True
+
+
+def ask_about_conflict(session, delta):
+    """Ask whether the file or the user's edits should win.
+
+    Args:
+        session: The NetworkSession with unsaved edits.
+        delta: NetworkDelta with conflicts.
+    Returns:
+        bool: True to reload the file and discard the edits.
+    """
+    from qgis.PyQt.QtWidgets import QMessageBox
+
+    answer = QMessageBox.question(
+        None,
+        'Network changed on disk',
+        '{} was changed by another program, in tables you have unsaved edits '
+        'in: {}.\n\nReload the file and discard your edits? Choose No to keep '
+        'your edits; the other changes in the file are merged in, and saving '
+        'writes your version of those tables.'.format(
+            os.path.basename(session.path), ', '.join(sorted(delta.conflicts))),
+        QMessageBox.Yes | QMessageBox.No,
+        QMessageBox.No,
+    )
+    return answer == QMessageBox.Yes
+
+
+def watch_session(session, loader, lazy_loader=None):
+    """Start watching a session's file, unless it is watched already.
+
+    Args:
+        session: A NetworkSession.
+        loader: Zero-argument callable returning the file's network.
+        lazy_loader: Optional zero-argument callable returning a
+            ``network_lazy.LazyNetwork``.
+    Returns:
+        NetworkWatcher: The session's watcher.
+    """
+    if session.file_watcher is None:
+        session.file_watcher = NetworkWatcher(session, loader, lazy_loader)
+    return session.file_watcher
@@ -0,0 +1,507 @@
+# -*- coding: utf-8 -*-
+"""Power flows in a persistent worker process, off the interpreter lock.
+
+A power flow on a worker thread (``network_calculation``) keeps QGIS usable,
+but not smooth: pandapower holds the interpreter lock for most of the
+calculation, and the layers' feature iterators, which are Python too, wait for
+it between every few features, so the map redraws in jerks until the power
+flow is done. With the worker enabled (:py:func:`configure`), a
+:py:class:`RemoteCalculation` runs the power flow in a second Python process
+instead, which has an interpreter lock of its own. This process only waits
+for the answer, and waiting releases the lock.
+
+The worker is started on first use and kept running. It holds a mirror of
+every network it calculated, so that the next calculation ships only what
+changed:
+
+* A mirror is first loaded by the worker itself from the network file when
+  the session has no edits the file lacks, so parsing the file costs this
+  process nothing. Otherwise the network is sent over, pickled.
+* Edits reach the mirror as deltas: the rows they touched, described as in
+  the journal (``network_journal.journal_entry``), or whole tables for edits
+  that cannot be described row by row, such as a deletion with its dependent
+  rows. The session collects them in ``NetworkSession.mirror_change``.
+* Only the result tables and flags such as ``converged`` come back; the
+  mirror keeps pandapower's internal structures to itself.
+* Cancelling kills the worker and with it every mirror; the next calculation
+  starts a new one.
+
+Messages are pickled with protocol 5 and sent over a pipe, which moves a
+table's arrays without converting them. Shared memory would save one more
+copy of the result tables, which are small next to the calculation itself.
+
+Saving stays in this process: a save writes the session's own network,
+backups and journal included (``NetworkSession.write``), and is already
+limited to what changed.
+
+This module is Qt-free, like ``network_session``, so the worker can import
+it.
+"""
+
+import copy
+import multiprocessing
+import os
+import pickle
+import threading
+import time
+import weakref
+
+from . import network_calculation
+from .network_calculation import Calculation
+from .network_change import NetworkChange
+from .network_compaction import COMPACTION_KEY
+from .network_journal import journal_entry
+from .network_preload import python_executable
+
+# Pickle protocol of the messages; 5 moves arrays without extra copies.
+PICKLE_PROTOCOL = 5
+
+# Seconds to wait for a killed worker to exit.
+STOP_TIMEOUT_S = 2.0
+
+# Run in the worker to import this module under the name the plugin was
+# imported with, which need not be importable from sys.path.
+_BOOTSTRAP = '''
+import importlib
+import importlib.util
+import os
+import sys
+
+if package not in sys.modules:
+    spec = importlib.util.spec_from_file_location(
+        package, os.path.join(directory, '__init__.py'),
+        submodule_search_locations=[directory])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[package] = module
+    spec.loader.exec_module(module)
+importlib.import_module(package + '.network_worker')._serve(connection)
+'''
+
+# Whether power flows run in the worker; off unless the user enables it.
+_enabled = False
+
+# The worker process and this process's end of its pipe.
+_process = None
+_connection = None
+
+# Held for a whole exchange with the worker, so that the messages of two
+# calculations do not interleave.
+_lock = threading.Lock()
+
+# Session key -> (weak reference to the session, weak reference to the
+# network its mirror was taken from), for the mirrors the worker holds.
+_mirrors = {}
+
+
+class WorkerError(RuntimeError):
+    """The worker process could not be started, or stopped answering."""
+
+
+def configure(enabled):
+    """Turn the worker on or off.
+
+    Turning it off stops a running worker.
+
+    Args:
+        enabled: Whether power flows run in the worker process.
+    """
+    global _enabled
+    _enabled = bool(enabled)
+    if not _enabled:
+        stop()
+
+
+def enabled():
+    """Whether power flows run in the worker process.
+
+    Returns:
+        bool: The setting, if a Python interpreter was found to run the
+            worker; False otherwise.
+    """
+    return _enabled and python_executable() is not None
+
+
+def _start():
+    """Start the worker process. Called with :py:data:`_lock` held.
+
+    Like the decode workers (``network_preload.worker_pool``), the worker is
+    spawned rather than forked.
+
+    Returns:
+        multiprocessing.connection.Connection: This process's end of the pipe.
+    Raises:
+        WorkerError: If no Python interpreter was found to run the worker.
+    """
+    global _process, _connection
+    executable = python_executable()
+    if executable is None:
+        raise WorkerError('No Python interpreter was found to start the '
+                          'worker process with.')
+    context = multiprocessing.get_context('spawn')
+    context.set_executable(executable)
+    connection, child = context.Pipe()
+    process = context.Process(
+        target=exec, name='pandapower worker', daemon=True,
+        args=(_BOOTSTRAP, {
+            'package': __name__.rpartition('.')[0],
+            'directory': os.path.dirname(os.path.abspath(__file__)),
+            'connection': child,
+        }))
+    process.start()
+    child.close()
+    _mirrors.clear()
+    _process, _connection = process, connection
+    return connection
+
+
+def running():
+    """Whether the worker process is running.
+
+    Returns:
+        bool: True once a calculation started it, until it is stopped.
+    """
+    process = _process
+    return process is not None and process.is_alive()
+
+
+def stop():
+    """Kill the worker process, if it runs, and forget its mirrors.
+
+    Safe to call while a calculation waits for the worker; that calculation
+    then fails with WorkerError.
+    """
+    global _process, _connection
+    process, connection = _process, _connection
+    _process = _connection = None
+    _mirrors.clear()
+    if process is not None:
+        process.kill()
+        process.join(STOP_TIMEOUT_S)
+    if connection is not None:
+        connection.close()
+
+
+def _request(message, waiting=None):
+    """Send the worker one message and wait for its answer.
+
+    Called with :py:data:`_lock` held.
+
+    Args:
+        message: Tuple of the command, the session key and its arguments.
+        waiting: Callable called every ``CHECK_INTERVAL_S`` seconds while the
+            worker works; an exception it raises kills the worker and is
+            passed on.
+    Returns:
+        Whatever the command returns.
+    Raises:
+        WorkerError: If the worker could not be started or stopped answering.
+        Any exception the command raised in the worker.
+    """
+    connection = _connection
+    if connection is None or not running():
+        stop()
+        connection = _start()
+    try:
+        connection.send_bytes(pickle.dumps(message, protocol=PICKLE_PROTOCOL))
+        while not connection.poll(network_calculation.CHECK_INTERVAL_S):
+            if waiting is not None:
+                try:
+                    waiting()
+                except BaseException:
+                    stop()
+                    raise
+            if not running():
+                raise EOFError
+        status, value = pickle.loads(connection.recv_bytes())
+    except InterruptedError:
+        raise  # From waiting(); an OSError, but the worker did not fail
+    except (EOFError, OSError) as error:
+        stop()
+        raise WorkerError('The worker process stopped: {}'.format(
+            error or 'no answer')) from error
+    if status == 'error':
+        raise value
+    return value
+
+
+def _is_table(value):
+    """Whether a network entry is a table.
+
+    Args:
+        value: The entry.
+    Returns:
+        bool: True for a DataFrame.
+    """
+    return hasattr(value, 'columns')
+
+
+def _handle(mirrors, command, key, *arguments):
+    """Carry out one message. Runs in the worker.
+
+    Args:
+        mirrors: Session key -> mirrored network.
+        command: What to do, see :py:meth:`RemoteCalculation.run`.
+        key: Key of the session concerned.
+        *arguments: The command's arguments.
+    Returns:
+        The command's answer.
+    Raises:
+        ValueError: For an unknown command.
+        KeyError: If the session has no mirror.
+    """
+    from .network_journal import apply_entries
+
+    if command == 'load':
+        from .network_compaction import compact_network
+        from .network_preload import read_network
+
+        path, kind, compact = arguments
+        net = read_network(path, kind)
+        if compact:
+            compact_network(net)
+        mirrors[key] = net
+    elif command == 'put':
+        mirrors[key] = arguments[0]
+    elif command == 'apply':
+        apply_entries(mirrors[key], arguments[0])
+    elif command == 'tables':
+        mirrors[key].update(arguments[0])
+    elif command == 'drop':
+        mirrors.pop(key, None)
+    elif command == 'run':
+        net = mirrors[key]
+        given = dict(net)
+        arguments[0](net)
+        return {name: value for name, value in net.items()
+                if name.startswith('res_')
+                or (not name.startswith('_') and not _is_table(value)
+                    and given.get(name) is not value)}
+    else:
+        raise ValueError('Unknown worker command: {}'.format(command))
+    return None
+
+
+def _serve(connection):
+    """Answer messages until the pipe closes. Runs in the worker.
+
+    Args:
+        connection: The worker's end of the pipe.
+    """
+    mirrors = {}
+    while True:
+        try:
+            message = pickle.loads(connection.recv_bytes())
+        except (EOFError, OSError):
+            return
+        try:
+            reply = ('ok', _handle(mirrors, *message))
+        except Exception as error:
+            reply = ('error', error)
+        try:
+            data = pickle.dumps(reply, protocol=PICKLE_PROTOCOL)
+        except Exception as error:
+            # An exception that does not pickle still reports its text.
+            data = pickle.dumps(('error', WorkerError('{}: {}'.format(
+                type(reply[1]).__name__, reply[1]))),
+                protocol=PICKLE_PROTOCOL)
+        connection.send_bytes(data)
+
+
+class RemoteCalculation(Calculation):
+    """A power flow run on the worker's mirror of a session's network.
+
+    Used like a :py:class:`network_calculation.Calculation`, but
+    :py:meth:`run` takes a function the worker can import, such as a
+    ``functools.partial`` of ``pandapower.runpp``.
+    """
+
+    def __init__(self, session):
+        """Take what the mirror needs to catch up with the session.
+
+        Nothing is copied or sent here: the session's tables are pinned
+        (``NetworkSession.capture``) until :py:meth:`run` has sent what it
+        needs of them.
+
+        Args:
+            session: The NetworkSession to calculate. A lazily opened network
+                is decoded in full first.
+        Raises:
+            ValueError: If the session has no network yet.
+        """
+        source = session.net
+        entries = session.capture()
+        if source is None or entries is None:
+            raise ValueError('The network of {} is not loaded yet.'.format(
+                session.path))
+        self.session = session
+        self.generation = session.generation
+        self.net = None
+        self._source = source
+        self._entries = entries
+        self._edited = None
+        self._results = None
+        # Edits since the mirror was last brought up to date; None if the
+        # session was never mirrored.
+        self._change = session.mirror_change
+        session.mirror_change = NetworkChange()
+        self._synchronised = False
+        # The worker may load a mirror from the file the session matches.
+        self._file = None
+        if not session.dirty and session.scenario is None \
+                and not session.file_changed_externally():
+            self._file = (session.path, session.kind,
+                          COMPACTION_KEY in source)
+
+    def run(self, function, is_canceled=None, progress=None):
+        """Bring the mirror up to date and run a calculation on it.
+
+        Blocks the calling thread, but not the interpreter lock.
+
+        Args:
+            function: Callable taking the network, which the worker unpickles
+                by importing it.
+            is_canceled: Callable returning True once the calculation should
+                stop, like :py:meth:`cancel`; the worker is then killed.
+            progress: Callable receiving an estimated percentage done.
+        Returns:
+            dict: The results, see :py:meth:`results`.
+        Raises:
+            InterruptedError: If the calculation was cancelled.
+            WorkerError: If the worker could not be started or died.
+            Any exception raised by ``function``.
+        """
+        expected = self.expected_duration()
+        started = time.monotonic()
+
+        def cancelled():
+            return self._cancelled \
+                or (is_canceled is not None and is_canceled())
+
+        def waiting():
+            if cancelled():
+                raise InterruptedError('Calculation cancelled.')
+            if progress is not None and expected:
+                progress(min(95.0, 100.0 * (time.monotonic() - started)
+                             / expected))
+
+        while not _lock.acquire(timeout=network_calculation.CHECK_INTERVAL_S):
+            waiting()
+        try:
+            self._drop_closed()
+            self._synchronise(waiting)
+            self._results = _request(('run', self.session.key, function),
+                                     waiting)
+            # Cancelled too late to stop the worker.
+            if cancelled():
+                raise InterruptedError('Calculation cancelled.')
+        except BaseException:
+            self._synchronised = False
+            raise
+        finally:
+            _lock.release()
+            self.release()
+        self.record_duration(time.monotonic() - started)
+        return self._results
+
+    def cancel(self):
+        """Stop the calculation. May be called from any thread.
+
+        :py:meth:`run` notices within ``CHECK_INTERVAL_S`` seconds and kills
+        the worker.
+        """
+        self._cancelled = True
+
+    def _drop_closed(self):
+        """Drop the mirrors of sessions that no longer exist."""
+        for key, (session, _) in list(_mirrors.items()):
+            if session() is None:
+                _mirrors.pop(key, None)
+                _request(('drop', key))
+
+    def _synchronise(self, waiting):
+        """Send the mirror what it lacks. Called with :py:data:`_lock` held.
+
+        Args:
+            waiting: See :py:func:`_request`.
+        """
+        key = self.session.key
+        mirror = _mirrors.pop(key, None)
+        current = mirror is not None and self._change is not None \
+            and mirror[0]() is self.session and mirror[1]() is self._source
+        if not current:
+            message = self._full()
+        elif self._change.is_empty():
+            message = None
+        else:
+            message = self._delta()
+        if message is not None:
+            _request(message, waiting)
+        _mirrors[key] = (weakref.ref(self.session), weakref.ref(self._source))
+        self._synchronised = True
+
+    def _full(self):
+        """The message that replaces the mirror.
+
+        Returns:
+            tuple: A ``load`` message if the session matches its file, a
+                ``put`` message with the whole network otherwise.
+        """
+        key = self.session.key
+        if self._file is not None:
+            return ('load', key) + self._file
+        net = copy.copy(self._source)
+        net.update(self._entries)
+        return ('put', key, net)
+
+    def _delta(self):
+        """The message that brings the mirror up to date with the edits.
+
+        Returns:
+            tuple: An ``apply`` message with the rows the edits touched, a
+                ``tables`` message with the tables they touched, or what
+                :py:meth:`_full` returns if neither describes them.
+        """
+        key = self.session.key
+        change = self._change
+        entry = journal_entry(self._entries, change)
+        if entry is not None:
+            return ('apply', key, [entry])
+        if not change.everything \
+                and all(name in self._entries for name in change.tables):
+            return ('tables', key,
+                    {name: self._entries[name] for name in change.tables})
+        return self._full()
+
+    def results(self):
+        """The entries the calculation produced.
+
+        Returns:
+            dict: The result tables and the flags the calculation changed.
+        """
+        return self._results or {}
+
+    def apply(self, net=None):
+        """Put the results into the session's network, on the main thread.
+
+        The mirror holds the results already; unless the session was edited
+        meanwhile, it is up to date afterwards.
+
+        Args:
+            net: Ignored; the results came from the worker.
+        Returns:
+            NetworkChange: The change, already marked on the session.
+        """
+        change = super().apply()
+        if not self._edited and self._synchronised:
+            self.session.mirror_change = NetworkChange()
+        return change
+
+    def release(self):
+        """Let edits change the session's tables in place again.
+
+        A mirror that was not brought up to date is forgotten, since the
+        session no longer collects the edits it lacks.
+        """
+        super().release()
+        if not self._synchronised:
+            _mirrors.pop(self.session.key, None)
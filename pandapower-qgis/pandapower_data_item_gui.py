@@ -10,12 +10,19 @@ See docs/dataprovider_v2_plan.md section 3.2.
 
 from qgis.core import QgsProject
 from qgis.gui import QgsDataItemGuiProvider
-from qgis.PyQt.QtWidgets import QAction, QMessageBox
-
-from .network_session import NetworkSession
+from qgis.PyQt.QtWidgets import QAction, QMenu, QMessageBox
+
+from .network_backup import list_snapshots, restore_snapshot
+from .network_change import NetworkChange
+from .network_compaction import format_bytes
+from .network_index import read_index
+from .network_session import NetworkSession, normalise_path
+from .network_tasks import commit_session
+from .network_watcher import merge_file_changes
 from .pandapower_data_items import PandapowerNetworkItem, \
     PandapowerResultsItem, PandapowerTableItem
 from .pandapower_layer_factory import create_layer
+from .refresh_scheduler import schedule_refresh
 
 
 def _add_table_item_to_project(item):
@@ -114,6 +121,37 @@ class PandapowerDataItemGuiProvider(QgsDataItemGuiProvider):
         reload_action.triggered.connect(lambda: self._reload(item))
         menu.addAction(reload_action)
 
+        if self._needs_upgrade(item):
+            upgrade = QAction('Upgrade file to current format', menu)
+            upgrade.triggered.connect(lambda: self._upgrade_format(item))
+            menu.addAction(upgrade)
+
+        menu.addMenu(self._restore_menu(item, menu))
+
+        memory = QAction('Memory usage', menu)
+        memory.triggered.connect(lambda: self._show_memory(item.file_path))
+        menu.addAction(memory)
+
+    def _restore_menu(self, item, menu):
+        """Build the submenu listing a network's backups.
+
+        Args:
+            item: The PandapowerNetworkItem.
+            menu: Parent QMenu.
+        Returns:
+            QMenu: The submenu, disabled if there are no backups.
+        """
+        restore = QMenu('Restore backup', menu)
+        snapshots = list_snapshots(item.file_path)
+        for snapshot in snapshots:
+            action = QAction(snapshot.label(), restore)
+            action.triggered.connect(
+                lambda _checked=False, snapshot=snapshot:
+                self._restore_backup(item, snapshot))
+            restore.addAction(action)
+        restore.setEnabled(bool(snapshots))
+        return restore
+
     def _populate_table_menu(self, item, menu):
         """Add the single-table entries.
 
@@ -225,8 +263,10 @@ class PandapowerDataItemGuiProvider(QgsDataItemGuiProvider):
             import pandapower as pp
 
             pp.runpp(session.net)
-            session.mark_dirty()
-            session.notify_changed()
+            change = NetworkChange.results_changed(session.net)
+            session.mark_dirty(change)
+            session.record_change(change)
+            schedule_refresh(session, change)
             self._info('Power flow complete',
                        'Results are available under "Results".')
         except Exception as error:
@@ -255,14 +295,12 @@ class PandapowerDataItemGuiProvider(QgsDataItemGuiProvider):
             if answer != QMessageBox.Yes:
                 return
 
-        try:
-            import pandapower as pp
-
-            pp.to_json(session.net, path)
-            session.mark_clean()
-            self._info('Network saved', 'Written to {}'.format(path))
-        except Exception as error:
-            self._warn('Save failed', str(error))
+        # Same atomic write as a layer commit; this menu never made a backup.
+        success, message, _backup = session.write(backup=False)
+        if success:
+            self._info('Network saved', message)
+        else:
+            self._warn('Save failed', message)
 
     def _reload(self, item):
         """Discard in-memory changes and reload a network from disk.
@@ -284,16 +322,161 @@ class PandapowerDataItemGuiProvider(QgsDataItemGuiProvider):
                 return
 
         try:
-            from .pandapower_provider import PandapowerProvider
-
-            net = PandapowerProvider._load_network_from_file(
-                item.file_path, item.kind)
-            NetworkSession.seed(item.file_path, net, kind=item.kind)
-            item.refresh()
+            self._load_from_disk(item)
             self._info('Network reloaded', 'Reloaded from disk.')
         except Exception as error:
             self._warn('Reload failed', str(error))
 
+    @staticmethod
+    def _needs_upgrade(item):
+        """Whether a network file is in an older pandapower format.
+
+        Args:
+            item: The PandapowerNetworkItem.
+        Returns:
+            bool: True if loading it runs pandapower's format conversion.
+        """
+        try:
+            # The index is remembered by file state, so this rarely reads
+            # the file.
+            return read_index(normalise_path(item.file_path), item.kind).legacy
+        except Exception:
+            return False
+
+    def _upgrade_format(self, item):
+        """Rewrite a network file in the current pandapower format.
+
+        The file then opens without format conversion, and lazily if it is
+        large. It is written like a save, in the background and after a
+        backup.
+
+        Args:
+            item: The PandapowerNetworkItem.
+        """
+        import pandapower
+
+        session = NetworkSession.get(item.file_path)
+        if session is not None and session.dirty:
+            self._warn('Unsaved changes',
+                       'Save or reload this network before upgrading its '
+                       'file.')
+            return
+
+        answer = QMessageBox.question(
+            None,
+            'Upgrade file format?',
+            'Rewrite {} in the format of pandapower {}?\n\n'
+            'It then opens faster, but older pandapower versions may not '
+            'read it. The current file is backed up first.'.format(
+                item.name(), pandapower.__version__),
+            QMessageBox.Yes | QMessageBox.No,
+            QMessageBox.No,
+        )
+        if answer != QMessageBox.Yes:
+            return
+
+        try:
+            if session is None or not session.has_network():
+                self._load_from_disk(item)
+                session = NetworkSession.get(item.file_path)
+        except Exception as error:
+            self._warn('Upgrade failed', str(error))
+            return
+        if session.file_changed_externally():
+            self._warn('File changed on disk',
+                       'Reload the network before upgrading its file.')
+            return
+
+        # Every table is encoded anew; none is copied from the old file.
+        session.mark_dirty()
+        commit_session(session)
+
+    def _restore_backup(self, item, snapshot):
+        """Replace a network file with one of its backups.
+
+        Args:
+            item: The PandapowerNetworkItem.
+            snapshot: The network_backup.Snapshot to restore.
+        """
+        session = NetworkSession.get(item.file_path)
+        warning = ''
+        if session is not None and session.dirty:
+            warning = '\n\nThe unsaved changes to this network will be lost.'
+        answer = QMessageBox.question(
+            None,
+            'Restore backup?',
+            'Replace the network with the backup from {}?\n\n'
+            'The current file is backed up first, so this can be '
+            'undone.{}'.format(snapshot.label(), warning),
+            QMessageBox.Yes | QMessageBox.No,
+            QMessageBox.No,
+        )
+        if answer != QMessageBox.Yes:
+            return
+
+        try:
+            restore_snapshot(item.file_path, snapshot.id)
+        except Exception as error:
+            self._warn('Restore failed', str(error))
+            return
+
+        try:
+            if session is not None:
+                self._load_from_disk(item)
+            else:
+                item.refresh()
+            self._info('Backup restored',
+                       'Restored the backup from {}.'.format(snapshot.label()))
+        except Exception as error:
+            self._warn('Reload failed', str(error))
+
+    @staticmethod
+    def _load_from_disk(item):
+        """Load a network file into its session, replacing what it held.
+
+        A clean session is only patched where the file differs, so layers
+        redraw just the rows that changed. A dirty one, whose edits the user
+        agreed to discard, is replaced whole.
+
+        Args:
+            item: The PandapowerNetworkItem.
+        """
+        from .pandapower_provider import PandapowerProvider
+
+        net = PandapowerProvider._load_network_from_file(
+            item.file_path, item.kind)
+        session = NetworkSession.get(item.file_path)
+        if session is not None and session.has_network() and not session.dirty:
+            merge_file_changes(session,
+                               session.diff_file(net.get, list(net.keys())),
+                               net=net)
+        else:
+            NetworkSession.seed(item.file_path, net, kind=item.kind)
+        item.refresh()
+
+    def _show_memory(self, path):
+        """Report how much memory an open network takes.
+
+        Args:
+            path: Path of the network file.
+        """
+        session = NetworkSession.get(path)
+        if session is None or not session.has_network():
+            self._info('Memory usage', 'This network is not open.')
+            return
+
+        report = session.memory_report()
+        if report is not None:
+            # Measured when it was loaded; counts shared strings once.
+            message = 'When it was opened, the network took ' \
+                + report.describe()
+        else:
+            message = ('The network takes about {} in memory. It is not '
+                       'compacted; turn on "Compact networks in memory" in '
+                       'the plugin menu to compact networks opened from then '
+                       'on.'.format(format_bytes(session.memory_usage())))
+        self._info('Memory usage', message)
+
     # -- messaging --------------------------------------------------------
 
     @staticmethod
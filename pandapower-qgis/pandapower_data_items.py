@@ -35,7 +35,12 @@ try:
 except ImportError:  # pragma: no cover - very old PyQt
     import sip
 
-from .network_session import KIND_PIPES, KIND_POWER, NetworkSession
+from .network_compression import is_network_file_name, open_text
+from .network_database import is_database_path, sniff_database_kind
+from .network_index import NetworkIndex, read_index
+from .network_session import DEFAULT_EPSG, KIND_PIPES, KIND_POWER, \
+    NetworkSession, normalise_path
+from .network_store import STORE_SUFFIX, is_store_path, sniff_store_kind
 from .pandapower_layer_factory import PROVIDER_KEY, build_uri
 from .pandapower_uri import LEVELLED_TABLES, has_geometry, layer_name_for
 
@@ -62,17 +67,28 @@ def sniff_network_kind(path):
     """Cheaply decide whether a file is a pandapower or pandapipes network.
 
     Reads a bounded prefix rather than parsing, because this runs for every
-    ``.json`` in every directory the user expands in the Browser.
+    ``.json`` in every directory the user expands in the Browser. A compressed
+    file has just that prefix decompressed. A columnar ``.ppnet`` store is
+    recognised from its small manifest, and a GeoPackage or SQLite database
+    from its ``pandapower_network`` table.
 
     Args:
         path: Path of the candidate file.
     Returns:
         str or None: KIND_POWER, KIND_PIPES, or None if it is neither.
     """
+    if is_store_path(path):
+        return sniff_store_kind(path)
+    if is_database_path(path):
+        return sniff_database_kind(path)
+
     try:
-        with open(path, 'r', encoding='utf-8', errors='ignore') as handle:
+        # Only the prefix of a compressed file is decompressed.
+        with open_text(path, errors='ignore') as handle:
             head = handle.read(SNIFF_BYTES)
-    except OSError:
+    except Exception:
+        # Unreadable, truncated, or zstd without the zstandard package: not
+        # a network the Browser can offer.
         return None
 
     if POWER_MARKER in head:
@@ -126,8 +142,29 @@ def _release_to_cpp(items_):
     return items_
 
 
-def list_tables(net):
-    """List the pandapower tables worth showing, derived from the net itself.
+def describe_network(path, kind=KIND_POWER):
+    """Index a network for listing, without loading it if it is not open.
+
+    A network that is open in full is indexed from memory, so unsaved edits
+    and power flow results show. Otherwise the index comes from the file (see
+    ``network_index``), which is cheap and cached by modification time.
+
+    Args:
+        path: Path of the network file.
+        kind: KIND_POWER or KIND_PIPES.
+    Returns:
+        NetworkIndex: The index.
+    Raises:
+        OSError, ValueError: If the file cannot be indexed.
+    """
+    session = NetworkSession.get(path)
+    if session is not None and session.lazy is None and session.has_network():
+        return NetworkIndex.from_net(session.net, session.kind)
+    return read_index(normalise_path(path), kind)
+
+
+def list_tables(index):
+    """List the pandapower tables worth showing, derived from the network.
 
     Derived rather than hardcoded, so pandapipes tables appear for free once
     pipe networks are supported (plan section 5.4).
@@ -140,33 +177,11 @@ def list_tables(net):
     (plan section 5.2).
 
     Args:
-        net: A loaded pandapower/pandapipes network.
+        index: NetworkIndex of the network, from :py:func:`describe_network`.
     Returns:
         tuple: (input_tables, result_tables), each a sorted list of names.
     """
-    import pandas as pd
-
-    inputs = []
-    results = []
-
-    for name in dir(net):
-        if name.startswith('_') or name in HIDDEN_TABLES:
-            continue
-        try:
-            value = getattr(net, name)
-        except Exception:
-            continue
-        if not isinstance(value, pd.DataFrame):
-            continue
-        if name.startswith('res_'):
-            results.append(name)
-        elif len(value) > 0:
-            inputs.append(name)
-
-    # Keep only the result tables whose input table is actually present. A
-    # res_ssc for an empty ssc table can never hold anything.
-    populated = set(inputs)
-    results = [name for name in results if name[4:] in populated]
+    inputs, results = index.tables(HIDDEN_TABLES)
 
     # Show the geometry-bearing tables first: they are what most users open.
     def input_key(name):
@@ -175,29 +190,18 @@ def list_tables(net):
     return sorted(inputs, key=input_key), sorted(results)
 
 
-def table_levels(net, table):
+def table_levels(index, table):
     """List the voltage or pressure levels a table can be split by.
 
     Args:
-        net: A loaded network.
+        index: NetworkIndex of the network.
         table: Table name, e.g. 'bus' or 'line'.
     Returns:
         list: Sorted level values, empty when the table has no level column.
     """
-    try:
-        if table in ('bus', 'line'):
-            column = 'vn_kv'
-        elif table in ('junction', 'pipe'):
-            column = 'pn_bar'
-        else:
-            return []
-
-        df = getattr(net, table, None)
-        if df is None or df.empty or column not in df.columns:
-            return []
-        return sorted(df[column].dropna().unique().tolist())
-    except Exception:
+    if table not in LEVELLED_TABLES:
         return []
+    return index.levels(table)
 
 
 class PandapowerTableItem(QgsLayerItem):
@@ -369,71 +373,46 @@ class PandapowerNetworkItem(QgsDataCollectionItem):
                                Qgis.BrowserItemCapability.ItemRepresentsFile)
         self.setIcon(_icon('pp.svg'))
 
-    def _acquire_session(self):
-        """Open (or join) the session for this file.
-
-        Returns:
-            NetworkSession or None: The session, or None if loading failed.
-        """
-        from .pandapower_provider import PandapowerProvider
-
-        try:
-            return NetworkSession.acquire(
-                self.file_path,
-                lambda: PandapowerProvider._load_network_from_file(
-                    self.file_path, self.kind),
-                kind=self.kind)
-        except Exception as error:
-            print('Could not open pandapower network {}: {}'.format(
-                self.file_path, error))
-            return None
-
     def createChildren(self):
         """Build the table items for this network.
 
-        Loading the network is unavoidable here, so it goes through
-        NetworkSession: the same load then serves any layer the user opens.
+        The tables come from the network's index, so expanding a folder of
+        networks loads none of them.
 
         Returns:
             list: Child items, or an empty list when the file cannot be read.
         """
-        session = self._acquire_session()
-        if session is None:
+        try:
+            index = describe_network(self.file_path, self.kind)
+        except Exception as error:
+            print('Could not read pandapower network {}: {}'.format(
+                self.file_path, error))
             return []
 
-        try:
-            net = session.net
-            epsg = session.epsg
-            inputs, results = list_tables(net)
-
-            children = []
-            for table in inputs:
-                levels = table_levels(net, table)
-                if len(levels) > 1:
-                    # Split into one child per level only when there is more
-                    # than one; a single level would add a pointless nesting.
-                    children.append(PandapowerLevelledTableItem(
-                        None, table, self.file_path, table, levels, epsg))
-                else:
-                    children.append(PandapowerTableItem(
-                        None, table, self.file_path, table,
-                        level=levels[0] if levels else None, epsg=epsg))
-
-            if results:
-                counts = []
-                for table in results:
-                    df = getattr(net, table, None)
-                    counts.append((table, 0 if df is None else len(df)))
-                children.append(PandapowerResultsItem(
-                    None, self.file_path, counts, epsg,
-                    has_results=any(count for _, count in counts)))
-
-            return _release_to_cpp(children)
-        finally:
-            # createChildren() only needed the network to enumerate tables; the
-            # reference is dropped so the session lives exactly as long as the
-            # layers that actually use it.
-            session.release()
+        session = NetworkSession.get(self.file_path)
+        epsg = session.epsg if session is not None else DEFAULT_EPSG
+        inputs, results = list_tables(index)
+
+        children = []
+        for table in inputs:
+            levels = table_levels(index, table)
+            if len(levels) > 1:
+                # Split into one child per level only when there is more
+                # than one; a single level would add a pointless nesting.
+                children.append(PandapowerLevelledTableItem(
+                    None, table, self.file_path, table, levels, epsg))
+            else:
+                children.append(PandapowerTableItem(
+                    None, table, self.file_path, table,
+                    level=levels[0] if levels else None, epsg=epsg))
+
+        if results:
+            counts = [(table, index.row_count(table)) for table in results]
+            children.append(PandapowerResultsItem(
+                None, self.file_path, counts, epsg,
+                has_results=any(count for _, count in counts)))
+
+        return _release_to_cpp(children)
 
 
 class PandapowerDataItemProvider(QgsDataItemProvider):
@@ -459,9 +438,11 @@ class PandapowerDataItemProvider(QgsDataItemProvider):
         """Kinds of browser entries this provider handles.
 
         Returns:
-            Qgis.DataItemProviderCapabilities: Files.
+            Qgis.DataItemProviderCapabilities: Files, and directories for
+                directory-form ``.ppnet`` stores.
         """
-        return Qgis.DataItemProviderCapability.Files
+        return (Qgis.DataItemProviderCapability.Files
+                | Qgis.DataItemProviderCapability.Directories)
 
     def createDataItem(self, path, parentItem):
         """Create a browser item for a candidate file.
@@ -473,7 +454,8 @@ class PandapowerDataItemProvider(QgsDataItemProvider):
             PandapowerNetworkItem or None: An item for pandapower networks,
                 None for every other file.
         """
-        if not path or not path.lower().endswith('.json'):
+        if not is_network_file_name(path) and not is_database_path(path) \
+                and not path.lower().endswith(STORE_SUFFIX):
             return None
 
         kind = sniff_network_kind(path)
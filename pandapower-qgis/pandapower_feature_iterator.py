@@ -41,11 +41,12 @@ class PandapowerFeatureIterator(QgsAbstractFeatureIterator):
                 request.transformContext()  # Transformation context
             )
 
-        # Prepare geometry data
+        # Prepare geometry data. A layer whose network is still loading has
+        # no features yet.
         self.df_geodata = None
-        if self._has_geometry:
-            self.df_geodata = getattr(
-                self._provider.net, self._provider.network_type).geo
+        if self._has_geometry and not self._provider._loading():
+            self.df_geodata = self._provider._table(
+                self._provider.network_type).geo
 
         # Prepare main dataframe
         self.df = self._provider.df
@@ -59,7 +60,7 @@ class PandapowerFeatureIterator(QgsAbstractFeatureIterator):
             if self.df_geodata is not None:
                 self.df_geodata.sort_index(inplace=True)
             self.df.sort_index(inplace=True)
-        else:
+        elif not self._provider._loading():
             print("Warning: Dataframe is empty in PandapowerFeatureIterator.")
 
 
@@ -74,7 +75,7 @@ class PandapowerFeatureIterator(QgsAbstractFeatureIterator):
             bool: True if feature was successfully fetched, False if no more features available
         """
         # Exit if there are no more rows to process
-        if self._index >= len(self.df):
+        if not self._is_valid or self._index >= len(self.df):
             return False
 
         # Get the current row
@@ -154,7 +155,7 @@ class PandapowerFeatureIterator(QgsAbstractFeatureIterator):
                         to_bus_idx = row[to_node]
 
                         # Access bus/junction geodata from the network
-                        bus_geodata = getattr(self._provider.net, bus_table).geo
+                        bus_geodata = self._provider._table(bus_table).geo
 
                         # Check if both buses exist in geodata
                         if from_bus_idx in bus_geodata.index and to_bus_idx in bus_geodata.index:
@@ -21,7 +21,7 @@ from .pandapower_uri import encode_uri, has_geometry, layer_name_for
 PROVIDER_KEY = 'PandapowerProvider'
 
 
-def build_uri(path, table, level=None, epsg=None):
+def build_uri(path, table, level=None, epsg=None, scenario=None):
     """Build a layer URI for one pandapower table.
 
     Goes through the registered provider metadata when it is available, so the
@@ -34,21 +34,51 @@ def build_uri(path, table, level=None, epsg=None):
         table: pandapower table name.
         level: Voltage or pressure level, or None for the whole table.
         epsg: EPSG code of the geodata.
+        scenario: Name of a scenario of the network, or None.
     Returns:
         str: Encoded URI.
     """
     metadata = QgsProviderRegistry.instance().providerMetadata(PROVIDER_KEY)
     if metadata is None:
-        return encode_uri(path, table, level=level, epsg=epsg)
+        return encode_uri(path, table, level=level, epsg=epsg,
+                          scenario=scenario)
 
     parts = {'path': path, 'table': table}
     if level not in (None, ''):
         parts['level'] = str(level)
     if epsg not in (None, ''):
         parts['epsg'] = str(epsg)
+    if scenario:
+        parts['scenario'] = scenario
     return metadata.encodeUri(parts)
 
 
+def switch_scenario(layer, scenario):
+    """Point a pandapower layer at a scenario of its network, or back.
+
+    Only the layer's data source changes; it keeps its name, style and place
+    in the project, and shows the same table of the chosen scenario.
+
+    Args:
+        layer: A QgsVectorLayer of this provider.
+        scenario: Scenario name, or None for the network itself.
+    Returns:
+        bool: True if the layer is valid afterwards.
+    """
+    parts = layer.dataProvider().parts
+    uri = build_uri(parts['path'], parts['table'], level=parts['level'],
+                    epsg=parts['epsg'], scenario=scenario)
+    layer.setDataSource(uri, layer.name(), PROVIDER_KEY)
+    if not layer.isValid():
+        return False
+
+    provider = layer.dataProvider()
+    if hasattr(provider, 'attach_layer'):
+        provider.attach_layer(layer)
+    configure_field_edit_permissions(layer)
+    return True
+
+
 def configure_field_edit_permissions(layer):
     """Mark provider-computed fields as read-only in the attribute form.
 
@@ -108,6 +138,12 @@ def create_layer(path, table, level=None, epsg=None, name=None,
         # better position to report the failure to the user.
         return layer
 
+    # Tell the provider which layer it backs, so its session can refresh and
+    # repaint the layer without searching the project for it.
+    provider = layer.dataProvider()
+    if hasattr(provider, 'attach_layer'):
+        provider.attach_layer(layer)
+
     if renderer is not None:
         layer.setRenderer(renderer)
 
@@ -9,8 +9,16 @@ import pandapower as pp
 # import pandapipes as ppi
 import os
 from . import pandapower_feature_iterator, pandapower_feature_source
-from .network_session import NetworkSession, KIND_POWER, KIND_PIPES, DEFAULT_EPSG, add_vn_kv_to_lines
+from .network_change import NetworkChange, ALL_ROWS, ADDED, REMOVED, snapshot_indices
+from .network_lazy import open_lazy
+from .network_loading import load_in_background, should_load_in_background
+from .network_preload import load_network
+from .network_watcher import watch_session
+from .network_session import NetworkSession, KIND_POWER, KIND_PIPES, DEFAULT_EPSG, \
+    prepare_table
 from .pandapower_uri import decode_uri, has_geometry, layer_name_for, LEVELLED_TABLES
+from .network_tasks import commit_session
+from .refresh_scheduler import schedule_refresh
 from .provider_utils import MessageManager
 
 
@@ -82,7 +90,6 @@ class PandapowerProvider(QgsVectorDataProvider):
         # Initialize all attributes with default values (prevents AttributeError while reopen qgis project file)
         self._is_valid = False
         self.session = None
-        self.net = None
         self._commit_connected = False
         # 'network_type' is the table this layer exposes. The name is kept for
         # the many internal uses; only the URI key was renamed to 'table'.
@@ -114,32 +121,39 @@ class PandapowerProvider(QgsVectorDataProvider):
 
         # Join the session for this file, loading the network only if this is the
         # first layer to open it. Every other layer of the same file reuses the
-        # very same net object.
+        # very same net object. A large file is opened lazily, so only the
+        # tables this layer shows are decoded now, and in the task manager, so
+        # the layer appears at once and fills in when the network arrives.
+        def loader():
+            return self._load_network_from_file(file_path, kind)
+
+        def lazy_loader():
+            return open_lazy(file_path, kind, prepare_table)
+
         try:
             self.session = NetworkSession.acquire(
                 file_path,
-                lambda: self._load_network_from_file(file_path, kind),
+                loader,
                 epsg=epsg,
-                kind=kind
+                kind=kind,
+                lazy_loader=lazy_loader,
+                background=(load_in_background
+                            if should_load_in_background(file_path) else None),
+                # A layer may show a what-if scenario of the network instead.
+                scenario=parts['scenario']
             )
+            # The table must actually exist on the loaded network. Without this an
+            # unknown name would surface much later as an obscure AttributeError.
+            # A network still loading is checked once it arrives.
+            if not self.session.is_loading():
+                self._check_table()
         except Exception as e:
+            if self.session is not None:
+                self.session.release()
+                self.session = None
             MessageManager.show_error("Network Load Failed", str(e))
             return  # Safe early return - all attributes already initialized
 
-        self.net = self.session.net
-
-        # The table must actually exist on the loaded network. Without this an
-        # unknown name would surface much later as an obscure AttributeError.
-        table_df = getattr(self.net, self.network_type, None)
-        if table_df is None or not isinstance(table_df, pd.DataFrame):
-            MessageManager.show_error(
-                "Network Load Failed",
-                f"The network has no table named '{self.network_type}'."
-            )
-            self.session.release()
-            self.session = None
-            return  # Safe early return - all attributes already initialized
-
         self.current_crs = self.session.epsg
         self.crs = self.sourceCrs()
 
@@ -159,6 +173,8 @@ class PandapowerProvider(QgsVectorDataProvider):
 
         # Join the session so sibling layers can be notified of changes.
         self.session.add_provider(self)
+        # Follow changes other programs make to the file.
+        watch_session(self.session, loader, lazy_loader)
 
         # Write on commit rather than on every change (plan section 3.7). The
         # layer does not exist yet at provider construction time, so the
@@ -166,6 +182,94 @@ class PandapowerProvider(QgsVectorDataProvider):
         self._commit_connected = False
 
 
+    def _check_table(self):
+        """
+        Make sure the loaded network has the table this layer shows.
+        Raises:
+            ValueError: If the network has no such table
+        """
+        table_df = self.session.table(self.network_type)
+        if table_df is None or not isinstance(table_df, pd.DataFrame):
+            raise ValueError(f"The network has no table named '{self.network_type}'.")
+
+
+    def _loading(self):
+        """
+        Whether the network behind this layer is still being loaded.
+        Returns:
+            bool: True while the layer has to stay empty
+        """
+        return self.session is None or not self.session.has_network()
+
+
+    def on_network_loaded(self):
+        """
+        Fill the layer in once its network has been loaded in the background.
+        Called by the load task on the main thread. The layer was created with no
+        fields and no features, so its fields are re-read and its extent and
+        features are announced as changed.
+        """
+        try:
+            self._check_table()
+        except Exception as e:
+            self.on_network_failed(str(e))
+            return
+
+        self.fields_list = None
+        self.df = None
+        self._extent = None
+
+        layer = self._get_layer()
+        if layer is not None:
+            from .pandapower_layer_factory import configure_field_edit_permissions
+
+            layer.updateFields()
+            configure_field_edit_permissions(layer)
+            layer.updateExtents()
+        self.fullExtentCalculated.emit()
+        self.dataChanged.emit()
+        if layer is not None:
+            layer.triggerRepaint()
+
+
+    def on_network_failed(self, message):
+        """
+        Report a background load that failed. The layer stays empty.
+        Args:
+            message: What went wrong
+        """
+        MessageManager.show_error(
+            "Network Load Failed",
+            f"Layer '{self.type_layer_name}' could not be loaded: {message}"
+        )
+
+
+    @property
+    def net(self):
+        """
+        The complete shared network, or None if the provider has no session.
+        Reading it decodes every table of a lazily opened network, so code that
+        only needs this layer's tables uses _table() instead.
+        Returns:
+            The session's pandapower network
+        """
+        if self.session is None:
+            return None
+        return self.session.net
+
+
+    def _table(self, name, default=None):
+        """
+        Read one table of the shared network without loading the others.
+        Args:
+            name: Table name, e.g. 'bus' or 'res_line'
+            default: Returned when the network has no such table
+        Returns:
+            The table, or default
+        """
+        return self.session.table(name, default)
+
+
     @property
     def network_data(self):
         """
@@ -191,7 +295,8 @@ class PandapowerProvider(QgsVectorDataProvider):
     @staticmethod
     def _load_network_from_file(file_path, kind):
         """
-        Load a pandapower network from a JSON file.
+        Load a pandapower network from a JSON file, a columnar .ppnet store or
+        a GeoPackage/SQLite database.
         Called by NetworkSession only when the file is not already open, so this
         runs once per file rather than once per layer.
         Args:
@@ -202,20 +307,9 @@ class PandapowerProvider(QgsVectorDataProvider):
         Raises:
             ValueError: If the path is empty, missing, or the kind is unsupported
         """
-        if not file_path:
-            raise ValueError("File path is empty")
-        if not os.path.exists(file_path):
-            raise ValueError(f"File not found: {file_path}")
-
-        if kind == KIND_PIPES:
-            # pandapipes support is planned but not integrated yet (plan section 5.4).
-            raise ValueError("Pipe networks not yet implemented")
-
-        net = pp.from_json(file_path)
-        # Add vn_kv column to lines, so line layers can be filtered by the
-        # voltage level of their from_bus.
-        add_vn_kv_to_lines(net)
-        return net
+        # A large file is parsed in a worker process, so that several files
+        # loading at once (a project being opened) load side by side.
+        return load_network(file_path, kind)
 
 
     def merge_df(self):
@@ -229,8 +323,8 @@ class PandapowerProvider(QgsVectorDataProvider):
             # Get the dataframes for the network type and its result.
             # Not every table has a res_* twin (e.g. 'switch'), and a res_*
             # table is its own source with no second result table behind it.
-            df_network_type = getattr(self.net, self.network_type)
-            df_res_network_type = getattr(self.net, f'res_{self.network_type}', None)
+            df_network_type = self._table(self.network_type)
+            df_res_network_type = self._table(f'res_{self.network_type}')
 
             if hasattr(self, 'vn_kv') and self.vn_kv is not None:
                 if self.network_type == 'bus':
@@ -239,7 +333,7 @@ class PandapowerProvider(QgsVectorDataProvider):
 
                 elif self.network_type == 'line':
                     # Get only specific vn_kv buses
-                    bus_df = getattr(self.net, 'bus')
+                    bus_df = self._table('bus')
                     bus_indices = bus_df[bus_df['vn_kv'] == self.vn_kv].index
 
                     # Use from_bus only - check add_column_from_node_to_elements() of data_modification.py
@@ -322,6 +416,10 @@ class PandapowerProvider(QgsVectorDataProvider):
         Returns:
             QgsFields: Collection of field definitions with appropriate data types
         """
+        if self._loading():
+            # Known once the network has arrived; see on_network_loaded().
+            return QgsFields()
+
         # if not self.fields_list:
         if not hasattr(self, 'fields_list') or not self.fields_list:
             self.fields_list = QgsFields()
@@ -373,8 +471,12 @@ class PandapowerProvider(QgsVectorDataProvider):
             bool: True if the geometries were updated
         """
         try:
+            moved = []
+            # A table shared with scenarios is copied before it is changed.
+            self.session.own([self.network_type])
             # Update Geodata of Pandapower Network
             for feature_id, new_geometry in geometry_map.items():
+                moved.append(feature_id)
                 if self.network_type in ['bus', 'junction']:
                     # If bus or junction, update x, y geometry
                     x = new_geometry.asPoint().x()
@@ -432,7 +534,8 @@ class PandapowerProvider(QgsVectorDataProvider):
 
             # The network diverges from the file until the edit buffer is
             # committed; the write itself happens in _on_layer_committed.
-            self._mark_dirty()
+            self._mark_dirty(NetworkChange.rows_modified(
+                self.network_type, moved, columns=['geo'], geometry=True))
             self.dataChanged.emit()
             return True
 
@@ -444,14 +547,28 @@ class PandapowerProvider(QgsVectorDataProvider):
             return False
 
 
-    def on_session_changed(self):
+    def on_session_changed(self, change=None):
         """
         Handle a change made to the shared network by another layer of the same file.
         Since every provider of a file shares one net object, there is nothing to copy:
-        the cached dataframe is simply rebuilt from the network that already changed
+        the cached dataframe is updated from the network that already changed
         underneath us, and the layer is repainted.
+        The change says which tables and rows were touched. A change that does not
+        concern this layer is ignored, and a change to a few rows patches only those
+        rows instead of rebuilding the whole dataframe.
+        Args:
+            change: NetworkChange describing the edit, or None if anything may have changed
         """
+        if change is not None and not self._is_affected_by(change):
+            return
+
         try:
+            if change is not None and self._patch_rows(change):
+                if change.geometry or change.rows(ADDED, self.network_type) \
+                        or change.rows(REMOVED, self.network_type):
+                    self._extent = None  # Only recompute when something moved
+                return
+
             # Rebuild into a separate variable first, so a failure cannot leave
             # self.df in a half-updated state.
             new_df = self._create_updated_dataframe()
@@ -476,6 +593,65 @@ class PandapowerProvider(QgsVectorDataProvider):
             )
 
 
+    def _is_affected_by(self, change):
+        """
+        Decide whether a change to the shared network concerns this layer.
+        A layer shows its own table merged with its res_* table. A line layer
+        filtered by voltage level also depends on the level of the buses its lines
+        start at, so a change to bus voltages concerns it too.
+        Args:
+            change: NetworkChange describing the edit
+        Returns:
+            bool: True if the layer must refresh
+        """
+        if change.everything:
+            return True
+        if change.touches(self.network_type) or change.touches(f'res_{self.network_type}'):
+            return True
+        if self.network_type == 'line' and self.vn_kv is not None:
+            return change.touches_column('bus', 'vn_kv')
+        return False
+
+
+    def _patch_rows(self, change):
+        """
+        Update only the rows of the cached dataframe that a change touched.
+        Falls back to a full rebuild (by returning False) when the change covers
+        whole tables, when the patched rows would not line up with the cached
+        columns, or when so many rows changed that a rebuild is cheaper anyway.
+        Args:
+            change: NetworkChange describing the edit
+        Returns:
+            bool: True if the dataframe was patched, False if it must be rebuilt
+        """
+        if self.df is None or self.df.empty:
+            return False
+        if self.network_type == 'line' and self.vn_kv is not None \
+                and change.touches_column('bus', 'vn_kv'):
+            return False  # Lines may have moved between voltage-level layers
+
+        affected = change.affected_rows(self.network_type)
+        res_affected = change.affected_rows(f'res_{self.network_type}')
+        if affected is ALL_ROWS or res_affected is ALL_ROWS:
+            return False
+        affected = affected | res_affected
+        if not affected:
+            return True  # Nothing of ours changed; keep the cached rows
+        if len(affected) > max(100, len(self.df) // 4):
+            return False
+
+        table = self._table(self.network_type)
+        present = [idx for idx in affected if idx in table.index]
+        new_rows = self._create_updated_dataframe(ids=present)
+        if new_rows is None or list(new_rows.columns) != list(self.df.columns):
+            return False
+
+        kept = self.df.drop(list(affected), errors='ignore')
+        parts = [part for part in (kept, new_rows) if not part.empty]
+        self.df = pd.concat(parts).sort_index() if parts else new_rows
+        return True
+
+
     def on_update_changed_network(self, network_data=None):
         """
         Backwards-compatible alias for on_session_changed().
@@ -485,39 +661,51 @@ class PandapowerProvider(QgsVectorDataProvider):
         Args:
             network_data: Ignored, accepted only for signature compatibility
         """
-        self.on_session_changed()
+        self.on_session_changed(NetworkChange.all())
 
 
-    def _create_updated_dataframe(self):
+    def _create_updated_dataframe(self, ids=None):
         """
         Safely create new dataframe from updated network data without modifying existing state.
         Replicates merge_df() logic but returns new dataframe instead of modifying self.df.
-        Used for on_update_changed_network()
+        Used for on_session_changed()
+        Args:
+            ids: Row ids to build, or None for the whole table. Rows outside this
+                layer's voltage level are left out either way.
         Returns:
             pandas.DataFrame or None: New dataframe with updated data, None if creation failed
         """
         try:
             # Execute existing merge_df logic in new variable
-            df_network_type = getattr(self.net, self.network_type)
-            df_res_network_type = getattr(self.net, f'res_{self.network_type}')
+            df_network_type = self._table(self.network_type)
+            df_res_network_type = self._table(f'res_{self.network_type}')
+
+            if ids is not None:
+                df_network_type = df_network_type.loc[
+                    df_network_type.index.intersection(list(ids))]
+
+            # vn_kv filtering, as in merge_df()
+            if hasattr(self, 'vn_kv') and self.vn_kv is not None:
+                if self.network_type == 'bus':
+                    df_network_type = df_network_type[df_network_type['vn_kv'] == self.vn_kv]
+                elif self.network_type == 'line':
+                    bus_df = self._table('bus')
+                    bus_indices = bus_df[bus_df['vn_kv'] == self.vn_kv].index
+                    df_network_type = df_network_type[
+                        df_network_type['from_bus'].isin(bus_indices)]
 
             # Check calculation results
             has_result_data = (df_res_network_type is not None and
                                not df_res_network_type.empty and len(df_res_network_type) > 0)
 
             if has_result_data:
-                # vn_kv filtering (existing logic)
-                if hasattr(self, 'vn_kv') and self.vn_kv is not None:
-                    if self.network_type == 'bus':
-                        filtered_indices = df_network_type[df_network_type['vn_kv'] == self.vn_kv].index
-                        df_network_type = df_network_type.loc[filtered_indices]
-                        # Only filter res for indices that exist
-                        available_res_indices = df_res_network_type.index.intersection(filtered_indices)
-                        df_res_network_type = df_res_network_type.loc[available_res_indices]
+                # Only keep res rows for indices that exist
+                available_res_indices = df_res_network_type.index.intersection(df_network_type.index)
+                df_res_network_type = df_res_network_type.loc[available_res_indices]
 
                 # Sort and merge
-                df_network_type.sort_index(inplace=True)
-                df_res_network_type.sort_index(inplace=True)
+                df_network_type = df_network_type.sort_index()
+                df_res_network_type = df_res_network_type.sort_index()
                 new_df = pd.merge(df_network_type, df_res_network_type,
                                   left_index=True, right_index=True, how='left', suffixes=('', '_res'))
             else:
@@ -552,10 +740,13 @@ class PandapowerProvider(QgsVectorDataProvider):
             bool: True if any attribute was updated
         """
         try:
-            # Track which features were modified
+            # Track which features and columns were modified
             modified_features = set()
+            modified_columns = set()
             # Track validation errors
             validation_errors = []
+            # A table shared with scenarios is copied before it is changed.
+            self.session.own([self.network_type])
 
             # Update attributes
             for feature_id, changes in attr_map.items():
@@ -584,6 +775,7 @@ class PandapowerProvider(QgsVectorDataProvider):
 
                     # Track modified feature
                     modified_features.add(feature_id)
+                    modified_columns.add(field_name)
 
             # Show validation errors to user
             if validation_errors:
@@ -598,7 +790,8 @@ class PandapowerProvider(QgsVectorDataProvider):
 
             # The network diverges from the file until the edit buffer is
             # committed; the write itself happens in _on_layer_committed.
-            self._mark_dirty()
+            self._mark_dirty(NetworkChange.rows_modified(
+                self.network_type, modified_features, columns=modified_columns))
             self.dataChanged.emit()
             return True
 
@@ -715,7 +908,7 @@ class PandapowerProvider(QgsVectorDataProvider):
             return False
 
         # Only fields in the original network DataFrame can be modified
-        df_network_type = getattr(self.net, self.network_type)
+        df_network_type = self._table(self.network_type)
         if field_name in df_network_type.columns:
             return True
 
@@ -779,7 +972,9 @@ class PandapowerProvider(QgsVectorDataProvider):
                     "Validation Error", f"Cannot add features due to validation errors:\n{error_msg}")
                 return (False, [])
 
-            # Add features to pandapower network
+            # Add features to pandapower network. pandapower appends rows in
+            # place, so tables shared with scenarios are copied first.
+            self.session.own([self.network_type, f'res_{self.network_type}'])
             added_indices = []
             added_features = []
 
@@ -835,9 +1030,9 @@ class PandapowerProvider(QgsVectorDataProvider):
 
             # The network diverges from the file until the edit buffer is
             # committed; the write itself happens in _on_layer_committed.
-            self._mark_dirty()
-            if self.session:
-                self.session.notify_changed(source=self)
+            change = NetworkChange.rows_added(self.network_type, added_indices)
+            self._mark_dirty(change)
+            schedule_refresh(self.session, change, source=self)
             self.dataChanged.emit()
             return (True, features)
 
@@ -889,25 +1084,53 @@ class PandapowerProvider(QgsVectorDataProvider):
     def _get_layer(self):
         """
         Get the QgsVectorLayer associated with this provider.
+        The layer id is registered with the session the first time the layer is
+        found, so later lookups (and the session's refresh scheduler) need no
+        search by name.
         Returns None if layer is not yet created.
         """
         try:
-            layers = QgsProject.instance().mapLayersByName(self.type_layer_name)
-            if layers:
-                return layers[0]
+            project = QgsProject.instance()
+            if self.session:
+                layer_id = self.session.layer_id(self)
+                layer = project.mapLayer(layer_id) if layer_id else None
+                if layer is not None:
+                    return layer
+
+            for layer in project.mapLayersByName(self.type_layer_name):
+                if layer.dataProvider() is self:
+                    self.attach_layer(layer)
+                    return layer
             return None
         except Exception as e:
             return None
 
 
-    def _mark_dirty(self):
+    def attach_layer(self, layer):
+        """
+        Register the layer this provider backs with the session.
+        Called by the layer factory right after the layer is created; layers
+        restored from a project file are registered lazily by _get_layer().
+        Args:
+            layer: The QgsVectorLayer using this provider
+        """
+        if self.session and layer is not None:
+            self.session.register_layer(self, layer.id())
+
+
+    def _mark_dirty(self, change=None):
         """
         Record that the in-memory network no longer matches the file on disk.
         Also makes sure the commit signal is connected, so the change actually
         reaches disk when the user saves the layer edits.
+        Args:
+            change: NetworkChange describing the edit, handed to the sibling
+                layers when the edits are committed
         """
         if self.session:
-            self.session.mark_dirty()
+            change = change if change is not None else NetworkChange.all()
+            self.session.mark_dirty(change)
+            self.session.record_change(change)
         self._connect_commit_signal()
 
 
@@ -934,36 +1157,25 @@ class PandapowerProvider(QgsVectorDataProvider):
     def _on_layer_committed(self):
         """
         Write the network to disk after the user commits the layer edit buffer.
-        This is the single point at which edits reach the file. If several
-        layers of one network commit in the same action, only the first write
-        does any work: it clears the session's dirty flag, so the rest see a
-        clean session and skip.
+        This is the single point at which edits reach the file. The write runs
+        as a background task on a snapshot of the network (see network_tasks),
+        so QGIS stays responsive while large files are saved. If several layers
+        of one network commit in the same action, the first starts the write and
+        the rest are queued behind it; a queued write only runs if edits arrived
+        after the snapshot.
         """
         session = self.session
-        if session is None or not session.dirty:
-            return  # Nothing to write, or another layer already wrote it
+        if session is None:
+            return
 
-        # Never silently overwrite a file that changed underneath us (plan 5.3).
-        if session.file_changed_externally():
-            if not self._confirm_overwrite_external_change():
-                return
+        # A committed edit can move features between voltage-level layers,
+        # so refresh siblings once per commit rather than once per feature,
+        # and only for the tables and rows the edits touched. Several layers
+        # committing in one action are coalesced by the scheduler. The layers
+        # show the in-memory network, so they need not wait for the write.
+        schedule_refresh(session, session.take_pending_change(), source=self)
 
-        success, message, backup_path = session.write()
-
-        if success:
-            MessageManager.show_success("Network Saved", message)
-            if backup_path:
-                MessageManager.show_info(
-                    "Backup Created", f"Backup file: {backup_path}")
-            # A committed edit can move features between voltage-level layers,
-            # so refresh siblings once per commit rather than once per feature.
-            session.notify_changed(source=self)
-        else:
-            MessageManager.show_error(
-                "Save Failed",
-                f"{message}\n\nThe changes are still in memory. "
-                f"Fix the problem and save the layer again."
-            )
+        commit_session(session, self._confirm_overwrite_external_change)
 
 
     def _confirm_overwrite_external_change(self):
@@ -1020,7 +1232,7 @@ class PandapowerProvider(QgsVectorDataProvider):
             root = config.invisibleRootContainer()
             root.clear()  # Clear existing fields
             # Get result DataFrame
-            df_res = getattr(self.net, f'res_{self.network_type}', None)
+            df_res = self._table(f'res_{self.network_type}')
 
             # Configure each field
             for field_name in field_names:
@@ -1593,14 +1805,18 @@ class PandapowerProvider(QgsVectorDataProvider):
             if not self._show_delete_confirmation_dialog(valid_buses, connected_info):
                 return False
 
-            # Use pandapower's drop_buses function (handles connected elements automatically)
-            pp.drop_buses(self.net, valid_buses, drop_elements=True)
+            # Use pandapower's drop_buses function (handles connected elements automatically).
+            # It cascades into other tables, so what it removed is read off the indices.
+            before = snapshot_indices(self.net)
+            with self.session.detached():
+                pp.drop_buses(self.net, valid_buses, drop_elements=True)
+            change = NetworkChange.from_index_diff(before, self.net)
 
             # Update self.df - Remove deleted buses from self.df
             self.df.drop(valid_buses, inplace=True, errors='ignore')
 
             # Save to JSON file and perform post-processing
-            return self._save_deletions(valid_buses, 'bus')
+            return self._save_deletions(valid_buses, 'bus', change)
 
         except Exception as e:
             return False
@@ -1635,47 +1851,22 @@ class PandapowerProvider(QgsVectorDataProvider):
 
             # Use pandapower's drop_lines function
             # This also removes geodata and connected switches automatically
-            pp.drop_lines(self.net, valid_lines)
+            before = snapshot_indices(self.net)
+            with self.session.detached():
+                pp.drop_lines(self.net, valid_lines)
+            change = NetworkChange.from_index_diff(before, self.net)
 
             # Update self.df
             self.df.drop(valid_lines, inplace=True, errors='ignore')
 
             # Save to JSON file and perform post-processing
-            return self._save_deletions(valid_lines, 'line')
+            return self._save_deletions(valid_lines, 'line', change)
 
         except Exception as e:
             return False
 
 
-    def _notify_affected_layers(self):
-        """
-        Notify sibling layers of the same network file that the data changed.
-        This handles cascade deletions where multiple network_types are affected
-        (e.g., bus deletion causes line deletion).
-        The session knows every provider of this file directly, so there is no need
-        to scan the whole project. Note that all network_types are notified, not just
-        those of the same voltage level: a bus deletion cascades into lines, which may
-        sit in a different layer.
-        """
-        if not self.session:
-            return
-        try:
-            for provider in self.session.providers():
-                if provider is self:
-                    continue    # Skip self (notified separately in _save_deletions())
-                provider.dataChanged.emit()
-
-            # Repaint the affected layers in the project.
-            for layer in QgsProject.instance().mapLayers().values():
-                provider = layer.dataProvider()
-                if getattr(provider, 'session', None) is self.session and provider is not self:
-                    layer.triggerRepaint()
-
-        except Exception as e:
-            print(f"Failed to notify affected layers: {str(e)}")
-
-
-    def _save_deletions(self, deleted_ids, element_type):
+    def _save_deletions(self, deleted_ids, element_type, change=None):
         """
         Record deletions and refresh the affected layers.
         Nothing is written to disk here: the file is written once when the user
@@ -1683,21 +1874,21 @@ class PandapowerProvider(QgsVectorDataProvider):
         Args:
             deleted_ids: List of deleted element indices
             element_type: Type of element ('bus' or 'line')
+            change: NetworkChange listing every row the deletion removed,
+                including cascaded ones
         Returns:
             bool: True when the deletion was recorded
         """
         try:
-            self._mark_dirty()
+            if change is None:
+                change = NetworkChange.rows_removed(element_type, deleted_ids)
+            self._mark_dirty(change)
 
-            if self.session:
-                self.session.notify_changed(source=self)
-
-            # Notify self first, then the sibling layers: deleting a bus
-            # cascades into the lines attached to it, which live in another
-            # layer.
+            # Notify self now and the sibling layers once the refresh window
+            # closes: deleting a bus cascades into the lines attached to it,
+            # which live in another layer.
             self.dataChanged.emit()
-            if element_type == 'bus':
-                self._notify_affected_layers()
+            schedule_refresh(self.session, change, source=self)
 
             return True
 
@@ -1779,7 +1970,7 @@ class PandapowerProvider(QgsVectorDataProvider):
                 detail_text += f"💡 Total: {total_elements} elements will be deleted ({len(bus_ids)} bus(es) + {connected_info['total_count']} connected)\n\n"
 
             # Warning about undo
-            detail_text += "⚠️ This action cannot be undone!\n      (A backup file will be created automatically)\n"
+            detail_text += "⚠️ This action cannot be undone!\n      (A backup is made on save; restore it from the Browser)\n"
 
             msg.setInformativeText(detail_text)
 
@@ -1820,6 +2011,10 @@ class PandapowerProvider(QgsVectorDataProvider):
         Returns:
             QgsVectorDataProvider.Capabilities
         """
+        if self._loading():
+            # Nothing can be edited before the network is there.
+            return QgsVectorDataProvider.NoCapabilities
+
         caps = (
             QgsVectorDataProvider.SelectAtId |
             QgsVectorDataProvider.ChangeAttributeValues
@@ -1890,8 +2085,9 @@ class PandapowerProvider(QgsVectorDataProvider):
         Returns:
             QgsRectangle: Bounding rectangle containing all features, empty if no valid coordinates
         """
-        # An attribute-only table has no spatial extent at all.
-        if not self.has_geometry():
+        # An attribute-only table has no spatial extent at all, and a layer
+        # still loading has none yet.
+        if not self.has_geometry() or self._loading():
             return QgsRectangle()
 
         if not self._extent:
@@ -1901,7 +2097,7 @@ class PandapowerProvider(QgsVectorDataProvider):
                 min_y = float('inf')
                 max_y = float('-inf')
 
-                df_geodata = getattr(self.net, self.network_type).geo
+                df_geodata = self._table(self.network_type).geo
                 if df_geodata is None or df_geodata.empty:
                     return QgsRectangle()
 
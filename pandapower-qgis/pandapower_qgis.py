@@ -75,6 +75,10 @@ warnings.simplefilter(action='ignore', category=FutureWarning)
 # are kept in the tree so the feature can be revived once the binding allows it.
 ENABLE_BROWSER_TREE = False
 
+# How long closing a project waits for a background save to finish before
+# reporting the network as unsaved.
+WRITE_WAIT_ON_CLOSE_S = 60
+
 class ppqgis:
     """QGIS Plugin Implementation."""
 
@@ -121,6 +125,10 @@ class ppqgis:
         self.data_item_provider = None
         self.data_item_gui_provider = None
         self.source_select_provider = None
+        # Sessions of the project being read, held until its layers exist.
+        self.preloaded_sessions = []
+        # Takes recovery snapshots of unsaved edits; see start_autosave().
+        self.autosave_timer = None
 
     def installer_func(self):
         plugin_dir = os.path.dirname(os.path.realpath(__file__))
@@ -265,13 +273,315 @@ class ppqgis:
             callback=self.runpp_action,
             parent=self.iface.mainWindow())
 
+        self.add_action(
+            icon_path='',
+            text=self.tr(u'Switch layers to scenario...'),
+            callback=self.switch_scenario_action,
+            add_to_toolbar=False,
+            status_tip=self.tr(u'Show the layers of a network as one of its '
+                               u'what-if scenarios, or fork a new one'),
+            parent=self.iface.mainWindow())
+
+        self.add_settings_actions()
         self.register_browser_providers()
         self.connect_unsaved_changes_prompt()
+        self.connect_project_preload()
+        self.start_autosave()
+
+        # Once QGIS is up, offer the edits a crashed session left behind.
+        from qgis.PyQt.QtCore import QTimer
+
+        QTimer.singleShot(0, self.offer_recovery)
 
         # will be set False in run()
         self.first_start_export = True
         self.first_start_runpp = True
 
+    def add_settings_actions(self):
+        """Apply the stored settings and add their toggles to the plugin menu."""
+        from . import plugin_settings
+
+        plugin_settings.apply_settings()
+
+        cache_action = self.add_action(
+            icon_path='',
+            text=self.tr(u'Cache parsed networks'),
+            callback=self.toggle_network_cache,
+            add_to_toolbar=False,
+            status_tip=self.tr(u'Keep a binary copy of each opened network so '
+                               u'it reopens without parsing the JSON'),
+            parent=self.iface.mainWindow())
+        cache_action.setCheckable(True)
+        cache_action.setChecked(plugin_settings.network_cache_enabled())
+
+        compact_action = self.add_action(
+            icon_path='',
+            text=self.tr(u'Compact networks in memory'),
+            callback=self.toggle_compaction,
+            add_to_toolbar=False,
+            status_tip=self.tr(u'Share repeated strings and store ids in 32 '
+                               u'bits in networks opened from now on; the '
+                               u'files stay unchanged'),
+            parent=self.iface.mainWindow())
+        compact_action.setCheckable(True)
+        compact_action.setChecked(plugin_settings.compact_networks_enabled())
+
+        journal_action = self.add_action(
+            icon_path='',
+            text=self.tr(u'Journal commits'),
+            callback=self.toggle_journal,
+            add_to_toolbar=False,
+            status_tip=self.tr(u'Save committed edits to a small journal next '
+                               u'to the network and rewrite the file only '
+                               u'when the journal grows large'),
+            parent=self.iface.mainWindow())
+        journal_action.setCheckable(True)
+        journal_action.setChecked(plugin_settings.journal_commits_enabled())
+
+        worker_action = self.add_action(
+            icon_path='',
+            text=self.tr(u'Calculate in a separate process'),
+            callback=self.toggle_worker_process,
+            add_to_toolbar=False,
+            status_tip=self.tr(u'Run power flows in a background Python '
+                               u'process that keeps a copy of each network, '
+                               u'so the map stays smooth while they run'),
+            parent=self.iface.mainWindow())
+        worker_action.setCheckable(True)
+        worker_action.setChecked(plugin_settings.worker_process_enabled())
+
+        self.add_action(
+            icon_path='',
+            text=self.tr(u'Memory for closed networks...'),
+            callback=self.set_session_pool_budget,
+            add_to_toolbar=False,
+            status_tip=self.tr(u'Keep networks in memory after their last '
+                               u'layer is closed, so they reopen instantly'),
+            parent=self.iface.mainWindow())
+
+        self.add_action(
+            icon_path='',
+            text=self.tr(u'Backup retention...'),
+            callback=self.set_backup_retention,
+            add_to_toolbar=False,
+            status_tip=self.tr(u'Choose how many backups of each network are '
+                               u'kept when it is saved'),
+            parent=self.iface.mainWindow())
+
+        self.add_action(
+            icon_path='',
+            text=self.tr(u'Autosave interval...'),
+            callback=self.set_autosave_interval,
+            add_to_toolbar=False,
+            status_tip=self.tr(u'Choose how often unsaved edits are kept in a '
+                               u'recovery snapshot, in case QGIS crashes'),
+            parent=self.iface.mainWindow())
+
+    def toggle_network_cache(self, checked):
+        """Turn the network cache on or off; turning it off deletes it.
+
+        :param checked: New state of the menu toggle.
+        :type checked: bool
+        """
+        from . import network_cache, plugin_settings
+
+        if not checked:
+            network_cache.clear()
+        plugin_settings.set_network_cache_enabled(checked)
+
+    def toggle_compaction(self, checked):
+        """Turn compaction of networks opened from now on on or off.
+
+        :param checked: New state of the menu toggle.
+        :type checked: bool
+        """
+        from . import plugin_settings
+
+        plugin_settings.set_compact_networks_enabled(checked)
+
+    def toggle_journal(self, checked):
+        """Turn journaling of commits on or off.
+
+        :param checked: New state of the menu toggle.
+        :type checked: bool
+        """
+        from . import plugin_settings
+
+        plugin_settings.set_journal_commits_enabled(checked)
+
+    def toggle_worker_process(self, checked):
+        """Turn the worker process for power flows on or off.
+
+        :param checked: New state of the menu toggle.
+        :type checked: bool
+        """
+        from . import plugin_settings
+
+        plugin_settings.set_worker_process_enabled(checked)
+
+    def set_session_pool_budget(self):
+        """Ask for the memory budget of networks without open layers."""
+        from qgis.PyQt.QtWidgets import QInputDialog
+        from . import plugin_settings
+
+        megabytes, accepted = QInputDialog.getInt(
+            self.iface.mainWindow(),
+            self.tr('Memory for closed networks'),
+            self.tr('Networks whose last layer was closed stay in memory up to '
+                    'this budget, least recently used first out.\n'
+                    'Networks with unsaved changes always stay. '
+                    '0 turns this off.\n\nBudget (MB):'),
+            plugin_settings.session_pool_megabytes(), 0, 1024 * 1024, 64)
+        if accepted:
+            plugin_settings.set_session_pool_megabytes(megabytes)
+
+    def set_backup_retention(self):
+        """Ask which backups of each network to keep."""
+        from qgis.PyQt.QtWidgets import QDialog, QDialogButtonBox, \
+            QFormLayout, QLabel, QSpinBox
+        from . import plugin_settings
+
+        dialog = QDialog(self.iface.mainWindow())
+        dialog.setWindowTitle(self.tr('Backup retention'))
+        layout = QFormLayout(dialog)
+        intro = QLabel(self.tr(
+            'Saving a network backs up the previous version in a folder next '
+            'to it, storing only the tables that changed. Older backups are '
+            'thinned out to:'))
+        intro.setWordWrap(True)
+        layout.addRow(intro)
+
+        spin_boxes = []
+        labels = (self.tr('Newest backups'),
+                  self.tr('One per hour, for hours'),
+                  self.tr('One per day, for days'))
+        minimums = (1, 0, 0)
+        for label, minimum, value in zip(
+                labels, minimums, plugin_settings.backup_retention()):
+            spin_box = QSpinBox(dialog)
+            spin_box.setRange(minimum, 10000)
+            spin_box.setValue(value)
+            layout.addRow(label, spin_box)
+            spin_boxes.append(spin_box)
+
+        buttons = QDialogButtonBox(
+            QDialogButtonBox.Ok | QDialogButtonBox.Cancel, dialog)
+        buttons.accepted.connect(dialog.accept)
+        buttons.rejected.connect(dialog.reject)
+        layout.addRow(buttons)
+
+        if dialog.exec_() == QDialog.Accepted:
+            plugin_settings.set_backup_retention(
+                *(spin_box.value() for spin_box in spin_boxes))
+
+    def set_autosave_interval(self):
+        """Ask how often unsaved edits are snapshotted for recovery."""
+        from qgis.PyQt.QtWidgets import QInputDialog
+        from . import plugin_settings
+
+        minutes, accepted = QInputDialog.getInt(
+            self.iface.mainWindow(),
+            self.tr('Autosave interval'),
+            self.tr('Networks with unsaved changes are copied to a recovery '
+                    'area in your QGIS profile this often; the network files '
+                    'stay untouched. After a crash, QGIS offers to restore '
+                    'them. 0 turns this off.\n\nInterval (minutes):'),
+            plugin_settings.autosave_minutes(), 0, 24 * 60, 1)
+        if accepted:
+            plugin_settings.set_autosave_minutes(minutes)
+            self.start_autosave()
+
+    def start_autosave(self):
+        """Start, restart or stop the autosave timer as the settings say."""
+        from qgis.PyQt.QtCore import QTimer
+        from . import plugin_settings
+
+        if self.autosave_timer is None:
+            self.autosave_timer = QTimer()
+            self.autosave_timer.timeout.connect(self.autosave_networks)
+        minutes = plugin_settings.autosave_minutes()
+        if minutes:
+            self.autosave_timer.start(minutes * 60 * 1000)
+        else:
+            self.autosave_timer.stop()
+
+    def autosave_networks(self):
+        """Snapshot the networks with unsaved edits in the background."""
+        from .network_autosave import autosave_all
+
+        autosave_all()
+
+    def offer_recovery(self):
+        """Offer to restore the unsaved edits an earlier session left behind."""
+        from qgis.PyQt.QtWidgets import QMessageBox
+        from .network_autosave import discard_recovery, list_recoveries
+
+        recoveries = list_recoveries()
+        if not recoveries:
+            return
+
+        box = QMessageBox(
+            QMessageBox.Question,
+            self.tr('Recover pandapower changes'),
+            self.tr('QGIS closed without saving changes to these '
+                    'networks:\n\n{}\n\nRestore them? The networks open '
+                    'with the changes unsaved, to be committed as usual.'
+                    ).format('\n'.join(recovery.label()
+                                       for recovery in recoveries)),
+            parent=self.iface.mainWindow())
+        restore_button = box.addButton(self.tr('Restore'),
+                                       QMessageBox.AcceptRole)
+        discard_button = box.addButton(self.tr('Discard'),
+                                       QMessageBox.DestructiveRole)
+        box.addButton(self.tr('Later'), QMessageBox.RejectRole)
+        box.exec_()
+
+        if box.clickedButton() is discard_button:
+            for recovery in recoveries:
+                discard_recovery(recovery)
+        elif box.clickedButton() is restore_button:
+            self.restore_recoveries(recoveries)
+
+    def restore_recoveries(self, recoveries):
+        """Open networks with the edits of their recovery snapshots.
+
+        The sessions stay in memory with unsaved edits; layers opened on
+        their files show the edits, and a commit writes them.
+
+        Args:
+            recoveries: ``network_autosave.Recovery`` objects.
+        """
+        from qgis.PyQt.QtCore import Qt
+        from qgis.PyQt.QtWidgets import QApplication
+        from .network_autosave import restore
+        from .network_preload import load_network
+
+        restored, failed = [], []
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            for recovery in recoveries:
+                try:
+                    session = restore(recovery, load_network)
+                except Exception as error:
+                    failed.append('{}: {}'.format(recovery.label(), error))
+                    continue
+                # Unsaved edits keep the network in memory without layers.
+                session.release()
+                restored.append(recovery.label())
+        finally:
+            QApplication.restoreOverrideCursor()
+
+        if restored:
+            self.iface.messageBar().pushMessage(
+                "Changes restored",
+                'Open the layers of {} to continue; commit to save the '
+                'changes.'.format('; '.join(restored)),
+                level=Qgis.Info, duration=15)
+        if failed:
+            self.iface.messageBar().pushMessage(
+                "Changes not restored", '; '.join(failed),
+                level=Qgis.Warning, duration=0)
+
     def connect_unsaved_changes_prompt(self):
         """Warn about networks with uncommitted changes before the project closes.
 
@@ -285,25 +595,104 @@ class ppqgis:
         except Exception as error:
             print('Could not connect project-cleared signal: {}'.format(error))
 
+    def connect_project_preload(self):
+        """Load the networks of a project side by side while it is read.
+
+        QGIS announces ``layerLoaded(0, n)`` before it builds the first layer
+        and ``readProject`` after the last, so the networks load while the
+        layers are being built rather than one layer at a time.
+        """
+        from qgis.core import QgsProject
+
+        project = QgsProject.instance()
+        try:
+            project.layerLoaded.connect(self.preload_project_networks)
+            project.readProject.connect(self.release_preloaded_networks)
+        except Exception as error:
+            print('Could not connect project-read signals: {}'.format(error))
+
+    def preload_project_networks(self, index, count):
+        """Start loading every network of the project being read.
+
+        Args:
+            index: Number of layers built so far; only 0 starts a preload.
+            count: Number of layers in the project.
+        """
+        if index != 0 or not count:
+            return
+        from qgis.core import QgsProject, QgsProviderRegistry
+        from .network_loading import preload_networks, release_preloaded
+        from .network_preload import PROVIDER_KEY, project_layer_sources, \
+            project_networks
+        from .pandapower_uri import decode_uri
+
+        # A project that failed to read never said it was done.
+        release_preloaded(self.preloaded_sessions)
+        metadata = QgsProviderRegistry.instance().providerMetadata(PROVIDER_KEY)
+        project_path = QgsProject.instance().fileName()
+        if metadata is None or not project_path:
+            return
+        try:
+            sources = project_layer_sources(project_path)
+        except Exception as error:  # Not readable; the layers load as usual
+            print('Could not preload networks of {}: {}'.format(
+                project_path, error))
+            return
+        self.preloaded_sessions = preload_networks(project_networks(
+            sources, lambda uri: decode_uri(metadata.decodeUri(uri)),
+            project_path))
+
+    def release_preloaded_networks(self, *args):
+        """Drop the references the preload held, once the layers exist."""
+        from .network_loading import release_preloaded
+
+        release_preloaded(self.preloaded_sessions)
+
     def warn_about_unsaved_networks(self):
         """Tell the user which networks still hold unwritten changes."""
         from .network_session import NetworkSession
+        from .network_tasks import wait_for_write
+
+        # A commit made just before closing may still be writing in the
+        # background; let it finish rather than report it as unsaved.
+        for session in NetworkSession.all_sessions():
+            wait_for_write(session, timeout=WRITE_WAIT_ON_CLOSE_S)
 
+        # Edits already in a journal are replayed when the network is opened
+        # again, so they are not lost.
         dirty = [session for session in NetworkSession.all_sessions()
-                 if session.dirty]
+                 if session.edits_at_risk()]
         if not dirty:
             return
 
         from qgis.PyQt.QtWidgets import QMessageBox
 
+        from .network_autosave import autosave, enabled
+
+        # A last recovery snapshot, so the changes can still be restored.
+        recoverable = enabled()
+        for session in dirty:
+            autosave(session)
+
         paths = '\n'.join(session.path for session in dirty)
+        message = self.tr('These networks have changes that were never '
+                          'saved:\n\n{}\n\nThe changes were not written to '
+                          'disk.').format(paths)
+        if recoverable:
+            message += ' ' + self.tr('QGIS offers to restore them the next '
+                                     'time the plugin starts.')
         QMessageBox.warning(
             self.iface.mainWindow() if self.iface else None,
             self.tr('Unsaved pandapower changes'),
-            self.tr('These networks have changes that were never saved:\n\n'
-                    '{}\n\nThe changes were not written to disk.').format(paths),
+            message,
         )
 
+        # The warm pool never evicts unsaved edits by itself. The user has now
+        # been told they are gone, so networks without layers are let go.
+        for session in dirty:
+            if not session.in_use():
+                session.drop()
+
     def register_browser_providers(self):
         """Register the Data Source Manager page, and optionally the Browser.
 
@@ -387,6 +776,23 @@ class ppqgis:
                 self.warn_about_unsaved_networks)
         except (TypeError, RuntimeError):
             pass  # Never connected, or already torn down
+        try:
+            QgsProject.instance().layerLoaded.disconnect(
+                self.preload_project_networks)
+            QgsProject.instance().readProject.disconnect(
+                self.release_preloaded_networks)
+        except (TypeError, RuntimeError):
+            pass
+        self.release_preloaded_networks()
+        if self.autosave_timer is not None:
+            self.autosave_timer.stop()
+            self.autosave_timer = None
+
+        from .network_preload import shutdown_pool
+        from . import network_worker
+
+        shutdown_pool()
+        network_worker.stop()
 
     def exprt(self):
         """Run method that performs all the real work"""
@@ -500,7 +906,7 @@ class ppqgis:
                 continue
             provider = layer.dataProvider()
             session = getattr(provider, 'session', None)
-            if session is not None and session.net is not None:
+            if session is not None and session.has_network():
                 return session
 
         return None
@@ -526,6 +932,15 @@ class ppqgis:
             return ('Open a network first: '
                     'Layer > Data Source Manager > pandapower.')
 
+        loading = [
+            layer for layer in pandapower_layers
+            if getattr(getattr(layer.dataProvider(), 'session', None),
+                       'is_loading', lambda: False)()
+        ]
+        if loading:
+            return ('{} is still loading. Try again once it appears on the '
+                    'map.'.format(loading[0].name()))
+
         # Layers exist but none carries a live network. This means their
         # providers failed to load the file, e.g. it was moved or deleted after
         # the project was saved.
@@ -562,3 +977,71 @@ class ppqgis:
         # Run dialog
         self.dlg_runpp.show()
         result = self.dlg_runpp.exec_()
+
+    def switch_scenario_action(self):
+        """Switch every layer of the active layer's network to a scenario.
+
+        Offers the network itself and its scenarios. A new name forks a
+        scenario off what the active layer shows now; it shares every table
+        with that network until one is edited (see ``network_scenario``).
+        Layers being edited are left as they are.
+        """
+        from qgis.PyQt.QtWidgets import QInputDialog
+        from .network_scenario import list_scenarios
+        from .pandapower_layer_factory import switch_scenario
+
+        active = self.iface.activeLayer()
+        session = getattr(active.dataProvider(), 'session', None) \
+            if active is not None else None
+        if session is None:
+            self.iface.messageBar().pushMessage(
+                "No pandapower layer",
+                "Select a layer of the network to switch.",
+                level=Qgis.Warning, duration=8)
+            return
+
+        root = session.parent or session
+        network_label = self.tr('(the network itself)')
+        scenarios = list_scenarios(root.path)
+        choices = [network_label] + scenarios
+        current = choices.index(session.scenario) \
+            if session.scenario in choices else 0
+        name, accepted = QInputDialog.getItem(
+            self.iface.mainWindow(),
+            self.tr('Switch layers to scenario'),
+            self.tr('Show the layers of {} as (type a new name to fork a '
+                    'scenario):').format(os.path.basename(root.path)),
+            choices, current, True)
+        if not accepted:
+            return
+        name = name.strip()
+        scenario = None if name in ('', network_label) else name
+
+        if scenario is not None and scenario not in scenarios:
+            try:
+                session.fork(scenario)
+            except ValueError as error:
+                self.iface.messageBar().pushMessage(
+                    "Scenario not created", str(error),
+                    level=Qgis.Warning, duration=8)
+                return
+
+        switched, skipped = 0, []
+        for layer in list(QgsProject.instance().mapLayers().values()):
+            other = getattr(layer.dataProvider(), 'session', None) \
+                if hasattr(layer, 'dataProvider') else None
+            if other is None or (other.parent or other) is not root \
+                    or other.scenario == scenario:
+                continue
+            if layer.isEditable():
+                skipped.append(layer.name())
+            elif switch_scenario(layer, scenario):
+                switched += 1
+
+        message = '{} layer(s) now show {}.'.format(
+            switched, 'scenario ' + scenario if scenario else 'the network')
+        if skipped:
+            message += ' Still being edited: {}.'.format(', '.join(skipped))
+        self.iface.messageBar().pushMessage(
+            "Scenario", message,
+            level=Qgis.Warning if skipped else Qgis.Info, duration=8)
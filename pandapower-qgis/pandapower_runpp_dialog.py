@@ -229,7 +229,7 @@ class ppRunDialog(QDialog):
         self.session = session
 
         try:
-            if session is None or session.net is None:
+            if session is None or not session.has_network():
                 self.show_error("No pandapower network is open.")
                 return
 
@@ -329,6 +329,12 @@ class ppRunDialog(QDialog):
 
 
     def start_calculation(self):
+        """Start the calculation in the task manager and close the dialog.
+
+        The calculation runs on a snapshot of the network, so QGIS stays
+        usable meanwhile; it can be followed and cancelled in the task
+        manager, and its outcome is reported in the message bar.
+        """
         try:
             if self.session is None:
                 self.show_error("Select a network first!")
@@ -336,32 +342,19 @@ class ppRunDialog(QDialog):
 
             parameters = self.get_parameters()
             self.enter_calculation_mode()
-
             self.add_progress_message("⚡ Starting calculation...")
-            QtCore.QCoreApplication.processEvents()
-
-            import time
-            time.sleep(0.5)
-
-            self.add_progress_message("⚡ Executing power grid calculation...")
-            QtCore.QCoreApplication.processEvents()
 
             from .ppqgis_runpp import run_session
-            success, error_message = run_session(None, self.session, parameters)
-
-            if success:
-                self.add_progress_message("✅ Calculation completed!")
-                if parameters.get('update_renderer', False):
-                    self.add_progress_message("🎨 Displaying results on the map...")
-                    self.add_progress_message("🎨 Map color update completed!")
-                time.sleep(2)
+            started, error_message = run_session(None, self.session, parameters)
+
+            if started:
+                self.add_progress_message(
+                    "⚡ Running in the background; see the task manager.")
                 self.calculation_success()
             else:
-                self.add_progress_message("❌ Calculation failed!")
+                self.add_progress_message("❌ Calculation not started!")
                 if error_message:
                     self.add_progress_message(f"Error details: {error_message}")
-                self.add_progress_message("Please check the parameters and try again.")
-                self.show_error("Calculation failed: Please check the progress.")
                 self.calculation_failed()
 
         except Exception as e:
@@ -429,13 +422,13 @@ class ppRunDialog(QDialog):
 
 
     def calculation_success(self):
-        """Finalization process when calculation succeeds"""
+        """Finalization process once the calculation has started"""
         try:
             # Reset all UI to original state
             self.reset_ui()
 
-            # Automatically close dialog after 3 seconds
-            QtCore.QTimer.singleShot(3000, self.accept)
+            # Close the dialog, so the map can be used while it runs
+            self.accept()
 
         except Exception as e:
             print(f"⚠️ Success handling error: {str(e)}")
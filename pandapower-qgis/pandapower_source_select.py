@@ -18,8 +18,11 @@ from qgis.PyQt.QtWidgets import (QAbstractItemView, QCheckBox, QComboBox,
                                  QPushButton, QTableWidget, QTableWidgetItem,
                                  QVBoxLayout)
 
-from .network_session import KIND_POWER, NetworkSession
-from .pandapower_data_items import list_tables, sniff_network_kind, table_levels
+from .network_compression import network_stem
+from .network_session import DEFAULT_EPSG, KIND_POWER, NetworkSession
+from .network_store import store_root
+from .pandapower_data_items import describe_network, list_tables, \
+    sniff_network_kind, table_levels
 from .pandapower_layer_factory import PROVIDER_KEY
 from .pandapower_uri import geometry_type_for, has_geometry, layer_name_for
 
@@ -70,23 +73,22 @@ def remember_network(path):
     QSettings().setValue(RECENT_KEY, recent[:MAX_RECENT])
 
 
-def describe_tables(net):
+def describe_tables(index):
     """Describe a network's contents for display in the listing.
 
     Each geometry table is expanded into one row per voltage level, so the
     listing mirrors what the Browser tree shows.
 
     Args:
-        net: A loaded pandapower network.
+        index: NetworkIndex of the network.
     Returns:
         list: Dicts with 'table', 'level', 'geometry' and 'features' keys.
     """
-    inputs, results = list_tables(net)
+    inputs, results = list_tables(index)
     rows = []
 
     for table in inputs:
-        levels = table_levels(net, table)
-        df = getattr(net, table, None)
+        levels = table_levels(index, table)
         geometry = geometry_type_for(table)
 
         if len(levels) > 1:
@@ -95,52 +97,28 @@ def describe_tables(net):
                     'table': table,
                     'level': level,
                     'geometry': geometry,
-                    'features': _count_at_level(net, table, level),
+                    # A line belongs to the level of its from_bus.
+                    'features': index.row_count(table, level),
                 })
         else:
             rows.append({
                 'table': table,
                 'level': levels[0] if levels else None,
                 'geometry': geometry,
-                'features': 0 if df is None else len(df),
+                'features': index.row_count(table),
             })
 
     for table in results:
-        df = getattr(net, table, None)
         rows.append({
             'table': table,
             'level': None,
             'geometry': geometry_type_for(table),
-            'features': 0 if df is None else len(df),
+            'features': index.row_count(table),
         })
 
     return rows
 
 
-def _count_at_level(net, table, level):
-    """Count the rows of a table belonging to one voltage level.
-
-    Args:
-        net: A loaded pandapower network.
-        table: Table name, 'bus' or 'line'.
-        level: The voltage level.
-    Returns:
-        int: Number of rows, 0 when it cannot be determined.
-    """
-    try:
-        df = getattr(net, table)
-        if table in ('bus', 'junction'):
-            column = 'vn_kv' if table == 'bus' else 'pn_bar'
-            return int((df[column] == level).sum())
-
-        # A line belongs to the level of its from_bus.
-        bus = net.bus
-        indices = bus[bus['vn_kv'] == level].index
-        return int(df['from_bus'].isin(indices).sum())
-    except Exception:
-        return 0
-
-
 class PandapowerSourceSelectWidget(QgsAbstractDataSourceWidget):
     """Lets the user pick a network file and add tables from it as layers."""
 
@@ -246,7 +224,9 @@ class PandapowerSourceSelectWidget(QgsAbstractDataSourceWidget):
         start = os.path.dirname(self.path) if self.path else ''
         path, _ = QFileDialog.getOpenFileName(
             self, 'Open pandapower network', start,
-            'pandapower networks (*.json);;All files (*.*)')
+            'pandapower networks (*.json *.json.gz *.json.zst *.ppnet '
+            'manifest.json *.gpkg *.sqlite);;'
+            'All files (*.*)')
         if path:
             self.file_combo.setEditText(path)
             self.load_network(path)
@@ -269,6 +249,8 @@ class PandapowerSourceSelectWidget(QgsAbstractDataSourceWidget):
         Returns:
             bool: True when the network was listed.
         """
+        # A directory store is picked through its manifest.json.
+        path = store_root(path) if path else path
         if not path or not os.path.exists(path):
             self._set_status('File not found: {}'.format(path), error=True)
             self._clear_listing()
@@ -282,26 +264,17 @@ class PandapowerSourceSelectWidget(QgsAbstractDataSourceWidget):
             self._clear_listing()
             return False
 
-        session = None
         try:
-            from .pandapower_provider import PandapowerProvider
-
-            session = NetworkSession.acquire(
-                path,
-                lambda: PandapowerProvider._load_network_from_file(path, kind),
-                kind=kind)
-            self.rows = describe_tables(session.net)
-            self.epsg = session.epsg
+            # The listing comes from the network's index; the network itself
+            # is only loaded by the layers the user adds.
+            self.rows = describe_tables(describe_network(path, kind))
         except Exception as error:
             self._set_status('Could not read network: {}'.format(error),
                              error=True)
             self._clear_listing()
             return False
-        finally:
-            # The listing only needed the network to enumerate tables. Any
-            # layer the user adds re-acquires the session for itself.
-            if session is not None:
-                session.release()
+        session = NetworkSession.get(path)
+        self.epsg = session.epsg if session is not None else DEFAULT_EPSG
 
         self.path = path
         remember_network(path)
@@ -440,7 +413,7 @@ class PandapowerSourceSelectWidget(QgsAbstractDataSourceWidget):
         from .pandapower_layer_factory import create_layer
 
         project = QgsProject.instance()
-        group_name = os.path.basename(self.path).rsplit('.', 1)[0]
+        group_name = network_stem(self.path)
 
         root = project.layerTreeRoot()
         group = root.findGroup(group_name) or root.addGroup(group_name)
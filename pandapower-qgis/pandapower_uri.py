@@ -7,6 +7,11 @@ narrowed to a single voltage (or pressure) level::
     path="C:/net/mv_oberrhein.json";table="bus";level="20.0";epsg="4326"
     path="C:/net/mv_oberrhein.json";table="trafo";epsg="4326"
 
+A ``scenario`` key points the layer at a what-if scenario of the network
+rather than at the network itself (see ``network_scenario``)::
+
+    path="C:/net/mv_oberrhein.json";table="bus";epsg="4326";scenario="feeder"
+
 The scheme changed in the data provider rework (plan section 3.5):
 
 ======================  ==========================================================
@@ -65,7 +70,7 @@ def has_geometry(table):
     return table in LEVELLED_TABLES
 
 
-def encode_uri(path, table, level=None, epsg=None):
+def encode_uri(path, table, level=None, epsg=None, scenario=None):
     """Build a layer URI.
 
     Args:
@@ -73,6 +78,7 @@ def encode_uri(path, table, level=None, epsg=None):
         table: pandapower table name, e.g. 'bus', 'line', 'trafo'.
         level: Voltage or pressure level to filter to, or None for the whole table.
         epsg: EPSG code of the geodata.
+        scenario: Name of a scenario of the network, or None for the network.
     Returns:
         str: Encoded URI.
     """
@@ -81,6 +87,8 @@ def encode_uri(path, table, level=None, epsg=None):
         parts.append(('level', str(level)))
     if epsg not in (None, ''):
         parts.append(('epsg', str(epsg)))
+    if scenario:
+        parts.append(('scenario', scenario))
 
     # Quotes inside a value would terminate it early, so they are escaped.
     return ';'.join(
@@ -98,8 +106,9 @@ def decode_uri(uri_parts):
     Args:
         uri_parts: Dictionary as returned by QgsProviderMetadata.decodeUri.
     Returns:
-        dict: With keys 'path', 'table', 'level' and 'epsg'. 'level' is None
-            when the URI addresses a whole table.
+        dict: With keys 'path', 'table', 'level', 'epsg' and 'scenario'.
+            'level' is None when the URI addresses a whole table, 'scenario'
+            when it addresses the network itself.
     """
     parts = dict(uri_parts or {})
 
@@ -121,6 +130,7 @@ def decode_uri(uri_parts):
         'table': table,
         'level': level,
         'epsg': parts.get('epsg') or None,
+        'scenario': parts.get('scenario') or None,
     }
 
 
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""User settings of the plugin, stored in QSettings.
+
+The session, cache and I/O modules are Qt-free and take their configuration as
+plain values. This module reads the values from the user's QGIS profile and
+hands them over, so the plugin calls :py:func:`apply_settings` once at start
+and again whenever a setting changes.
+"""
+
+import os
+
+from qgis.core import QgsApplication
+from qgis.PyQt.QtCore import QSettings
+
+# All keys live under one group, next to the recent-networks list kept by the
+# Data Source Manager page.
+SETTINGS_GROUP = 'pandapower-qgis'
+
+NETWORK_CACHE_KEY = SETTINGS_GROUP + '/networkCache'
+SESSION_POOL_KEY = SETTINGS_GROUP + '/sessionPoolMb'
+COMPACT_NETWORKS_KEY = SETTINGS_GROUP + '/compactNetworks'
+JOURNAL_COMMITS_KEY = SETTINGS_GROUP + '/journalCommits'
+BACKUP_KEEP_LAST_KEY = SETTINGS_GROUP + '/backupKeepLast'
+BACKUP_KEEP_HOURLY_KEY = SETTINGS_GROUP + '/backupKeepHourly'
+BACKUP_KEEP_DAILY_KEY = SETTINGS_GROUP + '/backupKeepDaily'
+AUTOSAVE_MINUTES_KEY = SETTINGS_GROUP + '/autosaveMinutes'
+WORKER_PROCESS_KEY = SETTINGS_GROUP + '/workerProcess'
+
+# Default memory for closed networks kept in the warm pool, in megabytes.
+DEFAULT_SESSION_POOL_MB = 512
+
+# Default interval between recovery snapshots of unsaved edits, in minutes.
+DEFAULT_AUTOSAVE_MINUTES = 5
+
+
+def _value(key, default, value_type):
+    """Read one setting.
+
+    Args:
+        key: QSettings key.
+        default: Value when the setting is absent.
+        value_type: Python type to convert the stored value to.
+    Returns:
+        The setting's value.
+    """
+    return QSettings().value(key, default, type=value_type)
+
+
+def plugin_data_directory():
+    """Directory in the user's QGIS profile for the plugin's own files.
+
+    Returns:
+        str: The directory path (not created here).
+    """
+    return os.path.join(QgsApplication.qgisSettingsDirPath(), SETTINGS_GROUP)
+
+
+def network_cache_enabled():
+    """Whether parsed networks are cached (off unless the user enables it).
+
+    Returns:
+        bool: The setting.
+    """
+    return _value(NETWORK_CACHE_KEY, False, bool)
+
+
+def set_network_cache_enabled(enabled):
+    """Turn the network cache on or off and apply the change.
+
+    Args:
+        enabled: New value.
+    """
+    QSettings().setValue(NETWORK_CACHE_KEY, bool(enabled))
+    apply_settings()
+
+
+def network_cache_directory():
+    """Directory holding the network cache entries.
+
+    Returns:
+        str: The directory path.
+    """
+    return os.path.join(plugin_data_directory(), 'cache')
+
+
+def session_pool_megabytes():
+    """Memory that networks without open layers may keep, in megabytes.
+
+    Returns:
+        int: The setting; 0 drops a network when its last layer closes.
+    """
+    return max(0, _value(SESSION_POOL_KEY, DEFAULT_SESSION_POOL_MB, int))
+
+
+def set_session_pool_megabytes(megabytes):
+    """Change the memory budget of the warm pool and apply it.
+
+    Args:
+        megabytes: New budget in megabytes.
+    """
+    QSettings().setValue(SESSION_POOL_KEY, max(0, int(megabytes)))
+    apply_settings()
+
+
+def compact_networks_enabled():
+    """Whether networks are compacted in memory after loading (off by default).
+
+    Returns:
+        bool: The setting.
+    """
+    return _value(COMPACT_NETWORKS_KEY, False, bool)
+
+
+def set_compact_networks_enabled(enabled):
+    """Turn compaction of loaded networks on or off and apply the change.
+
+    Args:
+        enabled: New value.
+    """
+    QSettings().setValue(COMPACT_NETWORKS_KEY, bool(enabled))
+    apply_settings()
+
+
+def journal_commits_enabled():
+    """Whether commits go to a journal next to the network (off by default).
+
+    Returns:
+        bool: The setting.
+    """
+    return _value(JOURNAL_COMMITS_KEY, False, bool)
+
+
+def set_journal_commits_enabled(enabled):
+    """Turn journaling of commits on or off and apply the change.
+
+    Args:
+        enabled: New value.
+    """
+    QSettings().setValue(JOURNAL_COMMITS_KEY, bool(enabled))
+    apply_settings()
+
+
+def backup_retention():
+    """Which backups of a network are kept when it is saved.
+
+    Returns:
+        tuple: ``(keep_last, keep_hourly, keep_daily)``, see
+            ``network_backup.configure``.
+    """
+    from .network_backup import DEFAULT_KEEP_DAILY, DEFAULT_KEEP_HOURLY, \
+        DEFAULT_KEEP_LAST
+
+    return (max(1, _value(BACKUP_KEEP_LAST_KEY, DEFAULT_KEEP_LAST, int)),
+            max(0, _value(BACKUP_KEEP_HOURLY_KEY, DEFAULT_KEEP_HOURLY, int)),
+            max(0, _value(BACKUP_KEEP_DAILY_KEY, DEFAULT_KEEP_DAILY, int)))
+
+
+def set_backup_retention(keep_last, keep_hourly, keep_daily):
+    """Change the backup retention policy and apply it.
+
+    Args:
+        keep_last: Number of newest backups always kept.
+        keep_hourly: Number of recent hours whose newest backup is kept.
+        keep_daily: Number of recent days whose newest backup is kept.
+    """
+    settings = QSettings()
+    settings.setValue(BACKUP_KEEP_LAST_KEY, max(1, int(keep_last)))
+    settings.setValue(BACKUP_KEEP_HOURLY_KEY, max(0, int(keep_hourly)))
+    settings.setValue(BACKUP_KEEP_DAILY_KEY, max(0, int(keep_daily)))
+    apply_settings()
+
+
+def autosave_minutes():
+    """Interval between recovery snapshots of unsaved edits, in minutes.
+
+    Returns:
+        int: The setting; 0 turns autosave off.
+    """
+    return max(0, _value(AUTOSAVE_MINUTES_KEY, DEFAULT_AUTOSAVE_MINUTES, int))
+
+
+def set_autosave_minutes(minutes):
+    """Change the autosave interval and apply it.
+
+    Args:
+        minutes: New interval in minutes, 0 to turn autosave off.
+    """
+    QSettings().setValue(AUTOSAVE_MINUTES_KEY, max(0, int(minutes)))
+    apply_settings()
+
+
+def worker_process_enabled():
+    """Whether power flows run in a separate process (off by default).
+
+    Returns:
+        bool: The setting.
+    """
+    return _value(WORKER_PROCESS_KEY, False, bool)
+
+
+def set_worker_process_enabled(enabled):
+    """Turn the worker process for power flows on or off and apply it.
+
+    Args:
+        enabled: New value.
+    """
+    QSettings().setValue(WORKER_PROCESS_KEY, bool(enabled))
+    apply_settings()
+
+
+def recovery_directory():
+    """Directory holding the recovery snapshots of unsaved edits.
+
+    Returns:
+        str: The directory path.
+    """
+    return os.path.join(plugin_data_directory(), 'recovery')
+
+
+def network_index_directory():
+    """Directory holding the stored network indexes.
+
+    Returns:
+        str: The directory path.
+    """
+    return os.path.join(plugin_data_directory(), 'index')
+
+
+def apply_settings():
+    """Hand the current settings to the Qt-free modules."""
+    from . import network_autosave, network_backup, network_cache, \
+        network_compaction, network_index, network_journal, network_session, \
+        network_worker
+
+    # Networks in an older format are cached either way: converting them
+    # costs as much as parsing them, on every open.
+    network_cache.configure(network_cache_directory(),
+                            converted_only=not network_cache_enabled())
+    # Indexes are a few kilobytes per network and always kept.
+    network_index.configure(network_index_directory())
+    network_session.configure_pool(session_pool_megabytes() * 1024 * 1024)
+    network_backup.configure(*backup_retention())
+    network_compaction.configure(compact_networks_enabled())
+    network_journal.configure(journal_commits_enabled())
+    network_autosave.configure(
+        recovery_directory() if autosave_minutes() else None)
+    network_worker.configure(worker_process_enabled())
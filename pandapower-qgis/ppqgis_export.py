@@ -24,7 +24,8 @@
 
 from qgis.PyQt.QtWidgets import QAction, QFileDialog, QListWidgetItem, QTreeWidgetItem, QPushButton, QDockWidget
 from qgis.core import QgsProject, QgsWkbTypes, QgsMessageLog, Qgis, NULL
-from .network_session import NetworkSession
+from .network_io import write_network
+from .network_session import KIND_POWER, NetworkSession
 
 from typing import List
 import copy
@@ -53,7 +54,7 @@ def get_original_network_from_container(selected_layers):
         # Check if this is a PandapowerProvider layer
         if provider.name() == "PandapowerProvider":
             session = getattr(provider, 'session', None)
-            if session is not None and session.net is not None:
+            if session is not None and session.has_network():
                 QgsMessageLog.logMessage(
                     f"Found original network from layer: {layer_name}",
                     level=Qgis.Info
@@ -96,9 +97,9 @@ def power_network(parent, selected_layers) -> None:
 
     import pandapower as pp
 
-    # Show file save dialog
-    filters = "pandapower networks (*.json)"
-    selected = "pandapower networks (*.json)"
+    # Show file save dialog. A .json.gz or .json.zst name saves compressed.
+    filters = "pandapower networks (*.json *.json.gz *.json.zst)"
+    selected = "pandapower networks (*.json *.json.gz *.json.zst)"
     file = QFileDialog.getSaveFileName(None, "Save Network", parent.dir, filters, selected)[0]
 
     if not file:
@@ -110,9 +111,9 @@ def power_network(parent, selected_layers) -> None:
         # QgsMessageLog.logMessage("Creating deep copy of network...", level=Qgis.Info)
         net = copy.deepcopy(original_net)
 
-        # Save the complete network to JSON
+        # Save the complete network to JSON, compressed if the name asks for it
         # QgsMessageLog.logMessage(f"Saving network to: {file}", level=Qgis.Info)
-        pp.to_json(net, file)
+        write_network(net, file, KIND_POWER)
 
         # Prepare export summary
         bus_count = len(net.bus) if hasattr(net, 'bus') else 0
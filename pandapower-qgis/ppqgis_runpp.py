@@ -1,71 +1,221 @@
 import ast
+import os
 import sys
 import traceback
 from typing import Dict, Any
 from time import sleep
 
-from qgis.core import QgsProject, QgsMessageLog, Qgis, QgsGraduatedSymbolRenderer, QgsSingleSymbolRenderer, QgsProviderRegistry
+from qgis.core import QgsApplication, QgsProject, QgsMessageLog, Qgis, QgsGraduatedSymbolRenderer, QgsSingleSymbolRenderer, QgsProviderRegistry, QgsTask
 from qgis.utils import iface
 from qgis.PyQt.QtCore import QThread, pyqtSignal
 from qgis.PyQt.QtWidgets import QMessageBox
 
 from .renderer_utils import create_power_renderer
+from .network_calculation import Calculation
+from .network_change import NetworkChange
 from .network_session import NetworkSession
+from .network_worker import RemoteCalculation
+from . import network_worker
+from .refresh_scheduler import schedule_refresh, layers_of
 
 
-def run_session(parent, session, parameters):
-    """
-    Run a power flow on an open network, from calculation to post-processing.
-    Args:
-        parent: Parent interface object
-        session (NetworkSession): The open network to calculate
-        parameters (dict): Calculation settings
-    Returns:
-        tuple: (success, message) - overall workflow status
+class NetworkCalculationTask(QgsTask):
+    """Runs a power flow on a snapshot of one session's network.
+
+    See ``network_calculation`` for the rules the calculation follows.
     """
-    try:
-        if session is None:
-            message = "No pandapower network is open."
-            show_error_message(parent, message)
-            return False, message
-
-        net = session.net
-        if net is None:
-            message = "Network object is not valid."
-            show_error_message(parent, message)
-            return False, message
-
-        # Execute calculation. pandapower mutates the network in place, so the
-        # results land directly on the object every layer of this file shares.
-        success, result_message, updated_net = execute_calculation(net, parameters)
-        if not success:
-            show_error_message(parent, f"Calculation failed: {result_message}")
-            return False, result_message
 
+    def __init__(self, session, parameters, on_finished=None):
+        """Initialise the task and take the snapshot. Use run_session().
+
+        Args:
+            session (NetworkSession): The open network to calculate.
+            parameters (dict): Calculation settings.
+            on_finished: Optional callable receiving ``(success, message)``
+                once the results are applied, on the main thread.
+        Raises:
+            ValueError: If the network is not loaded yet.
+        """
+        super().__init__('Calculating {}'.format(os.path.basename(session.path)),
+                         QgsTask.CanCancel)
+        self.session = session
+        self.parameters = parameters
+        self.on_finished = on_finished
+        # pandapipes has no worker; its calculations stay in this process.
+        if parameters.get('network_type', 'power') == 'power' \
+                and network_worker.enabled():
+            self.calculation = RemoteCalculation(session)
+        else:
+            self.calculation = Calculation(session)
+        self.outcome = (False, 'The calculation was cancelled.', None)
+
+    def run(self):
+        """Run the calculation. Runs on a worker thread.
+
+        Returns:
+            bool: True if the calculation succeeded.
+        """
+        self.setProgress(0)
+        try:
+            if isinstance(self.calculation, RemoteCalculation):
+                outcome = self._run_in_worker()
+            else:
+                outcome = self.calculation.run(
+                    lambda net: execute_calculation(net, self.parameters),
+                    is_canceled=self.isCanceled, progress=self.setProgress)
+        except InterruptedError:
+            return False
+        # Some error paths report no network.
+        success, message = outcome[0], outcome[1]
+        self.outcome = (success, message,
+                        outcome[2] if len(outcome) > 2 else None)
+        self.setProgress(100)
+        return success
+
+    def _run_in_worker(self):
+        """Run the calculation in the worker process. Runs on a worker thread.
+
+        Returns:
+            tuple: (success, message, None); the message is None on success,
+                since it describes the results once they are applied.
+        Raises:
+            InterruptedError: If the calculation was cancelled.
+        """
+        try:
+            function = power_function(self.parameters)
+            self.calculation.run(function, is_canceled=self.isCanceled,
+                                 progress=self.setProgress)
+        except InterruptedError:
+            raise
+        except Exception as e:
+            return False, f"pandapower calculation error: {e}", None
+        return True, None, None
+
+    def cancel(self):
+        """Stop the calculation at once, rather than at its next check."""
+        self.calculation.cancel()
+        super().cancel()
+
+    def finished(self, result):
+        """Apply the results in one step, on the main thread.
+
+        Args:
+            result: Return value of :py:meth:`run`.
+        """
+        session = self.session
+        session.calculation_task = None
+        success, message, updated_net = self.outcome
+
+        closed = NetworkSession.get(
+            session.path, scenario=session.scenario) is not session
+        if not result or closed:
+            self.calculation.release()
+            if result:
+                message = "The network was closed during the calculation."
+            elif not self.isCanceled():
+                show_error_message(None, f"Calculation failed: {message}")
+            self._report(False, message)
+            return
+
+        edited = self.calculation.edited()
+        # pandapipes returns no network; the snapshot holds its results then.
+        self.calculation.apply(
+            updated_net if updated_net is not None
+            and updated_net is not self.calculation.net else None)
         try:
-            # Keep the session pointing at the calculated network. This is
-            # normally the very same object, but an implementation that
-            # returns a new one is handled correctly too.
-            if updated_net is not None:
-                session.net = updated_net
-            session.mark_dirty()
             # Post-process calculation (update results and colors)
-            post_process_results(parent, session, parameters)
+            post_process_results(None, session, self.parameters)
         except Exception:
-            import traceback
             traceback.print_exc()
             # Treat as successful calculation even if post-processing fails
 
-        show_success_message(parent, "Calculation completed successfully!",
-                             result_message)
-        return True, ""
+        if message is None:
+            message = generate_power_result_message(
+                session.net, self.parameters.get('run_function', 'run'))
+        show_success_message(None, "Calculation completed successfully!",
+                             message)
+        if edited:
+            message = ("The network was edited while the calculation ran. "
+                       "The results describe it as it was when the "
+                       "calculation started; run it again for results of "
+                       "the current network.")
+            show_warning_message(None, "Results predate edits", message)
+        self._report(True, message)
+
+    def _report(self, success, message):
+        """Hand the outcome to the caller's callback, if any.
+
+        Args:
+            success (bool): Whether results were applied.
+            message (str): Outcome for the user.
+        """
+        if self.on_finished is not None:
+            try:
+                self.on_finished(success, message)
+            except Exception:
+                traceback.print_exc()
+
+
+def run_session(parent, session, parameters, on_finished=None):
+    """
+    Start a power flow on an open network in the QGIS task manager.
+    The calculation runs on a snapshot, so QGIS and its layers stay usable
+    meanwhile; the results are applied once it has finished. The task shows
+    in the task manager, where it can be cancelled.
+    Args:
+        parent: Parent interface object
+        session (NetworkSession): The open network to calculate
+        parameters (dict): Calculation settings
+        on_finished: Optional callable receiving ``(success, message)`` once
+            the calculation has finished and its results are applied
+    Returns:
+        tuple: (started, message) - whether the calculation was started
+    """
+    if session is None:
+        message = "No pandapower network is open."
+        show_error_message(parent, message)
+        return False, message
+    if session.calculation_task is not None:
+        message = "A calculation of this network is running already."
+        show_error_message(parent, message)
+        return False, message
+    if session.is_loading():
+        message = "The network is still loading."
+        show_error_message(parent, message)
+        return False, message
 
+    try:
+        task = NetworkCalculationTask(session, parameters,
+                                      on_finished=on_finished)
     except Exception as e:
-        message = f"Unexpected error occurred: {str(e)}"
-        import traceback
-        traceback.print_exc()
+        message = f"Network object is not valid: {e}"
         show_error_message(parent, message)
         return False, message
+    # The session keeps the Python wrapper alive until finished() has run.
+    session.calculation_task = task
+    QgsApplication.taskManager().addTask(task)
+    return True, ""
+
+
+def wait_for_calculation(session, timeout=None):
+    """
+    Block until a session's calculation has finished and been applied.
+    Processes events meanwhile, so the task's finished() runs. Used by tests.
+    Args:
+        session (NetworkSession): The calculated network
+        timeout: Seconds to wait at most, or None for no limit
+    Returns:
+        bool: True if no calculation is running any more
+    """
+    import time
+
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while session.calculation_task is not None:
+        if deadline is not None and time.monotonic() > deadline:
+            return False
+        QgsApplication.processEvents()
+        time.sleep(0.01)
+    return True
 
 
 def run_network(parent, uri, parameters):
@@ -97,16 +247,7 @@ def execute_calculation(net, parameters):
     try:
         # Get the user-selected execution function
         run_function_name = parameters.get('run_function', 'run')
-
-        # Process user-entered parameter string
-        kwargs_string = parameters.get('kwargs_string', '').strip()
-        kwargs_dict = {}
-        if kwargs_string:
-            kwargs_dict = parse_kwargs_string(kwargs_string)
-
-        # Add default parameters if needed
-        if 'init' in parameters and parameters['init'] != 'auto':
-            kwargs_dict['init'] = parameters['init']
+        kwargs_dict = calculation_kwargs(parameters)
 
         # Select the appropriate library based on the network type
         network_type = parameters.get('network_type', 'power')
@@ -123,6 +264,63 @@ def execute_calculation(net, parameters):
         return False, error_message
 
 
+def calculation_kwargs(parameters):
+    """
+    Collect the keyword arguments of a calculation from its settings.
+    Args:
+        parameters (dict): Raw calculation settings
+    Returns:
+        dict: Keyword arguments for the run function
+    """
+    # Process user-entered parameter string
+    kwargs_string = parameters.get('kwargs_string', '').strip()
+    kwargs_dict = {}
+    if kwargs_string:
+        kwargs_dict = parse_kwargs_string(kwargs_string)
+
+    # Add default parameters if needed
+    if 'init' in parameters and parameters['init'] != 'auto':
+        kwargs_dict['init'] = parameters['init']
+    return kwargs_dict
+
+
+def power_functions():
+    """
+    The pandapower functions a calculation can run, by name.
+    Returns:
+        dict: Function name -> pandapower function
+    """
+    import pandapower as pp
+
+    return {
+        'run': pp.runpp,
+        'runpp': pp.runpp,
+        'rundcpp': pp.rundcpp,
+        'runopp': pp.runopp,
+    }
+
+
+def power_function(parameters):
+    """
+    Build the pandapower call of a calculation for the worker process.
+    Args:
+        parameters (dict): Raw calculation settings
+    Returns:
+        functools.partial: The run function with its arguments, which the
+            worker process can unpickle
+    Raises:
+        ValueError: If the run function is not supported
+    """
+    import functools
+
+    function_name = parameters.get('run_function', 'run')
+    function_map = power_functions()
+    if function_name not in function_map:
+        raise ValueError(f"Unsupported function: {function_name}")
+    return functools.partial(function_map[function_name],
+                             **calculation_kwargs(parameters))
+
+
 def execute_power_calculation(net, function_name, kwargs_dict):
     """
     Execute pandapower calculation and validate results.
@@ -134,16 +332,10 @@ def execute_power_calculation(net, function_name, kwargs_dict):
         tuple: (success, message, network) - calculation outcome with safety checks
     """
     try:
-        import pandapower as pp
         import numpy as np
         import pandas as pd
 
-        function_map = {
-            'run': pp.runpp,
-            'runpp': pp.runpp,
-            'rundcpp': pp.rundcpp,
-            'runopp': pp.runopp,
-        }
+        function_map = power_functions()
 
         if function_name not in function_map:
             available_functions = list(function_map.keys())
@@ -273,32 +465,23 @@ def post_process_results(parent, session, parameters):
     try:
         # Every layer of this file shares the session's network object, so the
         # results are already visible to them. They only need to rebuild their
-        # cached dataframes and repaint.
-        session.notify_changed()
+        # cached dataframes and repaint, which the session's refresh scheduler
+        # does once per layer. Only the result tables changed, so layers of
+        # tables without results are left alone.
+        schedule_refresh(session, NetworkChange.results_changed(session.net))
 
-        # Find the layers backed by this session among the open QGIS layers
-        layers = QgsProject.instance().mapLayers()
-        target_layers = []
-        current_renderers = []
-
-        for layer_id, layer in layers.items():
-            if (hasattr(layer, 'dataProvider') and
-                    layer.dataProvider().name() == "PandapowerProvider"):
-                if getattr(layer.dataProvider(), 'session', None) is session:
-                    target_layers.append(layer)
-                    current_renderers.append(layer.renderer())
+        # The session knows its own layers; no need to scan the project.
+        target_layers = layers_of(session)
+        current_renderers = [layer.renderer() for layer in target_layers]
 
         if not target_layers:
             print("⚠️ No layers found for the calculated network.")
             return
 
-        # First assume same renderer
-        if isinstance(current_renderers[0], QgsGraduatedSymbolRenderer):
-            for i, layer in enumerate(target_layers):
-                layer.triggerRepaint()
-
-        # If it was single renderer originally, apply new graduated renderer
-        elif isinstance(current_renderers[0], QgsSingleSymbolRenderer):
+        # A graduated renderer already colours by result; the scheduled
+        # refresh repaints it. If it was single renderer originally, apply new
+        # graduated renderer
+        if isinstance(current_renderers[0], QgsSingleSymbolRenderer):
             for layer in target_layers:
                 # Build a fresh renderer per layer: a renderer instance must not
                 # be shared between layers, since each layer takes ownership.
@@ -308,7 +491,6 @@ def post_process_results(parent, session, parameters):
                     layer.setRenderer(bus_renderer)
                 elif network_type == 'line':
                     layer.setRenderer(line_renderer)
-                layer.triggerRepaint()
 
         # 3. Display results (if needed)
         if parameters.get('show_results', False):
@@ -406,6 +588,21 @@ def show_success_message(parent, title, message):
         print(f"⚠️ Error displaying the success message: {str(e)}")
 
 
+def show_warning_message(parent, title, message):
+    """Display a warning to the user."""
+    try:
+        if iface:
+            iface.messageBar().pushMessage(
+                title,
+                message,
+                level=Qgis.Warning,
+                duration=10
+            )
+        QgsMessageLog.logMessage(f"{title}: {message}", level=Qgis.Warning)
+    except Exception as e:
+        print(f"⚠️ Error displaying the warning: {str(e)}")
+
+
 def show_error_message(parent, message):
     """Display the error message to the user."""
     try:
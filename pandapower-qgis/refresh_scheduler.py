@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""Coalesced refresh of the layers of one network.
+
+Every edit, commit and power flow used to refresh the sibling layers of a file
+on the spot: each sibling rebuilt its dataframe and emitted ``dataChanged``,
+and then the whole project was scanned for layers to repaint. Rapid edits or
+several layers committing in one action produced a storm of rebuilds and
+repaints (the sibling-refresh risk in docs/dataprovider_v2_plan.md section 6).
+
+A :py:class:`RefreshScheduler` sits on each session. Refresh requests arriving
+within a short window are merged into one :py:class:`NetworkChange`, and when
+the window closes each affected layer is rebuilt once and repainted once. The
+layers are found through the session's own provider-to-layer map, so the
+project is never scanned.
+"""
+
+import weakref
+
+from qgis.core import QgsProject
+from qgis.PyQt.QtCore import QObject, QTimer
+
+from .network_change import NetworkChange
+
+# How long requests are collected before the refresh runs. Short enough to be
+# invisible to the user, long enough to swallow a burst of edits or the commits
+# of several layers saved in one action.
+REFRESH_WINDOW_MS = 50
+
+
+class RefreshScheduler(QObject):
+    """Collects refresh requests for one session and runs them once."""
+
+    def __init__(self, session, window_ms=REFRESH_WINDOW_MS):
+        """Initialise the scheduler. Use :py:func:`scheduler_for` instead.
+
+        Args:
+            session: The NetworkSession whose layers are refreshed.
+            window_ms: Milliseconds to wait for further requests.
+        """
+        super().__init__()
+        # Weak, so a scheduler with a pending timer cannot keep a released
+        # session (and its network) alive.
+        self._session = weakref.ref(session)
+        self._change = None
+        # Providers that caused every request in the window. They already
+        # updated themselves, so they are repainted but not rebuilt.
+        self._sources = None
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(window_ms)
+        self._timer.timeout.connect(self.flush)
+
+    def request(self, change=None, source=None):
+        """Ask for the session's layers to be refreshed soon.
+
+        Args:
+            change: NetworkChange describing what changed, or None for
+                anything.
+            source: Provider that made the change and has already updated its
+                own dataframe, or None.
+        """
+        if change is None:
+            change = NetworkChange.all()
+        if self._change is None:
+            self._change = NetworkChange()
+        self._change.merge(change)
+
+        sources = {source} if source is not None else set()
+        self._sources = sources if self._sources is None \
+            else self._sources & sources
+
+        # Restarting the timer extends the window while requests keep coming.
+        self._timer.start()
+
+    def pending(self):
+        """Whether a refresh is waiting to run.
+
+        Returns:
+            bool: True if requests are collected but not yet flushed.
+        """
+        return self._change is not None
+
+    def flush(self):
+        """Run the collected refresh now: one rebuild and one repaint per layer."""
+        self._timer.stop()
+        change, sources = self._change, self._sources or set()
+        self._change, self._sources = None, None
+
+        session = self._session()
+        if session is None or change is None or change.is_empty():
+            return
+        if not session.in_use():
+            return  # Released into the warm pool; no layer left to refresh
+
+        for provider in session.providers():
+            if not provider._is_affected_by(change):
+                continue
+            try:
+                if provider not in sources:
+                    provider.on_session_changed(change)
+                provider.dataChanged.emit()
+            except Exception as error:  # pragma: no cover - defensive
+                print('Failed to refresh layer: {}'.format(error))
+                continue
+
+            layer = layer_of(session, provider)
+            if layer is not None:
+                layer.triggerRepaint()
+
+
+def scheduler_for(session):
+    """Return the refresh scheduler of a session, creating it on first use.
+
+    Args:
+        session: A NetworkSession.
+    Returns:
+        RefreshScheduler: The session's scheduler.
+    """
+    if session.refresh_scheduler is None:
+        session.refresh_scheduler = RefreshScheduler(session)
+    return session.refresh_scheduler
+
+
+def schedule_refresh(session, change=None, source=None):
+    """Queue a refresh of the layers of a session.
+
+    Args:
+        session: A NetworkSession, or None (then nothing happens).
+        change: NetworkChange describing what changed, or None for anything.
+        source: Provider that made the change, or None.
+    """
+    if session is None:
+        return
+    scheduler_for(session).request(change, source)
+
+
+def layer_of(session, provider):
+    """Look up the layer a provider of a session belongs to.
+
+    Uses the layer id the provider registered with its session, so it is a
+    dictionary lookup rather than a scan of the project. A provider whose layer
+    was restored from a project file registers on this first lookup.
+
+    Args:
+        session: A NetworkSession.
+        provider: One of the session's providers.
+    Returns:
+        QgsVectorLayer or None: The layer, or None if unknown or removed.
+    """
+    layer_id = session.layer_id(provider)
+    if not layer_id:
+        return provider._get_layer()
+    return QgsProject.instance().mapLayer(layer_id)
+
+
+def layers_of(session):
+    """Return every live layer backed by a session.
+
+    Args:
+        session: A NetworkSession.
+    Returns:
+        list: QgsVectorLayer instances, in no particular order.
+    """
+    layers = []
+    for provider in session.providers():
+        layer = layer_of(session, provider)
+        if layer is not None:
+            layers.append(layer)
+    return layers
@@ -0,0 +1,156 @@
+# coding=utf-8
+"""Benchmark: network_decode against pandapower.from_json.
+
+Decodes the example networks bundled with pandapower three ways - with
+``pandapower.from_json``, with ``network_decode.decode_network`` on one
+thread, and with its large tables in worker processes - checks that all three
+give the same network, and prints the best time of each.
+
+Run from the repository root::
+
+    python -m test.benchmark_network_decode [repeats]
+
+Worker processes import the plugin by its package name, which the plugin
+directory ('pandapower-qgis') is not. The benchmark therefore links it into a
+temporary directory under an importable name; where that is not possible the
+worker column is left out.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+"""
+
+import importlib
+import os
+import sys
+import tempfile
+import time
+
+PLUGIN_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), os.pardir, 'pandapower-qgis'))
+PACKAGE = 'pandapower_qgis_plugin'
+
+# pandapower.networks functions and the arguments they are built with.
+NETWORKS = (
+    ('example_simple', {}),
+    ('example_multivoltage', {}),
+    ('create_cigre_network_mv', {'with_der': 'all'}),
+    ('mv_oberrhein', {}),
+    ('case1354pegase', {}),
+    ('case9241pegase', {}),
+)
+
+
+def import_plugin():
+    """Import the plugin under an importable name that workers can import too.
+
+    Returns:
+        tuple: ``(network_decode, network_preload, workers)``, where
+            ``workers`` says whether worker processes can import the plugin.
+    """
+    workers = True
+    if PACKAGE not in sys.modules:
+        directory = tempfile.mkdtemp()
+        try:
+            os.symlink(PLUGIN_DIR, os.path.join(directory, PACKAGE))
+        except (OSError, NotImplementedError):
+            workers = False
+            from .test_network_session import load_session_module
+
+            load_session_module()
+        else:
+            sys.path.insert(0, directory)
+            # Spawned workers start with the parent's sys.path.
+    return (importlib.import_module(PACKAGE + '.network_decode'),
+            importlib.import_module(PACKAGE + '.network_preload'), workers)
+
+
+def best_of(repeats, function):
+    """Run a function repeatedly and return its fastest time and result.
+
+    Args:
+        repeats: Number of runs.
+        function: Zero-argument callable.
+    Returns:
+        tuple: ``(seconds, result)``.
+    """
+    best, result = None, None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def same_network(first, second):
+    """Whether two networks hold the same entries, dtypes and order included.
+
+    Args:
+        first: A pandapower network.
+        second: Another one.
+    Returns:
+        bool: True if they are the same.
+    """
+    import pandas as pd
+
+    if list(first.keys()) != list(second.keys()):
+        return False
+    for name in first.keys():
+        a, b = first[name], second[name]
+        if isinstance(a, (pd.DataFrame, pd.Series)):
+            if type(a) is not type(b) or not a.equals(b) \
+                    or not a.index.equals(b.index) \
+                    or a.index.dtype != b.index.dtype \
+                    or (isinstance(a, pd.DataFrame)
+                        and not a.dtypes.equals(b.dtypes)):
+                return False
+        elif type(a) is not type(b) or (a != b and a == a):
+            return False
+    return True
+
+
+def main(repeats=3):
+    """Run the benchmark and print a table.
+
+    Args:
+        repeats: Runs per network and method; the fastest counts.
+    """
+    import pandapower as pp
+    import pandapower.networks as ppn
+
+    network_decode, network_preload, workers = import_plugin()
+    pool = network_preload.worker_pool() if workers else None
+    directory = tempfile.mkdtemp()
+
+    print('outer parser: {}, worker processes: {}'.format(
+        network_decode.json_backend(),
+        network_preload.PROCESS_WORKERS if pool is not None else 'none'))
+    print('{:<26}{:>9}{:>12}{:>12}{:>12}'.format(
+        'network', 'MB', 'from_json', 'decode', 'workers'))
+    try:
+        for name, arguments in NETWORKS:
+            path = os.path.join(directory, name + '.json')
+            pp.to_json(getattr(ppn, name)(**arguments), path)
+
+            reference, expected = best_of(repeats, lambda: pp.from_json(path))
+            single, net = best_of(
+                repeats, lambda: network_decode.decode_network(path))
+            columns = [reference, single]
+            same = same_network(expected, net)
+            if pool is not None:
+                parallel, net = best_of(
+                    repeats,
+                    lambda: network_decode.decode_network(path, pool))
+                columns.append(parallel)
+                same = same and same_network(expected, net)
+            print('{:<26}{:>9.1f}'.format(name, os.path.getsize(path) / 1e6)
+                  + ''.join('{:>11.3f}s'.format(value) for value in columns)
+                  + ('' if same else '  DIFFERENT'))
+    finally:
+        network_preload.shutdown_pool()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
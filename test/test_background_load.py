@@ -0,0 +1,106 @@
+# coding=utf-8
+"""Tests for loading networks in the task manager.
+
+A layer over a large network must appear at once, empty, and fill in when the
+background load finishes, with every layer of the file sharing one load.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+"""
+
+import os
+import tempfile
+import unittest
+
+from qgis.core import QgsProject, QgsProviderRegistry
+
+from .test_commit_writes import load_plugin_module
+from .utilities import get_qgis_app
+
+QGIS_APP = get_qgis_app()
+
+
+@unittest.skipIf(os.environ.get('SKIP_PANDAPOWER_TESTS'),
+                 'pandapower tests disabled')
+class BackgroundLoadTest(unittest.TestCase):
+    """Test placeholder layers and the single load behind them."""
+
+    @classmethod
+    def setUpClass(cls):
+        metadata_module = load_plugin_module('ppprovider_metadata')
+        registry = QgsProviderRegistry.instance()
+        if 'PandapowerProvider' not in registry.providerList():
+            registry.registerProvider(
+                metadata_module.PandapowerProviderMetadata())
+
+        cls.factory = load_plugin_module('pandapower_layer_factory')
+        cls.session_module = load_plugin_module('network_session')
+        cls.loading = load_plugin_module('network_loading')
+
+    def setUp(self):
+        import pandapower as pp
+        import pandapower.networks as ppn
+
+        self.session_module.NetworkSession.clear()
+        QgsProject.instance().removeAllMapLayers()
+        # Every file counts as large, so the test network loads in a task.
+        self.saved_threshold = self.loading.BACKGROUND_MIN_BYTES
+        self.loading.BACKGROUND_MIN_BYTES = 0
+
+        self.net = ppn.mv_oberrhein()
+        self.path = os.path.join(tempfile.mkdtemp(), 'net.json')
+        pp.to_json(self.net, self.path)
+
+    def tearDown(self):
+        self.loading.BACKGROUND_MIN_BYTES = self.saved_threshold
+        QgsProject.instance().removeAllMapLayers()
+        self.session_module.NetworkSession.clear()
+
+    def _layer(self, table, level=None):
+        layer = self.factory.create_layer(self.path, table, level=level,
+                                          epsg=4326)
+        QgsProject.instance().addMapLayer(layer)
+        return layer
+
+    def test_layer_is_empty_until_the_network_arrives(self):
+        """The layer is valid at once and shows its features after the load."""
+        layer = self._layer('bus', level=20.0)
+        session = layer.dataProvider().session
+
+        self.assertTrue(layer.isValid())
+        if session.is_loading():
+            self.assertEqual(layer.featureCount(), 0)
+        self.assertTrue(self.loading.wait_for_load(session, timeout=60))
+
+        expected = int((self.net.bus.vn_kv == 20.0).sum())
+        self.assertEqual(len(list(layer.getFeatures())), expected)
+        self.assertIn('vn_kv', layer.fields().names())
+        self.assertFalse(layer.extent().isEmpty())
+
+    def test_layers_of_one_file_share_one_load(self):
+        """A second layer opened while loading joins the same load."""
+        bus = self._layer('bus', level=20.0)
+        line = self._layer('line', level=20.0)
+        session = bus.dataProvider().session
+
+        self.assertIs(line.dataProvider().session, session)
+        self.assertTrue(self.loading.wait_for_load(session, timeout=60))
+        self.assertGreater(len(list(line.getFeatures())), 0)
+
+    def test_failed_load_drops_the_session(self):
+        """A file that cannot be read leaves an empty layer and no session."""
+        with open(self.path, 'w') as handle:
+            handle.write('this is not JSON')
+
+        layer = self._layer('bus')
+        session = layer.dataProvider().session
+        self.assertTrue(self.loading.wait_for_load(session, timeout=60))
+
+        self.assertEqual(len(list(layer.getFeatures())), 0)
+        self.assertIsNone(self.session_module.NetworkSession.get(self.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
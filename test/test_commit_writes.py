@@ -4,6 +4,8 @@
 Edits mutate the shared network and only reach disk when the user commits the
 layer's edit buffer (docs/dataprovider_v2_plan.md section 3.7). This replaced a
 per-change async save whose overlapping writes were a standing source of bugs.
+The commit itself writes in a background task on a snapshot, one at a time, so
+the tests wait for that task before looking at the file.
 
 .. note:: This program is free software; you can redistribute it and/or modify
      it under the terms of the GNU General Public License as published by
@@ -99,6 +101,8 @@ class CommitWriteTest(unittest.TestCase):
 
         cls.factory = load_plugin_module('pandapower_layer_factory')
         cls.session_module = load_plugin_module('network_session')
+        cls.tasks = load_plugin_module('network_tasks')
+        cls.backup = load_plugin_module('network_backup')
 
     def setUp(self):
         import pandapower as pp
@@ -122,6 +126,13 @@ class CommitWriteTest(unittest.TestCase):
         QgsProject.instance().addMapLayer(layer)
         return layer
 
+    def _commit(self, layer):
+        """Commit a layer's edits and wait for the background write."""
+        committed = layer.commitChanges()
+        self.assertTrue(self.tasks.wait_for_write(
+            layer.dataProvider().session, timeout=60))
+        return committed
+
     def _first_bus_xy(self, path=None):
         """Read the first bus coordinate straight from the file on disk."""
         import pandapower as pp
@@ -130,9 +141,8 @@ class CommitWriteTest(unittest.TestCase):
         return tuple(json.loads(net.bus.geo.iloc[0])['coordinates'])
 
     def _backups(self):
-        """List backup files sitting next to the network."""
-        return [name for name in os.listdir(self.directory)
-                if name.endswith('.bak')]
+        """List the snapshots in the network's backup store."""
+        return self.backup.list_snapshots(self.path)
 
     def test_uncommitted_edit_does_not_touch_the_file(self):
         """An edit sitting in the layer buffer never reaches disk."""
@@ -152,7 +162,7 @@ class CommitWriteTest(unittest.TestCase):
 
         layer.startEditing()
         layer.changeGeometry(fid, QgsGeometry.fromPointXY(QgsPointXY(9.99, 49.99)))
-        self.assertTrue(layer.commitChanges())
+        self.assertTrue(self._commit(layer))
 
         x, y = self._first_bus_xy()
         self.assertAlmostEqual(x, 9.99)
@@ -165,7 +175,7 @@ class CommitWriteTest(unittest.TestCase):
 
         layer.startEditing()
         layer.changeGeometry(fid, QgsGeometry.fromPointXY(QgsPointXY(9.9, 49.9)))
-        layer.commitChanges()
+        self._commit(layer)
 
         self.assertFalse(layer.dataProvider().session.dirty)
 
@@ -190,19 +200,19 @@ class CommitWriteTest(unittest.TestCase):
 
         layer.startEditing()
         layer.changeGeometry(fid, QgsGeometry.fromPointXY(QgsPointXY(9.99, 49.99)))
-        layer.commitChanges()
+        self._commit(layer)
 
         backups = self._backups()
         self.assertEqual(len(backups), 1)
-        self.assertEqual(
-            self._first_bus_xy(os.path.join(self.directory, backups[0])),
-            before)
+        copy = os.path.join(self.directory, 'restored.json')
+        self.backup.restore_snapshot(self.path, backups[0].id, target=copy)
+        self.assertEqual(self._first_bus_xy(copy), before)
 
     def test_two_layers_of_one_file_write_only_once(self):
         """Sibling commits coalesce; the file is not written twice.
 
-        The first write clears the dirty flag, so any further commit in the
-        same action finds a clean session and skips.
+        The second commit is queued behind the running write, and finds the
+        session clean once that write has finished, so it skips.
         """
         bus = self._bus_layer()
         line = self.factory.create_layer(
@@ -225,7 +235,7 @@ class CommitWriteTest(unittest.TestCase):
             bus.commitChanges()
 
             line.startEditing()
-            line.commitChanges()
+            self._commit(line)
         finally:
             self.session_module.NetworkSession.write = original
 
@@ -255,7 +265,7 @@ class CommitWriteTest(unittest.TestCase):
         fid = next(layer.getFeatures()).id()
         layer.startEditing()
         layer.changeGeometry(fid, QgsGeometry.fromPointXY(QgsPointXY(3.0, 4.0)))
-        layer.commitChanges()
+        self._commit(layer)
 
         self.assertEqual(self._first_bus_xy(), marker)
         self.assertTrue(session.dirty)
@@ -272,11 +282,47 @@ class CommitWriteTest(unittest.TestCase):
         with open(self.path, encoding='utf-8') as handle:
             self.assertNotIn('RENAMED BY TEST', handle.read())
 
-        layer.commitChanges()
+        self._commit(layer)
 
         with open(self.path, encoding='utf-8') as handle:
             self.assertIn('RENAMED BY TEST', handle.read())
 
+    def test_commit_during_a_write_is_queued(self):
+        """An edit committed while the previous write runs is not lost."""
+        layer = self._bus_layer()
+        session = layer.dataProvider().session
+        fid = next(layer.getFeatures()).id()
+
+        layer.startEditing()
+        layer.changeGeometry(fid, QgsGeometry.fromPointXY(QgsPointXY(5.0, 45.0)))
+        layer.commitChanges()
+        self.assertIsNotNone(session.write_task)
+
+        layer.startEditing()
+        layer.changeGeometry(fid, QgsGeometry.fromPointXY(QgsPointXY(6.0, 46.0)))
+        layer.commitChanges()
+        self.assertTrue(self.tasks.wait_for_write(session, timeout=60))
+
+        x, y = self._first_bus_xy()
+        self.assertAlmostEqual(x, 6.0)
+        self.assertAlmostEqual(y, 46.0)
+        self.assertFalse(session.dirty)
+
+    def test_edit_during_a_write_keeps_the_session_dirty(self):
+        """A write of an older snapshot does not mark newer edits as saved."""
+        layer = self._bus_layer()
+        session = layer.dataProvider().session
+        fid = next(layer.getFeatures()).id()
+
+        layer.startEditing()
+        layer.changeGeometry(fid, QgsGeometry.fromPointXY(QgsPointXY(5.0, 45.0)))
+        layer.commitChanges()
+
+        # Anything that changes the network meanwhile, e.g. a power flow.
+        session.mark_dirty()
+        self.assertTrue(self.tasks.wait_for_write(session, timeout=60))
+
+        self.assertTrue(session.dirty)
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,132 @@
+# coding=utf-8
+"""Tests for following network files changed outside QGIS.
+
+A file rewritten by another program must reach the open layers without a
+manual reload, patching only what changed, and unsaved edits elsewhere in the
+network must survive it.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+"""
+
+import copy
+import os
+import tempfile
+import time
+import unittest
+
+from qgis.core import QgsApplication, QgsProject, QgsProviderRegistry
+
+from .test_commit_writes import load_plugin_module
+from .utilities import get_qgis_app
+
+QGIS_APP = get_qgis_app()
+
+
+@unittest.skipIf(os.environ.get('SKIP_PANDAPOWER_TESTS'),
+                 'pandapower tests disabled')
+class FileWatcherTest(unittest.TestCase):
+    """Test the watcher merging external changes into open layers."""
+
+    @classmethod
+    def setUpClass(cls):
+        metadata_module = load_plugin_module('ppprovider_metadata')
+        registry = QgsProviderRegistry.instance()
+        if 'PandapowerProvider' not in registry.providerList():
+            registry.registerProvider(
+                metadata_module.PandapowerProviderMetadata())
+
+        cls.factory = load_plugin_module('pandapower_layer_factory')
+        cls.session_module = load_plugin_module('network_session')
+        cls.change_module = load_plugin_module('network_change')
+        cls.loading = load_plugin_module('network_loading')
+        cls.watcher = load_plugin_module('network_watcher')
+
+    def setUp(self):
+        import pandapower as pp
+        import pandapower.networks as ppn
+
+        self.session_module.NetworkSession.clear()
+        QgsProject.instance().removeAllMapLayers()
+        # Load on the spot, so the tests start from a loaded network.
+        self.saved_threshold = self.loading.BACKGROUND_MIN_BYTES
+        self.loading.BACKGROUND_MIN_BYTES = 1 << 40
+        # Reload as soon as the file is quiet, to keep the tests short.
+        self.saved_debounce = self.watcher.WATCH_DEBOUNCE_MS
+        self.watcher.WATCH_DEBOUNCE_MS = 0
+
+        self.net = ppn.mv_oberrhein()
+        self.path = os.path.join(tempfile.mkdtemp(), 'net.json')
+        pp.to_json(self.net, self.path)
+
+        self.layer = self.factory.create_layer(self.path, 'bus', level=20.0,
+                                               epsg=4326)
+        QgsProject.instance().addMapLayer(self.layer)
+        self.session = self.layer.dataProvider().session
+
+    def tearDown(self):
+        self.loading.BACKGROUND_MIN_BYTES = self.saved_threshold
+        self.watcher.WATCH_DEBOUNCE_MS = self.saved_debounce
+        QgsProject.instance().removeAllMapLayers()
+        self.session_module.NetworkSession.clear()
+
+    def rewrite(self, change):
+        """Rewrite the file as another program would."""
+        import pandapower as pp
+
+        net = copy.deepcopy(self.net)
+        change(net)
+        time.sleep(0.05)  # A distinct modification time
+        pp.to_json(net, self.path)
+
+    def wait_until(self, condition, timeout=30):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                return False
+            QgsApplication.processEvents()
+            time.sleep(0.01)
+        return True
+
+    def test_external_change_reaches_the_layer(self):
+        """A rewritten bus name shows up without a manual reload."""
+        bus = self.net.bus.index[self.net.bus.vn_kv == 20.0][0]
+
+        def rename(net):
+            net.bus.loc[bus, 'name'] = 'renamed outside'
+
+        self.rewrite(rename)
+
+        self.assertTrue(self.wait_until(
+            lambda: not self.session.file_changed_externally()))
+        names = {feature['name'] for feature in self.layer.getFeatures()}
+        self.assertIn('renamed outside', names)
+        self.assertFalse(self.session.dirty)
+
+    def test_unsaved_edit_elsewhere_survives(self):
+        """An edit to another row is kept, and the session stays dirty."""
+        buses = self.net.bus.index[self.net.bus.vn_kv == 20.0]
+        mine, theirs = buses[0], buses[1]
+        change = self.change_module.NetworkChange
+        self.session.net.bus.loc[mine, 'name'] = 'my edit'
+        self.session.mark_dirty()
+        self.session.record_change(
+            change.rows_modified('bus', [mine], columns=['name']))
+
+        def rename(net):
+            net.bus.loc[theirs, 'name'] = 'their edit'
+
+        self.rewrite(rename)
+
+        self.assertTrue(self.wait_until(
+            lambda: not self.session.file_changed_externally()))
+        bus = self.session.net.bus
+        self.assertEqual(bus.at[mine, 'name'], 'my edit')
+        self.assertEqual(bus.at[theirs, 'name'], 'their edit')
+        self.assertTrue(self.session.dirty)
+
+
+if __name__ == '__main__':
+    unittest.main()
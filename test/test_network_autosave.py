@@ -0,0 +1,152 @@
+# coding=utf-8
+"""Tests for recovery snapshots of unsaved edits.
+
+A snapshot must hold the session's edits as they were when it was captured,
+even if editing goes on while it is written, must never touch the network
+file, and must put the edits back on top of the file after a crash.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+"""
+
+import os
+import tempfile
+import unittest
+
+from .test_network_session import load_session_module
+from .utilities import get_qgis_app
+
+QGIS_APP = get_qgis_app()
+
+
+@unittest.skipIf(os.environ.get('SKIP_PANDAPOWER_TESTS'),
+                 'pandapower tests disabled')
+class NetworkAutosaveTest(unittest.TestCase):
+    """Test capturing, writing, listing and restoring recovery snapshots."""
+
+    @classmethod
+    def setUpClass(cls):
+        import importlib
+
+        cls.NetworkSession = load_session_module().NetworkSession
+        cls.autosave = importlib.import_module(
+            'pandapower_qgis_plugin.network_autosave')
+        cls.change = importlib.import_module(
+            'pandapower_qgis_plugin.network_change')
+
+    def setUp(self):
+        import pandapower as pp
+        import pandapower.networks as ppn
+
+        self.NetworkSession.clear()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'net.json')
+        pp.to_json(ppn.example_simple(), self.path)
+        self.autosave.configure(os.path.join(self.directory, 'recovery'))
+        self.session = self.NetworkSession.acquire(self.path, self._load)
+
+    def tearDown(self):
+        self.autosave.configure(None)
+        self.NetworkSession.clear()
+
+    def _load(self, *args):
+        import pandapower as pp
+
+        return pp.from_json(self.path)
+
+    def _rename_bus(self, name):
+        """Rename the first bus through the session, as a layer edit would.
+
+        :param name: The new name.
+        """
+        bus = self.session.net.bus.index[0]
+        self.session.own(['bus'])
+        self.session.net.bus.at[bus, 'name'] = name
+        self.session.mark_dirty(self.change.NetworkChange.rows_modified(
+            'bus', [bus], columns=['name']))
+
+    def test_snapshot_restores_after_a_crash(self):
+        """The edited table comes back on top of the untouched file."""
+        with open(self.path, 'rb') as handle:
+            original = handle.read()
+        self._rename_bus('recovered')
+
+        self.assertTrue(self.autosave.autosave(self.session))
+        self.assertFalse(self.autosave.autosave(self.session))  # Up to date
+
+        with open(self.path, 'rb') as handle:
+            self.assertEqual(handle.read(), original)
+        self.NetworkSession.clear()  # The crash
+        recoveries = self.autosave.list_recoveries()
+        self.assertEqual(len(recoveries), 1)
+        self.assertEqual(recoveries[0].tables, ['bus'])
+        self.assertTrue(recoveries[0].restorable())
+
+        session = self.autosave.restore(recoveries[0], self._load)
+
+        self.assertEqual(session.net.bus.iloc[0]['name'], 'recovered')
+        self.assertTrue(session.dirty)
+        self.assertEqual(session.dirty_tables, frozenset(['bus']))
+
+    def test_capture_keeps_the_state_it_took(self):
+        """An edit during the write copies the table instead of changing it."""
+        bus = self.session.net.bus
+        self._rename_bus('before')
+
+        entries = self.session.capture(frozenset(['bus']))
+        self.assertIs(entries['bus'], self.session.net.bus)
+        self.assertNotIn('line', entries)
+        self._rename_bus('after')
+        self.session.release_capture(entries)
+
+        self.assertEqual(entries['bus'].iloc[0]['name'], 'before')
+        self.assertEqual(self.session.net.bus.iloc[0]['name'], 'after')
+        self.assertIsNot(self.session.net.bus, bus)
+
+    def test_background_snapshot(self):
+        """The write runs on a thread and releases the capture."""
+        self._rename_bus('threaded')
+
+        threads = self.autosave.autosave_all()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(threads), 1)
+        self.assertEqual(self.session._captures, [])
+        self.assertTrue(os.path.exists(
+            self.autosave.snapshot_path(self.session.key)))
+
+    def test_saving_discards_the_snapshot(self):
+        """Once the file holds the edits, no snapshot is left to offer."""
+        self._rename_bus('saved')
+        self.autosave.autosave(self.session)
+
+        success, message, _ = self.session.write(backup=False)
+
+        self.assertTrue(success, message)
+        self.assertFalse(os.path.exists(
+            self.autosave.snapshot_path(self.session.key)))
+        self.NetworkSession.clear()
+        self.assertEqual(self.autosave.list_recoveries(), [])
+
+    def test_partial_snapshot_needs_its_file(self):
+        """Tables edited on top of a file do not apply to a changed file."""
+        import pandapower as pp
+        import pandapower.networks as ppn
+
+        self._rename_bus('stale')
+        self.autosave.autosave(self.session)
+        self.NetworkSession.clear()
+        pp.to_json(ppn.mv_oberrhein(), self.path)
+
+        recovery = self.autosave.list_recoveries()[0]
+
+        self.assertFalse(recovery.restorable())
+        with self.assertRaises(ValueError):
+            self.autosave.restore(recovery, self._load)
+
+
+if __name__ == '__main__':
+    unittest.main()
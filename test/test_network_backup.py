@@ -0,0 +1,220 @@
+# coding=utf-8
+"""Tests for the deduplicating backup store.
+
+A restored snapshot must give back the exact bytes that were backed up, and a
+snapshot after a small edit must only add the tables that changed.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+"""
+
+import copy
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from .test_network_session import load_session_module
+from .utilities import get_qgis_app
+
+QGIS_APP = get_qgis_app()
+
+try:
+    import pyarrow  # noqa: F401
+    HAVE_PYARROW = True
+except ImportError:
+    HAVE_PYARROW = False
+
+
+@unittest.skipIf(os.environ.get('SKIP_PANDAPOWER_TESTS'),
+                 'pandapower tests disabled')
+class BackupStoreTest(unittest.TestCase):
+    """Test snapshots, restores, deduplication and retention."""
+
+    @classmethod
+    def setUpClass(cls):
+        import importlib
+
+        import pandapower.networks as ppn
+
+        cls.session_module = load_session_module()
+        cls.module = importlib.import_module(
+            'pandapower_qgis_plugin.network_backup')
+        cls.io = importlib.import_module('pandapower_qgis_plugin.network_io')
+        cls.net = ppn.mv_oberrhein()
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'net.json')
+        self.io.write_network(self.net, self.path, 'power')
+        self.module.configure()
+
+    def tearDown(self):
+        self.module.configure()
+        self.session_module.NetworkSession.clear()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def read(self, path):
+        with open(path, 'rb') as handle:
+            return handle.read()
+
+    def objects(self):
+        found = set()
+        root = os.path.join(self.module.backup_directory(self.path),
+                            self.module.OBJECTS_DIR)
+        for _parent, _dirs, names in os.walk(root):
+            found.update(names)
+        return found
+
+    def edit_and_save(self, x):
+        import json
+
+        net = copy.deepcopy(self.net)
+        net.bus.loc[net.bus.index[0], 'geo'] = json.dumps(
+            {'type': 'Point', 'coordinates': [x, 49.0]})
+        self.io.write_network(net, self.path, 'power')
+        # A distinct modification time, whatever the file system's resolution
+        later = time.time() + x
+        os.utime(self.path, (later, later))
+
+    def test_restore_gives_back_the_exact_file(self):
+        """A restored snapshot is byte for byte the backed up file."""
+        original = self.read(self.path)
+        snapshot = self.module.create_snapshot(self.path)
+        self.edit_and_save(1)
+
+        self.module.restore_snapshot(self.path, snapshot.id)
+
+        self.assertEqual(self.read(self.path), original)
+
+    def test_unchanged_tables_are_stored_once(self):
+        """Editing one table adds one object to the store."""
+        self.module.create_snapshot(self.path)
+        before = self.objects()
+        self.edit_and_save(1)
+
+        self.module.create_snapshot(self.path)
+
+        self.assertEqual(len(self.objects() - before), 1)
+
+    def test_unchanged_file_adds_no_snapshot(self):
+        """Backing up an unchanged file returns the newest snapshot."""
+        first = self.module.create_snapshot(self.path)
+        second = self.module.create_snapshot(self.path)
+
+        self.assertEqual(second.id, first.id)
+        self.assertEqual(len(self.module.list_snapshots(self.path)), 1)
+
+    def test_restore_backs_up_the_current_file(self):
+        """A restore can be undone from the snapshot taken before it."""
+        snapshot = self.module.create_snapshot(self.path)
+        self.edit_and_save(1)
+        edited = self.read(self.path)
+
+        self.module.restore_snapshot(self.path, snapshot.id)
+        newest = self.module.list_snapshots(self.path)[0]
+        self.module.restore_snapshot(self.path, newest.id)
+
+        self.assertEqual(self.read(self.path), edited)
+
+    def test_compressed_network_is_restored_compressed(self):
+        """The restore of a .json.gz network is gzip-compressed again."""
+        import importlib
+
+        import pandapower as pp
+        from pandapower.toolbox import nets_equal
+
+        compression = importlib.import_module(
+            'pandapower_qgis_plugin.network_compression')
+        path = os.path.join(self.directory, 'net.json.gz')
+        self.io.write_network(self.net, path, 'power')
+        snapshot = self.module.create_snapshot(path)
+
+        restored = os.path.join(self.directory, 'copy.json.gz')
+        self.module.restore_snapshot(path, snapshot.id, target=restored)
+
+        self.assertEqual(compression.detect_compression(restored),
+                         compression.GZIP)
+        with compression.open_text(restored) as handle:
+            self.assertTrue(nets_equal(pp.from_json(handle), self.net,
+                                       check_only_results=False))
+
+    def test_retention_thins_out_old_snapshots(self):
+        """Keep the newest few and the newest of each hour and day."""
+        hour = 3600.0
+        now = time.mktime((2025, 6, 15, 12, 30, 0, 0, 0, -1))
+        times = [now, now - 60, now - 120,          # this hour
+                 now - hour, now - hour - 60,       # an hour ago
+                 now - 2 * hour,                    # two hours ago
+                 now - 26 * hour, now - 27 * hour,  # yesterday
+                 now - 50 * hour]                   # two days ago
+        snapshots = [self.module.Snapshot('', str(index), created, 0)
+                     for index, created in enumerate(times)]
+
+        kept = self.module.select_kept(snapshots, keep_last=2, keep_hourly=2,
+                                       keep_daily=2)
+
+        self.assertEqual(kept, {'0', '1', '3', '6'})
+
+    def test_pruning_deletes_unused_objects(self):
+        """Objects only the dropped snapshots used are deleted."""
+        self.module.create_snapshot(self.path)
+        self.edit_and_save(1)
+        self.module.create_snapshot(self.path)
+        self.edit_and_save(2)
+        latest = self.module.create_snapshot(self.path)
+        before = self.objects()
+
+        self.module.prune(self.path, policy=(1, 0, 0))
+
+        self.assertEqual([snapshot.id for snapshot
+                          in self.module.list_snapshots(self.path)],
+                         [latest.id])
+        self.assertEqual(len(before - self.objects()), 2)
+        restored = os.path.join(self.directory, 'copy.json')
+        self.module.restore_snapshot(self.path, latest.id, target=restored)
+        self.assertEqual(self.read(restored), self.read(self.path))
+
+    def test_session_write_takes_a_snapshot(self):
+        """Saving a session backs the previous file up."""
+        session = self.session_module.NetworkSession.acquire(
+            self.path, lambda: copy.deepcopy(self.net))
+        original = self.read(self.path)
+
+        success, _message, manifest = session.write()
+
+        self.assertTrue(success)
+        self.assertTrue(os.path.isfile(manifest))
+        snapshot = self.module.list_snapshots(self.path)[0]
+        restored = os.path.join(self.directory, 'copy.json')
+        self.module.restore_snapshot(self.path, snapshot.id, target=restored)
+        self.assertEqual(self.read(restored), original)
+
+    @unittest.skipUnless(HAVE_PYARROW, 'pyarrow is not installed')
+    def test_directory_store_is_restored(self):
+        """Every file of a directory store comes back."""
+        import importlib
+
+        store = importlib.import_module('pandapower_qgis_plugin.network_store')
+        path = os.path.join(self.directory, 'net.ppnet')
+        os.makedirs(path)
+        store.write_store(self.net, path)
+        files = {}
+        for parent, _dirs, names in os.walk(path):
+            for name in names:
+                member = os.path.join(parent, name)
+                files[os.path.relpath(member, path)] = self.read(member)
+        snapshot = self.module.create_snapshot(path)
+        shutil.rmtree(path)
+
+        self.module.restore_snapshot(path, snapshot.id)
+
+        for relative, content in files.items():
+            self.assertEqual(self.read(os.path.join(path, relative)), content)
+
+
+if __name__ == '__main__':
+    unittest.main()
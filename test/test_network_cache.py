@@ -0,0 +1,214 @@
+# coding=utf-8
+"""Tests for the binary cache of parsed networks.
+
+A cache entry may only stand in for the JSON while it describes the file
+exactly; anything else must fall back to parsing.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+"""
+
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from .test_network_session import load_session_module
+from .utilities import get_qgis_app
+
+QGIS_APP = get_qgis_app()
+
+
+def sample_net(name='cached'):
+    """A picklable stand-in for a network: one small table.
+
+    :param name: Value stored in the table, to tell nets apart.
+    :returns: dict holding a DataFrame.
+    """
+    import pandas as pd
+
+    return {'bus': pd.DataFrame({'name': [name], 'vn_kv': [20.0]})}
+
+
+class NetworkCacheTest(unittest.TestCase):
+    """Test entry validity, staleness and the session integration."""
+
+    @classmethod
+    def setUpClass(cls):
+        import importlib
+
+        cls.NetworkSession = load_session_module().NetworkSession
+        cls.cache = importlib.import_module(
+            'pandapower_qgis_plugin.network_cache')
+
+    def setUp(self):
+        self.NetworkSession.clear()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'net.json')
+        with open(self.path, 'w') as handle:
+            handle.write('{}')
+        self.cache.configure(os.path.join(self.directory, 'cache'))
+
+    def tearDown(self):
+        self.cache.configure(None)
+        self.NetworkSession.clear()
+
+    def test_disabled_cache_never_answers(self):
+        """Without a directory there are no entries."""
+        self.cache.configure(None)
+
+        self.assertFalse(self.cache.store(self.path, sample_net(), 'power'))
+        self.assertIsNone(self.cache.load(self.path, 'power'))
+
+    def test_round_trip(self):
+        """A stored network comes back while the file is unchanged."""
+        self.assertTrue(self.cache.store(self.path, sample_net(), 'power'))
+
+        net = self.cache.load(self.path, 'power')
+
+        self.assertEqual(net['bus'].loc[0, 'name'], 'cached')
+
+    def test_changed_file_makes_the_entry_stale(self):
+        """Touching the JSON invalidates the entry."""
+        self.cache.store(self.path, sample_net(), 'power')
+
+        later = time.time() + 5
+        os.utime(self.path, (later, later))
+
+        self.assertIsNone(self.cache.load(self.path, 'power'))
+
+    def test_compaction_setting_makes_the_entry_stale(self):
+        """A compacted network is not served once compaction is off."""
+        import importlib
+
+        compaction = importlib.import_module(
+            'pandapower_qgis_plugin.network_compaction')
+        net = sample_net()
+        net[compaction.COMPACTION_KEY] = {}
+        compaction.configure(True)
+        try:
+            self.cache.store(self.path, net, 'power')
+            self.assertIsNotNone(self.cache.load(self.path, 'power'))
+        finally:
+            compaction.configure(False)
+
+        self.assertIsNone(self.cache.load(self.path, 'power'))
+
+    def test_corrupt_entry_is_a_miss(self):
+        """A truncated entry is ignored rather than raised."""
+        self.cache.store(self.path, sample_net(), 'power')
+        with open(self.cache.entry_path(self.path), 'wb') as handle:
+            handle.write(b'not a pickle')
+
+        self.assertIsNone(self.cache.load(self.path, 'power'))
+
+    def test_acquire_uses_a_valid_entry(self):
+        """A cached network opens without running the loader."""
+        key = os.path.normcase(os.path.abspath(self.path))
+        self.cache.store(key, sample_net(), 'power')
+
+        def loader():
+            raise AssertionError('loader must not run for a cached network')
+
+        session = self.NetworkSession.acquire(self.path, loader)
+
+        self.assertEqual(session.net['bus'].loc[0, 'name'], 'cached')
+
+    def test_acquire_rebuilds_a_missing_entry(self):
+        """A cold open parses the file and leaves an entry behind."""
+        self.NetworkSession.acquire(self.path, lambda: sample_net('parsed'))
+
+        deadline = time.monotonic() + 10
+        key = os.path.normcase(os.path.abspath(self.path))
+        while self.cache.load(key, 'power') is None:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+        self.assertEqual(
+            self.cache.load(key, 'power')['bus'].loc[0, 'name'], 'parsed')
+
+    def test_clear_removes_entries(self):
+        """Clearing deletes the entries it created."""
+        self.cache.store(self.path, sample_net(), 'power')
+
+        self.assertEqual(self.cache.clear(), 1)
+        self.assertIsNone(self.cache.load(self.path, 'power'))
+
+
+def write_old_format(path):
+    """Write a network whose file asks for pandapower's format conversion.
+
+    :param path: Target path.
+    """
+    import pandapower as pp
+    import pandapower.networks as ppn
+
+    pp.to_json(ppn.example_simple(), path)
+    with open(path) as handle:
+        document = json.load(handle)
+    document['_object']['format_version'] = '2.0.0'
+    with open(path, 'w') as handle:
+        json.dump(document, handle)
+
+
+@unittest.skipIf(os.environ.get('SKIP_PANDAPOWER_TESTS'),
+                 'pandapower tests disabled')
+class ConvertedNetworkCacheTest(unittest.TestCase):
+    """Test that files in an older format are cached even when it is off."""
+
+    @classmethod
+    def setUpClass(cls):
+        import importlib
+
+        load_session_module()
+        cls.cache = importlib.import_module(
+            'pandapower_qgis_plugin.network_cache')
+        cls.index = importlib.import_module(
+            'pandapower_qgis_plugin.network_index')
+        cls.io = importlib.import_module('pandapower_qgis_plugin.network_io')
+
+    def setUp(self):
+        import pandapower as pp
+        import pandapower.networks as ppn
+
+        self.directory = tempfile.mkdtemp()
+        self.old = os.path.join(self.directory, 'old.json')
+        self.current = os.path.join(self.directory, 'current.json')
+        write_old_format(self.old)
+        pp.to_json(ppn.example_simple(), self.current)
+        self.index.forget()
+        self.cache.configure(os.path.join(self.directory, 'cache'),
+                             converted_only=True)
+
+    def tearDown(self):
+        self.cache.configure(None)
+        self.index.forget()
+
+    def test_only_old_files_are_stored(self):
+        """The converted network is kept; a current file needs no entry."""
+        self.assertTrue(self.cache.store(self.old, sample_net(), 'power'))
+        self.assertFalse(self.cache.store(self.current, sample_net(), 'power'))
+        self.assertIsNone(self.cache.store_in_background(
+            self.current, sample_net(), 'power'))
+
+        self.assertIsNotNone(self.cache.load(self.old, 'power'))
+
+    def test_upgraded_file_drops_its_entry(self):
+        """Once saved in the current format, the file's entry goes away."""
+        import pandapower as pp
+
+        self.cache.store(self.old, sample_net(), 'power')
+        entry = self.cache.entry_path(self.old)
+
+        net = pp.from_json(self.old)
+        self.io.write_network(net, self.old, 'power', changed={'bus'})
+        self.assertFalse(self.cache.store(self.old, net, 'power'))
+
+        self.assertFalse(os.path.exists(entry))
+
+
+if __name__ == '__main__':
+    unittest.main()
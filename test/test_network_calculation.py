@@ -0,0 +1,175 @@
+# coding=utf-8
+"""Tests for power flows on a snapshot of a session's network.
+
+A calculation must see the network as it was when it started, whatever is
+edited meanwhile, must move only its results into the session's network, and
+must leave the network untouched when cancelled.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+"""
+
+import os
+import tempfile
+import unittest
+
+from .test_network_session import load_session_module
+from .utilities import get_qgis_app
+
+QGIS_APP = get_qgis_app()
+
+
+@unittest.skipIf(os.environ.get('SKIP_PANDAPOWER_TESTS'),
+                 'pandapower tests disabled')
+class NetworkCalculationTest(unittest.TestCase):
+    """Test snapshots, result application and cancellation."""
+
+    @classmethod
+    def setUpClass(cls):
+        import importlib
+
+        cls.NetworkSession = load_session_module().NetworkSession
+        cls.module = importlib.import_module(
+            'pandapower_qgis_plugin.network_calculation')
+        cls.change = importlib.import_module(
+            'pandapower_qgis_plugin.network_change')
+
+    def setUp(self):
+        import pandapower as pp
+        import pandapower.networks as ppn
+
+        self.NetworkSession.clear()
+        self.path = os.path.join(tempfile.mkdtemp(), 'net.json')
+        pp.to_json(ppn.example_simple(), self.path)
+        self.session = self.NetworkSession.acquire(self.path, self._load)
+
+    def tearDown(self):
+        self.NetworkSession.clear()
+
+    def _load(self):
+        import pandapower as pp
+
+        return pp.from_json(self.path)
+
+    def test_results_reach_the_session(self):
+        """Result tables move over in one step; input tables stay put."""
+        import pandapower as pp
+
+        bus = self.session.net.bus
+        calculation = self.module.Calculation(self.session)
+        calculation.run(pp.runpp)
+
+        self.assertTrue(self.session.net.res_bus.empty)
+        change = calculation.apply()
+
+        net = self.session.net
+        self.assertFalse(net.res_bus.empty)
+        self.assertTrue(net.converged)
+        self.assertIs(net.bus, bus)
+        self.assertFalse(calculation.edited())
+        self.assertTrue(change.results)
+        self.assertIn('res_bus', self.session.dirty_tables)
+        self.assertEqual(self.session._captures, [])
+
+    def test_edits_during_the_run_are_flagged(self):
+        """The power flow sees the old load; the session keeps the new one."""
+        import pandapower as pp
+
+        NetworkChange = self.change.NetworkChange
+        load = self.session.net.load.index[0]
+        original = self.session.net.load.at[load, 'p_mw']
+        calculation = self.module.Calculation(self.session)
+
+        self.session.own(['load'])
+        self.session.net.load.at[load, 'p_mw'] = original * 2
+        self.session.mark_dirty(NetworkChange.rows_modified(
+            'load', [load], columns=['p_mw']))
+        calculation.run(pp.runpp)
+        calculation.apply()
+
+        self.assertEqual(calculation.net.load.at[load, 'p_mw'], original)
+        self.assertEqual(self.session.net.load.at[load, 'p_mw'], original * 2)
+        self.assertTrue(calculation.edited())
+        self.assertFalse(self.session.net.res_bus.empty)
+
+    def test_cancelled_run_changes_nothing(self):
+        """A cancelled power flow raises and leaves no results behind."""
+        import pandapower as pp
+
+        self.module.CHECK_INTERVAL_S, interval = \
+            0.0, self.module.CHECK_INTERVAL_S
+        try:
+            calculation = self.module.Calculation(self.session)
+            with self.assertRaises(InterruptedError):
+                calculation.run(pp.runpp, is_canceled=lambda: True)
+        finally:
+            self.module.CHECK_INTERVAL_S = interval
+        calculation.release()
+
+        self.assertTrue(self.session.net.res_bus.empty)
+        self.assertFalse(self.session.dirty)
+        self.assertEqual(self.session._captures, [])
+
+    def test_cancel_interrupts_a_running_calculation(self):
+        """A calculation busy in a loop stops soon after it is cancelled."""
+        import time
+
+        started = time.monotonic()
+
+        def busy(net):
+            while time.monotonic() - started < 30:
+                time.sleep(0.01)
+
+        calculation = self.module.Calculation(self.session)
+        with self.assertRaises(InterruptedError):
+            calculation.run(busy, is_canceled=lambda: (
+                time.monotonic() - started > 0.2))
+        calculation.release()
+
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertFalse(self.session.dirty)
+
+    def test_cancel_after_the_run_reaches_nobody(self):
+        """Cancelling a finished calculation leaves its thread alone."""
+        import time
+
+        import pandapower as pp
+
+        calculation = self.module.Calculation(self.session)
+        calculation.run(pp.runpp, is_canceled=lambda: False)
+        calculation.cancel()
+
+        # Python code on the same thread, where a stray exception would land.
+        deadline = time.monotonic() + 0.2
+        while time.monotonic() < deadline:
+            sum(range(100))
+        self.assertIsNone(calculation._thread)
+        calculation.apply()
+        self.assertFalse(self.session.net.res_bus.empty)
+
+    def test_run_installs_no_trace_hook(self):
+        """pandapower runs untraced, as fast as outside a calculation."""
+        import sys
+
+        import pandapower as pp
+
+        traces = []
+
+        def runpp(net):
+            traces.append(sys.gettrace())
+            pp.runpp(net)
+
+        outside = sys.gettrace()
+        calculation = self.module.Calculation(self.session)
+        calculation.run(runpp, is_canceled=lambda: False,
+                        progress=lambda percent: None)
+        calculation.apply()
+
+        self.assertEqual(traces, [outside])
+        self.assertFalse(self.session.net.res_bus.empty)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,183 @@
+# coding=utf-8
+"""Tests for compacting loaded networks in memory.
+
+Compaction may change how a network is held, never what it holds: a power flow
+gives the same results, features can still be added, and a save writes the
+file the network was read from.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+"""
+
+import os
+import tempfile
+import unittest
+
+from .test_network_session import load_session_module
+from .utilities import get_qgis_app
+
+QGIS_APP = get_qgis_app()
+
+
+@unittest.skipIf(os.environ.get('SKIP_PANDAPOWER_TESTS'),
+                 'pandapower tests disabled')
+class CompactionTest(unittest.TestCase):
+    """Test compaction, the original dtypes and the writers."""
+
+    @classmethod
+    def setUpClass(cls):
+        import importlib
+
+        load_session_module()
+        cls.module = importlib.import_module(
+            'pandapower_qgis_plugin.network_compaction')
+        cls.io = importlib.import_module('pandapower_qgis_plugin.network_io')
+        cls.store = importlib.import_module(
+            'pandapower_qgis_plugin.network_store')
+
+    def setUp(self):
+        import pandapower as pp
+        import pandapower.networks as ppn
+
+        self.net = ppn.mv_oberrhein()
+        pp.runpp(self.net)
+        self.directory = tempfile.mkdtemp()
+
+    def _compacted(self):
+        import copy
+
+        net = copy.deepcopy(self.net)
+        record = self.module.compact_network(net)
+        return net, record
+
+    def test_values_are_unchanged(self):
+        """Shared strings and 32-bit ids hold the same values."""
+        net, record = self._compacted()
+
+        self.assertEqual(str(net.line.index.dtype), 'int32')
+        self.assertEqual(record['dtypes']['line'][self.module.INDEX], 'int64')
+        std_types = net.line.std_type.to_numpy()
+        self.assertIs(std_types[0], std_types[list(std_types).index(
+            std_types[0], 1)])
+        for name in ('bus', 'line', 'trafo', 'res_bus'):
+            self.assertTrue((net[name].to_numpy() == self.net[name].to_numpy())
+                            .all() or net[name].equals(self.net[name]))
+        self.assertEqual(net.line.std_type.dtype, object)
+
+    def test_report_shows_the_saving(self):
+        """The record measures the network before and after."""
+        net, _ = self._compacted()
+
+        report = self.module.MemoryReport.of(net)
+
+        self.assertLess(report.after, report.before)
+        self.assertIn('% less', report.describe())
+        self.assertIsNone(self.module.MemoryReport.of(self.net))
+
+    def test_network_still_works(self):
+        """Power flows agree, and pandapower can add and remove elements."""
+        import pandapower as pp
+
+        net, _ = self._compacted()
+        pp.runpp(net)
+        self.assertLess(
+            (net.res_bus.vm_pu - self.net.res_bus.vm_pu).abs().max(), 1e-9)
+
+        bus = pp.create_bus(net, 20.0, type='n')
+        pp.create_line(net, bus, net.bus.index[0], 1.0,
+                       std_type=net.line.std_type.iloc[0])
+        pp.toolbox.drop_buses(net, [bus])
+        pp.runpp(net)
+        self.assertTrue(net.converged)
+
+    def test_json_round_trips_unchanged(self):
+        """A compacted network is saved as the file it was read from."""
+        expected = os.path.join(self.directory, 'expected.json')
+        actual = os.path.join(self.directory, 'actual.json')
+        net, _ = self._compacted()
+
+        self.io.write_network(self.net, expected)
+        self.io.write_network(net, actual)
+
+        with open(expected, 'rb') as first, open(actual, 'rb') as second:
+            self.assertEqual(first.read(), second.read())
+
+    def test_store_keeps_the_original_dtypes(self):
+        """A store written from a compacted network has the original dtypes."""
+        path = os.path.join(self.directory, 'grid.ppnet')
+        net, _ = self._compacted()
+
+        self.store.write_store(net, path)
+
+        loaded = self.store.load_store(path)
+        for name in ('bus', 'line'):
+            self.assertEqual(loaded[name].dtypes.to_dict(),
+                             self.net[name].dtypes.to_dict())
+            self.assertEqual(loaded[name].index.dtype,
+                             self.net[name].index.dtype)
+
+
+@unittest.skipIf(os.environ.get('SKIP_PANDAPOWER_TESTS'),
+                 'pandapower tests disabled')
+class SessionCompactionTest(unittest.TestCase):
+    """Test that sessions compact what they load, when enabled."""
+
+    @classmethod
+    def setUpClass(cls):
+        import importlib
+
+        cls.session_module = load_session_module()
+        cls.module = importlib.import_module(
+            'pandapower_qgis_plugin.network_compaction')
+
+    def setUp(self):
+        import pandapower as pp
+        import pandapower.networks as ppn
+
+        self.session_module.NetworkSession.clear()
+        self.path = os.path.join(tempfile.mkdtemp(), 'net.json')
+        pp.to_json(ppn.example_simple(), self.path)
+
+    def tearDown(self):
+        self.module.configure(False)
+        self.session_module.NetworkSession.clear()
+
+    def _acquire(self):
+        import pandapower as pp
+
+        return self.session_module.NetworkSession.acquire(
+            self.path, lambda: pp.from_json(self.path))
+
+    def test_off_by_default(self):
+        """Without the setting, a loaded network is left as it is."""
+        session = self._acquire()
+
+        self.assertIsNone(session.memory_report())
+        self.assertEqual(str(session.net.bus.index.dtype), 'int64')
+
+    def test_loaded_network_is_compacted(self):
+        """With the setting, the session compacts and reports."""
+        self.module.configure(True)
+
+        session = self._acquire()
+
+        self.assertIsNotNone(session.memory_report())
+        self.assertEqual(str(session.net.bus.index.dtype), 'int32')
+
+    def test_file_change_diffs_by_original_dtypes(self):
+        """An unchanged file does not look reshaped to a compacted session."""
+        import pandapower as pp
+
+        self.module.configure(True)
+        session = self._acquire()
+        fresh = pp.from_json(self.path)
+
+        delta = session.diff_file(fresh.get, list(fresh.keys()))
+
+        self.assertTrue(delta.is_empty(), delta.change)
+
+
+if __name__ == '__main__':
+    unittest.main()
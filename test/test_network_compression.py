@@ -0,0 +1,132 @@
+# coding=utf-8
+"""Tests for compressed network files.
+
+A ``.json.gz`` or ``.json.zst`` network must save and load to exactly the same
+network as a plain ``.json`` one, and must be recognised by its content rather
+than its name.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from .test_network_session import load_session_module
+from .utilities import get_qgis_app
+
+QGIS_APP = get_qgis_app()
+
+try:
+    import zstandard  # noqa: F401
+    HAVE_ZSTANDARD = True
+except ImportError:
+    HAVE_ZSTANDARD = False
+
+
+@unittest.skipIf(os.environ.get('SKIP_PANDAPOWER_TESTS'),
+                 'pandapower tests disabled')
+class CompressedNetworkTest(unittest.TestCase):
+    """Test detection, round trips and the scanners on compressed files."""
+
+    @classmethod
+    def setUpClass(cls):
+        import importlib
+
+        import pandapower as pp
+        import pandapower.networks as ppn
+
+        load_session_module()
+        cls.module = importlib.import_module(
+            'pandapower_qgis_plugin.network_compression')
+        cls.io = importlib.import_module('pandapower_qgis_plugin.network_io')
+        cls.net = ppn.mv_oberrhein()
+        pp.runpp(cls.net)
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def save(self, name):
+        path = os.path.join(self.directory, name)
+        self.io.write_network(self.net, path, 'power')
+        return path
+
+    def load(self, path):
+        import pandapower as pp
+
+        with self.module.open_text(path) as handle:
+            return pp.from_json(handle)
+
+    def assert_round_trip(self, name, compression):
+        from pandapower.toolbox import nets_equal
+
+        path = self.save(name)
+
+        self.assertEqual(self.module.detect_compression(path), compression)
+        self.assertTrue(nets_equal(self.load(path), self.net,
+                                   check_only_results=False))
+
+    def test_gzip_round_trip(self):
+        """A .json.gz network is gzip-compressed and loads unchanged."""
+        self.assert_round_trip('net.json.gz', self.module.GZIP)
+
+    @unittest.skipUnless(HAVE_ZSTANDARD, 'zstandard is not installed')
+    def test_zstd_round_trip(self):
+        """A .json.zst network is zstd-compressed and loads unchanged."""
+        self.assert_round_trip('net.json.zst', self.module.ZSTD)
+
+    def test_plain_json_stays_plain(self):
+        """A .json network is written uncompressed."""
+        self.assert_round_trip('net.json', None)
+
+    def test_existing_file_keeps_its_compression(self):
+        """Saving over a renamed gzip file compresses it again."""
+        path = self.save('net.json.gz')
+        renamed = os.path.join(self.directory, 'renamed.json')
+        os.rename(path, renamed)
+
+        self.io.write_network(self.net, renamed, 'power')
+
+        self.assertEqual(self.module.detect_compression(renamed),
+                         self.module.GZIP)
+
+    def test_names(self):
+        """Compressed names count as networks and lose both suffixes."""
+        self.assertTrue(self.module.is_network_file_name('a/grid.JSON.GZ'))
+        self.assertTrue(self.module.is_network_file_name('grid.json.zst'))
+        self.assertFalse(self.module.is_network_file_name('grid.gz'))
+        self.assertEqual(self.module.network_stem('/a/grid.json.gz'), 'grid')
+        self.assertEqual(self.module.network_stem('/a/grid.json'), 'grid')
+
+    def test_index_of_compressed_file(self):
+        """A compressed file is indexed like the plain one."""
+        import importlib
+
+        index = importlib.import_module('pandapower_qgis_plugin.network_index')
+        plain = index.build_index(self.save('net.json'), 'power')
+        packed = index.build_index(self.save('net.json.gz'), 'power')
+
+        self.assertEqual(packed.to_dict(), plain.to_dict())
+
+    def test_compressed_file_is_not_opened_lazily(self):
+        """open_lazy leaves compressed files to a full load."""
+        import importlib
+
+        lazy = importlib.import_module('pandapower_qgis_plugin.network_lazy')
+        saved = lazy.LAZY_MIN_BYTES
+        lazy.LAZY_MIN_BYTES = 0
+        try:
+            self.assertIsNone(lazy.open_lazy(self.save('net.json.gz'), 'power'))
+        finally:
+            lazy.LAZY_MIN_BYTES = saved
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+# coding=utf-8
+"""Tests for networks kept in a GeoPackage or SQLite database.
+
+A database must give back the network it was given, must save an edit by
+touching only the edited rows, and must keep its native geometry and spatial
+indexes in step with ``geo``.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+"""
+
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from .test_network_session import load_session_module
+from .utilities import get_qgis_app
+
+QGIS_APP = get_qgis_app()
+
+
+@unittest.skipIf(os.environ.get('SKIP_PANDAPOWER_TESTS'),
+                 'pandapower tests disabled')
+class NetworkDatabaseTest(unittest.TestCase):
+    """Test writing, reading and row-level saving of network databases."""
+
+    @classmethod
+    def setUpClass(cls):
+        import importlib
+
+        cls.NetworkSession = load_session_module().NetworkSession
+        cls.module = importlib.import_module(
+            'pandapower_qgis_plugin.network_database')
+        cls.change = importlib.import_module(
+            'pandapower_qgis_plugin.network_change')
+        cls.lazy = importlib.import_module(
+            'pandapower_qgis_plugin.network_lazy')
+
+    def setUp(self):
+        import pandapower as pp
+        import pandapower.networks as ppn
+
+        self.NetworkSession.clear()
+        self.net = ppn.mv_oberrhein()
+        pp.runpp(self.net)
+        self.path = os.path.join(tempfile.mkdtemp(), 'grid.gpkg')
+        self.module.write_database(self.net, self.path)
+
+    def tearDown(self):
+        self.NetworkSession.clear()
+
+    def _query(self, sql, *parameters):
+        # The spatial index triggers need the functions connect() provides.
+        with self.module.connect(self.path, writable=True) as connection:
+            return connection.execute(sql, parameters).fetchall()
+
+    def test_round_trip(self):
+        """The database loads back into an equal network, dtypes included."""
+        from pandapower.toolbox import nets_equal
+
+        net = self.module.load_database(self.path)
+
+        self.assertTrue(nets_equal(self.net, net, check_only_results=False))
+        for table in ('bus', 'line', 'switch', 'res_bus'):
+            self.assertTrue(net[table].dtypes.equals(self.net[table].dtypes))
+        self.assertEqual(self.module.sniff_database_kind(self.path), 'power')
+
+    def test_tables_are_geopackage_layers(self):
+        """bus and line have native geometry with a filled spatial index."""
+        columns = dict(self._query(
+            'SELECT table_name, geometry_type_name FROM gpkg_geometry_columns'))
+        self.assertEqual(columns, {'bus': 'POINT', 'line': 'MULTILINESTRING'})
+
+        indexed = self._query('SELECT count(*) FROM rtree_bus_geom')[0][0]
+        self.assertEqual(indexed, self.net.bus.geo.notna().sum())
+        x, y = self.net.bus.loc[0, 'geo'].split('[')[1].split(']')[0] \
+            .split(',')
+        found = self._query(
+            'SELECT id FROM rtree_bus_geom WHERE minx <= ? AND maxx >= ? '
+            'AND miny <= ? AND maxy >= ?', float(x), float(x),
+            float(y), float(y))
+        self.assertIn((0,), found)
+
+    def test_commit_writes_only_the_edited_rows(self):
+        """Edited rows are saved; rows nobody edited are not rewritten."""
+        import pandapower as pp
+
+        NetworkChange = self.change.NetworkChange
+        session = self.NetworkSession.acquire(
+            self.path, lambda: self.module.load_database(self.path))
+        net = session.net
+        untouched = net.bus.index[5]
+        self._query('UPDATE bus SET name = ? WHERE fid = ?',
+                    'edited elsewhere', int(untouched))
+        session.remember_file_state()
+
+        moved = net.bus.index[1]
+        net.bus.loc[moved, 'geo'] = '{"type": "Point", ' \
+            '"coordinates": [1.5, 2.5]}'
+        new = pp.create_bus(net, 20.0, name='added')
+        net.switch = net.switch.drop(index=[net.switch.index[0]])
+        change = NetworkChange.rows_modified('bus', [moved], columns=['geo'],
+                                             geometry=True)
+        change.merge(NetworkChange.rows_added('bus', [new]))
+        change.merge(NetworkChange.rows_removed('switch', [0]))
+        session.mark_dirty(change)
+
+        success, message, _ = session.write(backup=False)
+
+        self.assertTrue(success, message)
+        loaded = self.module.load_database(self.path)
+        self.assertEqual(loaded.bus.loc[untouched, 'name'], 'edited elsewhere')
+        self.assertEqual(loaded.bus.loc[new, 'name'], 'added')
+        self.assertEqual(loaded.bus.loc[moved, 'geo'],
+                         net.bus.loc[moved, 'geo'])
+        self.assertNotIn(0, loaded.switch.index)
+        self.assertEqual(self.module.describe_database(self.path)['bus'],
+                         len(net.bus))
+        self.assertEqual(self._query(
+            'SELECT minx, miny FROM rtree_bus_geom WHERE id = ?', int(moved)),
+            [(1.5, 2.5)])
+
+    def test_only_requested_tables_are_read(self):
+        """A lazy database network reads a table when it is asked for."""
+        lazy = self.lazy.open_lazy(self.path, 'power')
+
+        bus = lazy.table('bus')
+
+        self.assertTrue(bus.equals(self.net.bus))
+        self.assertNotIn('line', lazy.decoded())
+        self.assertNotIn('res_bus', lazy.decoded())
+
+    def test_other_geopackages_are_not_networks(self):
+        """A GeoPackage without a network is left to QGIS."""
+        path = os.path.join(os.path.dirname(self.path), 'roads.gpkg')
+        with sqlite3.connect(path) as connection:
+            connection.execute('CREATE TABLE roads (fid INTEGER PRIMARY KEY)')
+
+        self.assertIsNone(self.module.sniff_database_kind(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+# coding=utf-8
+"""Tests for decoding networks table by table.
+
+``network_decode.decode_network`` must return exactly the network
+``pandapower.from_json`` returns, or None where it cannot.
+``benchmark_network_decode.py`` compares their speed.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+"""
+
+import json
+import os
+import tempfile
+import unittest
+
+from .benchmark_network_decode import same_network
+from .test_network_session import load_session_module
+from .utilities import get_qgis_app
+
+QGIS_APP = get_qgis_app()
+
+
+@unittest.skipIf(os.environ.get('SKIP_PANDAPOWER_TESTS'),
+                 'pandapower tests disabled')
+class DecodeNetworkTest(unittest.TestCase):
+    """Test that decoding matches pandapower.from_json."""
+
+    @classmethod
+    def setUpClass(cls):
+        import importlib
+
+        load_session_module()
+        cls.module = importlib.import_module(
+            'pandapower_qgis_plugin.network_decode')
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def _write(self, net, name='net.json'):
+        import pandapower as pp
+
+        path = os.path.join(self.directory, name)
+        pp.to_json(net, path)
+        return path
+
+    def _assert_decodes_like_from_json(self, path):
+        import pandapower as pp
+
+        net = self.module.decode_network(path)
+
+        self.assertIsNotNone(net)
+        self.assertTrue(same_network(pp.from_json(path), net))
+        return net
+
+    def test_matches_from_json(self):
+        """Tables, dtypes, scalars and entry order are those of from_json."""
+        import pandapower as pp
+        import pandapower.networks as ppn
+
+        net = ppn.mv_oberrhein()
+        pp.runpp(net)
+
+        self._assert_decodes_like_from_json(self._write(net))
+
+    def test_objects_in_tables(self):
+        """Controllers, stored as objects inside a table, decode the same."""
+        import pandapower.networks as ppn
+        from pandapower.control import ContinuousTapControl
+
+        net = ppn.example_simple()
+        ContinuousTapControl(net, 0, 1.02)
+
+        decoded = self._assert_decodes_like_from_json(self._write(net))
+        self.assertIsInstance(decoded.controller.object.iloc[0],
+                              ContinuousTapControl)
+
+    def test_missing_scalars(self):
+        """NaN, which orjson does not accept, is read like from_json does."""
+        import pandapower.networks as ppn
+
+        net = ppn.example_simple()
+        net.f_hz = float('nan')
+
+        decoded = self._assert_decodes_like_from_json(self._write(net))
+        self.assertNotEqual(decoded.f_hz, decoded.f_hz)
+
+    def test_compressed_file(self):
+        """A .json.gz decodes to the network of the plain file."""
+        import gzip
+
+        import pandapower.networks as ppn
+
+        plain = self._write(ppn.example_multivoltage())
+        compressed = plain + '.gz'
+        with open(plain, 'rb') as source, gzip.open(compressed, 'wb') as target:
+            target.write(source.read())
+
+        self.assertTrue(same_network(self.module.decode_network(plain),
+                                     self.module.decode_network(compressed)))
+
+    def test_old_format_is_left_to_from_json(self):
+        """A file that needs convert_format is not decoded here."""
+        import pandapower.networks as ppn
+
+        path = self._write(ppn.example_simple())
+        with open(path) as handle:
+            document = json.load(handle)
+        document['_object']['format_version'] = '2.0.0'
+        with open(path, 'w') as handle:
+            json.dump(document, handle)
+
+        self.assertIsNone(self.module.decode_network(path))
+
+    def test_reused_empty_tables_are_copies(self):
+        """An empty table decoded before is not shared between networks."""
+        import pandapower as pp
+        import pandapower.networks as ppn
+
+        path = self._write(ppn.example_simple())
+        first = self.module.decode_network(path)
+        second = self.module.decode_network(path)
+        self.assertTrue(first.storage.empty)
+
+        pp.create_storage(first, first.bus.index[0], 1.0, 10.0)
+
+        self.assertTrue(second.storage.empty)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,215 @@
+# coding=utf-8
+"""Tests for merging an externally changed file into an open network.
+
+Applying the delta must leave the open network equal to the new file, report
+exactly the rows that changed, keep unsaved edits the file does not touch, and
+flag a conflict only where the file and the edits disagree.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+"""
+
+import copy
+import os
+import shutil
+import tempfile
+import unittest
+
+from .test_network_session import load_session_module
+from .utilities import get_qgis_app
+
+QGIS_APP = get_qgis_app()
+
+
+@unittest.skipIf(os.environ.get('SKIP_PANDAPOWER_TESTS'),
+                 'pandapower tests disabled')
+class NetworkDeltaTest(unittest.TestCase):
+    """Test diffing a session against new file content and applying it."""
+
+    @classmethod
+    def setUpClass(cls):
+        import importlib
+
+        import pandapower as pp
+        import pandapower.networks as ppn
+
+        cls.session_module = load_session_module()
+        cls.change_module = importlib.import_module(
+            'pandapower_qgis_plugin.network_change')
+        cls.net = ppn.mv_oberrhein()
+        pp.runpp(cls.net)
+        cls.session_module.add_vn_kv_to_lines(cls.net)
+
+    def setUp(self):
+        self.session_module.NetworkSession.clear()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'net.json')
+        with open(self.path, 'w') as handle:
+            handle.write('{}')
+        self.session = self.session_module.NetworkSession.acquire(
+            self.path, lambda: copy.deepcopy(self.net))
+        self.bus = self.net.bus.index[0]
+        self.other_bus = self.net.bus.index[1]
+
+    def tearDown(self):
+        self.session_module.NetworkSession.clear()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def changed_file(self):
+        """A copy of the network as another program would rewrite it."""
+        new = copy.deepcopy(self.net)
+        new.res_bus['vm_pu'] = new.res_bus['vm_pu'] * 1.01
+        new.bus.loc[self.other_bus, 'in_service'] = False
+        return new
+
+    def diff(self, new):
+        return self.session.diff_file(new.get, list(new.keys()))
+
+    def edit_bus_name(self):
+        change = self.change_module.NetworkChange
+        self.session.net.bus.loc[self.bus, 'name'] = 'edited'
+        self.session.mark_dirty()
+        self.session.record_change(
+            change.rows_modified('bus', [self.bus], columns=['name']))
+
+    def assert_matches(self, new):
+        from pandapower.toolbox import nets_equal
+
+        self.assertTrue(nets_equal(self.session.net, new,
+                                   check_only_results=False))
+
+    def test_unchanged_file_gives_an_empty_delta(self):
+        """A file equal to the open network changes nothing."""
+        delta = self.diff(copy.deepcopy(self.net))
+
+        self.assertTrue(delta.is_empty())
+        self.assertTrue(delta.change.is_empty())
+
+    def test_changed_cells_are_reported_and_applied(self):
+        """Only the changed rows and columns are reported."""
+        modified = self.change_module.MODIFIED
+        new = self.changed_file()
+
+        delta = self.diff(new)
+
+        self.assertEqual(delta.conflicts, [])
+        self.assertEqual(delta.change.rows(modified, 'bus'), {self.other_bus})
+        self.assertEqual(delta.change.modified_columns('bus'), {'in_service'})
+        self.assertEqual(delta.change.modified_columns('res_bus'), {'vm_pu'})
+        self.assertFalse(delta.change.touches('line'))
+        self.assertFalse(delta.change.geometry)
+        self.session.apply_delta(delta)
+        self.assert_matches(new)
+
+    def test_added_and_removed_rows(self):
+        """Rows the file gained or lost are added and dropped."""
+        import pandapower as pp
+
+        new = copy.deepcopy(self.net)
+        removed = new.load.index[0]
+        new.load = new.load.drop(index=removed)
+        added = pp.create_load(new, self.bus, p_mw=0.1)
+
+        delta = self.diff(new)
+        self.session.apply_delta(delta)
+
+        self.assertEqual(delta.change.rows(self.change_module.REMOVED, 'load'),
+                         {int(removed)})
+        self.assertEqual(delta.change.rows(self.change_module.ADDED, 'load'),
+                         {int(added)})
+        self.assertEqual(sorted(self.session.net.load.index),
+                         sorted(new.load.index))
+
+    def test_edits_elsewhere_are_kept(self):
+        """An edit the file does not touch survives the merge."""
+        self.edit_bus_name()
+        new = self.changed_file()
+
+        delta = self.diff(new)
+        self.session.apply_delta(delta)
+
+        self.assertEqual(delta.conflicts, [])
+        self.assertEqual(self.session.net.bus.at[self.bus, 'name'], 'edited')
+        self.assertFalse(self.session.net.bus.at[self.other_bus, 'in_service'])
+        self.assertTrue(self.session.dirty)
+
+    def test_edit_of_a_row_the_file_changed_conflicts(self):
+        """The file changing another column of an edited row is a conflict."""
+        self.edit_bus_name()
+        new = copy.deepcopy(self.net)
+        new.bus.loc[self.bus, 'in_service'] = False
+
+        delta = self.diff(new)
+
+        self.assertEqual(delta.conflicts, ['bus'])
+
+    def test_dirty_session_without_recorded_edits_conflicts(self):
+        """Unknown edits conflict with any difference."""
+        self.session.mark_dirty()
+
+        delta = self.diff(self.changed_file())
+
+        self.assertEqual(sorted(delta.conflicts), ['bus', 'res_bus'])
+
+    def test_reshaped_table_is_replaced(self):
+        """A table with a new column is taken over whole."""
+        new = copy.deepcopy(self.net)
+        new.bus['zone_name'] = 'north'
+
+        delta = self.diff(new)
+        self.session.apply_delta(delta)
+
+        self.assertIsNone(delta.change.rows(self.change_module.MODIFIED,
+                                            'bus'))
+        self.assertIn('zone_name', self.session.net.bus.columns)
+
+    def test_file_state_is_remembered(self):
+        """After the merge the file no longer counts as changed."""
+        import time
+
+        later = time.time() + 5
+        os.utime(self.path, (later, later))
+        self.assertTrue(self.session.file_changed_externally())
+
+        self.session.apply_delta(self.diff(self.changed_file()))
+
+        self.assertFalse(self.session.file_changed_externally())
+
+
+    def test_lazy_session_takes_over_the_new_file(self):
+        """A lazy session diffs its decoded tables and swaps networks."""
+        import importlib
+
+        import pandapower as pp
+
+        lazy_module = importlib.import_module(
+            'pandapower_qgis_plugin.network_lazy')
+        saved = lazy_module.LAZY_MIN_BYTES
+        lazy_module.LAZY_MIN_BYTES = 0
+        self.addCleanup(setattr, lazy_module, 'LAZY_MIN_BYTES', saved)
+
+        def open_lazy():
+            return lazy_module.open_lazy(path, 'power',
+                                         self.session_module.prepare_table)
+
+        path = os.path.join(self.directory, 'lazy.json')
+        pp.to_json(self.net, path)
+        session = self.session_module.NetworkSession.acquire(
+            path, lambda: self.fail('loaded in full'), lazy_loader=open_lazy)
+        session.table('bus')
+        pp.to_json(self.changed_file(), path)
+        new = open_lazy()
+
+        delta = session.diff_file(new.table, new.names())
+
+        self.assertEqual(delta.change.tables, {'bus'})
+        self.assertNotIn('res_bus', new.decoded())
+        self.assertTrue(session.apply_delta(delta, lazy=new))
+        self.assertIs(session.lazy, new)
+        self.assertFalse(session.table('bus').at[self.other_bus, 'in_service'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+# coding=utf-8
+"""Tests for network indexes.
+
+An index built from the raw file must describe the network exactly as the
+loaded network would, and must only be rebuilt when the file changes.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+"""
+
+import os
+import tempfile
+import time
+import unittest
+import unittest.mock
+
+from .test_network_session import load_session_module
+from .utilities import get_qgis_app
+
+QGIS_APP = get_qgis_app()
+
+try:
+    import pyarrow  # noqa: F401
+    HAVE_PYARROW = True
+except ImportError:
+    HAVE_PYARROW = False
+
+
+@unittest.skipIf(os.environ.get('SKIP_PANDAPOWER_TESTS'),
+                 'pandapower tests disabled')
+class NetworkIndexTest(unittest.TestCase):
+    """Test building, comparing and caching indexes."""
+
+    @classmethod
+    def setUpClass(cls):
+        import importlib
+
+        import pandapower as pp
+        import pandapower.networks as ppn
+
+        load_session_module()
+        cls.module = importlib.import_module(
+            'pandapower_qgis_plugin.network_index')
+        cls.net = ppn.mv_oberrhein()
+        pp.runpp(cls.net)
+
+    def setUp(self):
+        import pandapower as pp
+
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'net.json')
+        pp.to_json(self.net, self.path)
+        self.module.forget()
+        self.module.configure(os.path.join(self.directory, 'index'))
+
+    def tearDown(self):
+        self.module.configure(None)
+        self.module.forget()
+
+    def test_scan_matches_the_loaded_network(self):
+        """The index read off the bytes equals the one of the loaded net."""
+        index = self.module.build_index(self.path, 'power')
+        expected = self.module.NetworkIndex.from_net(self.net, 'power')
+
+        self.assertEqual(index.to_dict(), expected.to_dict())
+
+    def test_row_counts_and_levels(self):
+        """Tables are counted in full and per voltage level."""
+        index = self.module.build_index(self.path, 'power')
+        bus = self.net.bus
+
+        self.assertEqual(index.row_count('line'), len(self.net.line))
+        self.assertEqual(index.row_count('res_bus'), len(self.net.res_bus))
+        self.assertEqual(index.levels('bus'), sorted(bus.vn_kv.unique()))
+        for level in index.levels('line'):
+            at_level = bus.index[bus.vn_kv == level]
+            self.assertEqual(index.row_count('line', level),
+                             int(self.net.line.from_bus.isin(at_level).sum()))
+
+    def test_bbox_covers_the_buses(self):
+        """The bounding box spans every bus coordinate."""
+        import json
+
+        points = [json.loads(value)['coordinates']
+                  for value in self.net.bus.geo.dropna()]
+        xs = [point[0] for point in points]
+        ys = [point[1] for point in points]
+
+        bbox = self.module.build_index(self.path, 'power').bbox
+
+        self.assertEqual(tuple(bbox), (min(xs), min(ys), max(xs), max(ys)))
+
+    def test_unchanged_file_is_not_read_again(self):
+        """A stored index is reused until the file's state changes."""
+        first = self.module.read_index(self.path, 'power')
+        self.module.forget()
+
+        with unittest.mock.patch.object(
+                self.module, 'build_index',
+                side_effect=AssertionError('index rebuilt')):
+            reused = self.module.read_index(self.path, 'power')
+        self.assertEqual(reused.to_dict(), first.to_dict())
+
+        later = time.time() + 5
+        os.utime(self.path, (later, later))
+        with unittest.mock.patch.object(
+                self.module, 'build_index',
+                wraps=self.module.build_index) as build:
+            self.module.read_index(self.path, 'power')
+        build.assert_called_once()
+
+    def test_old_format_is_flagged(self):
+        """A file that needs format conversion is marked as legacy."""
+        from .test_network_cache import write_old_format
+
+        self.assertFalse(self.module.read_index(self.path, 'power').legacy)
+
+        old = os.path.join(self.directory, 'old.json')
+        write_old_format(old)
+        self.assertTrue(self.module.read_index(old, 'power').legacy)
+
+    @unittest.skipUnless(HAVE_PYARROW, 'pyarrow is not installed')
+    def test_store_index_matches_the_loaded_network(self):
+        """A .ppnet store is indexed from its manifest and two tables."""
+        import importlib
+
+        store = importlib.import_module('pandapower_qgis_plugin.network_store')
+        path = os.path.join(self.directory, 'net.ppnet')
+        store.write_store(self.net, path)
+
+        index = self.module.build_index(path, 'power')
+        expected = self.module.NetworkIndex.from_net(self.net, 'power')
+
+        self.assertEqual(index.to_dict(), expected.to_dict())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,230 @@
+# coding=utf-8
+"""Tests for the streamed, atomic network writer.
+
+A save must produce exactly the file ``pandapower.to_json`` would, and must
+never leave a truncated network behind when it fails half way.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+"""
+
+import os
+import tempfile
+import unittest
+
+from .test_network_session import load_session_module
+from .utilities import get_qgis_app
+
+QGIS_APP = get_qgis_app()
+
+
+class AtomicWriteTest(unittest.TestCase):
+    """Test the temp-file swap, independently of pandapower."""
+
+    @classmethod
+    def setUpClass(cls):
+        import importlib
+
+        load_session_module()
+        cls.module = importlib.import_module(
+            'pandapower_qgis_plugin.network_io')
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'net.json')
+        with open(self.path, 'w') as handle:
+            handle.write('original')
+
+    def test_replaces_the_file(self):
+        """The new content replaces the old one."""
+        self.module.atomic_write(self.path, lambda stream: stream.write('new'))
+
+        with open(self.path) as handle:
+            self.assertEqual(handle.read(), 'new')
+        self.assertEqual(os.listdir(self.directory), ['net.json'])
+
+    def test_failure_keeps_the_original(self):
+        """A writer that fails half way leaves the old file and no temp file."""
+        def failing(stream):
+            stream.write('half')
+            raise RuntimeError('disk full')
+
+        with self.assertRaises(RuntimeError):
+            self.module.atomic_write(self.path, failing)
+
+        with open(self.path) as handle:
+            self.assertEqual(handle.read(), 'original')
+        self.assertEqual(os.listdir(self.directory), ['net.json'])
+
+    @unittest.skipIf(os.name == 'nt', 'POSIX permission bits')
+    def test_permissions_are_kept(self):
+        """The replacement keeps the mode of the file it replaces."""
+        os.chmod(self.path, 0o640)
+
+        self.module.atomic_write(self.path, lambda stream: stream.write('new'))
+
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o640)
+
+
+@unittest.skipIf(os.environ.get('SKIP_PANDAPOWER_TESTS'),
+                 'pandapower tests disabled')
+class StreamedJsonTest(unittest.TestCase):
+    """Test that streaming does not change the file format."""
+
+    @classmethod
+    def setUpClass(cls):
+        import importlib
+
+        load_session_module()
+        cls.module = importlib.import_module(
+            'pandapower_qgis_plugin.network_io')
+
+    def test_output_matches_pandapower(self):
+        """The streamed file is byte-identical to pandapower.to_json."""
+        import pandapower as pp
+        import pandapower.networks as ppn
+
+        net = ppn.mv_oberrhein()
+        pp.runpp(net)
+        directory = tempfile.mkdtemp()
+        expected = os.path.join(directory, 'expected.json')
+        actual = os.path.join(directory, 'actual.json')
+
+        pp.to_json(net, expected)
+        self.module.write_network(net, actual)
+
+        with open(expected, 'rb') as first, open(actual, 'rb') as second:
+            self.assertEqual(first.read(), second.read())
+
+    def test_progress_is_reported_per_table(self):
+        """Progress rises to 1.0, and raising from it aborts the write."""
+        import pandapower.networks as ppn
+
+        net = ppn.example_simple()
+        path = os.path.join(tempfile.mkdtemp(), 'net.json')
+        seen = []
+
+        self.module.write_network(net, path, progress=seen.append)
+        self.assertEqual(seen, sorted(seen))
+        self.assertEqual(seen[-1], 1.0)
+
+        def cancel(fraction):
+            if fraction > 0.5:
+                raise InterruptedError
+
+        with open(path, 'rb') as handle:
+            before = handle.read()
+        net.bus.loc[0, 'name'] = 'changed'
+        with self.assertRaises(InterruptedError):
+            self.module.write_network(net, path, progress=cancel)
+        with open(path, 'rb') as handle:
+            self.assertEqual(handle.read(), before)
+
+    def test_snapshot_is_independent_of_later_edits(self):
+        """Editing the live network does not change a snapshot being written."""
+        import pandapower.networks as ppn
+
+        net = ppn.example_simple()
+        snapshot = self.module.snapshot_network(net)
+        net.bus.loc[0, 'name'] = 'edited after snapshot'
+
+        self.assertIs(type(snapshot), type(net))
+        self.assertNotEqual(snapshot.bus.loc[0, 'name'], 'edited after snapshot')
+
+
+@unittest.skipIf(os.environ.get('SKIP_PANDAPOWER_TESTS'),
+                 'pandapower tests disabled')
+class SplicedWriteTest(unittest.TestCase):
+    """Test that a save encodes only the tables that changed."""
+
+    @classmethod
+    def setUpClass(cls):
+        import importlib
+
+        load_session_module()
+        cls.module = importlib.import_module(
+            'pandapower_qgis_plugin.network_io')
+
+    def setUp(self):
+        import pandapower as pp
+        import pandapower.networks as ppn
+
+        self.net = ppn.example_simple()
+        pp.runpp(self.net)
+        self.directory = tempfile.mkdtemp()
+
+    def _read(self, path):
+        with open(path, 'rb') as handle:
+            return handle.read()
+
+    def test_spliced_file_matches_a_full_write(self):
+        """Copying unchanged tables gives the bytes a full write would."""
+        path = os.path.join(self.directory, 'net.json')
+        expected = os.path.join(self.directory, 'expected.json')
+        self.module.write_network(self.net, path)
+
+        self.net.bus.loc[0, 'name'] = 'edited'
+        self.module.write_network(self.net, path, changed={'bus'})
+        self.module.write_network(self.net, expected)
+
+        self.assertEqual(self._read(path), self._read(expected))
+
+    def test_unchanged_tables_are_copied_not_encoded(self):
+        """A table not named as changed keeps its bytes from the file."""
+        path = os.path.join(self.directory, 'net.json')
+        self.module.write_network(self.net, path)
+
+        # Not reported as changed, so this edit must not reach the file.
+        self.net.res_bus.loc[0, 'vm_pu'] = 0.5
+        self.net.bus.loc[0, 'name'] = 'edited'
+        self.module.write_network(self.net, path, changed={'bus'})
+
+        import pandapower as pp
+        written = pp.from_json(path)
+        self.assertEqual(written.bus.loc[0, 'name'], 'edited')
+        self.assertNotEqual(written.res_bus.loc[0, 'vm_pu'], 0.5)
+
+        # Unknown changes encode everything.
+        self.module.write_network(self.net, path, changed=None)
+        self.assertEqual(pp.from_json(path).res_bus.loc[0, 'vm_pu'], 0.5)
+
+    def test_compressed_file_is_spliced(self):
+        """A gzip file is spliced too, and stays compressed."""
+        import gzip
+
+        path = os.path.join(self.directory, 'net.json.gz')
+        expected = os.path.join(self.directory, 'expected.json')
+        self.module.write_network(self.net, path)
+
+        self.net.line.loc[0, 'length_km'] = 9.0
+        self.module.write_network(self.net, path, changed={'line'})
+        self.module.write_network(self.net, expected)
+
+        with gzip.open(path, 'rb') as handle:
+            self.assertEqual(handle.read(), self._read(expected))
+
+    def test_old_format_file_is_written_in_full(self):
+        """Tables of a file in an older format are not copied into a new one."""
+        import json
+
+        path = os.path.join(self.directory, 'net.json')
+        expected = os.path.join(self.directory, 'expected.json')
+        self.module.write_network(self.net, path)
+        with open(path) as handle:
+            document = json.load(handle)
+        document['_object']['format_version'] = '2.0.0'
+        document['_object']['line']['_object'] = document['_object'][
+            'line']['_object'].replace('length_km', 'length_old')
+        with open(path, 'w') as handle:
+            json.dump(document, handle)
+
+        self.module.write_network(self.net, path, changed={'bus'})
+        self.module.write_network(self.net, expected)
+
+        self.assertEqual(self._read(path), self._read(expected))
+
+
+if __name__ == '__main__':
+    unittest.main()
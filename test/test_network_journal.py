@@ -0,0 +1,159 @@
+# coding=utf-8
+"""Tests for the write-ahead journal of committed edits.
+
+A journal must bring a freshly loaded network back to the state it had when
+the edits were committed, and must never be applied to a file it was not
+written for.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+"""
+
+import os
+import tempfile
+import unittest
+
+from .test_network_session import load_session_module
+from .utilities import get_qgis_app
+
+QGIS_APP = get_qgis_app()
+
+
+@unittest.skipIf(os.environ.get('SKIP_PANDAPOWER_TESTS'),
+                 'pandapower tests disabled')
+class NetworkJournalTest(unittest.TestCase):
+    """Test appending, replaying and setting journals aside."""
+
+    @classmethod
+    def setUpClass(cls):
+        import importlib
+
+        cls.NetworkSession = load_session_module().NetworkSession
+        cls.journal = importlib.import_module(
+            'pandapower_qgis_plugin.network_journal')
+        cls.change = importlib.import_module(
+            'pandapower_qgis_plugin.network_change')
+
+    def setUp(self):
+        import pandapower as pp
+        import pandapower.networks as ppn
+
+        self.NetworkSession.clear()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'net.json')
+        pp.to_json(ppn.example_simple(), self.path)
+        self.journal.configure(True)
+
+    def tearDown(self):
+        self.journal.configure(False)
+        self.NetworkSession.clear()
+
+    def _edit(self, net):
+        """Modify, add and remove rows, as layer edits would.
+
+        :param net: The network to edit.
+        :returns: NetworkChange describing the edits.
+        """
+        import pandapower as pp
+
+        NetworkChange = self.change.NetworkChange
+        net.bus.loc[1, 'name'] = 'renamed'
+        net.line.loc[0, 'geo'] = '{"type": "LineString", ' \
+            '"coordinates": [[1.0, 2.0], [3.0, 4.5]]}'
+        new = pp.create_bus(net, 20.0, name='added')
+        net.switch = net.switch.drop(index=[0])
+
+        change = NetworkChange.rows_modified('bus', [1], columns=['name'])
+        change.merge(NetworkChange.rows_modified(
+            'line', [0], columns=['geo'], geometry=True))
+        change.merge(NetworkChange.rows_added('bus', [new]))
+        change.merge(NetworkChange.rows_removed('switch', [0]))
+        return change
+
+    def _load(self):
+        import pandapower as pp
+
+        return pp.from_json(self.path)
+
+    def test_replay_restores_the_committed_edits(self):
+        """Modified, added and removed rows come back, dtypes included."""
+        edited = self._load()
+        change = self._edit(edited)
+
+        self.assertTrue(self.journal.append(self.path, edited, change))
+        net = self._load()
+        replayed = self.journal.replay(self.path, net)
+
+        self.assertEqual(replayed.tables, {'bus', 'line', 'switch'})
+        for table in ('bus', 'line', 'switch'):
+            self.assertTrue(net[table].equals(edited[table]), table)
+            self.assertTrue(net[table].dtypes.equals(edited[table].dtypes))
+
+    def test_torn_last_line_is_ignored(self):
+        """A commit cut off by a crash is dropped; earlier ones apply."""
+        edited = self._load()
+        self.journal.append(self.path, edited, self._edit(edited))
+        with open(self.journal.journal_path(self.path), 'a') as handle:
+            handle.write('{"tables": {"bus": {"removed": [0')
+
+        net = self._load()
+        self.journal.replay(self.path, net)
+
+        self.assertEqual(net.bus.loc[1, 'name'], 'renamed')
+        self.assertIn(0, net.bus.index)
+
+    def test_journal_of_another_file_state_is_set_aside(self):
+        """After the file was rewritten, the journal is not applied."""
+        import pandapower as pp
+
+        edited = self._load()
+        self.journal.append(self.path, edited, self._edit(edited))
+        pp.to_json(self._load(), self.path)
+        os.utime(self.path, ns=(1, 1))
+
+        net = self._load()
+
+        self.assertIsNone(self.journal.replay(self.path, net))
+        self.assertNotEqual(net.bus.loc[1, 'name'], 'renamed')
+        self.assertFalse(self.journal.has_journal(self.path))
+        self.assertTrue(os.path.exists(self.journal.journal_path(self.path)
+                                       + self.journal.STALE_SUFFIX))
+
+    def test_whole_table_changes_are_not_journaled(self):
+        """A power flow's results go to the file, not the journal."""
+        net = self._load()
+        change = self.change.NetworkChange.results_changed(net)
+
+        self.assertFalse(self.journal.append(self.path, net, change))
+        self.assertFalse(self.journal.has_journal(self.path))
+
+    def test_session_journals_and_recovers_edits(self):
+        """A journaled commit leaves the file alone and survives a restart."""
+        with open(self.path, 'rb') as handle:
+            original = handle.read()
+        session = self.NetworkSession.acquire(self.path, self._load)
+        session.mark_dirty(self._edit(session.net))
+
+        self.assertTrue(session.append_journal())
+        self.assertFalse(session.edits_at_risk())
+        with open(self.path, 'rb') as handle:
+            self.assertEqual(handle.read(), original)
+
+        self.NetworkSession.clear()  # QGIS crashed
+        session = self.NetworkSession.acquire(self.path, self._load)
+
+        self.assertTrue(session.dirty)
+        self.assertFalse(session.edits_at_risk())
+        self.assertEqual(session.dirty_tables, {'bus', 'line', 'switch'})
+        self.assertEqual(session.net.bus.loc[1, 'name'], 'renamed')
+
+        success, message, _ = session.write(backup=False)
+        self.assertTrue(success, message)
+        self.assertFalse(self.journal.has_journal(self.path))
+        self.assertEqual(self._load().bus.loc[1, 'name'], 'renamed')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+# coding=utf-8
+"""Tests for lazily opened networks.
+
+A lazy network must decode only the tables that are asked for, and once
+completed must equal what a full load of the same file returns.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+"""
+
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from .test_network_session import load_session_module
+from .utilities import get_qgis_app
+
+QGIS_APP = get_qgis_app()
+
+
+@unittest.skipIf(os.environ.get('SKIP_PANDAPOWER_TESTS'),
+                 'pandapower tests disabled')
+class LazyNetworkTest(unittest.TestCase):
+    """Test the byte scan, on-demand decoding and the session integration."""
+
+    @classmethod
+    def setUpClass(cls):
+        import importlib
+
+        import pandapower as pp
+        import pandapower.networks as ppn
+
+        cls.session_module = load_session_module()
+        cls.module = importlib.import_module(
+            'pandapower_qgis_plugin.network_lazy')
+        cls.net = ppn.mv_oberrhein()
+        pp.runpp(cls.net)
+
+    def setUp(self):
+        import pandapower as pp
+
+        self.session_module.NetworkSession.clear()
+        self.saved_threshold = self.module.LAZY_MIN_BYTES
+        self.module.LAZY_MIN_BYTES = 0
+        self.path = os.path.join(tempfile.mkdtemp(), 'net.json')
+        pp.to_json(self.net, self.path)
+
+    def tearDown(self):
+        self.module.LAZY_MIN_BYTES = self.saved_threshold
+        self.session_module.NetworkSession.clear()
+
+    def open(self, path=None):
+        return self.module.open_lazy(path or self.path, 'power',
+                                     self.session_module.prepare_table)
+
+    def full_load(self):
+        import pandapower as pp
+
+        net = pp.from_json(self.path)
+        self.session_module.add_vn_kv_to_lines(net)
+        return net
+
+    def test_spans_hold_the_entries(self):
+        """Each scanned span decodes to the entry of the same name."""
+        spans = self.module.scan_entries(self.path)
+        with open(self.path, 'rb') as handle:
+            document = json.load(handle)['_object']
+
+        self.assertEqual(list(spans), list(document))
+        with open(self.path, 'rb') as handle:
+            start, end = spans['f_hz']
+            handle.seek(start)
+            self.assertEqual(json.loads(handle.read(end - start)),
+                             document['f_hz'])
+
+    def test_only_requested_tables_are_decoded(self):
+        """Reading the bus table leaves every other table undecoded."""
+        lazy = self.open()
+
+        bus = lazy.table('bus')
+
+        self.assertEqual(len(bus), len(self.net.bus))
+        decoded = set(lazy.decoded())
+        self.assertIn('bus', decoded)
+        self.assertNotIn('line', decoded)
+        self.assertNotIn('res_bus', decoded)
+        self.assertNotIn('std_types', decoded)
+
+    def test_line_table_gets_its_voltage_level(self):
+        """A line table decoded alone carries vn_kv, as after a full load."""
+        line = self.open().table('line')
+
+        self.assertTrue(line['vn_kv'].equals(self.full_load().line['vn_kv']))
+
+    def test_materialized_network_equals_a_full_load(self):
+        """Completing the network gives exactly what from_json gives."""
+        from pandapower.toolbox import nets_equal
+
+        lazy = self.open()
+        lazy.table('line')
+        net = lazy.materialize()
+        expected = self.full_load()
+
+        self.assertEqual(list(net.keys()), list(expected.keys()))
+        self.assertTrue(nets_equal(net, expected, check_only_results=False))
+
+    def test_compact_documents_are_scanned(self):
+        """The scan does not rely on pandapower's indentation."""
+        with open(self.path) as handle:
+            document = json.load(handle)
+        compact = os.path.join(os.path.dirname(self.path), 'compact.json')
+        with open(compact, 'w') as handle:
+            json.dump(document, handle, separators=(',', ':'))
+
+        bus = self.open(compact).table('bus')
+
+        self.assertTrue(bus.index.equals(self.net.bus.index))
+
+    def test_older_formats_are_loaded_fully(self):
+        """A file that needs conversion is not opened lazily."""
+        with open(self.path) as handle:
+            document = json.load(handle)
+        document['_object']['format_version'] = '2.0.0'
+        with open(self.path, 'w') as handle:
+            json.dump(document, handle)
+
+        self.assertIsNone(self.open())
+
+    def test_changed_file_is_reported(self):
+        """Decoding from a file that changed on disk raises."""
+        lazy = self.open()
+        later = time.time() + 5
+        os.utime(self.path, (later, later))
+
+        with self.assertRaises(self.module.StaleNetworkError):
+            lazy.table('line')
+
+    def test_session_stays_lazy_until_the_net_is_needed(self):
+        """table() keeps the session lazy; reading net completes it."""
+        def loader():
+            raise AssertionError('a lazy open must not run the full loader')
+
+        session = self.session_module.NetworkSession.acquire(
+            self.path, loader, lazy_loader=self.open)
+
+        self.assertIsNotNone(session.lazy)
+        self.assertEqual(len(session.table('bus')), len(self.net.bus))
+        self.assertIsNotNone(session.lazy)
+
+        bus = session.table('bus')
+        self.assertIs(session.net.bus, bus)
+        self.assertIsNone(session.lazy)
+        self.assertTrue(session.has_network())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+# coding=utf-8
+"""Tests for preloading the networks of a project.
+
+Opening a project should find every network its pandapower layers use, once
+per file, straight from the project file, and load each one the way a layer
+would.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+"""
+
+import os
+import re
+import tempfile
+import unittest
+import zipfile
+
+from .test_network_session import load_session_module
+from .utilities import get_qgis_app
+
+QGIS_APP = get_qgis_app()
+
+PROJECT = """<!DOCTYPE qgis PUBLIC 'http://mrcc.com/qgis.dtd' 'SYSTEM'>
+<qgis version="3.44.0" projectname="regional">
+  <projectlayers>
+    <maplayer type="vector">
+      <id>bus_1</id>
+      <datasource>path="{first}";table="bus";level="20.0";epsg="4326"</datasource>
+      <provider encoding="UTF-8">PandapowerProvider</provider>
+    </maplayer>
+    <maplayer type="vector">
+      <id>roads</id>
+      <datasource>{first}|layername=roads</datasource>
+      <provider encoding="UTF-8">ogr</provider>
+    </maplayer>
+    <maplayer type="vector">
+      <id>line_1</id>
+      <datasource>path="{first}";table="line";level="20.0";epsg="4326"</datasource>
+      <provider encoding="UTF-8">PandapowerProvider</provider>
+    </maplayer>
+    <maplayer type="vector">
+      <id>bus_2</id>
+      <datasource>path="{second}";network_type="bus";epsg="31467"</datasource>
+      <provider encoding="UTF-8">PandapowerProvider</provider>
+    </maplayer>
+  </projectlayers>
+</qgis>
+"""
+
+
+def decode(uri):
+    """Decode a layer URI as the provider metadata and decode_uri do."""
+    from pandapower_qgis_plugin.pandapower_uri import decode_uri
+
+    return decode_uri(dict(re.findall(r'(\w+)="((?:\\"|[^"])*)"', uri)))
+
+
+@unittest.skipIf(os.environ.get('SKIP_PANDAPOWER_TESTS'),
+                 'pandapower tests disabled')
+class PreloadTest(unittest.TestCase):
+    """Test reading a project's networks and loading them."""
+
+    @classmethod
+    def setUpClass(cls):
+        import importlib
+
+        load_session_module()
+        cls.module = importlib.import_module(
+            'pandapower_qgis_plugin.network_preload')
+
+    def setUp(self):
+        import pandapower as pp
+        import pandapower.networks as ppn
+
+        self.directory = tempfile.mkdtemp()
+        self.first = os.path.join(self.directory, 'first.json')
+        self.second = os.path.join(self.directory, 'second.json')
+        pp.to_json(ppn.example_simple(), self.first)
+        pp.to_json(ppn.mv_oberrhein(), self.second)
+
+    def tearDown(self):
+        self.module.shutdown_pool()
+
+    def _write_project(self, name):
+        path = os.path.join(self.directory, name)
+        document = PROJECT.format(first=self.first, second=self.second)
+        if name.endswith('.qgz'):
+            with zipfile.ZipFile(path, 'w') as archive:
+                archive.writestr('regional.qgs', document)
+        else:
+            with open(path, 'w') as handle:
+                handle.write(document)
+        return path
+
+    def test_sources_are_read_from_the_project(self):
+        """Only pandapower layers are listed, from .qgs and .qgz alike."""
+        for name in ('regional.qgs', 'regional.qgz'):
+            sources = self.module.project_layer_sources(
+                self._write_project(name))
+
+            self.assertEqual(len(sources), 3, name)
+            self.assertTrue(all('table=' in source or 'network_type=' in source
+                                for source in sources))
+
+    def test_each_network_is_listed_once(self):
+        """Layers of one file share an entry; old URI keys are understood."""
+        sources = self.module.project_layer_sources(
+            self._write_project('regional.qgz'))
+
+        networks = self.module.project_networks(sources, decode)
+
+        self.assertEqual(networks, [
+            (self.first, 'power', 4326),
+            (self.second, 'power', 31467),
+        ])
+
+    def test_relative_sources_resolve_against_the_project(self):
+        """A source saved relative to the project names the file next to it."""
+        sources = ['path="./first.json";table="bus";epsg="4326"',
+                   'path="../elsewhere/second.json";table="bus"']
+        project = os.path.join(self.directory, 'regional.qgz')
+
+        networks = self.module.project_networks(sources, decode, project)
+
+        self.assertEqual(networks, [
+            (self.first, 'power', 4326),
+            (os.path.join(os.path.dirname(self.directory), 'elsewhere',
+                          'second.json'), 'power', 4326),
+        ])
+
+    def test_load_matches_a_layer_load(self):
+        """Worker or not, the loaded network is the one a layer would get."""
+        import pandapower as pp
+        from pandapower.toolbox import nets_equal
+
+        expected = pp.from_json(self.second)
+        load_session_module().add_vn_kv_to_lines(expected)
+        limit = self.module.PROCESS_MIN_BYTES
+        self.module.PROCESS_MIN_BYTES = 0
+        try:
+            net = self.module.load_network(self.second, 'power')
+        finally:
+            self.module.PROCESS_MIN_BYTES = limit
+
+        self.assertTrue(nets_equal(net, expected))
+
+    def test_worker_result_unpickles(self):
+        """A table decoded in a worker arrives whole."""
+        import importlib
+        import pickle
+
+        import pandapower as pp
+
+        network_decode = importlib.import_module(
+            'pandapower_qgis_plugin.network_decode')
+        net = pp.from_json(self.first)
+        entry = network_decode.parse_document(
+            pp.to_json(net))['_object']['line']
+
+        table = pickle.loads(pickle.dumps(network_decode.decode_table(entry)))
+
+        self.assertTrue(table.equals(net.line))
+        self.assertTrue(table.dtypes.equals(net.line.dtypes))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+# coding=utf-8
+"""Tests for what-if scenarios forked copy-on-write off a network.
+
+A scenario must share every table it has not changed with the network it was
+forked from, must never let an edit reach the other side, and must come back
+from its saved tables on top of the network file.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+"""
+
+import os
+import tempfile
+import unittest
+
+from .test_network_session import load_session_module
+from .utilities import get_qgis_app
+
+QGIS_APP = get_qgis_app()
+
+
+@unittest.skipIf(os.environ.get('SKIP_PANDAPOWER_TESTS'),
+                 'pandapower tests disabled')
+class NetworkScenarioTest(unittest.TestCase):
+    """Test forking, copy-on-write editing and saving of scenarios."""
+
+    @classmethod
+    def setUpClass(cls):
+        import importlib
+
+        cls.NetworkSession = load_session_module().NetworkSession
+        cls.module = importlib.import_module(
+            'pandapower_qgis_plugin.network_scenario')
+        cls.change = importlib.import_module(
+            'pandapower_qgis_plugin.network_change')
+
+    def setUp(self):
+        import pandapower as pp
+        import pandapower.networks as ppn
+
+        self.NetworkSession.clear()
+        self.path = os.path.join(tempfile.mkdtemp(), 'grid.json')
+        pp.to_json(ppn.mv_oberrhein(), self.path)
+        self.base = self.NetworkSession.acquire(self.path, self._load)
+
+    def tearDown(self):
+        self.NetworkSession.clear()
+
+    def _load(self):
+        import pandapower as pp
+
+        return pp.from_json(self.path)
+
+    def _tables(self, net):
+        return [name for name, value in net.items()
+                if not name.startswith('_') and hasattr(value, 'columns')]
+
+    def test_fork_shares_every_table(self):
+        """Ten forks hold no table of their own until they edit one."""
+        forks = [self.base.fork('variant {}'.format(number))
+                 for number in range(10)]
+
+        for fork in forks:
+            for name in self._tables(self.base.net):
+                self.assertIs(fork.net[name], self.base.net[name], name)
+            self.assertEqual(fork.memory_usage(), 0)
+        self.assertEqual(self.NetworkSession.get(
+            self.path, scenario='variant 3'), forks[3])
+
+    def test_edits_stay_on_their_side(self):
+        """Only the edited table is copied, in either direction."""
+        fork = self.base.fork('feeder')
+        bus = fork.net.bus.index[0]
+        original = self.base.net.bus.loc[bus, 'name']
+
+        self.assertEqual(fork.own(['bus', 'line']), ['bus', 'line'])
+        fork.net.bus.at[bus, 'name'] = 'scenario'
+        self.base.own(['load'])
+        self.base.net.load.at[self.base.net.load.index[0], 'p_mw'] = 99.0
+
+        self.assertEqual(self.base.net.bus.loc[bus, 'name'], original)
+        self.assertNotEqual(fork.net.load.iloc[0]['p_mw'], 99.0)
+        self.assertIs(fork.net.trafo, self.base.net.trafo)
+        self.assertEqual(fork.own(['bus']), [])  # Owned already
+
+    def test_deletion_and_power_flow_copy_what_they_touch(self):
+        """Dropped rows and results stay in the scenario; the rest is shared."""
+        import pandapower as pp
+        from pandapower.toolbox import drop_lines
+
+        fork = self.base.fork('outage')
+        line = fork.net.line.index[0]
+        results = self.base.net.res_bus.copy()
+
+        with fork.detached():
+            drop_lines(fork.net, [line])
+        fork.own(self.change.result_tables(fork.net))
+        with fork.detached():
+            pp.runpp(fork.net)
+
+        self.assertIn(line, self.base.net.line.index)
+        self.assertNotIn(line, fork.net.line.index)
+        self.assertTrue(self.base.net.res_bus.equals(results))
+        self.assertIs(fork.net.bus, self.base.net.bus)
+        self.assertIs(fork.net.trafo, self.base.net.trafo)
+
+    def test_saved_scenario_reopens_on_top_of_the_file(self):
+        """A commit saves the scenario's tables only, not the network file."""
+        NetworkChange = self.change.NetworkChange
+        with open(self.path, 'rb') as handle:
+            original = handle.read()
+        fork = self.NetworkSession.acquire(self.path, self._load,
+                                           scenario='feeder')
+        bus = fork.net.bus.index[0]
+        fork.own(['bus'])
+        fork.net.bus.at[bus, 'name'] = 'scenario'
+        fork.mark_dirty(NetworkChange.rows_modified('bus', [bus],
+                                                    columns=['name']))
+
+        success, message, _ = fork.write()
+
+        self.assertTrue(success, message)
+        self.assertFalse(fork.dirty)
+        with open(self.path, 'rb') as handle:
+            self.assertEqual(handle.read(), original)
+        saved = self.module.read_scenario(
+            self.module.scenario_path(self.path, 'feeder'))
+        self.assertEqual(list(saved), ['bus'])
+        self.assertEqual(self.module.list_scenarios(self.path), ['feeder'])
+
+        self.NetworkSession.clear()
+        reopened = self.NetworkSession.acquire(self.path, self._load,
+                                               scenario='feeder')
+        base = self.NetworkSession.get(self.path)
+
+        self.assertEqual(reopened.table('bus').loc[bus, 'name'], 'scenario')
+        self.assertNotEqual(base.net.bus.loc[bus, 'name'], 'scenario')
+        self.assertIs(reopened.net.line, base.net.line)
+
+    def test_scenario_holds_its_network(self):
+        """The file's session stays open while a scenario uses it."""
+        fork = self.NetworkSession.acquire(self.path, self._load,
+                                           scenario='feeder')
+        self.base.release()
+
+        self.assertTrue(self.base.in_use())
+        fork.release()
+        fork.drop()
+        self.assertFalse(self.base.in_use())
+
+    def test_invalid_names_are_refused(self):
+        """A name that is not a safe file name raises ValueError."""
+        for name in ('', '../grid', 'a/b'):
+            with self.assertRaises(ValueError):
+                self.base.fork(name)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -81,6 +81,7 @@ class NetworkSessionTest(unittest.TestCase):
 
     def tearDown(self):
         self.NetworkSession.clear()
+        self.module.configure_pool(self.module.DEFAULT_POOL_BUDGET)
         if os.path.exists(self.path):
             os.remove(self.path)
 
@@ -135,6 +136,7 @@ class NetworkSessionTest(unittest.TestCase):
 
     def test_release_is_reference_counted(self):
         """The session survives until the last user releases it."""
+        self.module.configure_pool(0)
         first = self._acquire()
         self._acquire()
 
@@ -146,6 +148,7 @@ class NetworkSessionTest(unittest.TestCase):
 
     def test_reacquire_after_release_reloads(self):
         """Once dropped, the next acquisition loads the file again."""
+        self.module.configure_pool(0)
         session = self._acquire()
         session.release()
 
@@ -180,7 +183,7 @@ class NetworkSessionTest(unittest.TestCase):
         notified = []
 
         class Provider:
-            def on_session_changed(self):
+            def on_session_changed(self, change=None):
                 notified.append(self)
 
         source, other = Provider(), Provider()
@@ -191,6 +194,60 @@ class NetworkSessionTest(unittest.TestCase):
 
         self.assertEqual(notified, [other])
 
+    def test_notify_changed_carries_the_change(self):
+        """Providers receive what changed, and nothing for an empty change."""
+        session = self._acquire()
+        received = []
+
+        class Provider:
+            def on_session_changed(self, change=None):
+                received.append(change)
+
+        provider = Provider()
+        session.add_provider(provider)
+        NetworkChange = self.module.NetworkChange
+
+        session.notify_changed(change=NetworkChange())
+        self.assertEqual(received, [])
+
+        change = NetworkChange.rows_modified('line', [3])
+        session.notify_changed(change=change)
+        self.assertIs(received[0], change)
+
+        session.notify_changed()
+        self.assertTrue(received[1].everything)
+
+    def test_pending_change_accumulates_until_taken(self):
+        """Edits between commits fold into one change, handed over once."""
+        session = self._acquire()
+        NetworkChange = self.module.NetworkChange
+
+        session.record_change(NetworkChange.rows_modified('bus', [1]))
+        session.record_change(NetworkChange.rows_added('line', [7]))
+
+        pending = session.take_pending_change()
+        self.assertEqual(pending.tables, {'bus', 'line'})
+        self.assertTrue(session.take_pending_change().is_empty())
+
+    def test_layer_map_follows_providers(self):
+        """Registered layer ids are found directly and forgotten with the provider."""
+        session = self._acquire()
+
+        class Provider:
+            pass
+
+        provider, unregistered = Provider(), Provider()
+        session.add_provider(provider)
+        session.add_provider(unregistered)
+        session.register_layer(provider, 'bus_layer_id')
+
+        self.assertEqual(session.layer_id(provider), 'bus_layer_id')
+        self.assertIsNone(session.layer_id(unregistered))
+        self.assertEqual(session.layer_ids(), ['bus_layer_id'])
+
+        session.remove_provider(provider)
+        self.assertEqual(session.layer_ids(), [])
+
     def test_dirty_flag_round_trip(self):
         """mark_dirty/mark_clean track divergence from the file on disk."""
         session = self._acquire()
@@ -202,6 +259,45 @@ class NetworkSessionTest(unittest.TestCase):
         session.mark_clean()
         self.assertFalse(session.dirty)
 
+    def test_snapshot_write_cleans_only_an_unchanged_session(self):
+        """An edit made while a snapshot is written keeps the session dirty."""
+        session = self._acquire()
+
+        session.mark_dirty()
+        generation = session.generation
+        self.assertTrue(session.finish_write(generation))
+        self.assertFalse(session.dirty)
+
+        session.mark_dirty()
+        generation = session.generation
+        session.mark_dirty()
+        self.assertFalse(session.finish_write(generation))
+        self.assertTrue(session.dirty)
+
+    def test_dirty_tables_follow_the_edits(self):
+        """Edits name the tables a save has to encode again."""
+        NetworkChange = self.module.NetworkChange
+        session = self._acquire()
+        self.assertEqual(session.dirty_tables, frozenset())
+
+        session.mark_dirty(NetworkChange.rows_modified('bus', [1]))
+        session.mark_dirty(NetworkChange.rows_added('line', [7]))
+        self.assertEqual(session.dirty_tables, {'bus', 'line'})
+
+        generation = session.generation
+        session.mark_dirty(NetworkChange.rows_modified('load', [0]))
+        self.assertFalse(session.finish_write(generation))
+        self.assertEqual(session.dirty_tables, {'bus', 'line', 'load'})
+
+        # An edit that does not say what it changed dirties everything.
+        session.mark_dirty()
+        self.assertIs(session.dirty_tables, self.module.ALL_TABLES)
+        session.mark_dirty(NetworkChange.rows_modified('bus', [1]))
+        self.assertIs(session.dirty_tables, self.module.ALL_TABLES)
+
+        session.mark_clean()
+        self.assertEqual(session.dirty_tables, frozenset())
+
     def test_external_change_is_detected(self):
         """A write by another process is noticed before we overwrite it."""
         session = self._acquire()
@@ -231,5 +327,359 @@ class NetworkSessionTest(unittest.TestCase):
             self.NetworkSession.acquire('', lambda: FakeNet())
 
 
+class BackgroundAcquireTest(unittest.TestCase):
+    """Test sessions whose network is loaded elsewhere."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.module = load_session_module()
+        cls.NetworkSession = cls.module.NetworkSession
+
+    def setUp(self):
+        self.NetworkSession.clear()
+        self.path = os.path.join(tempfile.mkdtemp(), 'net.json')
+        with open(self.path, 'w') as handle:
+            handle.write('{}')
+        self.loads = []
+
+    def tearDown(self):
+        self.NetworkSession.clear()
+
+    def background(self, session, load):
+        """Stand-in for network_loading: remember the load, run it later."""
+        session.load_task = load
+        self.loads.append((session, load))
+
+    def _acquire(self, net):
+        return self.NetworkSession.acquire(
+            self.path, lambda: net, background=self.background)
+
+    def _finish(self):
+        session, load = self.loads.pop()
+        session.load_task = None
+        net, lazy = load()
+        return session.install(net=net, lazy=lazy)
+
+    def test_session_is_registered_before_the_network_arrives(self):
+        """The first acquire returns at once with a loading session."""
+        session = self._acquire(FakeNet())
+
+        self.assertTrue(session.is_loading())
+        self.assertFalse(session.has_network())
+        self.assertIsNone(session.net)
+        self.assertIsNone(session.table('bus'))
+
+    def test_concurrent_acquires_share_one_load(self):
+        """A second acquire while loading joins the load in flight."""
+        first = self._acquire(FakeNet('first'))
+        second = self._acquire(FakeNet('second'))
+
+        self.assertIs(first, second)
+        self.assertEqual(len(self.loads), 1)
+
+        self.assertTrue(self._finish())
+        self.assertFalse(first.is_loading())
+        self.assertEqual(second.net.name, 'first')
+
+    def test_seeded_network_wins_over_the_load(self):
+        """A network seeded while loading is not replaced by the load."""
+        session = self._acquire(FakeNet('loaded'))
+        self.NetworkSession.seed(self.path, FakeNet('seeded'))
+
+        self.assertFalse(self._finish())
+        self.assertEqual(session.net.name, 'seeded')
+
+
+class ConcurrentAcquireTest(unittest.TestCase):
+    """Test the registry from several threads at once."""
+
+    THREADS = 8
+
+    @classmethod
+    def setUpClass(cls):
+        cls.module = load_session_module()
+        cls.NetworkSession = cls.module.NetworkSession
+
+    def setUp(self):
+        self.NetworkSession.clear()
+        self.path = os.path.join(tempfile.mkdtemp(), 'net.json')
+        with open(self.path, 'w') as handle:
+            handle.write('{}')
+
+    def tearDown(self):
+        self.NetworkSession.clear()
+        self.module.configure_pool(self.module.DEFAULT_POOL_BUDGET)
+
+    def _run(self, target):
+        """Run target in THREADS threads released together; return results."""
+        import threading
+
+        barrier = threading.Barrier(self.THREADS)
+        results = [None] * self.THREADS
+
+        def run(slot):
+            barrier.wait()
+            try:
+                results[slot] = target()
+            except Exception as error:
+                results[slot] = error
+
+        threads = [threading.Thread(target=run, args=(slot,))
+                   for slot in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(30)
+        return results
+
+    def test_one_load_for_concurrent_acquires(self):
+        """Threads acquiring one file share a single load and session."""
+        import threading
+        import time
+
+        calls = []
+        lock = threading.Lock()
+
+        def loader():
+            with lock:
+                calls.append(1)
+            time.sleep(0.2)  # Long enough for every thread to arrive
+            return FakeNet()
+
+        sessions = self._run(
+            lambda: self.NetworkSession.acquire(self.path, loader))
+
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(session is sessions[0] for session in sessions))
+        self.assertEqual(sessions[0]._refcount, self.THREADS)
+
+    def test_concurrent_releases_count_exactly(self):
+        """Releasing from many threads leaves no reference behind."""
+        self.module.configure_pool(0)
+        for _ in range(self.THREADS):
+            session = self.NetworkSession.acquire(self.path, FakeNet)
+
+        dropped = self._run(session.release)
+
+        self.assertEqual(dropped.count(True), 1)
+        self.assertIsNone(self.NetworkSession.get(self.path))
+
+    def test_failed_load_is_reported_to_every_waiter(self):
+        """Waiters see the loader's error; the next acquire tries again."""
+        import time
+
+        def loader():
+            time.sleep(0.2)
+            raise ValueError('broken file')
+
+        errors = self._run(
+            lambda: self.NetworkSession.acquire(self.path, loader))
+
+        self.assertTrue(all(isinstance(error, ValueError) for error in errors))
+        session = self.NetworkSession.acquire(self.path, FakeNet)
+        self.assertIsInstance(session.net, FakeNet)
+
+    def test_clear_forgets_loads_in_flight(self):
+        """A load running across clear() is neither joined nor registered."""
+        import threading
+
+        started, resume = threading.Event(), threading.Event()
+
+        def loader():
+            started.set()
+            resume.wait(30)
+            return FakeNet('before')
+
+        result = []
+        thread = threading.Thread(target=lambda: result.append(
+            self.NetworkSession.acquire(self.path, loader)))
+        thread.start()
+        started.wait(30)
+        self.NetworkSession.clear()
+
+        after = self.NetworkSession.acquire(self.path,
+                                            lambda: FakeNet('after'))
+        resume.set()
+        thread.join(30)
+
+        self.assertEqual(after.net.name, 'after')
+        self.assertIs(self.NetworkSession.get(self.path), after)
+        self.assertIs(result[0], after)  # The open session wins, as a seed
+
+    def test_seeded_session_is_not_built_twice(self):
+        """A load that loses to a seed builds no session of its own."""
+        built = []
+        original = self.NetworkSession.__init__
+
+        def init(session, *args, **kwargs):
+            built.append(session)
+            original(session, *args, **kwargs)
+
+        def loader():
+            self.NetworkSession.seed(self.path, FakeNet('seeded'))
+            return FakeNet('loaded')
+
+        self.NetworkSession.__init__ = init
+        try:
+            session = self.NetworkSession.acquire(self.path, loader)
+        finally:
+            self.NetworkSession.__init__ = original
+
+        self.assertEqual(session.net.name, 'seeded')
+        self.assertEqual(built, [session])
+
+
+class WarmPoolTest(unittest.TestCase):
+    """Test that released sessions are kept warm within the memory budget."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.module = load_session_module()
+        cls.NetworkSession = cls.module.NetworkSession
+
+    def setUp(self):
+        self.NetworkSession.clear()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.NetworkSession.clear()
+        self.module.configure_pool(self.module.DEFAULT_POOL_BUDGET)
+
+    def _path(self, name):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as handle:
+            handle.write('{}')
+        return path
+
+    def _open(self, path, rows=1000):
+        """Acquire a session for a file whose network has one table."""
+        import pandas as pd
+
+        net = {'bus': pd.DataFrame({'vn_kv': [20.0] * rows})}
+        return self.NetworkSession.acquire(path, lambda: net)
+
+    def _must_not_load(self):
+        raise AssertionError('a warm session must not be loaded again')
+
+    def test_released_session_is_reused(self):
+        """Reopening a released file takes the warm session, not the loader."""
+        path = self._path('a.json')
+        session = self._open(path)
+
+        self.assertFalse(session.release())
+        self.assertFalse(session.in_use())
+
+        again = self.NetworkSession.acquire(path, self._must_not_load)
+        self.assertIs(again, session)
+        self.assertTrue(again.in_use())
+
+    def test_least_recently_released_is_evicted_first(self):
+        """The pool evicts the oldest session once the budget is exceeded."""
+        first = self._open(self._path('a.json'))
+        second = self._open(self._path('b.json'))
+        size = first.memory_usage()
+        self.assertGreater(size, 0)
+        self.module.configure_pool(int(size * 1.5))
+
+        first.release()
+        second.release()
+
+        self.assertIsNone(self.NetworkSession.get(first.path))
+        self.assertIs(self.NetworkSession.get(second.path), second)
+
+    def test_dirty_session_is_never_evicted(self):
+        """Unsaved edits stay in memory, even over budget or with no pool."""
+        self.module.configure_pool(0)
+        path = self._path('a.json')
+        session = self._open(path)
+        session.mark_dirty()
+
+        self.assertFalse(session.release())
+        self.NetworkSession.trim_pool()
+
+        self.assertIs(self.NetworkSession.acquire(path, self._must_not_load),
+                      session)
+
+    def test_warm_session_of_a_changed_file_is_reloaded(self):
+        """A clean warm session is stale once the file changed on disk."""
+        path = self._path('a.json')
+        session = self._open(path)
+        session.release()
+        with open(path, 'w') as handle:
+            handle.write('{"changed": true}')
+        os.utime(path, (0, 0))
+
+        reloaded = self._open(path)
+
+        self.assertIsNot(reloaded, session)
+
+    def test_drop_forgets_a_released_session(self):
+        """drop() lets go of unsaved edits once the user was told."""
+        path = self._path('a.json')
+        session = self._open(path)
+        session.mark_dirty()
+        session.release()
+
+        session.drop()
+
+        self.assertIsNone(self.NetworkSession.get(path))
+
+
+class NetworkChangeTest(unittest.TestCase):
+    """Test the change payload carried by session change events."""
+
+    @classmethod
+    def setUpClass(cls):
+        import importlib
+
+        load_session_module()
+        cls.module = importlib.import_module(
+            'pandapower_qgis_plugin.network_change')
+        cls.NetworkChange = cls.module.NetworkChange
+
+    def test_untouched_table_is_not_affected(self):
+        """A line edit says nothing about the bus table."""
+        change = self.NetworkChange.rows_modified('line', [4], columns=['name'])
+
+        self.assertTrue(change.touches('line'))
+        self.assertFalse(change.touches('bus'))
+        self.assertFalse(change.geometry)
+
+    def test_merge_unions_rows(self):
+        """Merged changes keep every row of both."""
+        change = self.NetworkChange.rows_modified('bus', [1, 2])
+        change.merge(self.NetworkChange.rows_modified('bus', [2, 3],
+                                                      geometry=True))
+
+        self.assertEqual(change.rows(self.module.MODIFIED, 'bus'), {1, 2, 3})
+        self.assertTrue(change.geometry)
+
+    def test_all_rows_absorbs_id_sets(self):
+        """Once a whole table changed, individual ids no longer matter."""
+        change = self.NetworkChange.rows_modified('res_bus', [1])
+        change.merge(self.NetworkChange.rows_modified(
+            'res_bus', self.module.ALL_ROWS))
+
+        self.assertIs(change.affected_rows('res_bus'), self.module.ALL_ROWS)
+        self.assertTrue(change.results)
+
+    def test_columns_are_tracked_for_modified_rows(self):
+        """A rename of a bus does not touch its voltage level."""
+        change = self.NetworkChange.rows_modified('bus', [1], columns=['name'])
+
+        self.assertTrue(change.touches_column('bus', 'name'))
+        self.assertFalse(change.touches_column('bus', 'vn_kv'))
+
+        change.merge(self.NetworkChange.rows_removed('bus', [5]))
+        self.assertTrue(change.touches_column('bus', 'vn_kv'))
+
+    def test_everything_touches_every_table(self):
+        """A reload stands for a change to anything."""
+        change = self.NetworkChange.all()
+
+        self.assertTrue(change.touches('trafo'))
+        self.assertIs(change.affected_rows('bus'), self.module.ALL_ROWS)
+
+
 if __name__ == '__main__':
     unittest.main()
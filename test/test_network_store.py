@@ -0,0 +1,179 @@
+# coding=utf-8
+"""Tests for the columnar .ppnet network store.
+
+A store must give back the network it was given, in both its zip and its
+directory form, and must describe itself without reading any table.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+"""
+
+import os
+import tempfile
+import unittest
+
+from .test_network_session import load_session_module
+from .utilities import get_qgis_app
+
+QGIS_APP = get_qgis_app()
+
+try:
+    import pyarrow  # noqa: F401
+    HAVE_PYARROW = True
+except ImportError:
+    HAVE_PYARROW = False
+
+
+class StorePathTest(unittest.TestCase):
+    """Test how store paths are recognised and mapped."""
+
+    @classmethod
+    def setUpClass(cls):
+        import importlib
+
+        load_session_module()
+        cls.module = importlib.import_module(
+            'pandapower_qgis_plugin.network_store')
+
+    def test_manifest_path_maps_to_the_store(self):
+        """Picking manifest.json in a file dialog opens the whole store."""
+        store = os.path.join(tempfile.mkdtemp(), 'grid.ppnet')
+        manifest = os.path.join(store, 'manifest.json')
+
+        self.assertTrue(self.module.is_store_path(store))
+        self.assertTrue(self.module.is_store_path(manifest))
+        self.assertEqual(self.module.store_root(manifest), store)
+        self.assertFalse(self.module.is_store_path('grid.json'))
+
+    def test_json_file_is_not_sniffed_as_a_store(self):
+        """A JSON network is left to the JSON sniffer."""
+        path = os.path.join(tempfile.mkdtemp(), 'net.json')
+        with open(path, 'w') as handle:
+            handle.write('{}')
+
+        self.assertIsNone(self.module.sniff_store_kind(path))
+
+
+@unittest.skipIf(os.environ.get('SKIP_PANDAPOWER_TESTS'),
+                 'pandapower tests disabled')
+@unittest.skipUnless(HAVE_PYARROW, 'pyarrow is not installed')
+class StoreRoundTripTest(unittest.TestCase):
+    """Test writing and reading complete networks."""
+
+    @classmethod
+    def setUpClass(cls):
+        import importlib
+
+        load_session_module()
+        cls.module = importlib.import_module(
+            'pandapower_qgis_plugin.network_store')
+
+    def setUp(self):
+        import pandapower as pp
+        import pandapower.networks as ppn
+
+        self.net = ppn.mv_oberrhein()
+        pp.runpp(self.net)
+        self.directory = tempfile.mkdtemp()
+
+    def assert_same_network(self, net):
+        from pandapower.toolbox import nets_equal
+
+        self.assertTrue(nets_equal(self.net, net, check_only_results=False))
+        for table in ('bus', 'line', 'res_bus'):
+            self.assertEqual(net[table].dtypes.to_dict(),
+                             self.net[table].dtypes.to_dict())
+
+    def test_zip_round_trip(self):
+        """A zip store loads back into an equal network."""
+        path = os.path.join(self.directory, 'grid.ppnet')
+
+        self.module.write_store(self.net, path)
+
+        self.assertTrue(os.path.isfile(path))
+        self.assert_same_network(self.module.load_store(path))
+
+    def test_directory_round_trip(self):
+        """A directory store is rewritten in place and loads back equal."""
+        path = os.path.join(self.directory, 'grid.ppnet')
+        os.mkdir(path)
+
+        self.module.write_store(self.net, path)
+        self.module.write_store(self.net, path)
+
+        self.assertTrue(os.path.isdir(path))
+        self.assertEqual(
+            [name for name in os.listdir(self.directory)], ['grid.ppnet'])
+        self.assert_same_network(self.module.load_store(path))
+
+    def test_manifest_describes_the_tables(self):
+        """Row counts and kind come from the manifest alone."""
+        path = os.path.join(self.directory, 'grid.ppnet')
+        self.module.write_store(self.net, path)
+
+        rows = self.module.describe_store(path)
+
+        self.assertEqual(rows['bus'], len(self.net.bus))
+        self.assertEqual(rows['line'], len(self.net.line))
+        self.assertEqual(self.module.sniff_store_kind(path), 'power')
+
+    def test_single_table_read(self):
+        """One table can be read without loading the network."""
+        path = os.path.join(self.directory, 'grid.ppnet')
+        self.module.write_store(self.net, path)
+
+        line = self.module.read_table(path, 'line')
+
+        self.assertTrue(line.equals(self.net.line))
+
+    def test_unchanged_tables_are_kept(self):
+        """A save rewrites only the Parquet files of changed tables."""
+        path = os.path.join(self.directory, 'grid.ppnet')
+        os.mkdir(path)
+        self.module.write_store(self.net, path)
+        bus_file = os.path.join(path, 'tables', 'bus.parquet')
+        line_file = os.path.join(path, 'tables', 'line.parquet')
+        bus_inode = os.stat(bus_file).st_ino
+        line_inode = os.stat(line_file).st_ino
+
+        self.net.line.loc[self.net.line.index[0], 'length_km'] = 9.0
+        self.module.write_store(self.net, path, changed={'line'})
+
+        # The kept file is the old one, linked into the new directory.
+        self.assertEqual(os.stat(bus_file).st_ino, bus_inode)
+        self.assertNotEqual(os.stat(line_file).st_ino, line_inode)
+        self.assert_same_network(self.module.load_store(path))
+
+    def test_zip_keeps_unchanged_tables(self):
+        """A zip store copies kept tables into the new archive."""
+        path = os.path.join(self.directory, 'grid.ppnet')
+        self.module.write_store(self.net, path)
+
+        self.net.line.loc[self.net.line.index[0], 'length_km'] = 9.0
+        self.module.write_store(self.net, path, changed={'line'})
+
+        self.assert_same_network(self.module.load_store(path))
+
+    def test_session_writes_back_to_the_store(self):
+        """Committing a store-backed session keeps the store format."""
+        session_module = load_session_module()
+        session_module.NetworkSession.clear()
+        path = os.path.join(self.directory, 'grid.ppnet')
+        self.module.write_store(self.net, path)
+
+        session = session_module.NetworkSession.acquire(
+            path, lambda: self.module.load_store(path))
+        session.net.bus.loc[session.net.bus.index[0], 'name'] = 'edited'
+        session.mark_dirty()
+        success, message, _ = session.write(backup=False)
+
+        self.assertTrue(success, message)
+        self.assertEqual(
+            self.module.read_table(path, 'bus').iloc[0]['name'], 'edited')
+        session_module.NetworkSession.clear()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+# coding=utf-8
+"""Tests for power flows in the persistent worker process.
+
+The worker's mirror must follow the session's edits, shipped as deltas, a
+calculation must bring back the same results as one run in this process and
+nothing but results, and a cancelled calculation must leave the session
+untouched and the next one a fresh worker.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+"""
+
+import functools
+import os
+import tempfile
+import unittest
+
+from .test_network_session import load_session_module
+from .utilities import get_qgis_app
+
+QGIS_APP = get_qgis_app()
+
+
+@unittest.skipIf(os.environ.get('SKIP_PANDAPOWER_TESTS'),
+                 'pandapower tests disabled')
+class NetworkWorkerTest(unittest.TestCase):
+    """Test mirroring, delta updates, results and cancellation."""
+
+    @classmethod
+    def setUpClass(cls):
+        import importlib
+
+        cls.NetworkSession = load_session_module().NetworkSession
+        cls.module = importlib.import_module(
+            'pandapower_qgis_plugin.network_worker')
+        cls.change = importlib.import_module(
+            'pandapower_qgis_plugin.network_change')
+
+    def setUp(self):
+        import pandapower as pp
+        import pandapower.networks as ppn
+
+        self.NetworkSession.clear()
+        self.path = os.path.join(tempfile.mkdtemp(), 'net.json')
+        pp.to_json(ppn.mv_oberrhein(), self.path)
+        self.session = self.NetworkSession.acquire(self.path, self._load)
+        self.module.configure(True)
+
+    def tearDown(self):
+        self.module.configure(False)
+        self.NetworkSession.clear()
+
+    def _load(self):
+        import pandapower as pp
+
+        return pp.from_json(self.path)
+
+    def _calculate(self):
+        """Run a power flow in the worker and apply its results.
+
+        :returns: The RemoteCalculation.
+        """
+        import pandapower as pp
+
+        calculation = self.module.RemoteCalculation(self.session)
+        calculation.run(functools.partial(pp.runpp))
+        calculation.apply()
+        return calculation
+
+    def _scale_load(self, factor):
+        """Scale the first load through the session, as a layer edit would.
+
+        :param factor: Factor applied to its active power.
+        :returns: The load's index.
+        """
+        load = self.session.net.load.index[0]
+        self.session.own(['load'])
+        self.session.net.load.at[load, 'p_mw'] *= factor
+        self.session.mark_dirty(self.change.NetworkChange.rows_modified(
+            'load', [load], columns=['p_mw']))
+        return load
+
+    def test_only_results_come_back(self):
+        """The results match a local run; input tables stay the session's."""
+        import pandapower as pp
+
+        bus = self.session.net.bus
+        calculation = self._calculate()
+
+        expected = self._load()
+        pp.runpp(expected)
+        self.assertTrue(all(name.startswith('res_') or not hasattr(
+            value, 'columns') for name, value in calculation.results().items()))
+        self.assertIs(self.session.net.bus, bus)
+        self.assertTrue(self.session.net.converged)
+        self.assertAlmostEqual(self.session.net.res_bus.vm_pu.sum(),
+                               expected.res_bus.vm_pu.sum())
+        self.assertTrue(self.session.mirror_change.is_empty())
+        self.assertEqual(self.session._captures, [])
+
+    def test_edits_reach_the_mirror_as_rows(self):
+        """An edit ships the rows it touched and changes the results."""
+        import pandapower as pp
+
+        self._calculate()
+        load = self._scale_load(50)
+
+        calculation = self.module.RemoteCalculation(self.session)
+        self.assertEqual(calculation._delta()[0], 'apply')
+        calculation.run(functools.partial(pp.runpp))
+        calculation.apply()
+
+        expected = self._load()
+        expected.load.at[load, 'p_mw'] *= 50
+        pp.runpp(expected)
+        self.assertAlmostEqual(self.session.net.res_bus.vm_pu.sum(),
+                               expected.res_bus.vm_pu.sum())
+
+    def test_calculation_errors_are_raised(self):
+        """A power flow that fails in the worker fails here, results unset."""
+        import pandapower as pp
+
+        calculation = self.module.RemoteCalculation(self.session)
+        with self.assertRaises(pp.LoadflowNotConverged):
+            calculation.run(functools.partial(pp.runpp, max_iteration=1))
+
+        self.assertFalse(self.session.dirty)
+        self.assertEqual(self.session._captures, [])
+        self._calculate()  # The worker carries on
+        self.assertTrue(self.session.net.converged)
+
+    def test_cancelled_run_kills_the_worker(self):
+        """Nothing reaches the session; the next run starts a new worker."""
+        import pandapower as pp
+
+        calculation = self.module.RemoteCalculation(self.session)
+        with self.assertRaises(InterruptedError):
+            calculation.run(functools.partial(pp.runpp),
+                            is_canceled=lambda: True)
+
+        self.assertFalse(self.module.running())
+        self.assertFalse(self.session.dirty)
+        self.assertEqual(self.session._captures, [])
+        self._calculate()
+        self.assertTrue(self.module.running())
+
+
+if __name__ == '__main__':
+    unittest.main()
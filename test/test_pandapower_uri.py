@@ -175,6 +175,18 @@ class UriSchemeTest(unittest.TestCase):
         self.assertEqual(decoded['level'], '110.0')
         self.assertEqual(decoded['epsg'], '25832')
 
+    def test_scenario_round_trip(self):
+        """A scenario survives encoding; without one it decodes as None."""
+        import re
+
+        encoded = self.uri.encode_uri('C:/net/mv.json', 'bus',
+                                      scenario='new feeder')
+        decoded = self.uri.decode_uri(
+            dict(re.findall(r'(\w+)="((?:\\"|[^"])*)"', encoded)))
+
+        self.assertEqual(decoded['scenario'], 'new feeder')
+        self.assertIsNone(self.uri.decode_uri({'table': 'bus'})['scenario'])
+
     # -- geometry derivation ----------------------------------------------
 
     def test_geometry_type_for_tables(self):
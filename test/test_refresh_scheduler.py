@@ -0,0 +1,151 @@
+# coding=utf-8
+"""Tests for the per-session refresh scheduler.
+
+Refresh requests arriving within a short window must collapse into one rebuild
+and one repaint per affected layer, instead of a refresh storm across sibling
+layers (docs/dataprovider_v2_plan.md section 6).
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+"""
+
+import os
+import tempfile
+import unittest
+
+from .test_network_session import FakeNet, load_session_module
+from .utilities import get_qgis_app
+
+QGIS_APP = get_qgis_app()
+
+
+class FakeSignal:
+    """Counts emissions, standing in for a provider's dataChanged signal."""
+
+    def __init__(self):
+        self.count = 0
+
+    def emit(self):
+        self.count += 1
+
+
+class FakeProvider:
+    """Records rebuilds; affected by changes to one table only."""
+
+    def __init__(self, table):
+        self.table = table
+        self.rebuilds = []
+        self.dataChanged = FakeSignal()
+
+    def _is_affected_by(self, change):
+        return change.touches(self.table)
+
+    def on_session_changed(self, change=None):
+        self.rebuilds.append(change)
+
+    def _get_layer(self):
+        return None
+
+
+class RefreshSchedulerTest(unittest.TestCase):
+    """Test coalescing, source handling and layer lookup."""
+
+    @classmethod
+    def setUpClass(cls):
+        import importlib
+
+        cls.NetworkSession = load_session_module().NetworkSession
+        cls.NetworkChange = importlib.import_module(
+            'pandapower_qgis_plugin.network_change').NetworkChange
+        cls.module = importlib.import_module(
+            'pandapower_qgis_plugin.refresh_scheduler')
+
+    def setUp(self):
+        self.NetworkSession.clear()
+        handle, self.path = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        self.session = self.NetworkSession.acquire(
+            self.path, lambda: FakeNet())
+        self.bus = FakeProvider('bus')
+        self.line = FakeProvider('line')
+        self.session.add_provider(self.bus)
+        self.session.add_provider(self.line)
+
+    def tearDown(self):
+        self.NetworkSession.clear()
+        os.remove(self.path)
+
+    def test_burst_becomes_one_rebuild_per_layer(self):
+        """Many requests in one window rebuild each affected layer once."""
+        for bus in range(5):
+            self.module.schedule_refresh(
+                self.session, self.NetworkChange.rows_modified('bus', [bus]))
+        self.module.schedule_refresh(
+            self.session, self.NetworkChange.rows_added('line', [9]))
+
+        scheduler = self.module.scheduler_for(self.session)
+        self.assertTrue(scheduler.pending())
+        self.assertEqual(self.bus.rebuilds, [])
+
+        scheduler.flush()
+
+        self.assertEqual(len(self.bus.rebuilds), 1)
+        self.assertEqual(self.bus.rebuilds[0].affected_rows('bus'), set(range(5)))
+        self.assertEqual(len(self.line.rebuilds), 1)
+        self.assertEqual(self.bus.dataChanged.count, 1)
+        self.assertFalse(scheduler.pending())
+
+    def test_unaffected_layer_is_left_alone(self):
+        """A layer whose table was not touched is neither rebuilt nor signalled."""
+        self.module.schedule_refresh(
+            self.session, self.NetworkChange.rows_modified('bus', [1]))
+        self.module.scheduler_for(self.session).flush()
+
+        self.assertEqual(self.line.rebuilds, [])
+        self.assertEqual(self.line.dataChanged.count, 0)
+
+    def test_source_is_signalled_but_not_rebuilt(self):
+        """The provider that made every change already updated itself."""
+        self.module.schedule_refresh(
+            self.session, self.NetworkChange.rows_modified('bus', [1]),
+            source=self.bus)
+        self.module.scheduler_for(self.session).flush()
+
+        self.assertEqual(self.bus.rebuilds, [])
+        self.assertEqual(self.bus.dataChanged.count, 1)
+
+    def test_mixed_sources_rebuild_everyone(self):
+        """A change from elsewhere in the window still reaches the source."""
+        self.module.schedule_refresh(
+            self.session, self.NetworkChange.rows_modified('bus', [1]),
+            source=self.bus)
+        self.module.schedule_refresh(
+            self.session, self.NetworkChange.rows_modified('bus', [2]))
+        self.module.scheduler_for(self.session).flush()
+
+        self.assertEqual(len(self.bus.rebuilds), 1)
+
+    def test_released_session_flushes_nothing(self):
+        """A pending refresh does not keep a dropped session alive."""
+        scheduler = self.module.scheduler_for(self.session)
+        self.module.schedule_refresh(self.session)
+        self.session.release()
+        bus = self.bus
+        del self.session, self.bus, self.line
+
+        scheduler.flush()
+
+        self.assertEqual(bus.rebuilds, [])
+
+    def test_layers_are_looked_up_by_registered_id(self):
+        """Unknown layer ids resolve to nothing rather than a project scan."""
+        self.session.register_layer(self.bus, 'no-such-layer')
+
+        self.assertIsNone(self.module.layer_of(self.session, self.bus))
+        self.assertEqual(self.module.layers_of(self.session), [])
+
+
+if __name__ == '__main__':
+    unittest.main()